@@ -0,0 +1,62 @@
+"""
+Action 注册表基准测试
+
+测量启动时解析 action-library.ts 的耗时，以及每次执行前的注册表查找和参数校验开销。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_action_registry.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import config  # noqa: E402
+from services.action_registry import ActionRegistry, action_registry  # noqa: E402
+
+CASES = [
+    ("lookup calculator", lambda: action_registry.get("calculator")),
+    ("lookup legacy '8'", lambda: action_registry.get("8")),
+    ("lookup unknown", lambda: action_registry.get("not_registered")),
+    ("validate calculator",
+     lambda: action_registry.get("calculator").validate({"expression": "2 + 2"})),
+    ("validate text_processor (default fill)",
+     lambda: action_registry.get("text_processor").validate({"text": "这个游戏太好玩了"})),
+    ("validate datetime_processor",
+     lambda: action_registry.get("datetime_processor").validate({
+         "operation": "diff", "date_input": "2024-01-01", "unit": "hours"
+     })),
+    ("validate google_search (coerce)",
+     lambda: action_registry.get("google_search").validate({"query": "原神", "max_results": "5"})),
+    ("validate invalid select",
+     lambda: action_registry.get("json_processor").validate({"json_string": "{}", "operation": "drop"})),
+]
+
+
+def bench(fn, iterations: int) -> float:
+    """返回每次调用的平均耗时（纳秒）"""
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter_ns() - start) / iterations
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+
+    start = time.perf_counter()
+    for _ in range(20):
+        ActionRegistry.from_file(config.ACTION_LIBRARY_PATH)
+    load_ms = (time.perf_counter() - start) / 20 * 1000
+    print(f"解析 action-library.ts 并编译校验函数: {load_ms:.2f} ms（{len(action_registry)} 个 Action）\n")
+
+    print(f"{'case':<42}{'ns/op':>10}")
+    print("-" * 52)
+    for name, fn in CASES:
+        bench(fn, iterations // 10)  # 预热
+        print(f"{name:<42}{bench(fn, iterations):>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
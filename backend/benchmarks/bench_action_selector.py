@@ -0,0 +1,77 @@
+"""
+Action 选择基准测试
+
+对一组待办步骤（不在 Action 样例中）测量向量排序选择 Action 的延迟、准确率，
+以及不需要 LLM 裁决（候选无歧义）的比例。期望值 None 表示步骤不需要工具，直接由 LLM 处理。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_action_selector.py [重复轮数，默认 200]
+"""
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.action_selector import ActionSelectorService  # noqa: E402
+
+# (步骤文本, 期望的 Action ID)
+CASES = [
+    ("计算上季度收入的增长率", "calculator"),
+    ("计算 (120+80)*0.3", "calculator"),
+    ("统计评论文本的字数", "text_processor"),
+    ("把结果格式化成JSON", "json_processor"),
+    ("提取JSON中的用户字段", "json_processor"),
+    ("获取当前日期", "datetime_processor"),
+    ("比较两个日期相差多少天", "datetime_processor"),
+    ("搜索竞品王者荣耀的最新版本资讯", "google_search"),
+    ("查找原神的用户评价", "google_search"),
+    ("生成一张活动宣传海报", "gpt_image_gen"),
+    ("画一个游戏角色", "gpt_image_gen"),
+    ("分析用户评论的情感倾向", "sentiment_analysis"),
+    ("判断反馈是正面还是负面", "sentiment_analysis"),
+    ("给这些游戏生成类型标签", "game_classification"),
+    ("策划一个春节运营活动", "event_planning"),
+    ("设计签到活动的流程", "event_planning"),
+    ("总结竞品分析的主要结论", None),
+    ("撰写一份周报", None),
+    ("整理玩家反馈中的主要问题", None),
+    ("根据调研结果给出优化建议", None),
+]
+
+
+async def run(rounds: int) -> None:
+    service = ActionSelectorService()
+    t = time.perf_counter()
+    built = await service.build()
+    print(f"建立索引: {built['exemplars']} 条样例，{(time.perf_counter() - t) * 1000:.1f}ms\n")
+
+    results = [await service.select(step, allow_llm=False) for step, _ in CASES]
+    correct = sum(result["action_id"] == expected for result, (_, expected) in zip(results, CASES))
+    unambiguous = [
+        (result, expected) for result, (_, expected) in zip(results, CASES) if not result["ambiguous"]
+    ]
+    print(f"准确率（全部按向量排序）: {correct}/{len(CASES)}")
+    print(f"无需 LLM 裁决: {len(unambiguous)}/{len(CASES)}，"
+          f"其中正确 {sum(result['action_id'] == expected for result, expected in unambiguous)}")
+
+    latencies = []
+    for _ in range(rounds):
+        for step, _ in CASES:
+            started = time.perf_counter()
+            await service.rank(step)
+            latencies.append(time.perf_counter() - started)
+    latencies = np.asarray(latencies) * 1e6
+    print(f"\n排序延迟（{len(latencies)} 次）: p50 {np.percentile(latencies, 50):.1f}µs  "
+          f"p99 {np.percentile(latencies, 99):.1f}µs")
+
+
+def main() -> None:
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
+
+
+if __name__ == "__main__":
+    main()
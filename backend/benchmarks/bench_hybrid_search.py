@@ -0,0 +1,100 @@
+"""
+知识库混合检索基准测试
+
+用合成中文 chunk（同 bench_search_index）和带簇结构的随机向量写入知识库，
+测量 retrieve（词法 + 向量两路并行召回、RRF 融合、取正文）的延迟，不含查询向量化。
+行数超过 KB_ANN_MIN_ROWS 时向量一路走 IVF。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_hybrid_search.py [chunk 数，默认 100000] [维度，默认 384] [查询数，默认 300]
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_search_index import synthetic_document, synthetic_query  # noqa: E402
+from config import config  # noqa: E402
+from services.knowledge_base_service import KnowledgeBaseService  # noqa: E402
+
+_BATCH = 5000
+_TOPICS = 2000
+_FEEDBACK_TYPES = ["游戏体验", "内容评价", "社交体验", "付费体验"]
+
+CASES = [
+    ("hybrid", {}),
+    ("hybrid + sourceId", {"sourceId": ["1", "2"]}),
+    ("hybrid + feedback_type", {"feedback_type": "社交体验"}),
+    ("vector only", None),
+    ("lexical only", None),
+]
+
+
+async def build(service: KnowledgeBaseService, n_chunks: int, dim: int, rng: np.random.Generator) -> None:
+    topics = rng.standard_normal((_TOPICS, dim), dtype=np.float32) / np.sqrt(dim)
+    for offset in range(0, n_chunks, _BATCH):
+        n = min(_BATCH, n_chunks - offset)
+        vectors = topics[rng.integers(_TOPICS, size=n)] + \
+            rng.standard_normal((n, dim), dtype=np.float32) * (0.7 / np.sqrt(dim))
+        chunks = []
+        for i, vector in zip(range(offset, offset + n), vectors):
+            doc = synthetic_document(rng, i)
+            chunks.append({
+                "id": doc["id"],
+                "content": doc["body"],
+                "keywords": doc["title"].split(),
+                "sourceId": str(i % 8),
+                "sourceName": f"source-{i % 8}",
+                "metadata": {"feedback_type": _FEEDBACK_TYPES[i % len(_FEEDBACK_TYPES)]},
+                "embedding": vector.tolist()
+            })
+        await service.add_chunks(chunks)
+
+
+async def run(n_chunks: int, dim: int, n_queries: int) -> None:
+    rng = np.random.default_rng(5)
+    service = KnowledgeBaseService()
+
+    start = time.perf_counter()
+    await build(service, n_chunks, dim, rng)
+    print(f"写入 {n_chunks} 个 chunk: {time.perf_counter() - start:.1f}s，{service.stats().get('ann')}\n")
+
+    queries = [(synthetic_query(rng), rng.standard_normal(dim).astype(np.float32)) for _ in range(n_queries)]
+    print(f"{'case':<26}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, filters in CASES:
+        mode = {"vector only": "vector", "lexical only": "lexical"}.get(name, "hybrid")
+        for text, vector in queries[:10]:
+            await service.retrieve(text, vector, 5, filters, mode)  # 预热（含过滤掩码缓存）
+        latencies = []
+        for text, vector in queries:
+            t = time.perf_counter()
+            await service.retrieve(text, vector, 5, filters, mode)
+            latencies.append((time.perf_counter() - t) * 1000)
+        latencies = np.asarray(latencies)
+        print(
+            f"{name:<26}{np.percentile(latencies, 50):>10.2f}"
+            f"{np.percentile(latencies, 95):>10.2f}{np.percentile(latencies, 99):>10.2f}"
+        )
+
+
+def main() -> None:
+    n_chunks = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 384
+    n_queries = int(sys.argv[3]) if len(sys.argv) > 3 else 300
+    directory = tempfile.mkdtemp()
+    config.KB_VECTOR_DIR = directory
+    config.KB_LEXICAL_INDEX_PATH = os.path.join(directory, "lexical.db")
+    try:
+        asyncio.run(run(n_chunks, dim, n_queries))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
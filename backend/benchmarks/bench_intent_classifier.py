@@ -0,0 +1,91 @@
+"""
+本地意图分类基准测试
+
+对一组未出现在种子样例中的运营常见问法，测量本地两层分类（关键词字典树 + 最近质心，不回退 LLM）的
+延迟分布、准确率，以及达到 INTENT_CONFIDENCE_THRESHOLD、无需 LLM 回退的比例。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_intent_classifier.py [重复轮数，默认 200]
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import config  # noqa: E402
+from services.intent_classifier import IntentClassifierService  # noqa: E402
+
+# (问法, 期望标签)
+CASES = [
+    ("你好呀", "text_answer"),
+    ("怎么提升次日留存", "text_answer"),
+    ("什么是ARPU", "text_answer"),
+    ("付费率低怎么办", "text_answer"),
+    ("把这段话翻译成日语", "text_answer"),
+    ("计算 15*8 等于多少", "tool_call:calculator"),
+    ("3000 乘以 0.15 是多少", "tool_call:calculator"),
+    ("帮我画一个游戏主界面", "tool_call:gpt_image_gen"),
+    ("生成一张新年主题的海报图", "tool_call:gpt_image_gen"),
+    ("策划一个中秋节活动", "tool_call:event_planning"),
+    ("做一个回流活动的方案", "tool_call:event_planning"),
+    ("现在是几点了", "tool_call:datetime_processor"),
+    ("统计一下这段话的字数", "tool_call:text_processor"),
+    ("把这个JSON格式化", "tool_call:json_processor"),
+    ("看看评论是好评还是差评", "tool_call:sentiment_analysis"),
+    ("这个游戏是什么类型的", "tool_call:game_classification"),
+    ("做一份竞品分析", "workflow"),
+    ("调研一下日本市场的二次元游戏", "workflow"),
+    ("帮我处理下", "clarify"),
+    ("弄一下那个", "clarify"),
+]
+
+
+def label_of(result):
+    return result["intent"] + (f":{result['toolId']}" if "toolId" in result else "")
+
+
+async def run(rounds: int) -> None:
+    service = IntentClassifierService()
+    t = time.perf_counter()
+    trained = await service.train()
+    print(f"训练: {trained['labels']} 个标签，{trained['examples']} 条样例，{(time.perf_counter() - t) * 1000:.1f}ms\n")
+
+    results = [await service.classify_local(message) for message, _ in CASES]
+    correct = sum(label_of(result) == expected for result, (_, expected) in zip(results, CASES))
+    confident = [result for result in results if result["confident"]]
+    confident_correct = sum(
+        label_of(result) == expected for result, (_, expected) in zip(results, CASES) if result["confident"]
+    )
+    print(f"准确率（全部本地）: {correct}/{len(CASES)}")
+    print(f"本地直接返回: {len(confident)}/{len(CASES)}，其中正确 {confident_correct}")
+
+    latencies = []
+    for _ in range(rounds):
+        for message, _ in CASES:
+            started = time.perf_counter()
+            await service.classify_local(message)
+            latencies.append(time.perf_counter() - started)
+    latencies = np.asarray(latencies) * 1000
+    print(f"\n延迟（{len(latencies)} 次）: p50 {np.percentile(latencies, 50):.3f}ms  "
+          f"p99 {np.percentile(latencies, 99):.3f}ms  max {latencies.max():.3f}ms")
+
+
+def main() -> None:
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    directory = tempfile.mkdtemp()
+    config.INTENT_LABELS_PATH = os.path.join(directory, "intent_labels.db")
+    config.INTENT_CENTROIDS_PATH = os.path.join(directory, "intent_centroids.npz")
+    try:
+        asyncio.run(run(rounds))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+IVF 近似检索基准测试：召回率 vs 延迟
+
+合成带簇结构的向量（接近真实 embedding 的分布，纯随机向量对任何 ANN 都是最坏情况），
+以精确检索为基准，测量不同 nprobe 下的 recall@10 和单条查询延迟。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_ivf_index.py [行数，默认 1000000] [维度，默认 384] [查询数，默认 200]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.ivf_index import IVFIndex  # noqa: E402
+from services.vector_store import VectorStore  # noqa: E402
+
+_BATCH = 50_000
+_TOPICS = 5000
+_NPROBES = [1, 2, 4, 8, 16, 32, 64]
+
+
+def clustered(rng: np.random.Generator, topics: np.ndarray, n: int) -> np.ndarray:
+    """每个向量 = 随机主题中心 + 噪声（噪声模长约为主题中心的 0.7 倍）"""
+    picks = rng.integers(len(topics), size=n)
+    noise = rng.standard_normal((n, topics.shape[1]), dtype=np.float32) * (0.7 / np.sqrt(topics.shape[1]))
+    return topics[picks] + noise
+
+
+def timed(fn, queries: np.ndarray) -> np.ndarray:
+    latencies = []
+    for query in queries:
+        t = time.perf_counter()
+        fn(query)
+        latencies.append((time.perf_counter() - t) * 1000)
+    return np.asarray(latencies)
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 384
+    n_queries = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    rng = np.random.default_rng(11)
+    topics = rng.standard_normal((_TOPICS, dim), dtype=np.float32) / np.sqrt(dim)
+    directory = tempfile.mkdtemp()
+
+    try:
+        store = VectorStore(directory, dim=dim)
+        for offset in range(0, rows, _BATCH):
+            n = min(_BATCH, rows - offset)
+            chunks = [{"id": f"chunk-{i}", "content": ""} for i in range(offset, offset + n)]
+            store.add_chunks(chunks, clustered(rng, topics, n))
+
+        index = IVFIndex(store)
+        t = time.perf_counter()
+        trained = index.train()
+        print(f"[{rows} 行 x {dim} 维] 训练 + 分配 + 重排: {time.perf_counter() - t:.1f}s，{trained}")
+
+        queries = clustered(rng, topics, n_queries)
+        truth, _ = store.search_vectors(queries, 10)
+        exact = timed(lambda q: store.search_vectors(q, 10), queries[:50])
+        print(f"精确检索: p50 {np.percentile(exact, 50):.1f}ms  p95 {np.percentile(exact, 95):.1f}ms\n")
+
+        print(f"{'nprobe':>7}{'recall@10':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for nprobe in _NPROBES:
+            found, _ = index.search_vectors(queries, 10, nprobe=nprobe)
+            recall = np.mean([len(set(f) & set(t)) / 10 for f, t in zip(found.tolist(), truth.tolist())])
+            latencies = timed(lambda q: index.search_vectors(q, 10, nprobe=nprobe), queries)
+            print(
+                f"{nprobe:>7}{recall:>12.3f}{np.percentile(latencies, 50):>10.2f}"
+                f"{np.percentile(latencies, 95):>10.2f}{np.percentile(latencies, 99):>10.2f}"
+            )
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+参数提取规则基准测试
+
+对一组待办步骤 / 工具调用中常见的说法，测量由参数定义编译的规则（不调用 LLM）的命中率、
+准确率和延迟。未命中的说法在实际运行中会回退 LLM。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_parameter_extractor.py [重复轮数，默认 200]
+"""
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.action_registry import action_registry  # noqa: E402
+from services.parameter_extractor import ParameterExtractorService  # noqa: E402
+
+# (Action ID, 文本, 期望参数（只比较列出的键）；None 表示规则应当放弃、交给 LLM)
+CASES = [
+    ("calculator", "帮我计算8*8*9*123+567-1232/890 的结果", {"expression": "8*8*9*123+567-1232/890"}),
+    ("calculator", "计算 2 + 2", {"expression": "2 + 2"}),
+    ("calculator", "计算 sqrt(16)", {"expression": "sqrt(16)"}),
+    ("calculator", "10 的 3 次方是多少", {"expression": "10**3"}),
+    ("calculator", "3000 乘以 0.15 是多少", {"expression": "3000*0.15"}),
+    ("calculator", "计算增长率（1200-1000）/1000", {"expression": "(1200-1000)/1000"}),
+    ("calculator", "计算上月的付费率", None),
+    ("json_processor", '格式化这个JSON：{"name": "LaunchBox", "tags": ["rpg", "moba"]}',
+     {"json_string": '{"name": "LaunchBox", "tags": ["rpg", "moba"]}', "operation": "format"}),
+    ("json_processor", '验证 [1, 2, 3] 是否合法', {"json_string": "[1, 2, 3]", "operation": "validate"}),
+    ("json_processor", '提取 {"a": 1, "b": 2} 的键名', {"json_string": '{"a": 1, "b": 2}', "operation": "keys"}),
+    ("datetime_processor", "获取当前时间", {"operation": "now"}),
+    ("datetime_processor", "计算2024-01-01到2024年3月15日相差多少天",
+     {"operation": "diff", "date_input": "2024-01-01", "compare_to": "2024-03-15", "unit": "days"}),
+    ("datetime_processor", "解析 2024/5/1 14:30", {"operation": "parse", "date_input": "2024-05-01 14:30"}),
+    ("datetime_processor", "把2024-06-18格式化为 %Y年%m月%d日",
+     {"operation": "format", "date_input": "2024-06-18", "output_format": "%Y年%m月%d日"}),
+    ("text_processor", "把“hello world”转成大写", {"text": "hello world", "operation": "uppercase"}),
+    ("text_processor", "统计这段文字的字数：今天天气很好，适合出去玩", {"text": "今天天气很好，适合出去玩", "operation": "word_count"}),
+    ("text_processor", "统计用户反馈的字数", None),
+    ("google_search", "搜索原神最新版本的玩家评价", {"query": "原神最新版本的玩家评价"}),
+    ("google_search", "查找竞品游戏的相关资讯", {"query": "竞品游戏"}),
+    ("gpt_image_gen", "生成一张中秋节主题的活动海报，1024x1024", {"prompt": "中秋节主题的活动海报，1024x1024", "width": 1024}),
+    ("sentiment_analysis", "分析评论“画面很棒但是太肝了”的情感", {"text": "画面很棒但是太肝了"}),
+    ("sentiment_analysis", "分析玩家评论的情感倾向", None),
+    ("game_classification", "给这款游戏分类：一款以三国为背景的策略卡牌手游", {"description": "一款以三国为背景的策略卡牌手游"}),
+]
+
+
+async def run(rounds: int) -> None:
+    service = ParameterExtractorService()
+    hits = correct = declined = 0
+    for action_id, text, expected in CASES:
+        parameters, missing = service.extract_with_rules(action_registry.get(action_id), text)
+        if missing:
+            declined += expected is None
+            status = "→ LLM" if expected is None else "✗ 未命中"
+        else:
+            hits += 1
+            ok = expected is not None and all(parameters.get(key) == value for key, value in expected.items())
+            correct += ok
+            status = "✓" if ok else "✗ 错误"
+        print(f"{status:8} {action_id:20} {text[:30]:32} {parameters}")
+
+    expected_hits = sum(expected is not None for _, _, expected in CASES)
+    print(f"\n规则命中: {hits}/{len(CASES)}（期望 {expected_hits}），命中中正确 {correct}，"
+          f"应交给 LLM 的 {declined}/{len(CASES) - expected_hits}")
+
+    latencies = []
+    for _ in range(rounds):
+        for action_id, text, _ in CASES:
+            spec = action_registry.get(action_id)
+            started = time.perf_counter()
+            service.extract_with_rules(spec, text)
+            latencies.append(time.perf_counter() - started)
+    latencies = np.asarray(latencies) * 1e6
+    print(f"\n规则延迟（{len(latencies)} 次）: p50 {np.percentile(latencies, 50):.1f}µs  "
+          f"p99 {np.percentile(latencies, 99):.1f}µs  max {latencies.max():.1f}µs")
+
+
+def main() -> None:
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    asyncio.run(run(rounds))
+
+
+if __name__ == "__main__":
+    main()
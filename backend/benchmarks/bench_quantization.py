@@ -0,0 +1,116 @@
+"""
+向量量化基准测试：内存占用 vs 召回率 vs QPS
+
+与 bench_ivf_index 相同的带簇结构合成向量，以 float32 精确检索为基准，对比：
+- 扫描方式：全量扫描 / IVF（nprobe 固定）
+- 向量表示：float32 / int8 / PQ
+- 是否用 float32 原向量重排前 k x rerank 个候选
+
+内存为检索时需要常驻的数据：全量 float32 为整个向量矩阵，IVF float32 为按簇重排的副本，
+量化模式为编码（重排只按行读取少量原向量）。QPS 为单条查询串行执行。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_quantization.py [行数，默认 1000000] [维度，默认 384] [查询数，默认 200]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_ivf_index import clustered  # noqa: E402
+from services.ivf_index import IVFIndex  # noqa: E402
+from services.vector_quantizer import CODES_FILE, PARAMS_FILE, QuantizedVectors  # noqa: E402
+from services.vector_store import VectorStore  # noqa: E402
+
+_BATCH = 50_000
+_TOPICS = 5000
+_NPROBE = 16
+_RERANKS = [0, 4]
+
+
+def measure(search, queries: np.ndarray, truth: np.ndarray, n_timed: int):
+    found = np.stack([search(query)[0][0][:10] for query in queries])
+    recall = np.mean([len(set(f) & set(t)) / 10 for f, t in zip(found.tolist(), truth.tolist())])
+    latencies = []
+    for query in queries[:n_timed]:
+        t = time.perf_counter()
+        search(query)
+        latencies.append(time.perf_counter() - t)
+    latencies = np.asarray(latencies)
+    return recall, 1.0 / latencies.mean(), np.percentile(latencies, 50) * 1000
+
+
+def report(name: str, memory: int, recall: float, qps: float, p50: float) -> None:
+    print(f"{name:<26}{memory / 2 ** 20:>12.1f}{recall:>12.3f}{qps:>10.1f}{p50:>10.2f}")
+
+
+def remove_codes(directory: str) -> None:
+    for name in (PARAMS_FILE, CODES_FILE):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 384
+    n_queries = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    rng = np.random.default_rng(11)
+    topics = rng.standard_normal((_TOPICS, dim), dtype=np.float32) / np.sqrt(dim)
+    directory = tempfile.mkdtemp()
+
+    try:
+        store = VectorStore(directory, dim=dim)
+        for offset in range(0, rows, _BATCH):
+            n = min(_BATCH, rows - offset)
+            store.add_chunks([{"id": f"chunk-{i}", "content": ""} for i in range(offset, offset + n)], clustered(rng, topics, n))
+
+        queries = clustered(rng, topics, n_queries)
+        truth, _ = store.search_vectors(queries, 10)
+        # 全量扫描的慢模式只计时部分查询
+        n_timed_flat = min(n_queries, 50)
+
+        print(f"[{rows} 行 x {dim} 维，IVF nprobe={_NPROBE}]\n")
+        print(f"{'mode':<26}{'memory MB':>12}{'recall@10':>12}{'QPS':>10}{'p50 ms':>10}")
+        float_bytes = rows * dim * 4
+        report("flat float32", float_bytes, *measure(lambda q: store.search_vectors(q, 10), queries, truth, n_timed_flat))
+
+        ivf = IVFIndex(store, nprobe=_NPROBE)
+        ivf.train()
+        report(
+            "ivf float32", ivf.stats()["packed_bytes"],
+            *measure(lambda q: ivf.search_vectors(q, 10), queries, truth, n_queries)
+        )
+
+        for kind in ("int8", "pq"):
+            remove_codes(directory)
+            quantized = QuantizedVectors(store, kind=kind)
+            t = time.perf_counter()
+            trained = quantized.train()
+            print(f"{'':<26}（{kind} 训练 + 编码 {time.perf_counter() - t:.1f}s，每行 {trained['code_size']} 字节）")
+            code_bytes = quantized.stats()["code_bytes"]
+            for rerank in _RERANKS:
+                report(
+                    f"flat {kind} rerank={rerank}", code_bytes,
+                    *measure(lambda q: quantized.search_vectors(q, 10, rerank=rerank), queries, truth, n_timed_flat)
+                )
+            # 复用已训练的簇中心和分配，只重新布局
+            ivf_quantized = IVFIndex(store, nprobe=_NPROBE, quantized=quantized)
+            for rerank in _RERANKS:
+                report(
+                    f"ivf {kind} rerank={rerank}", code_bytes,
+                    *measure(lambda q: ivf_quantized.search_vectors(q, 10, rerank=rerank), queries, truth, n_queries)
+                )
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
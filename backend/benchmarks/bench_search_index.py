@@ -0,0 +1,80 @@
+"""
+本地 BM25 索引基准测试
+
+生成合成语料（中英混合），测量批量写入吞吐和查询延迟（p50 / p95 / p99）。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_search_index.py [文档数，默认 200000] [查询次数，默认 500]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.search_index import BM25Index  # noqa: E402
+
+# 合成词表：3000 个常用汉字按 Zipf 分布抽样，混入少量英文运营术语
+_CHARS = [chr(0x4E00 + i * 7) for i in range(3000)]
+_WORDS = ["dau", "arppu", "ltv", "gacha", "pvp", "pve", "roi", "kpi", "genshin", "moba", "rpg", "event", "battle", "pass"]
+_BATCH = 5000
+
+
+def synthetic_document(rng: np.random.Generator, doc_id: int) -> dict:
+    parts = []
+    for _ in range(int(rng.integers(3, 9))):
+        ranks = np.minimum(rng.zipf(1.3, size=int(rng.integers(4, 17))), len(_CHARS)) - 1
+        parts.append("".join(_CHARS[r] for r in ranks))
+        if rng.random() < 0.4:
+            parts.append(_WORDS[int(rng.integers(len(_WORDS)))])
+    title_ranks = np.minimum(rng.zipf(1.3, size=6), len(_CHARS)) - 1
+    return {"id": f"doc-{doc_id}", "title": "".join(_CHARS[r] for r in title_ranks), "body": " ".join(parts)}
+
+
+def synthetic_query(rng: np.random.Generator) -> str:
+    """从合成文档中截取两个 2~4 字的片段作为查询"""
+    words = [w for w in synthetic_document(rng, 0)["body"].split() if len(w) >= 2]
+    picks = []
+    for _ in range(2):
+        word = words[int(rng.integers(len(words)))]
+        start = int(rng.integers(0, max(1, len(word) - 1)))
+        picks.append(word[start:start + int(rng.integers(2, 5))])
+    return " ".join(picks)
+
+
+def main() -> None:
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    rng = np.random.default_rng(42)
+    path = os.path.join(tempfile.mkdtemp(), "bench_search.db")
+    index = BM25Index(path)
+
+    start = time.perf_counter()
+    for offset in range(0, n_docs, _BATCH):
+        index.add_documents([synthetic_document(rng, i) for i in range(offset, min(offset + _BATCH, n_docs))])
+    build = time.perf_counter() - start
+    index.compact()
+    print(f"写入 {n_docs} 篇文档: {build:.1f}s（{n_docs / build:.0f} 篇/秒），合并后 {index.stats()}")
+
+    queries = [synthetic_query(rng) for _ in range(n_queries)]
+
+    for query in queries[:20]:
+        index.search(query, 10)  # 预热
+
+    latencies = []
+    for query in queries:
+        t = time.perf_counter()
+        index.search(query, 10)
+        latencies.append((time.perf_counter() - t) * 1000)
+    latencies = np.asarray(latencies)
+    print(
+        f"查询 {n_queries} 次: p50 {np.percentile(latencies, 50):.2f}ms  "
+        f"p95 {np.percentile(latencies, 95):.2f}ms  p99 {np.percentile(latencies, 99):.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
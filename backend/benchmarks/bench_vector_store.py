@@ -0,0 +1,81 @@
+"""
+知识库向量存储基准测试
+
+分别在 100k 和 1M 行（默认 384 维随机向量）上测量：
+- 追加写入吞吐（向量文件 + SQLite 元数据）
+- 单条查询的精确 top-10 延迟（p50 / p95 / p99）
+- 批量查询（64 条一次矩阵乘法）的平均每条耗时
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_vector_store.py [维度，默认 384] [行数...，默认 100000 1000000]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.vector_store import VectorStore  # noqa: E402
+
+_BATCH = 50_000
+_QUERIES = 200
+_BATCH_QUERIES = 64
+
+
+def build(store: VectorStore, rows: int, dim: int, rng: np.random.Generator) -> float:
+    start = time.perf_counter()
+    for offset in range(0, rows, _BATCH):
+        n = min(_BATCH, rows - offset)
+        chunks = [
+            {"id": f"chunk-{i}", "sourceId": str(i % 8), "content": f"chunk {i}"}
+            for i in range(offset, offset + n)
+        ]
+        store.add_chunks(chunks, rng.standard_normal((n, dim), dtype=np.float32))
+    return time.perf_counter() - start
+
+
+def run(rows: int, dim: int) -> None:
+    rng = np.random.default_rng(7)
+    directory = tempfile.mkdtemp()
+    try:
+        store = VectorStore(directory, dim=dim)
+        seconds = build(store, rows, dim, rng)
+        print(f"\n[{rows} 行 x {dim} 维] 写入 {seconds:.1f}s（{rows / seconds:.0f} 行/秒）")
+
+        queries = rng.standard_normal((_QUERIES, dim), dtype=np.float32)
+        for query in queries[:5]:
+            store.search_vectors(query, 10)  # 预热，页缓存
+
+        latencies = []
+        for query in queries:
+            t = time.perf_counter()
+            store.search_vectors(query, 10)
+            latencies.append((time.perf_counter() - t) * 1000)
+        latencies = np.asarray(latencies)
+        print(
+            f"  单条查询 top-10: p50 {np.percentile(latencies, 50):.1f}ms  "
+            f"p95 {np.percentile(latencies, 95):.1f}ms  p99 {np.percentile(latencies, 99):.1f}ms"
+        )
+
+        t = time.perf_counter()
+        store.search_vectors(queries[:_BATCH_QUERIES], 10)
+        batched = (time.perf_counter() - t) * 1000
+        print(f"  批量 {_BATCH_QUERIES} 条: {batched:.1f}ms（每条 {batched / _BATCH_QUERIES:.2f}ms）")
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main() -> None:
+    dim = int(sys.argv[1]) if len(sys.argv) > 1 else 384
+    sizes = [int(arg) for arg in sys.argv[2:]] or [100_000, 1_000_000]
+    for rows in sizes:
+        run(rows, dim)
+
+
+if __name__ == "__main__":
+    main()
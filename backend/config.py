@@ -20,6 +20,140 @@ class Config:
     # Development Configuration
     USE_MOCK_OPENAI: bool = False  # Set to True for testing without real API
     
+    # Upload / Streaming Configuration
+    UPLOAD_DIR: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
+    TEXT_STREAM_CHUNK_SIZE: int = 1 << 20  # 流式读取上传文件的分块大小（字符数）
+    
+    # Bulk Job Configuration
+    BULK_OUTPUT_DIR: str = os.path.join(UPLOAD_DIR, "bulk_results")
+    BULK_MAX_WORKERS: int = 16
+    
+    # Upstream Scheduling Configuration
+    UPSTREAM_MAX_CONCURRENCY: int = 12  # 同时进行的上游请求总数
+    UPSTREAM_PRIORITY_CLASSES: dict = {
+        # weight: 竞争时的份额权重；max_concurrency: 该类别的并发隔舱上限
+        "interactive": {"weight": 8, "max_concurrency": 8},
+        "action": {"weight": 4, "max_concurrency": 6},
+        "batch": {"weight": 1, "max_concurrency": 4},
+        "image": {"weight": 2, "max_concurrency": 3},
+    }
+    
+    # Async Job Queue Configuration
+    JOB_WORKERS: int = 4
+    JOB_RESULT_TTL: int = 3600  # 已完成任务结果保留时间（秒）
+    JOB_MAX_QUEUED: int = 1000
+    
+    # Code Sandbox Configuration
+    SANDBOX_WORKERS: int = 4              # 预先启动的沙箱进程数
+    SANDBOX_MAX_TASKS_PER_WORKER: int = 200  # 每个进程执行多少次后回收重建
+    SANDBOX_CPU_SECONDS: int = 2          # 单次执行的CPU时间上限
+    SANDBOX_MEMORY_MB: int = 256          # 单个进程可额外申请的内存上限
+    SANDBOX_WALL_TIMEOUT: float = 5.0     # 单次执行的墙钟时间上限（秒）
+    SANDBOX_USER: str = "nobody"          # 服务以 root 运行时沙箱进程切换到的非特权用户
+    
+    # Search Configuration
+    SEARCH_PROVIDER: str = "mock"  # mock: 模拟结果；local: 本地BM25索引（通过 /api/search/documents 写入语料后再切换）
+    DATA_DIR: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    SEARCH_INDEX_PATH: str = os.path.join(DATA_DIR, "search_index.db")
+    SEARCH_BM25_K1: float = 1.2
+    SEARCH_BM25_B: float = 0.75
+    SEARCH_MAX_SEGMENTS: int = 8  # 段数超过后自动合并
+    
+    # Knowledge Base Configuration
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
+    EMBEDDING_PROVIDER: str = "openai"    # openai / local（本地 CPU 模型）/ hash（哈希向量，离线测试）
+    EMBEDDING_LOCAL_MODEL: str = ""       # 本地 sentence-transformers 模型名，如 "BAAI/bge-small-zh-v1.5"
+    EMBEDDING_LOCAL_BATCH_SIZE: int = 64
+    EMBEDDING_BATCH_SIZE: int = 256       # 单次 embeddings 请求的最大文本条数
+    EMBEDDING_BATCH_TOKENS: int = 100000  # 单次 embeddings 请求的估算 token 上限
+    EMBEDDING_CONCURRENCY: int = 4        # 同时进行的 embeddings 请求数
+    EMBEDDING_CACHE_PATH: str = os.path.join(DATA_DIR, "embedding_cache.db")
+    EMBEDDING_CACHE_MAX_ROWS: int = 2000000
+    EMBEDDING_MEMORY_CACHE_SIZE: int = 10000
+    KB_VECTOR_DIR: str = os.path.join(DATA_DIR, "kb_vectors")
+    KB_SEARCH_BLOCK_ROWS: int = 65536     # 精确检索时每次矩阵乘法处理的行数
+    KB_ANN_INDEX: str = "ivf"             # ivf: 近似检索（行数达到 KB_ANN_MIN_ROWS 后训练）；exact: 始终精确检索
+    KB_ANN_MIN_ROWS: int = 50000
+    KB_ANN_NPROBE: int = 16               # 每次查询扫描的簇数，越大召回越高、延迟越高
+    KB_ANN_REPACK_ROWS: int = 20000       # 增量区达到该行数后重排
+    KB_QUANTIZATION: str = "none"         # none: float32；int8: 标量量化（内存 1/4）；pq: 乘积量化（默认 1/32）
+    KB_QUANT_MIN_ROWS: int = 10000        # 行数达到后训练量化器
+    KB_PQ_SUBVECTORS: int = 0             # PQ 段数，0 表示维度 / 8
+    KB_RERANK_FACTOR: int = 4             # 量化检索取前 k x 该倍数个候选用 float32 原向量重排，0 关闭
+    KB_LEXICAL_INDEX_PATH: str = os.path.join(KB_VECTOR_DIR, "lexical.db")
+    KB_HYBRID_CANDIDATES: int = 50        # 混合检索时每一路召回的候选数
+    KB_RRF_K: int = 60                    # 倒数排名融合的平滑常数
+    KB_FILTER_CACHE_SIZE: int = 64        # 缓存的元数据过滤掩码个数
+    KB_INGEST_MANIFEST_PATH: str = os.path.join(KB_VECTOR_DIR, "ingest_manifest.db")
+    KB_INGEST_SPOOL_DIR: str = os.path.join(DATA_DIR, "ingest_spool")
+    KB_INGEST_PROCESSES: int = 2          # 并行切分文件的进程数
+    KB_INGEST_BATCH: int = 1000           # 每批向量化并写入的 chunk 数
+    KB_CHUNK_MAX_CHARS: int = 800         # 单个 chunk 的最大字符数
+    
+    # Chat RAG Configuration
+    RAG_MAX_RESULTS: int = 5              # 聊天检索增强默认取回的 chunk 数
+    RAG_CONTEXT_TOKENS: int = 3000        # 注入上下文的估算 token 上限
+    RAG_MIN_CHUNK_TOKENS: int = 50        # 剩余预算不足该值时不再截断塞入下一个 chunk
+    UPSTREAM_WARMUP_IDLE: float = 4.0     # 上游连接空闲超过该秒数时，检索期间预先建立连接
+    
+    # Semantic Response Cache Configuration
+    SEMANTIC_CACHE_ENABLED: bool = False  # 聊天回答语义缓存（近似重复问题直接返回缓存回答）
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92  # 最后一条用户消息的余弦相似度阈值
+    SEMANTIC_CACHE_SIZE: int = 5000
+    SEMANTIC_CACHE_TTL: int = 24 * 3600   # 秒
+    SEMANTIC_CACHE_AUDIT_RATE: float = 0.05  # 语义命中中后台重新生成以审计误命中的比例
+    SEMANTIC_CACHE_AUDIT_MIN_SIMILARITY: float = 0.8  # 新旧回答相似度低于该值记为疑似误命中
+    
+    # Intent Classifier Configuration
+    INTENT_CONFIDENCE_THRESHOLD: float = 0.8  # 本地分类置信度低于该值时回退 LLM
+    INTENT_EMBEDDING: str = "hash"        # hash: 哈希 n-gram 向量（纯本地，亚毫秒）；service: embedding_service
+    INTENT_HASH_DIM: int = 1024
+    INTENT_CENTROID_TEMPERATURE: float = 0.05  # 质心相似度 softmax 的温度，越小置信度越集中
+    INTENT_LLM_MODEL: str = "gpt-4.1-nano"
+    INTENT_LLM_LABEL_MIN_CONFIDENCE: float = 0.7  # LLM 回退结果达到该置信度才记为训练标签
+    INTENT_LABELS_PATH: str = os.path.join(DATA_DIR, "intent_labels.db")
+    INTENT_CENTROIDS_PATH: str = os.path.join(DATA_DIR, "intent_centroids.npz")
+    INTENT_RETRAIN_INTERVAL: int = 3600   # 秒
+    INTENT_RETRAIN_MIN_LABELS: int = 20   # 新增 LLM 标签达到该数量才重新训练
+    INTENT_MAX_EXAMPLES_PER_LABEL: int = 2000
+    
+    # Action Selection Configuration
+    ACTION_SELECT_EMBEDDING: str = "hash"  # hash: 哈希 n-gram 向量（微秒级）；service: embedding_service
+    ACTION_SELECT_HASH_DIM: int = 1024
+    ACTION_SELECT_MIN_SCORE: float = 0.3  # 最高分低于该值视为有歧义
+    ACTION_SELECT_MARGIN: float = 0.08    # 最高分领先第二名不足该值视为有歧义
+    ACTION_SELECT_TOP_K: int = 3          # 有歧义时交给 LLM 裁决的候选数
+    ACTION_SELECT_LLM_MODEL: str = "gpt-4.1-nano"
+    
+    # Parameter Extraction Configuration
+    PARAM_EXTRACT_LLM_MODEL: str = "gpt-4.1-nano"  # 规则取不全必填参数时使用的模型
+    PARAM_EXTRACT_CACHE_SIZE: int = 5000
+    PARAM_EXTRACT_CACHE_TTL: int = 24 * 3600  # 秒
+    
+    # Todo Engine Configuration
+    TODO_MAX_CONCURRENT_STEPS: int = 4    # 单个待办运行同时执行的步骤数
+    TODO_DEPENDENCY_MIN_SHARED: int = 2   # 与前面步骤共享的关键词（字符二元组）达到该数量视为依赖
+    TODO_CONTEXT_CHARS: int = 2000        # 每个依赖步骤结果放入上下文的最大字符数
+    TODO_KB_RESULTS: int = 3              # LLM 步骤检索的知识库片段数
+    TODO_LLM_MAX_TOKENS: int = 2000
+    TODO_RUN_TTL: int = 3600              # 结束的运行保留时间（秒）
+    
+    # Action Registry Configuration
+    ACTION_LIBRARY_PATH: str = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "shared", "action-library.ts"
+    )
+    
+    # Action Result Cache Configuration
+    ACTION_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_KEY_TTL: int = 24 * 3600  # 秒
+    
+    # Sentiment Batch Configuration
+    SENTIMENT_BATCH_MAX_TOKENS: int = 3000  # 单批评论的估算输入token上限
+    SENTIMENT_BATCH_MAX_ITEMS: int = 50     # 单批评论条数上限
+    SENTIMENT_BATCH_CONCURRENCY: int = 4    # 同时进行的批次请求数
+    SENTIMENT_CACHE_SIZE: int = 100000
+    SENTIMENT_CACHE_TTL: int = 7 * 24 * 3600  # 秒
+    
     # CORS Configuration
     FRONTEND_URL: str = "http://localhost:5174"
     
@@ -4,14 +4,32 @@ Provides OpenAI API integration with secure API key management
 """
 import json
 import asyncio
-from typing import Dict, Any
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+import time
+from typing import Dict, Any, List, Optional
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from services.openai_service import openai_service
 from services.mock_openai_service import mock_openai_service
 from services.gpt_image_service import gpt_image_service
 from services.action_executor_service import action_executor_service
+from services.action_cache import action_result_cache
+from services.bulk_classification_service import bulk_classification_service
+from services.job_queue_service import job_queue_service, TERMINAL_STATUSES
+from services.sandbox_pool import sandbox_pool
+from services.search_service import get_local_search, get_search_provider
+from services.knowledge_base_service import knowledge_base_service
+from services.kb_ingestion_service import kb_ingestion_service
+from services.embedding_service import embedding_service
+from services.rag_service import normalize_options, rag_service
+from services.semantic_cache import is_error_chunk, semantic_cache
+from services.intent_classifier import intent_classifier_service
+from services.action_selector import action_selector_service
+from services.parameter_extractor import parameter_extractor_service
+from services.todo_engine import todo_engine
+from services.deadline import DeadlineMiddleware, deadline_scope
+from services.upstream_scheduler import current_priority_class, priority_scope, upstream_scheduler
 from config import config
 
 # FastAPI app initialization
@@ -30,33 +48,138 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求截止时间：X-Request-Deadline-Ms 请求头（请求体字段 deadline_ms 在各端点内处理）
+app.add_middleware(DeadlineMiddleware)
+
+@app.on_event("startup")
+async def warm_up_sandbox_pool():
+    """预先启动代码沙箱进程，避免首个自定义代码 Action 承担启动开销"""
+    await sandbox_pool.start()
+
+@app.on_event("startup")
+async def warm_up_local_classifiers():
+    """训练意图分类器质心、预先计算 Action 样例向量，首个请求不承担这部分开销"""
+    intent_classifier_service.start()
+    try:
+        await action_selector_service.build()
+    except Exception as e:
+        # 首次选择时会再次尝试建立索引
+        print(f"⚠️ Action 选择索引建立失败: {e}")
+
+@app.on_event("shutdown")
+async def stop_sandbox_pool():
+    sandbox_pool.shutdown()
+    kb_ingestion_service.shutdown()
+    intent_classifier_service.shutdown()
+
 # Pydantic models for request/response
 class ChatMessage(BaseModel):
     role: str
     content: str
 
+class RAGOptions(BaseModel):
+    enabled: bool = True
+    limit: Optional[int] = None  # 检索的 chunk 数，默认 RAG_MAX_RESULTS
+    source_ids: Optional[List[str]] = None  # 只检索这些知识源
+    mode: str = "hybrid"  # hybrid / vector / lexical
+    filters: Optional[Dict[str, Any]] = None
+    max_context_tokens: Optional[int] = None  # 上下文 token 预算，默认 RAG_CONTEXT_TOKENS
+
 class ChatRequest(BaseModel):
     messages: list[ChatMessage]
     temperature: float = 0.7
     max_tokens: int = 2000
     model: str = None  # 新增：支持指定模型
+    deadline_ms: Optional[int] = None  # 请求总预算（毫秒）
+    rag: Optional[RAGOptions] = None  # 由后端检索知识库并注入上下文
+    semantic_cache: bool = True  # SEMANTIC_CACHE_ENABLED 时是否允许返回近似问题的缓存回答
 
 class ImageGenerationRequest(BaseModel):
     prompt: str
     width: int = 1024
     height: int = 1024
+    deadline_ms: Optional[int] = None
 
 class ActionExecutionRequest(BaseModel):
     action_id: str
     action_name: str
     action_type: str
     parameters: Dict[str, Any]
+    deadline_ms: Optional[int] = None
+
+class BulkClassificationRequest(BaseModel):
+    input_file: str  # 相对上传目录的 CSV / JSONL 文件路径
+    text_field: str = "description"
+    id_field: Optional[str] = None
+    workers: int = 4
+    job_id: Optional[str] = None  # 字母、数字、_、-（最长64）；不指定时由输入文件推导，重复提交即续跑
+
+class JobSubmitRequest(BaseModel):
+    kind: str  # image | action | event_plan | event_mockup | kb_ingest
+    payload: Dict[str, Any]
+    priority: int = 5  # 数字越小越优先
+
+class SearchDocumentsRequest(BaseModel):
+    documents: List[Dict[str, Any]]  # [{'id', 'title', 'body', 'url', 'metadata'}]
+
+class SearchDeleteRequest(BaseModel):
+    ids: List[str]
+
+class KnowledgeChunksRequest(BaseModel):
+    chunks: List[Dict[str, Any]]  # [{'id', 'content', 'sourceId', 'sourceName', 'metadata', 'embedding'(可选)}]
+
+class KnowledgeDeleteRequest(BaseModel):
+    ids: List[str]
+
+class KnowledgeSearchRequest(BaseModel):
+    query: str
+    limit: int = 5
+    source_ids: Optional[List[str]] = None  # 只检索这些知识源
+    nprobe: Optional[int] = None  # IVF 每次扫描的簇数（召回/延迟权衡）
+    exact: bool = False  # 向量一路强制精确检索
+    mode: str = "hybrid"  # hybrid / vector / lexical
+    filters: Optional[Dict[str, Any]] = None  # 元数据过滤，如 {"sourceId": ["2"], "feedback_type": "游戏体验"}
+    rerank: Optional[int] = None  # 量化检索的重排倍数，默认 KB_RERANK_FACTOR，0 关闭
+
+class KnowledgeIndexRebuildRequest(BaseModel):
+    nlist: Optional[int] = None  # 簇数，默认 sqrt(行数)
+
+class KnowledgeIngestRequest(BaseModel):
+    files: List[Dict[str, Any]]  # [{"file_path": 上传目录内路径, "source_id", "source_name", "file_key"(可选)}]
+    priority: int = 5
+
+class IntentClassifyRequest(BaseModel):
+    message: str
+    allow_llm: bool = True  # 本地置信度不足时是否回退 LLM
+
+class ActionSelectRequest(BaseModel):
+    step_text: str
+    allow_llm: bool = True  # 候选有歧义时是否交给 LLM 裁决
+
+class ParameterExtractRequest(BaseModel):
+    action_id: str
+    text: str  # 步骤文本或用户的自然语言输入
+    user_input: str = ""  # 用户原始请求
+    context: str = ""  # 前置步骤结果
+    allow_llm: bool = True  # 规则取不全必填参数时是否调用 LLM
+
+class TodoRunRequest(BaseModel):
+    items: List[Dict[str, Any]]  # SimpleTodoItem 列表：id、text、taskType、userPrompt、order，可选 dependsOn
+    user_input: str = ""  # 用户原始请求
+    title: str = ""
+
+class TodoInputRequest(BaseModel):
+    step_id: str
+    response: str
 
 class ChatResponse(BaseModel):
     success: bool
     content: str = None
     error: str = None
     usage: Dict[str, int] = None
+    rag: Optional[Dict[str, Any]] = None  # 检索增强时：引用的片段、上下文 token 数、检索耗时
+    timing: Optional[Dict[str, float]] = None  # cache_ms / retrieval_ms / model_ms
+    cached: Optional[Dict[str, Any]] = None  # 语义缓存命中时：exact / similarity / matched_question
 
 # WebSocket connection manager
 class ConnectionManager:
@@ -87,6 +210,29 @@ async def health_check():
         "openai_configured": bool(config.OPENAI_API_KEY)
     }
 
+def _chat_regenerator(service, messages: List[Dict[str, str]], rag_options: Optional[Dict[str, Any]],
+                      temperature: float, max_tokens: int, model: Optional[str]):
+    """语义缓存误命中审计用：不经过缓存重新生成同一请求的回答"""
+    async def regenerate() -> Optional[str]:
+        augmented = messages
+        if rag_options is not None:
+            augmented, _ = await rag_service.prepare(messages, rag_options, service)
+        result = await service.get_chat_completion(
+            messages=augmented,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            model=model
+        )
+        return result["content"] if result["success"] else None
+    return regenerate
+
+def _cache_hit_info(lookup: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "exact": lookup["exact"],
+        "similarity": lookup["similarity"],
+        "matched_question": lookup["matched_question"]
+    }
+
 # Non-streaming chat endpoint
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat_completion(request: ChatRequest):
@@ -105,23 +251,55 @@ async def chat_completion(request: ChatRequest):
         # Get completion from service
         # 支持自定义模型，如果未指定则使用默认模型
         model = request.model if request.model else None
-        result = await service.get_chat_completion(
-            messages=formatted_messages,
-            temperature=request.temperature,
-            max_tokens=request.max_tokens,
-            model=model
-        )
+        rag_options = normalize_options(request.rag.dict() if request.rag else None)
+        rag_info = None
+        timing: Dict[str, float] = {}
+        with priority_scope("interactive"), deadline_scope(request.deadline_ms):
+            cache_lookup = None
+            if request.semantic_cache and semantic_cache.enabled:
+                cache_started = time.perf_counter()
+                cache_lookup = await semantic_cache.lookup(formatted_messages, model or service.model, rag_options)
+                timing["cache_ms"] = round((time.perf_counter() - cache_started) * 1000, 1)
+                if cache_lookup["hit"]:
+                    semantic_cache.audit(cache_lookup, _chat_regenerator(
+                        service, formatted_messages, rag_options, request.temperature, request.max_tokens, model
+                    ))
+                    return ChatResponse(
+                        success=True,
+                        content=cache_lookup["content"],
+                        usage={"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                        timing=timing,
+                        cached=_cache_hit_info(cache_lookup)
+                    )
+            
+            if rag_options is not None:
+                formatted_messages, rag_info = await rag_service.prepare(formatted_messages, rag_options, service)
+                timing["retrieval_ms"] = rag_info.get("retrieval_ms", 0.0)
+            model_started = time.perf_counter()
+            result = await service.get_chat_completion(
+                messages=formatted_messages,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens,
+                model=model
+            )
+            timing["model_ms"] = round((time.perf_counter() - model_started) * 1000, 1)
         
         if result["success"]:
+            if cache_lookup is not None:
+                semantic_cache.store(cache_lookup, result["content"])
             return ChatResponse(
                 success=True,
                 content=result["content"],
-                usage=result["usage"]
+                usage=result["usage"],
+                rag=rag_info,
+                timing=timing
             )
         else:
             return ChatResponse(
                 success=False,
-                error=result["error"]
+                error=result["error"],
+                rag=rag_info,
+                timing=timing
             )
             
     except Exception as e:
@@ -138,6 +316,9 @@ async def websocket_chat_endpoint(websocket: WebSocket):
     """
     await manager.connect(websocket)
     
+    # 聊天请求优先于 Action、批量和图像任务获得上游槽位
+    current_priority_class.set("interactive")
+    
     try:
         while True:
             # Receive message from client
@@ -161,8 +342,57 @@ async def websocket_chat_endpoint(websocket: WebSocket):
             # Format messages for API
             formatted_messages = service.format_messages(messages)
             
-            # Send start streaming signal
+            timing: Dict[str, float] = {}
+            # rag 与 /api/chat 一样校验：布尔值或 RAGOptions 字典，其他值返回错误事件，不中断连接
+            rag = message_data.get("rag")
+            try:
+                if isinstance(rag, dict):
+                    rag = RAGOptions(**rag).dict()
+                elif rag is not None and not isinstance(rag, bool):
+                    raise ValueError(f"rag 必须是布尔值或选项对象，收到 {type(rag).__name__}")
+            except ValueError as e:  # 包括 pydantic 的 ValidationError
+                await manager.send_message(websocket, {"type": "error", "message": f"rag 参数无效: {str(e)}"})
+                continue
+            rag_options = normalize_options(rag)
             service_name = "Mock GPT-5" if config.USE_MOCK_OPENAI else f"Compass {config.OPENAI_MODEL}"
+            
+            # 语义缓存：近似问题直接以单个 chunk 返回缓存的回答
+            cache_lookup = None
+            if message_data.get("semantic_cache", True) and semantic_cache.enabled:
+                cache_started = time.perf_counter()
+                cache_lookup = await semantic_cache.lookup(formatted_messages, service.model, rag_options)
+                timing["cache_ms"] = round((time.perf_counter() - cache_started) * 1000, 1)
+                if cache_lookup["hit"]:
+                    semantic_cache.audit(cache_lookup, _chat_regenerator(
+                        service, formatted_messages, rag_options, temperature, max_tokens, None
+                    ))
+                    await manager.send_message(websocket, {
+                        "type": "stream_start",
+                        "message": f"Starting cached response from {service_name}..."
+                    })
+                    await manager.send_message(websocket, {
+                        "type": "stream_chunk",
+                        "content": cache_lookup["content"]
+                    })
+                    await manager.send_message(websocket, {
+                        "type": "stream_complete",
+                        "message": "Response completed",
+                        "full_response": cache_lookup["content"],
+                        "timing": timing,
+                        "cached": _cache_hit_info(cache_lookup)
+                    })
+                    continue
+            
+            # 检索增强：检索期间后台建立上游连接，检索结果先于流式回答发给客户端
+            if rag_options is not None:
+                formatted_messages, rag_info = await rag_service.prepare(formatted_messages, rag_options, service)
+                timing["retrieval_ms"] = rag_info.get("retrieval_ms", 0.0)
+                await manager.send_message(websocket, {
+                    "type": "rag_context",
+                    **rag_info
+                })
+            
+            # Send start streaming signal
             await manager.send_message(websocket, {
                 "type": "stream_start",
                 "message": f"Starting response from {service_name}..."
@@ -170,12 +400,17 @@ async def websocket_chat_endpoint(websocket: WebSocket):
             
             # Stream response from service
             full_response = ""
+            stream_failed = False
+            model_started = time.perf_counter()
             async for chunk in service.stream_chat_completion(
                 messages=formatted_messages,
                 temperature=temperature,
                 max_tokens=max_tokens
             ):
+                if not full_response:
+                    timing["first_token_ms"] = round((time.perf_counter() - model_started) * 1000, 1)
                 full_response += chunk
+                stream_failed = stream_failed or is_error_chunk(chunk)
                 
                 # Send chunk to client
                 await manager.send_message(websocket, {
@@ -186,11 +421,16 @@ async def websocket_chat_endpoint(websocket: WebSocket):
                 # Small delay to prevent overwhelming the client
                 await asyncio.sleep(0.01)
             
+            # 流中途出错时只有部分回答，不写入缓存
+            if cache_lookup is not None and not stream_failed:
+                semantic_cache.store(cache_lookup, full_response)
+            
             # Send completion signal
             await manager.send_message(websocket, {
                 "type": "stream_complete",
                 "message": "Response completed",
-                "full_response": full_response
+                "full_response": full_response,
+                "timing": {**timing, "model_ms": round((time.perf_counter() - model_started) * 1000, 1)}
             })
             
     except WebSocketDisconnect:
@@ -243,11 +483,12 @@ async def test_openai():
 async def generate_image(request: ImageGenerationRequest):
     """生成图像API端点"""
     try:
-        result = await gpt_image_service.generate_image(
-            prompt=request.prompt,
-            width=request.width,
-            height=request.height
-        )
+        with deadline_scope(request.deadline_ms):
+            result = await gpt_image_service.generate_image(
+                prompt=request.prompt,
+                width=request.width,
+                height=request.height
+            )
         return result
     except Exception as e:
         return {
@@ -256,15 +497,20 @@ async def generate_image(request: ImageGenerationRequest):
         }
 
 @app.post("/api/execute-action")
-async def execute_action(request: ActionExecutionRequest):
-    """执行Action API端点"""
+async def execute_action(
+    request: ActionExecutionRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """执行Action API端点（支持 Idempotency-Key 请求头防止重复提交）"""
     try:
-        result = await action_executor_service.execute_action(
-            action_id=request.action_id,
-            action_name=request.action_name,
-            action_type=request.action_type,
-            parameters=request.parameters
-        )
+        with deadline_scope(request.deadline_ms):
+            result = await action_executor_service.execute_action(
+                action_id=request.action_id,
+                action_name=request.action_name,
+                action_type=request.action_type,
+                parameters=request.parameters,
+                idempotency_key=idempotency_key
+            )
         return result
     except Exception as e:
         return {
@@ -272,6 +518,429 @@ async def execute_action(request: ActionExecutionRequest):
             "error": f"执行Action失败: {str(e)}"
         }
 
+@app.post("/api/execute-action/stream")
+async def execute_action_stream(
+    request: ActionExecutionRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """
+    流式执行Action（Server-Sent Events）
+    
+    依次推送 queued、started、upstream_request_sent、first_token、partial_result、done 事件，
+    每个事件带 timestamp 和 elapsed_ms；done 事件带最终结果和延迟分解
+    """
+    async def event_source():
+        async for event in action_executor_service.execute_action_stream(
+            action_id=request.action_id,
+            action_name=request.action_name,
+            action_type=request.action_type,
+            parameters=request.parameters,
+            idempotency_key=idempotency_key,
+            deadline_ms=request.deadline_ms
+        ):
+            yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/ws/execute-action")
+async def websocket_execute_action(websocket: WebSocket):
+    """
+    WebSocket 流式执行Action：每条消息是一个 ActionExecutionRequest，
+    服务端推送该次执行的进度事件，以 done 事件结束，连接可继续复用
+    """
+    await websocket.accept()
+    try:
+        while True:
+            data = await websocket.receive_text()
+            try:
+                request = ActionExecutionRequest(**json.loads(data))
+            except Exception as e:
+                await websocket.send_text(json.dumps({"type": "error", "message": f"请求格式错误: {str(e)}"}, ensure_ascii=False))
+                continue
+
+            events = action_executor_service.execute_action_stream(
+                action_id=request.action_id,
+                action_name=request.action_name,
+                action_type=request.action_type,
+                parameters=request.parameters,
+                deadline_ms=request.deadline_ms
+            )
+            try:
+                async for event in events:
+                    await websocket.send_text(json.dumps(event, ensure_ascii=False))
+            finally:
+                await events.aclose()
+    except WebSocketDisconnect:
+        print("Client disconnected from action WebSocket")
+
+@app.get("/api/actions/cache-stats")
+async def get_action_cache_stats():
+    """Action结果缓存命中率与合并执行统计"""
+    return {"success": True, "data": action_result_cache.stats()}
+
+@app.get("/api/scheduler/stats")
+async def get_scheduler_stats():
+    """各优先级类别的并发占用和排队等待时间"""
+    return {"success": True, "data": upstream_scheduler.stats()}
+
+@app.get("/api/sandbox/stats")
+async def get_sandbox_stats():
+    """代码沙箱进程池的执行次数、超时、回收和平均耗时"""
+    return {"success": True, "data": sandbox_pool.stats()}
+
+@app.get("/api/search")
+async def search(q: str, max_results: int = 10):
+    """使用当前配置的搜索服务检索（与 google_search Action 相同）"""
+    try:
+        provider = get_search_provider()
+        found = await provider.search(q, max_results=max_results)
+        return {"success": True, "data": {**found, "query": q, "provider": provider.name}}
+    except Exception as e:
+        return {"success": False, "error": f"搜索失败: {str(e)}"}
+
+@app.post("/api/search/documents")
+async def add_search_documents(request: SearchDocumentsRequest):
+    """向本地索引添加或替换文档（按 id 去重）"""
+    missing = [i for i, doc in enumerate(request.documents) if not doc.get("id")]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"文档缺少 id 字段: 第 {missing[:10]} 条")
+    result = await get_local_search().add_documents(request.documents)
+    return {"success": True, "data": result}
+
+@app.delete("/api/search/documents")
+async def delete_search_documents(request: SearchDeleteRequest):
+    """从本地索引删除文档"""
+    deleted = await get_local_search().delete_documents(request.ids)
+    return {"success": True, "data": {"deleted": deleted}}
+
+@app.post("/api/search/compact")
+async def compact_search_index():
+    """合并索引段并清理已删除文档"""
+    return {"success": True, "data": await get_local_search().compact()}
+
+@app.get("/api/search/stats")
+async def get_search_stats():
+    """本地索引的文档数、词项数、段数"""
+    return {"success": True, "data": get_local_search().stats()}
+
+@app.post("/api/kb/chunks")
+async def add_knowledge_chunks(request: KnowledgeChunksRequest):
+    """向知识库写入或替换 chunk（后端向量化）"""
+    result = await knowledge_base_service.add_chunks(request.chunks)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return {"success": True, "data": {"added": result["added"], "replaced": result["replaced"]}}
+
+@app.delete("/api/kb/chunks")
+async def delete_knowledge_chunks(request: KnowledgeDeleteRequest):
+    """从知识库删除 chunk"""
+    result = await knowledge_base_service.delete_chunks(request.ids)
+    return {"success": True, "data": {"deleted": result["deleted"]}}
+
+@app.post("/api/kb/search")
+async def search_knowledge_base(request: KnowledgeSearchRequest):
+    """知识库检索（默认 BM25 + 向量混合），返回前端 SearchResult 格式"""
+    result = await knowledge_base_service.search(
+        request.query,
+        request.limit,
+        request.source_ids,
+        nprobe=request.nprobe,
+        exact=request.exact,
+        mode=request.mode,
+        filters=request.filters,
+        rerank=request.rerank
+    )
+    if not result["success"]:
+        return {"success": False, "error": result["error"]}
+    data = {"results": result["results"], "query": request.query, "mode": result["mode"]}
+    if result.get("degraded"):
+        data["degraded"] = True
+    return {"success": True, "data": data}
+
+@app.post("/api/kb/index/rebuild")
+async def rebuild_knowledge_index(request: KnowledgeIndexRebuildRequest):
+    """重新训练知识库的 IVF 近似检索索引"""
+    result = await knowledge_base_service.rebuild_index(request.nlist)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return {"success": True, "data": {k: v for k, v in result.items() if k != "success"}}
+
+@app.post("/api/kb/ingest")
+async def ingest_knowledge_files(request: KnowledgeIngestRequest):
+    """提交知识库文件入库任务（切分、向量化，未变化的 chunk 跳过），进度通过 /api/jobs/{job_id} 查询"""
+    prepared = kb_ingestion_service.prepare_files(request.files)
+    if not prepared["success"]:
+        raise HTTPException(status_code=400, detail=prepared["error"])
+    return job_queue_service.submit("kb_ingest", {"files": request.files}, request.priority)
+
+@app.get("/api/kb/sources")
+async def get_knowledge_sources():
+    """各知识源已入库的文件数和 chunk 数"""
+    return {"success": True, "data": await asyncio.to_thread(kb_ingestion_service.sources)}
+
+@app.get("/api/kb/stats")
+async def get_knowledge_base_stats():
+    """知识库 chunk 数、向量维度和文件大小"""
+    return {"success": True, "data": knowledge_base_service.stats()}
+
+@app.post("/api/classify-intent")
+async def classify_intent(request: IntentClassifyRequest):
+    """
+    意图分类：关键词字典树 + 向量最近质心，本地置信度不足时才回退 LLM
+
+    返回结构与前端 IntentResult 相同，另有 source（keyword / centroid / llm）和 latency_ms
+    """
+    try:
+        result = await intent_classifier_service.classify(request.message, allow_llm=request.allow_llm)
+        return {"success": True, "data": result}
+    except Exception as e:
+        return {"success": False, "error": f"Server error: {str(e)}"}
+
+@app.post("/api/classify-intent/retrain")
+async def retrain_intent_classifier():
+    """用种子样例和已记录的 LLM 回退标签立即重新计算质心"""
+    try:
+        return {"success": True, "data": await intent_classifier_service.train()}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@app.get("/api/classify-intent/stats")
+async def get_intent_classifier_stats():
+    """各层命中比例、LLM 回退率、本地路径 p50/p99 延迟"""
+    return {"success": True, "data": intent_classifier_service.stats()}
+
+@app.post("/api/select-action")
+async def select_action(request: ActionSelectRequest):
+    """
+    为待办步骤选择 Action：按预先向量化的 Action 描述和样例排序，候选有歧义时才交给 LLM
+
+    action_id 为 None 表示步骤不需要工具，直接由 LLM 处理
+    """
+    try:
+        return {"success": True, "data": await action_selector_service.select(request.step_text, request.allow_llm)}
+    except Exception as e:
+        return {"success": False, "error": f"Server error: {str(e)}"}
+
+@app.get("/api/select-action/stats")
+async def get_action_selector_stats():
+    """不经过 LLM 直接选定的步骤比例和排序延迟"""
+    return {"success": True, "data": action_selector_service.stats()}
+
+@app.post("/api/extract-parameters")
+async def extract_parameters(request: ParameterExtractRequest):
+    """
+    提取 Action 参数：先用由参数定义编译的规则，必填参数取不全时才调用 LLM（结果缓存）
+
+    source 为 rules / cache / llm / fallback
+    """
+    try:
+        result = await parameter_extractor_service.extract(
+            request.action_id,
+            request.text,
+            user_input=request.user_input,
+            context=request.context,
+            allow_llm=request.allow_llm
+        )
+        if not result["success"]:
+            return result
+        result.pop("success")
+        return {"success": True, "data": result}
+    except Exception as e:
+        return {"success": False, "error": f"Server error: {str(e)}"}
+
+@app.get("/api/extract-parameters/stats")
+async def get_parameter_extractor_stats():
+    """各 Action 的规则命中率、LLM 调用数和估算节省的 LLM 耗时"""
+    return {"success": True, "data": parameter_extractor_service.stats()}
+
+@app.post("/api/todo/runs")
+async def start_todo_run(request: TodoRunRequest):
+    """
+    在后端执行待办列表：推断步骤依赖，独立步骤并发执行，立即返回 run_id 和依赖图
+
+    通过 /ws/todo/{run_id} 订阅进度
+    """
+    return todo_engine.start(request.items, user_input=request.user_input, title=request.title)
+
+@app.get("/api/todo/runs/{run_id}")
+async def get_todo_run(run_id: str):
+    """查询待办运行的步骤状态和结果"""
+    run = todo_engine.get(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail=f"运行不存在或已过期: {run_id}")
+    return {"success": True, "data": run.to_dict()}
+
+@app.post("/api/todo/runs/{run_id}/input")
+async def submit_todo_input(run_id: str, request: TodoInputRequest):
+    """提交 user_input 步骤的用户回复，只恢复依赖该步骤的分支"""
+    return await todo_engine.submit_input(run_id, request.step_id, request.response)
+
+@app.post("/api/todo/runs/{run_id}/steps/{step_id}/retry")
+async def retry_todo_step(run_id: str, step_id: str):
+    """重新执行失败的步骤"""
+    return todo_engine.retry(run_id, step_id)
+
+@app.delete("/api/todo/runs/{run_id}")
+async def cancel_todo_run(run_id: str):
+    """取消待办运行中的全部步骤"""
+    run = await todo_engine.cancel(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail=f"运行不存在或已过期: {run_id}")
+    return {"success": True, "data": run.to_dict()}
+
+@app.get("/api/todo/stats")
+async def get_todo_stats():
+    """待办运行数、已执行步骤数和并发执行节省的时间"""
+    return {"success": True, "data": todo_engine.stats()}
+
+async def _receive_todo_commands(websocket: WebSocket, run_id: str):
+    """处理客户端在待办订阅连接上发来的命令：user_input、retry、cancel；连接断开时返回"""
+    while True:
+        try:
+            data = await websocket.receive_text()
+        except WebSocketDisconnect:
+            return
+        try:
+            command = json.loads(data)
+            if command.get("type") == "user_input":
+                result = await todo_engine.submit_input(run_id, command["step_id"], command["response"])
+            elif command.get("type") == "retry":
+                result = todo_engine.retry(run_id, command["step_id"])
+            elif command.get("type") == "cancel":
+                await todo_engine.cancel(run_id)
+                result = {"success": True}
+            else:
+                result = {"success": False, "error": f"不支持的命令: {command.get('type')}"}
+        except Exception as e:
+            result = {"success": False, "error": f"命令格式错误: {str(e)}"}
+        if not result["success"]:
+            await websocket.send_text(json.dumps({"type": "error", "message": result["error"]}, ensure_ascii=False))
+
+@app.websocket("/ws/todo/{run_id}")
+async def websocket_todo_endpoint(websocket: WebSocket, run_id: str):
+    """
+    WebSocket 订阅待办运行：先推送当前快照，再推送 step_started、step_action_selected、
+    waiting_input、follow_up、step_succeeded、step_failed、step_blocked 和 run_* 事件；
+    客户端可在同一连接上发送 {"type": "user_input", "step_id", "response"}、
+    {"type": "retry", "step_id"} 或 {"type": "cancel"}。运行成功或取消后关闭连接
+    """
+    await websocket.accept()
+    run = todo_engine.get(run_id)
+    if not run:
+        await websocket.send_text(json.dumps({"type": "error", "message": f"运行不存在或已过期: {run_id}"}, ensure_ascii=False))
+        await websocket.close()
+        return
+
+    queue = todo_engine.subscribe(run_id)
+    receiver = asyncio.create_task(_receive_todo_commands(websocket, run_id))
+    try:
+        await websocket.send_text(json.dumps({"type": "snapshot", "run": run.to_dict()}, ensure_ascii=False))
+        while not run.finished or not queue.empty():
+            next_event = asyncio.ensure_future(queue.get())
+            await asyncio.wait({next_event, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                # 客户端断开
+                next_event.cancel()
+                break
+            await websocket.send_text(json.dumps(next_event.result(), ensure_ascii=False, default=str))
+        else:
+            await websocket.close()
+    except WebSocketDisconnect:
+        print(f"Client disconnected from todo WebSocket: {run_id}")
+    finally:
+        receiver.cancel()
+        todo_engine.unsubscribe(run_id, queue)
+
+@app.get("/api/chat/cache-stats")
+async def get_chat_cache_stats():
+    """聊天语义缓存的命中率和误命中审计结果"""
+    return {"success": True, "data": semantic_cache.stats()}
+
+@app.get("/api/embeddings/stats")
+async def get_embedding_stats():
+    """embedding 提供方、缓存命中率、上游请求数和平均批大小"""
+    return {"success": True, "data": embedding_service.stats()}
+
+@app.post("/api/jobs")
+async def submit_job(request: JobSubmitRequest):
+    """提交异步任务，立即返回 job_id"""
+    return job_queue_service.submit(request.kind, request.payload, request.priority)
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查询异步任务状态和结果"""
+    job = job_queue_service.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"任务不存在或已过期: {job_id}")
+    return {"success": True, "data": job.to_dict()}
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """取消排队中或运行中的异步任务"""
+    job = await job_queue_service.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"任务不存在或已过期: {job_id}")
+    return {"success": True, "data": job.to_dict()}
+
+@app.websocket("/ws/jobs/{job_id}")
+async def websocket_job_endpoint(websocket: WebSocket, job_id: str):
+    """
+    WebSocket 订阅异步任务：先推送当前状态，再推送进度事件，任务结束后关闭
+    """
+    await websocket.accept()
+    job = job_queue_service.get(job_id)
+    if not job:
+        await websocket.send_text(json.dumps({"type": "error", "message": f"任务不存在或已过期: {job_id}"}))
+        await websocket.close()
+        return
+
+    queue = job_queue_service.subscribe(job_id)
+    try:
+        # 快照已包含结果时直接结束；否则一直转发到最终状态事件发出为止，
+        # 不能只看 job.done，任务可能在发送上一条事件时结束
+        finished = job.done
+        await websocket.send_text(json.dumps({"type": "snapshot", "job": job.to_dict(include_result=finished)}, ensure_ascii=False))
+        while not finished:
+            event = await queue.get()
+            await websocket.send_text(json.dumps(event, ensure_ascii=False))
+            finished = event["type"] in TERMINAL_STATUSES
+        await websocket.close()
+    except WebSocketDisconnect:
+        print(f"Client disconnected from job WebSocket: {job_id}")
+    finally:
+        job_queue_service.unsubscribe(job_id, queue)
+
+@app.post("/api/bulk/game-classification")
+async def start_bulk_game_classification(request: BulkClassificationRequest):
+    """启动或续跑批量游戏分类任务"""
+    return await bulk_classification_service.start_job(
+        input_file=request.input_file,
+        text_field=request.text_field,
+        id_field=request.id_field,
+        workers=request.workers,
+        job_id=request.job_id
+    )
+
+@app.get("/api/bulk/jobs/{job_id}")
+async def get_bulk_job(job_id: str):
+    """查询批量任务进度（吞吐量、ETA）"""
+    job = bulk_classification_service.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    return {"success": True, "data": job}
+
+@app.delete("/api/bulk/jobs/{job_id}")
+async def cancel_bulk_job(job_id: str):
+    """停止批量任务，检查点保留以便续跑"""
+    job = await bulk_classification_service.cancel_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    return {"success": True, "data": job}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -290,6 +959,8 @@ class EventPlanningRequest(BaseModel):
     targetPlayer: str
     targetPlayerCustom: str = ""
     targetRegion: str
+    deadline_ms: Optional[int] = None  # 超时后返回不带mockup的策划案
+    mockup_mode: str = "inline"  # inline: 与策划案并发生成一起返回；separate: 策划案先返回，mockup 作为异步任务交付
 
 @app.post("/api/generate-event-plan")
 async def generate_event_plan(request: EventPlanningRequest):
@@ -307,7 +978,8 @@ async def generate_event_plan(request: EventPlanningRequest):
             'targetRegion': request.targetRegion
         }
         
-        result = await event_planning_service.generate_event_plan(form_data)
+        with deadline_scope(request.deadline_ms):
+            result = await event_planning_service.generate_event_plan(form_data, request.mockup_mode)
         return result
         
     except Exception as e:
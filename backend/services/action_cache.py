@@ -0,0 +1,198 @@
+"""
+Action 结果缓存
+
+位于 ActionExecutorService.execute_action 之前：
+1. 结果缓存：键为 Action ID + 规范化参数，每类 Action 有独立的可缓存判断和 TTL
+2. 合并执行：相同键的并发请求只执行一次，其余等待同一结果
+3. 幂等键：客户端携带 Idempotency-Key 时，重复提交直接返回首次执行的结果
+"""
+import asyncio
+import copy
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from config import config
+from .action_registry import canonical_action_id
+from .cache_utils import TTLCache
+
+
+def _always(parameters: Dict[str, Any]) -> bool:
+    return True
+
+
+def _text_processor_cacheable(parameters: Dict[str, Any]) -> bool:
+    # 上传文件内容可能被覆盖，只缓存直接传入文本的结果
+    return not parameters.get('file_path')
+
+
+def _datetime_cacheable(parameters: Dict[str, Any]) -> bool:
+    # now 以及默认与当前时间比较的 diff 依赖调用时刻，不能缓存
+    operation = parameters.get('operation', 'now')
+    if operation == 'now':
+        return False
+    if operation == 'diff' and not parameters.get('compare_to') and not parameters.get('dates'):
+        return False
+    return True
+
+
+def _no_failed_items(result: Dict[str, Any]) -> bool:
+    # 批量结果中有条目失败（多为上游暂时不可用）时不缓存，重试才能拿到新结果
+    return not (result.get('data') or {}).get('failed')
+
+
+# Action ID -> (是否可缓存, TTL 秒)
+# 未列出的 Action（如图像生成）不缓存
+ACTION_CACHE_POLICIES: Dict[str, Tuple[Callable[[Dict[str, Any]], bool], float]] = {
+    # 确定性计算：结果只取决于参数
+    'calculator': (_always, 24 * 3600),
+    'json_processor': (_always, 24 * 3600),
+    'text_processor': (_text_processor_cacheable, 24 * 3600),
+    'datetime_processor': (_datetime_cacheable, 24 * 3600),
+
+    # 低温度 LLM 任务：短时间内重复执行没有意义
+    'sentiment_analysis': (_always, 3600),
+    'game_classification': (_always, 3600),
+
+    # 搜索结果会变化，只做短时缓存
+    'google_search': (_always, 300),
+}
+
+# Action ID -> 执行结果是否可写入缓存（未列出的 Action 只要求 success）
+ACTION_RESULT_CHECKS: Dict[str, Callable[[Dict[str, Any]], bool]] = {
+    'sentiment_analysis': _no_failed_items,
+}
+
+
+def _normalize(value: Any) -> Any:
+    """规范化参数值：去掉 None、整数值浮点数转为整数，字典按键排序由 json.dumps 完成"""
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def make_cache_key(action_id: str, parameters: Dict[str, Any]) -> str:
+    """Action ID + 规范化参数 -> 缓存键"""
+    canonical = json.dumps(
+        _normalize(parameters),
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(',', ':')
+    )
+    return hashlib.sha256(f"{canonical_action_id(action_id)}\n{canonical}".encode('utf-8')).hexdigest()
+
+
+class ActionResultCache:
+    """Action 结果缓存、并发合并与幂等键管理"""
+
+    def __init__(self):
+        self.results = TTLCache(maxsize=config.ACTION_CACHE_SIZE)
+        self.idempotency = TTLCache(maxsize=config.ACTION_CACHE_SIZE, ttl=config.IDEMPOTENCY_KEY_TTL)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def policy_for(self, action_id: str, parameters: Dict[str, Any]) -> Optional[float]:
+        """返回该次调用的缓存 TTL；不可缓存时返回 None"""
+        policy = ACTION_CACHE_POLICIES.get(canonical_action_id(action_id))
+        if not policy:
+            return None
+        cacheable, ttl = policy
+        return ttl if cacheable(parameters) else None
+
+    def result_cacheable(self, action_id: str, result: Dict[str, Any]) -> bool:
+        """按 Action 的结果检查判断成功的结果能否写入缓存"""
+        check = ACTION_RESULT_CHECKS.get(canonical_action_id(action_id))
+        return check(result) if check else True
+
+    async def get_or_execute(
+        self,
+        action_id: str,
+        parameters: Dict[str, Any],
+        execute: Callable[[], Awaitable[Dict[str, Any]]],
+        idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        命中缓存或幂等记录时直接返回，否则执行并按策略写入缓存
+
+        Args:
+            action_id: Action ID
+            parameters: 执行参数
+            execute: 实际执行 Action 的协程函数
+            idempotency_key: 客户端提供的幂等键（可选）
+        """
+        cache_key = make_cache_key(action_id, parameters)
+
+        if idempotency_key:
+            recorded = self.idempotency.get(idempotency_key)
+            if recorded is not None:
+                recorded_key, result = recorded
+                if recorded_key != cache_key:
+                    return {
+                        "success": False,
+                        "error": "Idempotency-Key 已用于不同的 Action 请求"
+                    }
+                return self._mark_cached(result, "idempotency")
+
+        ttl = self.policy_for(action_id, parameters)
+        if ttl is not None:
+            cached = self.results.get(cache_key)
+            if cached is not None:
+                return self._mark_cached(cached, "result")
+
+        # 同一请求正在执行中：等待它的结果
+        # 不可缓存的请求只有携带相同幂等键时才合并
+        inflight_key = cache_key if ttl is not None else (f"idem:{idempotency_key}" if idempotency_key else None)
+        if inflight_key and inflight_key in self._inflight:
+            self.coalesced += 1
+            result = await asyncio.shield(self._inflight[inflight_key])
+            return self._mark_cached(result, "coalesced")
+
+        future: Optional[asyncio.Future] = None
+        if inflight_key:
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[inflight_key] = future
+
+        try:
+            self.executions += 1
+            result = await execute()
+        except BaseException as e:
+            if future:
+                # 等待者拿到失败结果，异常只在发起执行的请求中抛出
+                future.set_result({"success": False, "error": f"合并执行的请求失败: {str(e) or type(e).__name__}"})
+            raise
+        finally:
+            if inflight_key:
+                self._inflight.pop(inflight_key, None)
+
+        if future:
+            future.set_result(result)
+        if result.get("success"):
+            if ttl is not None and self.result_cacheable(action_id, result):
+                self.results.set(cache_key, result, ttl=ttl)
+            if idempotency_key:
+                self.idempotency.set(idempotency_key, (cache_key, result))
+        return result
+
+    def _mark_cached(self, result: Dict[str, Any], source: str) -> Dict[str, Any]:
+        marked = copy.deepcopy(result)
+        marked["cached"] = True
+        marked["cache_source"] = source
+        return marked
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "results": self.results.stats(),
+            "idempotency_keys": len(self.idempotency),
+            "inflight": len(self._inflight),
+            "executions": self.executions,
+            "coalesced": self.coalesced
+        }
+
+
+# 创建全局实例
+action_result_cache = ActionResultCache()
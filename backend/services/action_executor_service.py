@@ -12,64 +12,165 @@ Action执行服务 - 重构版本
 - 统一的错误处理和日志记录
 - 安全执行（代码沙箱、参数验证）
 """
+import asyncio
 import json
 import math
 import re
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional
+from typing import AsyncGenerator, Dict, Any, Iterable, Iterator, List, Optional
+import numpy as np
+from config import config
+from .action_cache import action_result_cache
+from .action_progress import ProgressStream, emit_progress, progress_scope
+from .action_registry import action_registry, canonical_action_id
+from .cache_utils import TTLCache, content_hash
+from .datetime_bulk import (
+    BUCKET_TYPES, DEFAULT_OUTPUT_FORMAT, DIFF_UNITS,
+    bucket_column, coerce_column, cohort_table, diff_column, format_column, parse_column, parse_single,
+    to_timestamp, utc_now
+)
+from .deadline import DeadlineExceeded, deadline_scope, with_deadline
 from .gpt_image_service import gpt_image_service
 from .openai_service import openai_service
+from .sandbox_pool import sandbox_pool
+from .search_service import get_search_provider
+from .text_analytics import analyze_chunks, estimate_tokens, iter_file_chunks, resolve_upload_path
+from .upstream_scheduler import priority_scope
+
+# 情感标签中文翻译
+SENTIMENT_CN = {
+    'positive': '正面',
+    'negative': '负面',
+    'neutral': '中性'
+}
+
+WEEKDAY_CN = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+
+# 处理函数名不是 _execute_<id> 的 Action
+HANDLER_METHODS = {
+    'gpt_image_gen': '_execute_image_generation',
+}
 
 class ActionExecutorService:
     """Action执行服务 - 统一管理所有 Action 的执行"""
 
     def __init__(self):
         """初始化Action执行服务"""
-        # 定义 Action ID 到执行函数的映射
-        self.action_handlers = {
-            # 代码执行类
-            'calculator': self._execute_calculator,
-            'text_processor': self._execute_text_processor,
-            'json_processor': self._execute_json_processor,
-            'datetime_processor': self._execute_datetime_processor,
-            
-            # API调用类
-            'google_search': self._execute_google_search,
-            
-            # LLM任务类
-            'sentiment_analysis': self._execute_sentiment_analysis,
-            'game_classification': self._execute_game_classification,
-            
-            # 图像生成类
-            'gpt_image_gen': self._execute_image_generation,
-            
-            # 其他（兼容旧版本）
-            '4': self._execute_image_generation,  # 旧版本的图像生成ID
-            '8': self._execute_calculator,
-            '9': self._execute_text_processor,
-            '10': self._execute_json_processor,
-            '11': self._execute_datetime_processor,
-        }
+        # Action ID 到执行函数的映射，由 Action 库生成的注册表决定有哪些 Action；
+        # 处理函数按 _execute_<id> 命名，例外在 HANDLER_METHODS 中声明
+        self.action_handlers = {}
+        for spec in action_registry:
+            handler = getattr(self, HANDLER_METHODS.get(spec.id, f"_execute_{spec.id}"), None)
+            if handler:
+                self.action_handlers[spec.id] = handler
+        
+        # 情感分析结果缓存：内容哈希 -> 分析结果
+        self.sentiment_cache = TTLCache(
+            maxsize=config.SENTIMENT_CACHE_SIZE,
+            ttl=config.SENTIMENT_CACHE_TTL
+        )
 
     async def execute_action(
         self,
         action_id: str,
         action_name: str,
         action_type: str,
-        parameters: Dict[str, Any]
+        parameters: Dict[str, Any],
+        idempotency_key: Optional[str] = None
     ) -> Dict[str, Any]:
         """
-        执行指定的Action
+        执行指定的Action（经过结果缓存）
         
         Args:
             action_id: Action ID（如 'calculator', 'gpt_image_gen'）
             action_name: Action 名称（显示用）
             action_type: Action 类型（如 'code_execution', 'image_generation'）
             parameters: 执行参数
+            idempotency_key: 客户端幂等键，重复提交只执行一次
             
         Returns:
-            执行结果字典，包含 success、data、message 等字段
+            执行结果字典，包含 success、data、message 等字段；
+            来自缓存的结果额外带有 cached、cache_source 字段
         """
+        # 注册表中的 Action 先按参数定义校验，不合法的输入不进入缓存和执行
+        spec = action_registry.get(action_id)
+        if spec:
+            if spec.status == 'disabled':
+                return {
+                    "success": False,
+                    "error": f"Action已停用: {spec.name}"
+                }
+            parameters, errors = spec.validate(parameters)
+            if errors:
+                print(f"⚠️  Action参数校验失败: {action_id} - {'; '.join(errors)}")
+                return {
+                    "success": False,
+                    "error": f"参数校验失败: {'; '.join(errors)}",
+                    "validation_errors": errors
+                }
+        
+        return await action_result_cache.get_or_execute(
+            action_id,
+            parameters,
+            lambda: self._dispatch_action(action_id, action_name, action_type, parameters),
+            idempotency_key=idempotency_key
+        )
+
+    async def execute_action_stream(
+        self,
+        action_id: str,
+        action_name: str,
+        action_type: str,
+        parameters: Dict[str, Any],
+        idempotency_key: Optional[str] = None,
+        deadline_ms: Optional[int] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        执行 Action 并逐个产出进度事件
+        
+        依次产出 queued、started、upstream_request_sent、first_token、partial_result 等事件，
+        最后产出带 result 和 latency 分解的 done 事件。调用方停止迭代时取消执行。
+        
+        Args:
+            deadline_ms: 请求预算；执行任务在创建时继承截止时间和进度回调
+        """
+        stream = ProgressStream()
+        with progress_scope(stream, started=stream.started), deadline_scope(deadline_ms):
+            emit_progress("queued", action_id=action_id)
+            task = asyncio.create_task(self.execute_action(
+                action_id=action_id,
+                action_name=action_name,
+                action_type=action_type,
+                parameters=parameters,
+                idempotency_key=idempotency_key
+            ))
+        
+        try:
+            while not task.done() or not stream.queue.empty():
+                next_event = asyncio.ensure_future(stream.queue.get())
+                await asyncio.wait({next_event, task}, return_when=asyncio.FIRST_COMPLETED)
+                if next_event.done():
+                    yield next_event.result()
+                else:
+                    next_event.cancel()
+            
+            try:
+                result = task.result()
+            except Exception as e:
+                result = {"success": False, "error": f"执行Action时发生错误: {str(e)}"}
+            yield stream.emit("done", result=result, latency=stream.latency_breakdown())
+        finally:
+            if not task.done():
+                task.cancel()
+    
+    async def _dispatch_action(
+        self,
+        action_id: str,
+        action_name: str,
+        action_type: str,
+        parameters: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """查找并执行 Action 处理函数（不经过缓存）"""
         try:
             print(f"\n{'='*60}")
             print(f"📋 执行Action: {action_name}")
@@ -78,12 +179,24 @@ class ActionExecutorService:
             print(f"   参数: {json.dumps(parameters, ensure_ascii=False)}")
             print(f"{'='*60}\n")
 
-            # 查找对应的处理函数
-            handler = self.action_handlers.get(action_id)
+            # 查找对应的处理函数；没有内置处理函数的 code_execution Action 在沙箱中执行 Action 库中的代码
+            handler = self.action_handlers.get(canonical_action_id(action_id))
+            code = None if handler else self._library_code(action_id)
+            if code:
+                handler = lambda params: self._execute_sandboxed_code(code, params)
             
             if handler:
-                # 执行对应的处理函数
-                result = await handler(parameters)
+                emit_progress("started", action_id=action_id)
+                # 执行对应的处理函数（受请求截止时间约束，下游调用只拿到剩余预算）
+                try:
+                    result = await with_deadline(handler(parameters))
+                except DeadlineExceeded as e:
+                    print(f"⏱️  Action超过请求截止时间: {action_name}")
+                    return {
+                        "success": False,
+                        "error": f"执行Action超时: {str(e)}",
+                        "deadline_exceeded": True
+                    }
                 print(f"✅ Action执行成功: {action_name}")
                 return result
             else:
@@ -108,6 +221,47 @@ class ActionExecutorService:
     # 代码执行类 Actions
     # ==========================================
     
+    @staticmethod
+    def _library_code(action_id: str) -> Optional[str]:
+        """Action 库中 code_execution Action 的 Python 代码（codeConfig.code）；只从服务端读取，不接受请求传入"""
+        spec = action_registry.get(action_id)
+        if not spec or spec.type != 'code_execution':
+            return None
+        code_config = spec.definition.get('codeConfig') or {}
+        if code_config.get('language', 'python') != 'python':
+            return None
+        return code_config.get('code') or None
+    
+    async def _execute_sandboxed_code(self, code: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        在沙箱进程池中执行自定义 Python 代码
+        
+        Args:
+            code: Action 库中的 Python 代码，通过 params 读取参数，结果写入 result 变量
+            parameters: 执行参数
+            
+        Returns:
+            {'success': True, 'data': {'result': ..., 'stdout': ...}}
+        """
+        run = await sandbox_pool.run(code, parameters)
+        if not run.get('success'):
+            return {
+                "success": False,
+                "error": f"代码执行失败: {run.get('error')}",
+                "data": {key: run[key] for key in ('stdout', 'limit', 'timeout') if run.get(key)}
+            }
+        
+        return {
+            "success": True,
+            "type": "code_execution",
+            "data": {
+                "result": run['result'],
+                "stdout": run['stdout'],
+                "duration_ms": run['duration_ms']
+            },
+            "message": f"代码执行完成，耗时 {run['duration_ms']}ms"
+        }
+    
     async def _execute_calculator(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """
         执行数学计算
@@ -182,17 +336,20 @@ class ActionExecutorService:
         
         Args:
             parameters: {'text': '示例文本', 'operation': 'analyze'}
+                analyze 也支持 {'file_path': 'feedback.txt'}（相对上传目录），
+                以及可选的 top_k、ngram_n、sketch_capacity
             
         Operations:
-            - analyze: 统计字数、字符数、行数
+            - analyze: 单遍流式统计字数、字符数、行数、CJK分词、高频词和n-gram
             - uppercase: 转大写
             - lowercase: 转小写
             - word_count: 仅统计字数
         """
         text = parameters.get('text', '')
+        file_path = parameters.get('file_path', '')
         operation = parameters.get('operation', 'analyze')
         
-        if not text:
+        if not text and not (file_path and operation == 'analyze'):
             return {
                 "success": False,
                 "error": "缺少必要参数: text"
@@ -200,21 +357,32 @@ class ActionExecutorService:
         
         try:
             if operation == 'analyze':
-                # 分析统计
-                words = len(text.split())
-                chars = len(text)
-                chars_no_space = len(text.replace(' ', '').replace('\n', ''))
-                lines = len(text.split('\n'))
+                # 单遍流式分析：文本直接作为一个分块，文件按块读取
+                if file_path:
+                    chunks = self._report_chunk_progress(iter_file_chunks(resolve_upload_path(file_path)))
+                else:
+                    chunks = [text]
+                
+                stats = await asyncio.to_thread(
+                    analyze_chunks,
+                    chunks,
+                    top_k=int(parameters.get('top_k', 10)),
+                    ngram_n=int(parameters.get('ngram_n', 2)),
+                    sketch_capacity=int(parameters.get('sketch_capacity', 1000))
+                )
+                
+                words = stats['word_count']
+                chars = stats['char_count']
+                chars_no_space = stats['char_count_no_space']
+                lines = stats['line_count']
                 
                 return {
                     "success": True,
                     "type": "text_analysis",
                     "data": {
-                        "word_count": words,
-                        "char_count": chars,
-                        "char_count_no_space": chars_no_space,
-                        "line_count": lines,
-                        "analysis": f"包含 {words} 个单词，{chars} 个字符（含空格），{chars_no_space} 个字符（不含空格），{lines} 行"
+                        **stats,
+                        "analysis": f"包含 {words} 个单词，{chars} 个字符（含空格），{chars_no_space} 个字符（不含空格），{lines} 行；"
+                                    f"分词 {stats['token_count']} 个（其中CJK字符 {stats['cjk_char_count']} 个）"
                     },
                     "message": "文本分析完成"
                 }
@@ -256,6 +424,15 @@ class ActionExecutorService:
                 "error": f"文本处理错误: {str(e)}"
             }
     
+    @staticmethod
+    def _report_chunk_progress(chunks: Iterable[str]) -> Iterator[str]:
+        """逐块转发文件内容，每读完一块上报一次进度（在 to_thread 线程中运行）"""
+        chars = 0
+        for index, chunk in enumerate(chunks, 1):
+            yield chunk
+            chars += len(chunk)
+            emit_progress("partial_result", chunks=index, chars=chars)
+    
     async def _execute_json_processor(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """
         执行JSON处理
@@ -359,80 +536,215 @@ class ActionExecutorService:
         
         Args:
             parameters: {'operation': 'now', 'date_input': '2024-01-01'}
+                format 可选 output_format；diff 可选 compare_to（默认当前时间）和 unit
+                批量模式：{'dates': [...] 或按行分隔的字符串, 'operation': 'parse|format|diff|bucket'}
             
         Operations:
             - now: 获取当前时间
             - parse: 解析日期
             - format: 格式化日期
             - diff: 计算时间差
+            - bucket: 按 day/week/month/cohort 分桶（仅批量模式）
         """
         operation = parameters.get('operation', 'now')
         date_input = parameters.get('date_input', '')
         
+        if parameters.get('dates'):
+            return await asyncio.to_thread(self._execute_datetime_bulk, operation, parameters)
+        
         try:
             if operation == 'now':
-                # 获取当前时间
-                now = datetime.now()
+                # 获取当前时间（UTC，与 parse/diff 的约定一致）
+                now = utc_now()
                 return {
                     "success": True,
                     "type": "datetime",
                     "data": {
                         "current_time": now.strftime("%Y-%m-%d %H:%M:%S"),
-                        "timestamp": int(now.timestamp()),
+                        "timezone": "UTC",
+                        "timestamp": to_timestamp(now),
                         "iso_format": now.isoformat(),
                         "weekday": now.strftime("%A"),
-                        "weekday_cn": ["周一", "周二", "周三", "周四", "周五", "周六", "周日"][now.weekday()]
+                        "weekday_cn": WEEKDAY_CN[now.weekday()]
                     },
-                    "message": f"当前时间: {now.strftime('%Y-%m-%d %H:%M:%S')}"
+                    "message": f"当前时间 (UTC): {now.strftime('%Y-%m-%d %H:%M:%S')}"
                 }
-                
-            elif operation == 'parse':
-                # 解析日期
-                if not date_input:
+            
+            if operation not in ('parse', 'format', 'diff'):
+                return {
+                    "success": False,
+                    "error": f"不支持的操作类型: {operation}"
+                }
+            
+            if not date_input:
+                return {
+                    "success": False,
+                    "error": "缺少必要参数: date_input"
+                }
+            
+            # 先按正则识别格式，只调用一次 strptime
+            parsed_date = parse_single(str(date_input))
+            if not parsed_date:
+                return {
+                    "success": False,
+                    "error": "无法解析日期格式，请使用 YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS 格式"
+                }
+            
+            if operation == 'parse':
+                return {
+                    "success": True,
+                    "type": "datetime_parse",
+                    "data": {
+                        "parsed": parsed_date.strftime("%Y-%m-%d %H:%M:%S"),
+                        "weekday": parsed_date.strftime("%A"),
+                        "timestamp": to_timestamp(parsed_date)
+                    },
+                    "message": "日期解析成功"
+                }
+            
+            if operation == 'format':
+                output_format = parameters.get('output_format') or DEFAULT_OUTPUT_FORMAT
+                formatted = parsed_date.strftime(output_format)
+                return {
+                    "success": True,
+                    "type": "datetime_format",
+                    "data": {
+                        "formatted": formatted,
+                        "output_format": output_format,
+                        "weekday_cn": WEEKDAY_CN[parsed_date.weekday()]
+                    },
+                    "message": f"格式化结果: {formatted}"
+                }
+            
+            # diff：date_input - compare_to
+            compare_input = parameters.get('compare_to')
+            if compare_input:
+                compare_date = parse_single(str(compare_input))
+                if not compare_date:
                     return {
                         "success": False,
-                        "error": "缺少必要参数: date_input"
+                        "error": f"无法解析 compare_to: {compare_input}"
                     }
+            else:
+                compare_date = utc_now()
+            
+            delta = parsed_date - compare_date
+            total_seconds = delta.total_seconds()
+            days, remainder = divmod(abs(int(total_seconds)), 86400)
+            hours, remainder = divmod(remainder, 3600)
+            minutes = remainder // 60
+            direction = "晚于" if total_seconds >= 0 else "早于"
+            return {
+                "success": True,
+                "type": "datetime_diff",
+                "data": {
+                    "from": compare_date.strftime("%Y-%m-%d %H:%M:%S"),
+                    "to": parsed_date.strftime("%Y-%m-%d %H:%M:%S"),
+                    "total_seconds": int(total_seconds),
+                    "total_days": round(total_seconds / 86400, 4),
+                    "total_hours": round(total_seconds / 3600, 4),
+                    "readable": f"{days}天{hours}小时{minutes}分钟"
+                },
+                "message": f"{parsed_date.strftime('%Y-%m-%d %H:%M:%S')} {direction} {compare_date.strftime('%Y-%m-%d %H:%M:%S')} {days}天{hours}小时{minutes}分钟"
+            }
                 
-                # 尝试多种格式解析
-                formats = [
-                    "%Y-%m-%d",
-                    "%Y-%m-%d %H:%M:%S",
-                    "%Y/%m/%d",
-                    "%Y/%m/%d %H:%M:%S"
-                ]
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"日期时间处理错误: {str(e)}"
+            }
+    
+    def _execute_datetime_bulk(self, operation: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        批量日期处理：推断一次格式后整列向量化解析和计算
+        
+        Args:
+            operation: parse / format / diff / bucket
+            parameters: dates（必填）、output_format、compare_to、unit、bucket、user_ids、cohort_period
+        """
+        try:
+            values = coerce_column(parameters.get('dates'))
+            dates, format_name = parse_column(values)
+            if format_name is None:
+                return {
+                    "success": False,
+                    "error": "无法从样本推断日期格式，请使用 YYYY-MM-DD、YYYY/MM/DD（可带时间）或Unix时间戳"
+                }
+            
+            invalid = int(np.isnat(dates).sum())
+            valid_dates = dates[~np.isnat(dates)]
+            data: Dict[str, Any] = {
+                "count": len(values),
+                "invalid_count": invalid,
+                "inferred_format": format_name,
+                "min": str(valid_dates.min()) if valid_dates.size else None,
+                "max": str(valid_dates.max()) if valid_dates.size else None
+            }
+            
+            if operation == 'parse':
+                data["parsed"] = format_column(dates)
+                result_type = "datetime_bulk_parse"
                 
-                parsed_date = None
-                for fmt in formats:
-                    try:
-                        parsed_date = datetime.strptime(date_input, fmt)
-                        break
-                    except:
-                        continue
+            elif operation == 'format':
+                output_format = parameters.get('output_format') or DEFAULT_OUTPUT_FORMAT
+                data["output_format"] = output_format
+                data["formatted"] = format_column(dates, output_format)
+                result_type = "datetime_bulk_format"
                 
-                if not parsed_date:
+            elif operation == 'diff':
+                unit = parameters.get('unit', 'days')
+                if unit not in DIFF_UNITS:
                     return {
                         "success": False,
-                        "error": "无法解析日期格式，请使用 YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS 格式"
+                        "error": f"不支持的时间单位: {unit}，可选 {', '.join(DIFF_UNITS)}"
                     }
+                compare_to = None
+                if parameters.get('compare_to'):
+                    compare_date = parse_single(str(parameters['compare_to']))
+                    if not compare_date:
+                        return {
+                            "success": False,
+                            "error": f"无法解析 compare_to: {parameters['compare_to']}"
+                        }
+                    compare_to = np.datetime64(compare_date.replace(microsecond=0), 's')
+                data["diffs"], data["diff_stats"] = diff_column(dates, compare_to, unit)
+                data["diff_mode"] = "compare_to" if compare_to is not None else "consecutive"
+                result_type = "datetime_bulk_diff"
                 
-                return {
-                    "success": True,
-                    "type": "datetime_parse",
-                    "data": {
-                        "parsed": parsed_date.strftime("%Y-%m-%d %H:%M:%S"),
-                        "weekday": parsed_date.strftime("%A"),
-                        "timestamp": int(parsed_date.timestamp())
-                    },
-                    "message": "日期解析成功"
-                }
+            elif operation == 'bucket':
+                bucket = parameters.get('bucket', 'day')
+                if bucket not in BUCKET_TYPES:
+                    return {
+                        "success": False,
+                        "error": f"不支持的分桶类型: {bucket}，可选 {', '.join(BUCKET_TYPES)}"
+                    }
+                data["bucket"] = bucket
+                if bucket == 'cohort':
+                    user_ids = parameters.get('user_ids')
+                    if not user_ids:
+                        return {
+                            "success": False,
+                            "error": "cohort 分桶需要参数: user_ids"
+                        }
+                    data["cohort_period"] = parameters.get('cohort_period', 'week')
+                    data["cohorts"] = cohort_table(dates, coerce_column(user_ids), data["cohort_period"])
+                else:
+                    data["buckets"] = bucket_column(dates, bucket)
+                result_type = "datetime_bulk_bucket"
                 
             else:
                 return {
                     "success": False,
-                    "error": f"不支持的操作类型: {operation}"
+                    "error": f"批量模式不支持的操作类型: {operation}"
                 }
-                
+            
+            return {
+                "success": True,
+                "type": result_type,
+                "data": data,
+                "message": f"批量处理 {len(values)} 个日期完成（格式 {format_name}，无法解析 {invalid} 个）"
+            }
+            
         except Exception as e:
             return {
                 "success": False,
@@ -445,7 +757,7 @@ class ActionExecutorService:
     
     async def _execute_google_search(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """
-        执行Google搜索（Mock实现）
+        执行搜索（由 SEARCH_PROVIDER 决定使用本地BM25索引或其他搜索服务）
         
         Args:
             parameters: {'query': '搜索关键词', 'max_results': 10}
@@ -459,34 +771,25 @@ class ActionExecutorService:
                 "error": "缺少必要参数: query"
             }
         
-        # Mock 搜索结果
-        mock_results = [
-            {
-                "title": f"{query} - 相关结果 1",
-                "snippet": "这是一个模拟的搜索结果描述...",
-                "url": f"https://example.com/result1?q={query}"
-            },
-            {
-                "title": f"{query} - 相关结果 2",
-                "snippet": "另一个模拟的搜索结果，包含相关信息...",
-                "url": f"https://example.com/result2?q={query}"
-            },
-            {
-                "title": f"{query} - 深入分析",
-                "snippet": "详细的分析和讨论内容...",
-                "url": f"https://example.com/result3?q={query}"
+        try:
+            provider = get_search_provider()
+            found = await provider.search(query, max_results=int(max_results))
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"搜索失败: {str(e)}"
             }
-        ]
         
         return {
             "success": True,
             "type": "search_results",
             "data": {
-                "results": mock_results[:max_results],
+                "results": found["results"],
                 "query": query,
-                "total": len(mock_results)
+                "total": found["total"],
+                "provider": provider.name
             },
-            "message": f"找到 {len(mock_results)} 条搜索结果"
+            "message": f"找到 {found['total']} 条搜索结果"
         }
     
     # ==========================================
@@ -499,7 +802,12 @@ class ActionExecutorService:
         
         Args:
             parameters: {'text': '这个游戏太好玩了！'}
+                或批量模式 {'texts': ['评论1', '评论2', ...]}
         """
+        texts = parameters.get('texts')
+        if texts:
+            return await self._execute_sentiment_batch(texts, parameters)
+        
         text = parameters.get('text', '')
         
         if not text:
@@ -534,19 +842,12 @@ class ActionExecutorService:
                 if json_match:
                     analysis = json.loads(json_match.group())
                     
-                    # 翻译情感标签
-                    sentiment_cn = {
-                        'positive': '正面',
-                        'negative': '负面',
-                        'neutral': '中性'
-                    }
-                    
                     return {
                         "success": True,
                         "type": "sentiment_analysis",
                         "data": {
                             "sentiment": analysis.get('sentiment', 'neutral'),
-                            "sentiment_cn": sentiment_cn.get(analysis.get('sentiment', 'neutral'), '中性'),
+                            "sentiment_cn": SENTIMENT_CN.get(analysis.get('sentiment', 'neutral'), '中性'),
                             "confidence": analysis.get('confidence', 0.5),
                             "reasoning": analysis.get('reasoning', '')
                         },
@@ -572,6 +873,205 @@ class ActionExecutorService:
                 "error": f"情感分析错误: {str(e)}"
             }
     
+    async def _execute_sentiment_batch(self, texts: List[str], parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        批量情感分析
+        
+        - 已分析过的文本直接从内容哈希缓存返回
+        - 其余文本按估算 token 数自适应打包，一次请求分析多条评论
+        - 响应无法解析的批次对半拆分重试，单条仍失败才记为错误
+        - 上游请求失败（网络、API 错误）时整批直接记为错误，不拆分
+        
+        Args:
+            texts: 评论列表
+            parameters: 可选 max_batch_tokens、max_batch_items 覆盖默认打包上限
+        """
+        if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            return {
+                "success": False,
+                "error": "参数 texts 必须是字符串数组"
+            }
+        
+        max_batch_tokens = int(parameters.get('max_batch_tokens', config.SENTIMENT_BATCH_MAX_TOKENS))
+        max_batch_items = int(parameters.get('max_batch_items', config.SENTIMENT_BATCH_MAX_ITEMS))
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+        pending: Dict[str, List[int]] = {}  # 内容哈希 -> 原始下标（同一文本只分析一次）
+        cache_hits = 0
+        failed = 0
+        
+        for index, text in enumerate(texts):
+            if not text.strip():
+                results[index] = {"index": index, "error": "评论内容为空"}
+                failed += 1
+                continue
+            key = content_hash(text)
+            cached = self.sentiment_cache.get(key)
+            if cached is not None:
+                results[index] = {"index": index, **cached, "cached": True}
+                cache_hits += 1
+            else:
+                pending.setdefault(key, []).append(index)
+        
+        # 按 token 预算打包批次
+        unique_items = [(key, texts[indexes[0]]) for key, indexes in pending.items()]
+        batches: List[List[tuple]] = []
+        current: List[tuple] = []
+        current_tokens = 0
+        for item in unique_items:
+            item_tokens = estimate_tokens(item[1])
+            if current and (current_tokens + item_tokens > max_batch_tokens or len(current) >= max_batch_items):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(item)
+            current_tokens += item_tokens
+        if current:
+            batches.append(current)
+        
+        stats = {"llm_calls": 0, "split_retries": 0}
+        semaphore = asyncio.Semaphore(config.SENTIMENT_BATCH_CONCURRENCY)
+        
+        async def run_batch(batch: List[tuple]) -> Dict[str, Dict[str, Any]]:
+            async with semaphore:
+                stats["llm_calls"] += 1
+                response = await self._classify_sentiment_batch([text for _, text in batch])
+            if response['success']:
+                return {key: analysis for (key, _), analysis in zip(batch, response['analyses'])}
+            if response.get('upstream_error'):
+                # 上游不可用时拆分只会成倍增加失败请求
+                return {key: {"error": f"情感分析请求失败: {response['error']}"} for key, _ in batch}
+            if len(batch) == 1:
+                return {batch[0][0]: {"error": "情感分析失败"}}
+            # 对半拆分重试
+            stats["split_retries"] += 1
+            middle = len(batch) // 2
+            left, right = await asyncio.gather(run_batch(batch[:middle]), run_batch(batch[middle:]))
+            return {**left, **right}
+        
+        completed = {"items": 0}
+        
+        async def run_top_level_batch(batch: List[tuple]) -> Dict[str, Dict[str, Any]]:
+            output = await run_batch(batch)
+            completed["items"] += len(batch)
+            emit_progress(
+                "partial_result",
+                completed=completed["items"],
+                total=len(unique_items),
+                results=[
+                    {"index": index, **analysis}
+                    for key, analysis in output.items() if "error" not in analysis
+                    for index in pending[key]
+                ]
+            )
+            return output
+        
+        # 批量请求归入 batch 优先级类别
+        with priority_scope("batch"):
+            batch_outputs = await asyncio.gather(*(run_top_level_batch(batch) for batch in batches))
+        
+        for output in batch_outputs:
+            for key, analysis in output.items():
+                if "error" in analysis:
+                    failed += len(pending[key])
+                else:
+                    self.sentiment_cache.set(key, analysis)
+                for index in pending[key]:
+                    results[index] = {"index": index, **analysis, "cached": False}
+        
+        summary = {label: 0 for label in SENTIMENT_CN}
+        for item in results:
+            if item and item.get('sentiment') in summary:
+                summary[item['sentiment']] += 1
+        
+        data = {
+            "results": results,
+            "summary": summary,
+            "total": len(texts),
+            "failed": failed,
+            "cache_hits": cache_hits,
+            "batches": len(batches),
+            "llm_calls": stats["llm_calls"],
+            "split_retries": stats["split_retries"]
+        }
+        if texts and failed == len(texts):
+            # 全部失败时不能报告成功，否则会被结果缓存和幂等记录保存下来
+            errors = [item["error"] for item in results if item and item.get("error")]
+            return {
+                "success": False,
+                "type": "sentiment_analysis_batch",
+                "error": f"批量情感分析全部失败: {errors[0]}" if errors else "批量情感分析全部失败",
+                "data": data
+            }
+        
+        return {
+            "success": True,
+            "type": "sentiment_analysis_batch",
+            "data": data,
+            "message": f"批量情感分析完成：{len(texts)} 条评论，缓存命中 {cache_hits} 条，LLM调用 {stats['llm_calls']} 次"
+        }
+    
+    async def _classify_sentiment_batch(self, texts: List[str]) -> Dict[str, Any]:
+        """
+        一次 LLM 请求分析多条评论
+        
+        Returns:
+            成功时 {'success': True, 'analyses': 与 texts 一一对应的分析结果}；
+            上游请求失败时 {'success': False, 'error', 'upstream_error': True}；
+            响应无法解析或条目缺失时 {'success': False, 'error'}
+        """
+        numbered = "\n".join(
+            f"[{i}] {json.dumps(text, ensure_ascii=False)}" for i, text in enumerate(texts, 1)
+        )
+        messages = [
+            {
+                "role": "system",
+                "content": "你是一个专业的情感分析专家。逐条分析用户评论，判断情感倾向（正面/负面/中性），并给出置信度和简短理由。\n\n请只返回JSON数组，每条评论一个对象，id 与评论编号一致：\n[\n  {\"id\": 1, \"sentiment\": \"positive|negative|neutral\", \"confidence\": 0.95, \"reasoning\": \"判断理由\"}\n]"
+            },
+            {
+                "role": "user",
+                "content": f"请分析以下 {len(texts)} 条评论的情感倾向：\n\n{numbered}"
+            }
+        ]
+        
+        result = await openai_service.get_chat_completion(
+            messages=messages,
+            temperature=0.3,
+            max_tokens=min(16000, 100 + 80 * len(texts))
+        )
+        if not result.get('success'):
+            print(f"⚠️  批量情感分析请求失败: {result.get('error')}")
+            return {"success": False, "error": result.get('error', 'LLM调用失败'), "upstream_error": True}
+        
+        unparseable = {"success": False, "error": "响应无法解析"}
+        json_match = re.search(r'\[[\s\S]*\]', result.get('content') or '')
+        if not json_match:
+            return unparseable
+        try:
+            items = json.loads(json_match.group())
+        except json.JSONDecodeError:
+            return unparseable
+        
+        by_id = {}
+        for item in items:
+            if isinstance(item, dict) and isinstance(item.get('id'), int):
+                by_id[item['id']] = item
+        if any(i not in by_id for i in range(1, len(texts) + 1)):
+            return unparseable
+        
+        analyses = []
+        for i in range(1, len(texts) + 1):
+            item = by_id[i]
+            sentiment = item.get('sentiment', 'neutral')
+            if sentiment not in SENTIMENT_CN:
+                sentiment = 'neutral'
+            analyses.append({
+                "sentiment": sentiment,
+                "sentiment_cn": SENTIMENT_CN[sentiment],
+                "confidence": item.get('confidence', 0.5),
+                "reasoning": item.get('reasoning', '')
+            })
+        return {"success": True, "analyses": analyses}
+    
     async def _execute_game_classification(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """
         执行游戏分类
@@ -0,0 +1,108 @@
+"""
+Action 执行进度事件
+
+入口（流式执行接口、任务队列）用 progress_scope 注册回调，调用链上的服务通过
+emit_progress 上报类型化的事件，不需要层层传参：
+
+- queued: 请求已接收
+- started: 处理函数开始执行（已通过校验和缓存）
+- upstream_request_sent: 拿到上游槽位，请求已发出（与 started 之差即排队时间）
+- first_token: 收到上游的第一个 token / 响应
+- partial_result: 批量或分段任务的中间结果
+- done: 执行结束，携带最终结果
+
+每个事件带 timestamp（Unix 时间）和 elapsed_ms（相对 scope 开始），同一通道即可作为延迟分解。
+没有注册回调时 emit_progress 是空操作。
+"""
+import asyncio
+import contextlib
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+PROGRESS_EVENTS = (
+    "queued", "started", "upstream_request_sent", "first_token", "partial_result", "done"
+)
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+# (回调, 回调所在事件循环, 回调所在线程, scope 开始时间)
+_current_emitter: ContextVar[Optional[Tuple[ProgressCallback, asyncio.AbstractEventLoop, int, float]]] = \
+    ContextVar("current_progress_emitter", default=None)
+
+
+def _build_event(event_type: str, started: float, info: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": event_type,
+        "timestamp": time.time(),
+        "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+        **info
+    }
+
+
+@contextlib.contextmanager
+def progress_scope(callback: ProgressCallback, started: Optional[float] = None):
+    """
+    在当前上下文（及其中创建的子任务、to_thread 线程）内把进度事件交给 callback
+
+    Args:
+        callback: 接收事件字典的回调，总是在事件循环线程中调用
+        started: elapsed_ms 的起点（time.monotonic()），默认为进入 scope 的时刻
+    """
+    token = _current_emitter.set((
+        callback,
+        asyncio.get_running_loop(),
+        threading.get_ident(),
+        started if started is not None else time.monotonic()
+    ))
+    try:
+        yield
+    finally:
+        _current_emitter.reset(token)
+
+
+def emit_progress(event_type: str, **info: Any) -> None:
+    """
+    上报进度事件；可以在事件循环线程或 asyncio.to_thread 的工作线程中调用
+
+    Args:
+        event_type: PROGRESS_EVENTS 中的事件类型
+        **info: 事件附带的信息（如 completed/total、model）
+    """
+    emitter = _current_emitter.get()
+    if emitter is None:
+        return
+
+    callback, loop, thread_id, started = emitter
+    event = _build_event(event_type, started, info)
+    if threading.get_ident() == thread_id:
+        callback(event)
+    else:
+        loop.call_soon_threadsafe(callback, event)
+
+
+class ProgressStream:
+    """把进度事件收集到队列中，供 WebSocket / SSE 逐个推送"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.events: List[Dict[str, Any]] = []
+
+    def __call__(self, event: Dict[str, Any]) -> None:
+        self.events.append(event)
+        self.queue.put_nowait(event)
+
+    def emit(self, event_type: str, **info: Any) -> Dict[str, Any]:
+        """在 scope 之外直接追加事件（如入口自己发出的 done）"""
+        event = _build_event(event_type, self.started, info)
+        self(event)
+        return event
+
+    def latency_breakdown(self) -> Dict[str, float]:
+        """各类事件首次出现时的 elapsed_ms，如 {'started': 0.4, 'first_token': 812.3, ...}"""
+        breakdown: Dict[str, float] = {}
+        for event in self.events:
+            breakdown.setdefault(event["type"], event["elapsed_ms"])
+        return breakdown
@@ -0,0 +1,324 @@
+"""
+Action 注册表
+
+启动时解析 shared/action-library.ts（前后端共享的单一数据源），为每个 Action 的参数定义
+预编译校验函数。ActionExecutorService 在执行前先查注册表并校验参数，
+不合法的输入在进入缓存、排队或上游调用之前就被拒绝。
+
+action-library.ts 中只描述了前端表单用到的参数；后端额外支持的参数
+（批量模式、上传文件等）在 BACKEND_PARAMETER_EXTENSIONS 中声明。
+"""
+import ast
+import json
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import config
+
+# 旧版本数字 ID 到当前 ID 的映射
+LEGACY_ACTION_IDS = {
+    '4': 'gpt_image_gen',
+    '8': 'calculator',
+    '9': 'text_processor',
+    '10': 'json_processor',
+    '11': 'datetime_processor',
+}
+
+# 后端额外支持的参数：同名参数覆盖库中的定义
+# type 除 ActionParameter 的类型外还支持 list（数组）和 lines（按行分隔的字符串或数组）
+BACKEND_PARAMETER_EXTENSIONS: Dict[str, List[Dict[str, Any]]] = {
+    'text_processor': [
+        {'name': 'file_path', 'type': 'string', 'required': False},
+        {'name': 'top_k', 'type': 'number', 'required': False},
+        {'name': 'ngram_n', 'type': 'number', 'required': False},
+        {'name': 'sketch_capacity', 'type': 'number', 'required': False},
+    ],
+    'datetime_processor': [
+        {'name': 'dates', 'type': 'lines', 'required': False},
+        {'name': 'user_ids', 'type': 'lines', 'required': False},
+        {'name': 'cohort_period', 'type': 'select', 'required': False,
+         'options': [{'value': 'day'}, {'value': 'week'}, {'value': 'month'}]},
+    ],
+    'sentiment_analysis': [
+        {'name': 'texts', 'type': 'list', 'required': False},
+        {'name': 'max_batch_tokens', 'type': 'number', 'required': False},
+        {'name': 'max_batch_items', 'type': 'number', 'required': False},
+    ],
+}
+
+# 必填参数的替代参数：提供替代参数时视为满足必填要求
+REQUIRED_ALTERNATIVES: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    'text_processor': {'text': ('file_path',)},
+    'sentiment_analysis': {'text': ('texts',)},
+}
+
+Validator = Callable[[Dict[str, Any]], Tuple[Dict[str, Any], List[str]]]
+
+_MISSING = object()
+
+
+# ==========================================
+# action-library.ts 解析
+# ==========================================
+
+def _ts_literal_to_json(source: str, start: int) -> str:
+    """
+    把从 start 开始的 TypeScript 数组/对象字面量转换为 JSON 文本
+
+    支持：单/双引号字符串、无引号键名、注释、尾随逗号、true/false/null/undefined。
+    """
+    tokens: List[str] = []
+    depth = 0
+    i = start
+    n = len(source)
+
+    while i < n:
+        c = source[i]
+
+        if c in " \t\r\n":
+            i += 1
+        elif source.startswith("//", i):
+            end = source.find("\n", i)
+            i = n if end == -1 else end
+        elif source.startswith("/*", i):
+            i = source.index("*/", i) + 2
+        elif c in "'\"`":
+            j = i + 1
+            while source[j] != c:
+                j += 2 if source[j] == "\\" else 1
+            raw = source[i + 1:j]
+            value = raw if c == "`" else ast.literal_eval(f'"{raw}"' if c == '"' else f"'{raw}'")
+            tokens.append(json.dumps(value, ensure_ascii=False))
+            i = j + 1
+        elif c.isalpha() or c in "_$":
+            j = i
+            while j < n and (source[j].isalnum() or source[j] in "_$"):
+                j += 1
+            word = source[i:j]
+            k = j
+            while k < n and source[k] in " \t\r\n":
+                k += 1
+            if k < n and source[k] == ":":
+                tokens.append(json.dumps(word))
+            elif word in ("true", "false", "null"):
+                tokens.append(word)
+            elif word == "undefined":
+                tokens.append("null")
+            else:
+                raise ValueError(f"不支持的标识符: {word}（位置 {i}）")
+            i = j
+        elif c in "]}":
+            if tokens and tokens[-1] == ",":
+                tokens.pop()  # 尾随逗号
+            tokens.append(c)
+            depth -= 1
+            i += 1
+            if depth == 0:
+                return "".join(tokens)
+        else:
+            if c in "[{":
+                depth += 1
+            tokens.append(c)
+            i += 1
+
+    raise ValueError("Action 库字面量不完整")
+
+
+def load_action_library(path: str) -> List[Dict[str, Any]]:
+    """解析 action-library.ts 中的 ACTION_LIBRARY 数组"""
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+
+    marker = source.find("export const ACTION_LIBRARY")
+    if marker == -1:
+        raise ValueError(f"{path} 中没有找到 ACTION_LIBRARY")
+    start = source.index("[", source.index("=", marker))
+    return json.loads(_ts_literal_to_json(source, start))
+
+
+# ==========================================
+# 参数校验函数编译
+# ==========================================
+
+def _is_blank(value: Any) -> bool:
+    return value is None or value == "" or value == []
+
+
+def _coerce_string(value: Any) -> Tuple[bool, Any]:
+    if isinstance(value, str):
+        return True, value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return True, str(value)
+    return False, "应为字符串"
+
+
+def _coerce_number(value: Any) -> Tuple[bool, Any]:
+    if isinstance(value, bool):
+        return False, "应为数字"
+    if isinstance(value, (int, float)):
+        return True, value
+    if isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            return False, "应为数字"
+        return True, int(number) if number.is_integer() else number
+    return False, "应为数字"
+
+
+def _coerce_boolean(value: Any) -> Tuple[bool, Any]:
+    if isinstance(value, bool):
+        return True, value
+    if isinstance(value, str) and value.lower() in ("true", "false"):
+        return True, value.lower() == "true"
+    return False, "应为布尔值"
+
+
+def _coerce_list(value: Any) -> Tuple[bool, Any]:
+    if isinstance(value, (list, tuple)):
+        return True, list(value)
+    return False, "应为数组"
+
+
+def _coerce_lines(value: Any) -> Tuple[bool, Any]:
+    if isinstance(value, (str, list, tuple)):
+        return True, value
+    return False, "应为按行分隔的字符串或数组"
+
+
+def _select_coercer(options: List[Dict[str, Any]]) -> Callable[[Any], Tuple[bool, Any]]:
+    allowed = frozenset(str(option["value"]) for option in options)
+    hint = "、".join(str(option["value"]) for option in options)
+
+    def coerce(value: Any) -> Tuple[bool, Any]:
+        if isinstance(value, (str, int, float)) and not isinstance(value, bool) and str(value) in allowed:
+            return True, str(value)
+        return False, f"取值无效: {value}，可选 {hint}"
+
+    return coerce
+
+
+_TYPE_COERCERS = {
+    "string": _coerce_string,
+    "textarea": _coerce_string,
+    "number": _coerce_number,
+    "boolean": _coerce_boolean,
+    "list": _coerce_list,
+    "lines": _coerce_lines,
+}
+
+
+def compile_validator(
+    parameters: List[Dict[str, Any]],
+    alternatives: Optional[Dict[str, Tuple[str, ...]]] = None
+) -> Validator:
+    """
+    把参数定义编译为校验函数
+
+    校验函数返回 (规范化后的参数, 错误列表)：
+    - 必填参数缺失时使用 defaultValue，没有默认值且没有替代参数则报错
+    - 按类型做无损转换（数字字符串 -> 数字、数字 -> 字符串），类型不符则报错
+    - select 只接受 options 中的值
+    - 未声明的参数原样保留
+    """
+    alternatives = alternatives or {}
+    checks = []
+    for param in parameters:
+        if param["type"] == "select" and param.get("options"):
+            coerce = _select_coercer(param["options"])
+        else:
+            coerce = _TYPE_COERCERS.get(param["type"], _coerce_string)
+        checks.append((
+            param["name"],
+            bool(param.get("required")),
+            param.get("defaultValue", _MISSING),
+            coerce,
+            alternatives.get(param["name"], ())
+        ))
+    checks = tuple(checks)
+
+    def validate(values: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+        result = dict(values)
+        errors: List[str] = []
+        for name, required, default, coerce, alts in checks:
+            value = result.get(name)
+            if _is_blank(value):
+                if not required:
+                    continue
+                if default is not _MISSING:
+                    result[name] = default
+                elif not any(not _is_blank(result.get(alt)) for alt in alts):
+                    errors.append(f"缺少必要参数: {name}")
+                continue
+            ok, coerced = coerce(value)
+            if ok:
+                result[name] = coerced
+            else:
+                errors.append(f"参数 {name} {coerced}")
+        return result, errors
+
+    return validate
+
+
+# ==========================================
+# 注册表
+# ==========================================
+
+class ActionSpec:
+    """注册表中的单个 Action"""
+
+    __slots__ = ("id", "name", "type", "status", "parameters", "validate", "definition")
+
+    def __init__(self, definition: Dict[str, Any]):
+        self.id: str = definition["id"]
+        self.name: str = definition.get("name", self.id)
+        self.type: str = definition.get("type", "")
+        self.status: str = definition.get("status", "enabled")
+        self.definition = definition
+
+        # 库中的参数定义 + 后端扩展（同名覆盖）
+        merged = {param["name"]: param for param in definition.get("parameters", [])}
+        for param in BACKEND_PARAMETER_EXTENSIONS.get(self.id, []):
+            merged[param["name"]] = param
+        self.parameters: List[Dict[str, Any]] = list(merged.values())
+        self.validate: Validator = compile_validator(self.parameters, REQUIRED_ALTERNATIVES.get(self.id))
+
+
+class ActionRegistry:
+    """从 Action 库生成的注册表"""
+
+    def __init__(self, definitions: List[Dict[str, Any]]):
+        self.specs: Dict[str, ActionSpec] = {}
+        for definition in definitions:
+            spec = ActionSpec(definition)
+            self.specs[spec.id] = spec
+        # 旧版本 ID 直接指向同一个 ActionSpec，查找只需一次字典访问
+        self._lookup: Dict[str, ActionSpec] = dict(self.specs)
+        for legacy_id, action_id in LEGACY_ACTION_IDS.items():
+            if action_id in self.specs:
+                self._lookup[legacy_id] = self.specs[action_id]
+
+    @classmethod
+    def from_file(cls, path: str) -> "ActionRegistry":
+        return cls(load_action_library(path))
+
+    def get(self, action_id: str) -> Optional[ActionSpec]:
+        """按 ID（包括旧版本数字 ID）查找 Action"""
+        return self._lookup.get(action_id)
+
+    def __contains__(self, action_id: str) -> bool:
+        return action_id in self._lookup
+
+    def __iter__(self) -> Iterator[ActionSpec]:
+        return iter(self.specs.values())
+
+    def __len__(self) -> int:
+        return len(self.specs)
+
+
+def canonical_action_id(action_id: str) -> str:
+    return LEGACY_ACTION_IDS.get(action_id, action_id)
+
+
+# 创建全局实例（启动时解析一次）
+action_registry = ActionRegistry.from_file(config.ACTION_LIBRARY_PATH)
+print(f"📚 已从 Action 库加载 {len(action_registry)} 个 Action")
@@ -0,0 +1,234 @@
+"""
+Action 选择
+
+前端 TodoExecutor.selectActionWithLLM 为每个待办步骤把整个 Action 库发给 LLM 选工具。
+本服务在启动时把 shared/action-library.ts 中每个 Action 的 description、name 和 examples
+（加上 ACTION_SELECTION_HINTS 中的补充说法）向量化，步骤文本到来时：
+
+1. 向量化步骤文本，与所有样例求余弦相似度，每个 Action 取最相似样例的分数排序（哈希向量下为微秒级）
+2. 最高分不低于 ACTION_SELECT_MIN_SCORE 且领先第二名至少 ACTION_SELECT_MARGIN 时直接返回
+3. 否则视为有歧义，只把前 ACTION_SELECT_TOP_K 个候选交给 LLM 裁决（提示词比整库短得多）
+
+"llm" 是一个伪 Action：步骤只需要分析、总结、撰写，不需要任何工具，返回 action_id 为 None。
+"""
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import numpy as np
+
+from config import config
+from .action_registry import action_registry
+from .embedding_service import embedding_service, hash_embedding
+from .mock_openai_service import mock_openai_service
+from .openai_service import openai_service
+from .upstream_scheduler import priority_scope
+
+NO_ACTION = "llm"
+
+# Action 库中样例较少，补充前端 LLM 提示词匹配规则里的说法
+ACTION_SELECTION_HINTS: Dict[str, List[str]] = {
+    "calculator": ["数学计算", "计算表达式的结果", "算一下总和", "求平均值", "计算增长率百分比"],
+    "text_processor": ["统计文本字数", "转换文本大小写", "提取文本关键词", "处理文字内容"],
+    "json_processor": ["格式化JSON数据", "验证JSON格式", "解析数据结构", "提取JSON字段"],
+    "datetime_processor": ["获取当前时间", "格式化日期", "计算两个日期相差天数", "时区转换"],
+    "google_search": ["搜索竞品资讯", "查找最新新闻", "搜索行业动态", "查找竞品游戏的用户反馈"],
+    "gpt_image_gen": ["生成图像", "画一张插图", "设计活动海报图片", "生成界面原型图"],
+    "sentiment_analysis": ["分析评论情感", "判断用户反馈是正面还是负面", "评论情感倾向分析"],
+    "game_classification": ["游戏分类", "生成游戏类型标签", "判断游戏属于什么品类"],
+    "event_planning": ["策划运营活动", "制定活动方案", "设计节日活动流程"],
+    NO_ACTION: [
+        "分析数据并总结结论", "撰写分析报告", "整理要点形成总结", "给出优化建议",
+        "对比分析各方案的优缺点", "生成总结报告", "归纳用户反馈的主要问题", "撰写文案",
+    ],
+}
+
+_ACTION_ID = re.compile(r"[a-z_]+")
+
+
+class ActionSelectorService:
+    """基于样例向量的 Action 选择，候选有歧义时才交给 LLM"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.action_ids: List[str] = []
+        self._rows_action: Optional[np.ndarray] = None  # 每行样例所属 Action 的下标
+        self._matrix: Optional[np.ndarray] = None
+        self._embedding_id: Optional[str] = None
+
+        self.requests = 0
+        self.resolved_locally = 0
+        self.escalated = 0
+        self.llm_failures = 0
+        self._local_latencies: Deque[float] = deque(maxlen=2000)
+
+    # ==========================================
+    # 索引
+    # ==========================================
+
+    @property
+    def embedding_id(self) -> str:
+        if config.ACTION_SELECT_EMBEDDING == "service":
+            return embedding_service.model_id
+        return f"hash-{config.ACTION_SELECT_HASH_DIM}"
+
+    async def _embed(self, texts: List[str]) -> np.ndarray:
+        if config.ACTION_SELECT_EMBEDDING == "service":
+            embedded = await embedding_service.embed(texts)
+            if not embedded["success"]:
+                raise RuntimeError(embedded.get("error"))
+            vectors = embedded["embeddings"]
+        else:
+            vectors = hash_embedding(texts, dim=config.ACTION_SELECT_HASH_DIM)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _exemplars(self) -> Dict[str, List[str]]:
+        """Action ID -> 样例文本（禁用的 Action 不参与选择）"""
+        exemplars: Dict[str, List[str]] = {}
+        for spec in action_registry:
+            if spec.status == "disabled":
+                continue
+            definition = spec.definition
+            texts = [definition.get("description") or "", spec.name]
+            texts.extend(definition.get("examples") or [])
+            texts.extend(ACTION_SELECTION_HINTS.get(spec.id, []))
+            exemplars[spec.id] = [text for text in texts if text]
+        exemplars[NO_ACTION] = list(ACTION_SELECTION_HINTS[NO_ACTION])
+        return exemplars
+
+    async def build(self) -> Dict[str, Any]:
+        """预先计算全部样例的向量（启动时调用；向量模型变化后自动重建）"""
+        exemplars = self._exemplars()
+        action_ids = list(exemplars)
+        texts = [text for action_id in action_ids for text in exemplars[action_id]]
+        rows_action = np.repeat(np.arange(len(action_ids)), [len(exemplars[a]) for a in action_ids])
+        matrix = (await self._embed(texts)).astype(np.float32)
+        with self._lock:
+            self.action_ids = action_ids
+            self._rows_action = rows_action
+            self._matrix = matrix
+            self._embedding_id = self.embedding_id
+        print(f"🧭 Action 选择索引已建立: {len(action_ids) - 1} 个 Action，{len(texts)} 条样例")
+        return {"actions": len(action_ids) - 1, "exemplars": len(texts)}
+
+    async def _ensure_built(self) -> None:
+        if self._matrix is None or self._embedding_id != self.embedding_id:
+            await self.build()
+
+    # ==========================================
+    # 选择
+    # ==========================================
+
+    async def rank(self, step_text: str) -> List[Dict[str, Any]]:
+        """各 Action（含 "llm"）按最相似样例的分数降序排列"""
+        await self._ensure_built()
+        vector = (await self._embed([step_text]))[0]
+        similarities = self._matrix @ vector
+        scores = np.full(len(self.action_ids), -1.0, dtype=np.float32)
+        np.maximum.at(scores, self._rows_action, similarities)
+        order = np.argsort(-scores)
+        return [{"action_id": self.action_ids[i], "score": round(float(scores[i]), 4)} for i in order]
+
+    async def _select_with_llm(self, step_text: str, candidates: List[Dict[str, Any]]) -> Optional[str]:
+        """只在候选中让 LLM 裁决；返回 Action ID、"llm" 或 None（无法解析）"""
+        lines = []
+        for candidate in candidates:
+            spec = action_registry.get(candidate["action_id"])
+            if spec is None:
+                lines.append(f"- {NO_ACTION}: 不需要工具，直接由 LLM 分析、总结或撰写")
+            else:
+                lines.append(f"- {spec.id}: {spec.name}（{spec.definition.get('description', '')}）")
+        if not any(candidate["action_id"] == NO_ACTION for candidate in candidates):
+            lines.append(f"- {NO_ACTION}: 以上工具都不合适，直接由 LLM 处理")
+        prompt = (
+            "你是一个任务分析专家。分析任务步骤，从以下工具ID中选择最合适的：\n\n"
+            + "\n".join(lines)
+            + f"\n\n【任务步骤】: \"{step_text}\"\n\n只回答工具ID，不要其他内容。"
+        )
+
+        service = mock_openai_service if config.USE_MOCK_OPENAI else openai_service
+        with priority_scope("interactive"):
+            response = await service.get_chat_completion(
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0,
+                max_tokens=20,
+                model=config.ACTION_SELECT_LLM_MODEL
+            )
+        if not response["success"] or not response.get("content"):
+            return None
+        allowed = {candidate["action_id"] for candidate in candidates} | {NO_ACTION}
+        for token in _ACTION_ID.findall(response["content"].lower()):
+            if token in allowed:
+                return token
+        return None
+
+    async def select(self, step_text: str, allow_llm: bool = True) -> Dict[str, Any]:
+        """
+        为待办步骤选择 Action
+
+        Args:
+            step_text: 步骤文本
+            allow_llm: 候选有歧义时是否交给 LLM 裁决
+
+        Returns:
+            {'action_id': Action ID 或 None（直接由 LLM 处理）, 'action_name', 'score', 'margin',
+             'candidates': 前 ACTION_SELECT_TOP_K 个候选, 'source': embedding / llm, 'ambiguous', 'latency_ms'}
+        """
+        started = time.perf_counter()
+        self.requests += 1
+        ranked = await self.rank(step_text)
+        top, runner_up = ranked[0], ranked[1]
+        margin = top["score"] - runner_up["score"]
+        ambiguous = top["score"] < config.ACTION_SELECT_MIN_SCORE or margin < config.ACTION_SELECT_MARGIN
+        candidates = ranked[:config.ACTION_SELECT_TOP_K]
+        self._local_latencies.append(time.perf_counter() - started)
+
+        choice, source = top["action_id"], "embedding"
+        if ambiguous and allow_llm:
+            self.escalated += 1
+            try:
+                chosen = await self._select_with_llm(step_text, candidates)
+            except Exception as e:
+                print(f"⚠️ LLM Action 选择失败，使用向量排序结果: {e}")
+                chosen = None
+            if chosen is None:
+                self.llm_failures += 1
+            else:
+                choice, source = chosen, "llm"
+        else:
+            self.resolved_locally += 1
+
+        action_id = None if choice == NO_ACTION else choice
+        spec = action_registry.get(action_id) if action_id else None
+        return {
+            "action_id": action_id,
+            "action_name": spec.name if spec else None,
+            "score": top["score"],
+            "margin": round(margin, 4),
+            "candidates": candidates,
+            "source": source,
+            "ambiguous": ambiguous,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = np.asarray(self._local_latencies) * 1e6 if self._local_latencies else None
+        return {
+            "embedding": self.embedding_id,
+            "actions": max(len(self.action_ids) - 1, 0),
+            "exemplars": 0 if self._matrix is None else int(self._matrix.shape[0]),
+            "requests": self.requests,
+            "resolved_locally": self.resolved_locally,
+            "escalated_to_llm": self.escalated,
+            "local_resolution_rate": round(self.resolved_locally / self.requests, 4) if self.requests else None,
+            "llm_failures": self.llm_failures,
+            "rank_p50_us": round(float(np.percentile(latencies, 50)), 1) if latencies is not None else None,
+            "rank_p99_us": round(float(np.percentile(latencies, 99)), 1) if latencies is not None else None
+        }
+
+
+# 创建全局实例
+action_selector_service = ActionSelectorService()
@@ -0,0 +1,337 @@
+"""
+批量游戏分类服务
+
+对上传目录中的 CSV / JSONL 文件逐行流式读取，用有限数量的 worker 并发调用
+game_classification，结果逐行追加写入 JSONL 输出文件。
+
+断点续跑：
+- 检查点记录"低水位"（该行号之前全部完成）、水位之上已完成的行号，以及写检查点时输出文件的字节偏移
+- 重新提交同一任务时，先扫描输出文件中偏移之后的记录补齐已完成集合，再跳过这些行继续处理
+"""
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Dict, Any, Iterator, Optional, Set, Tuple
+
+from config import config
+from .deadline import create_detached_task
+from .text_analytics import resolve_upload_path
+from .upstream_scheduler import current_priority_class
+
+# 每完成多少行或间隔多少秒写一次检查点
+CHECKPOINT_EVERY_ROWS = 50
+CHECKPOINT_EVERY_SECONDS = 2.0
+
+# 客户端指定的 job_id 直接用作输出文件名，只允许安全字符
+_JOB_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def _iter_rows(path: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """按行流式读取 CSV / JSONL 文件，返回 (行号, 行数据)"""
+    if path.lower().endswith(".csv"):
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            for row_index, row in enumerate(csv.DictReader(f)):
+                yield row_index, row
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            row_index = 0
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    row = {"_parse_error": line.strip()}
+                yield row_index, row if isinstance(row, dict) else {"value": row}
+                row_index += 1
+
+
+def _count_rows(path: str) -> int:
+    """估算总行数（CSV 按换行计，字段内换行会导致略微高估）"""
+    count = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            count += block.count(b"\n")
+    if path.lower().endswith(".csv"):
+        count -= 1  # 表头
+    return max(count, 0)
+
+
+class BulkClassificationJob:
+    """单个批量分类任务的运行状态"""
+
+    def __init__(
+        self,
+        job_id: str,
+        input_path: str,
+        output_path: str,
+        text_field: str,
+        id_field: Optional[str],
+        workers: int
+    ):
+        self.job_id = job_id
+        self.input_path = input_path
+        self.output_path = output_path
+        self.checkpoint_path = output_path + ".checkpoint.json"
+        self.text_field = text_field
+        self.id_field = id_field
+        self.workers = workers
+
+        self.status = "pending"  # pending | running | completed | cancelled | failed
+        self.error: Optional[str] = None
+        self.total_rows = 0
+        self.skipped_rows = 0     # 续跑时跳过的已完成行
+        self.processed_rows = 0   # 本次运行完成的行
+        self.failed_rows = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        # 检查点状态
+        self.watermark = 0
+        self.done_above: Set[int] = set()
+        self.task: Optional[asyncio.Task] = None
+        self.checkpoint_lock = asyncio.Lock()
+
+    def is_done(self, row_index: int) -> bool:
+        return row_index < self.watermark or row_index in self.done_above
+
+    def mark_done(self, row_index: int) -> None:
+        self.done_above.add(row_index)
+        while self.watermark in self.done_above:
+            self.done_above.remove(self.watermark)
+            self.watermark += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = self.finished_at or time.time()
+        elapsed = now - self.started_at if self.started_at else 0.0
+        throughput = self.processed_rows / elapsed if elapsed > 0 else 0.0
+        completed = self.skipped_rows + self.processed_rows
+        remaining = max(self.total_rows - completed, 0)
+        eta = remaining / throughput if throughput > 0 and self.status == "running" else None
+
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "error": self.error,
+            "input_file": os.path.basename(self.input_path),
+            "output_file": os.path.relpath(self.output_path, config.UPLOAD_DIR),
+            "workers": self.workers,
+            "total_rows": self.total_rows,
+            "completed_rows": completed,
+            "skipped_rows": self.skipped_rows,
+            "processed_rows": self.processed_rows,
+            "failed_rows": self.failed_rows,
+            "progress": round(completed / self.total_rows, 4) if self.total_rows else 0.0,
+            "elapsed_seconds": round(elapsed, 1),
+            "throughput_rows_per_sec": round(throughput, 2),
+            "eta_seconds": round(eta, 1) if eta is not None else None
+        }
+
+
+class BulkClassificationService:
+    """批量游戏分类任务管理"""
+
+    def __init__(self):
+        self.jobs: Dict[str, BulkClassificationJob] = {}
+
+    async def start_job(
+        self,
+        input_file: str,
+        text_field: str = "description",
+        id_field: Optional[str] = None,
+        workers: int = 4,
+        job_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        启动（或续跑）一个批量分类任务
+
+        同一输入文件和文本字段默认得到相同的 job_id，重复提交即从检查点续跑。
+        """
+        try:
+            input_path = resolve_upload_path(input_file)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        if job_id is not None and not _JOB_ID.match(job_id):
+            return {"success": False, "error": "job_id 只能包含字母、数字、下划线和连字符（最长64个字符）"}
+
+        job_id = job_id or hashlib.sha1(f"{input_path}:{text_field}".encode("utf-8")).hexdigest()[:16]
+        existing = self.jobs.get(job_id)
+        # 新任务在首次调度前是 pending，同样视为活跃，避免两个任务写同一输出和检查点
+        if existing and existing.status in ("pending", "running"):
+            return {"success": True, "data": existing.to_dict(), "message": "任务已在运行"}
+
+        os.makedirs(config.BULK_OUTPUT_DIR, exist_ok=True)
+        output_path = os.path.join(config.BULK_OUTPUT_DIR, f"{job_id}.jsonl")
+        workers = max(1, min(int(workers), config.BULK_MAX_WORKERS))
+
+        job = BulkClassificationJob(job_id, input_path, output_path, text_field, id_field, workers)
+        self.jobs[job_id] = job
+        job.task = create_detached_task(self._run_job(job))
+
+        return {"success": True, "data": job.to_dict(), "message": "批量分类任务已启动"}
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        return job.to_dict() if job else None
+
+    async def cancel_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """停止任务；检查点保留，之后可重新提交续跑"""
+        job = self.jobs.get(job_id)
+        if not job:
+            return None
+        if job.task and not job.task.done():
+            job.task.cancel()
+            try:
+                await job.task
+            except asyncio.CancelledError:
+                pass
+        return job.to_dict()
+
+    # ==========================================
+    # 任务执行
+    # ==========================================
+
+    async def _run_job(self, job: BulkClassificationJob) -> None:
+        from .action_executor_service import action_executor_service
+
+        # 本任务及其 worker 的上游调用都归入 batch 类别，不与交互式聊天抢槽位
+        current_priority_class.set("batch")
+        output = None
+        try:
+            job.status = "running"
+            job.started_at = time.time()
+            job.total_rows = await asyncio.to_thread(_count_rows, job.input_path)
+            await asyncio.to_thread(self._restore_checkpoint, job)
+
+            output = open(job.output_path, "a", encoding="utf-8")
+            queue: asyncio.Queue = asyncio.Queue(maxsize=job.workers * 2)
+            last_checkpoint = [time.monotonic(), 0]
+
+            async def record(row_index: int, record_data: Dict[str, Any]) -> None:
+                output.write(json.dumps(record_data, ensure_ascii=False) + "\n")
+                job.mark_done(row_index)
+                job.processed_rows += 1
+                since = job.processed_rows - last_checkpoint[1]
+                if since >= CHECKPOINT_EVERY_ROWS or time.monotonic() - last_checkpoint[0] >= CHECKPOINT_EVERY_SECONDS:
+                    last_checkpoint[0] = time.monotonic()
+                    last_checkpoint[1] = job.processed_rows
+                    await self._write_checkpoint(job, output)
+
+            async def worker() -> None:
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        queue.task_done()
+                        return
+                    row_index, row = item
+                    text = str(row.get(job.text_field) or "").strip()
+                    record_data = {"row": row_index}
+                    if job.id_field:
+                        record_data["id"] = row.get(job.id_field)
+
+                    if not text:
+                        result = {"success": False, "error": f"缺少字段: {job.text_field}"}
+                    else:
+                        try:
+                            result = await action_executor_service._execute_game_classification({"description": text})
+                        except Exception as e:
+                            result = {"success": False, "error": str(e)}
+
+                    if result.get("success"):
+                        record_data.update({"success": True, **result.get("data", {})})
+                    else:
+                        job.failed_rows += 1
+                        record_data.update({"success": False, "error": result.get("error")})
+                    await record(row_index, record_data)
+                    queue.task_done()
+
+            tasks = [asyncio.create_task(worker()) for _ in range(job.workers)]
+            try:
+                for row_index, row in _iter_rows(job.input_path):
+                    if job.is_done(row_index):
+                        continue
+                    await queue.put((row_index, row))
+                for _ in tasks:
+                    await queue.put(None)
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+            job.total_rows = max(job.total_rows, job.watermark + len(job.done_above))
+            job.status = "completed"
+            print(f"✅ 批量分类完成: {job.job_id}，本次处理 {job.processed_rows} 行，失败 {job.failed_rows} 行")
+
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            print(f"❌ 批量分类任务失败: {job.job_id} - {e}")
+        finally:
+            job.finished_at = time.time()
+            if output:
+                await self._write_checkpoint(job, output)
+                output.close()
+
+    def _restore_checkpoint(self, job: BulkClassificationJob) -> None:
+        """读取检查点，并补齐检查点之后已写入输出文件的行"""
+        offset = 0
+        if os.path.exists(job.checkpoint_path):
+            with open(job.checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            job.watermark = checkpoint.get("watermark", 0)
+            job.done_above = set(checkpoint.get("done_above", []))
+            offset = checkpoint.get("output_offset", 0)
+
+        if os.path.exists(job.output_path):
+            with open(job.output_path, "rb+") as f:
+                f.seek(offset)
+                valid_end = offset
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # 崩溃时写了一半的行
+                    try:
+                        job.mark_done(json.loads(line)["row"])
+                    except (ValueError, KeyError):
+                        break
+                    valid_end += len(line)
+                f.truncate(valid_end)
+
+        job.skipped_rows = job.watermark + len(job.done_above)
+        if job.skipped_rows:
+            print(f"🔁 从检查点续跑: {job.job_id}，已完成 {job.skipped_rows} 行")
+
+    async def _write_checkpoint(self, job: BulkClassificationJob, output) -> None:
+        """先落盘输出，再原子替换检查点文件（fsync 和文件写入在线程中执行，不阻塞事件循环）"""
+        # 在事件循环中取快照，保证偏移和已完成集合一致
+        output.flush()
+        checkpoint = {
+            "job_id": job.job_id,
+            "input_file": job.input_path,
+            "text_field": job.text_field,
+            "watermark": job.watermark,
+            "done_above": sorted(job.done_above),
+            "output_offset": output.tell(),
+            "updated_at": time.time()
+        }
+        # 串行写入，避免较旧的检查点覆盖较新的
+        async with job.checkpoint_lock:
+            await asyncio.to_thread(self._persist_checkpoint, job, output.fileno(), checkpoint)
+
+    @staticmethod
+    def _persist_checkpoint(job: BulkClassificationJob, output_fd: int, checkpoint: Dict[str, Any]) -> None:
+        os.fsync(output_fd)
+        tmp_path = job.checkpoint_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, job.checkpoint_path)
+
+
+# 创建全局实例
+bulk_classification_service = BulkClassificationService()
@@ -0,0 +1,293 @@
+"""
+日期时间批量处理
+
+单值解析：先用正则判断格式，再只调用一次 strptime，不靠异常逐个试格式。
+批量处理：从样本推断一次格式，整列转换为 NumPy datetime64 后向量化计算
+（解析、格式化、时间差、按天/周/月分桶、留存 cohort）。
+
+注意：结果不带时区，统一约定为 UTC：日期字符串按 UTC 时间理解，Unix 时间戳按 UTC 换算，
+当前时间和时间戳换算也走 utc_now / to_timestamp（单值与批量一致，不受服务器 TZ 影响）。
+"""
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# (名称, 匹配正则, strptime 格式)；按优先级排列
+DATE_FORMATS: List[Tuple[str, "re.Pattern", Optional[str]]] = [
+    ("iso_datetime", re.compile(r"^\d{4}-\d{1,2}-\d{1,2}[ T]\d{1,2}:\d{2}:\d{2}$"), "%Y-%m-%d %H:%M:%S"),
+    ("iso_minute", re.compile(r"^\d{4}-\d{1,2}-\d{1,2}[ T]\d{1,2}:\d{2}$"), "%Y-%m-%d %H:%M"),
+    ("iso_date", re.compile(r"^\d{4}-\d{1,2}-\d{1,2}$"), "%Y-%m-%d"),
+    ("slash_datetime", re.compile(r"^\d{4}/\d{1,2}/\d{1,2} \d{1,2}:\d{2}:\d{2}$"), "%Y/%m/%d %H:%M:%S"),
+    ("slash_minute", re.compile(r"^\d{4}/\d{1,2}/\d{1,2} \d{1,2}:\d{2}$"), "%Y/%m/%d %H:%M"),
+    ("slash_date", re.compile(r"^\d{4}/\d{1,2}/\d{1,2}$"), "%Y/%m/%d"),
+    ("epoch_millis", re.compile(r"^\d{13}$"), None),
+    ("epoch_seconds", re.compile(r"^\d{9,10}(\.\d+)?$"), None),
+]
+
+_FORMAT_BY_NAME = {name: (pattern, fmt) for name, pattern, fmt in DATE_FORMATS}
+
+# 常用输出格式 -> (datetime_as_string 精度, 字符替换)，可完全向量化
+_VECTOR_OUTPUT_FORMATS = {
+    "%Y-%m-%d %H:%M:%S": ("s", [("T", " ")]),
+    "%Y-%m-%dT%H:%M:%S": ("s", []),
+    "%Y-%m-%d %H:%M": ("m", [("T", " ")]),
+    "%Y-%m-%d": ("D", []),
+    "%Y/%m/%d": ("D", [("-", "/")]),
+    "%Y-%m": ("M", []),
+}
+
+# 时间差单位 -> 秒数
+DIFF_UNITS = {"seconds": 1, "minutes": 60, "hours": 3600, "days": 86400, "weeks": 604800}
+
+BUCKET_TYPES = ("day", "week", "month", "cohort")
+
+DEFAULT_OUTPUT_FORMAT = "%Y-%m-%d %H:%M:%S"
+SAMPLE_SIZE = 50
+
+
+def utc_now() -> datetime:
+    """当前 UTC 时间（不带时区，秒级），与解析结果的约定一致"""
+    return datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+def to_timestamp(value: datetime) -> int:
+    """把不带时区的 UTC 时间换算为 Unix 时间戳（naive datetime.timestamp() 会按本地时区换算）"""
+    return int(value.replace(tzinfo=timezone.utc).timestamp())
+
+
+def detect_format(value: str) -> Optional[str]:
+    """返回值匹配的格式名称，无法识别时返回 None"""
+    value = value.strip()
+    for name, pattern, _ in DATE_FORMATS:
+        if pattern.match(value):
+            return name
+    return None
+
+
+def parse_single(value: str, format_name: Optional[str] = None) -> Optional[datetime]:
+    """
+    解析单个日期字符串
+
+    Args:
+        value: 日期字符串
+        format_name: 已知格式名称；为空时自动识别
+
+    Returns:
+        datetime；无法解析时返回 None
+    """
+    value = value.strip()
+    format_name = format_name or detect_format(value)
+    if format_name is None:
+        return None
+
+    pattern, fmt = _FORMAT_BY_NAME[format_name]
+    if not pattern.match(value):
+        return None
+    if format_name == "epoch_millis":
+        return datetime.fromtimestamp(int(value) / 1000, tz=timezone.utc).replace(tzinfo=None)
+    if format_name == "epoch_seconds":
+        return datetime.fromtimestamp(float(value), tz=timezone.utc).replace(tzinfo=None)
+    try:
+        return datetime.strptime(value.replace("T", " "), fmt)
+    except ValueError:
+        return None  # 格式匹配但数值越界，如 2024-13-01
+
+
+def infer_format(values: Sequence[str]) -> Optional[str]:
+    """从前若干个非空样本中推断出现次数最多的格式"""
+    counts: Dict[str, int] = {}
+    sampled = 0
+    for value in values:
+        if not value or not value.strip():
+            continue
+        name = detect_format(value)
+        if name:
+            counts[name] = counts.get(name, 0) + 1
+        sampled += 1
+        if sampled >= SAMPLE_SIZE:
+            break
+    if not counts:
+        return None
+    return max(counts, key=counts.get)
+
+
+def coerce_column(values: Any) -> List[str]:
+    """接受数组或按行分隔的字符串，统一成字符串列表"""
+    if isinstance(values, str):
+        return [line.strip() for line in values.splitlines() if line.strip()]
+    return ["" if v is None else str(v).strip() for v in values]
+
+
+def parse_column(values: Sequence[str], format_name: Optional[str] = None) -> Tuple[np.ndarray, Optional[str]]:
+    """
+    整列解析为 datetime64[s]，无法解析的元素为 NaT
+
+    Returns:
+        (datetime64 数组, 推断出的格式名称)
+    """
+    format_name = format_name or infer_format(values)
+    arr = np.char.strip(np.asarray(values, dtype=str))
+    result = np.full(arr.shape, np.datetime64("NaT"), dtype="datetime64[s]")
+    if format_name is None or arr.size == 0:
+        return result, format_name
+
+    # 先用推断格式的正则过滤：numpy 会把 'now'、'today'、'2024' 之类当成合法日期，
+    # 单值解析则拒绝它们；不匹配的值一律为 NaT，保证批量与单值结果一致
+    pattern, _ = _FORMAT_BY_NAME[format_name]
+    matched = np.fromiter((pattern.match(v) is not None for v in arr), dtype=bool, count=arr.size)
+    candidates = arr[matched]
+
+    if format_name in ("epoch_seconds", "epoch_millis"):
+        numeric = candidates.astype(float)
+        if format_name == "epoch_millis":
+            numeric = numeric / 1000
+        result[matched] = numeric.astype("int64").astype("datetime64[s]")
+        return result, format_name
+
+    # 统一分隔符后交给 numpy 的 C 实现一次性解析
+    iso = np.char.replace(np.char.replace(candidates, "/", "-"), " ", "T")
+    try:
+        result[matched] = iso.astype("datetime64[s]")
+        return result, format_name
+    except ValueError:
+        pass
+
+    # 存在非定宽或越界值：逐个解析（仅在异常数据时走这条路径）
+    for i in np.flatnonzero(matched):
+        parsed = parse_single(str(arr[i]), format_name)
+        if parsed is not None:
+            result[i] = np.datetime64(parsed.replace(microsecond=0), "s")
+    return result, format_name
+
+
+def format_column(dates: np.ndarray, output_format: str = DEFAULT_OUTPUT_FORMAT) -> List[Optional[str]]:
+    """把 datetime64 数组格式化为字符串列表，NaT 输出为 None"""
+    valid = ~np.isnat(dates)
+    out = np.empty(dates.shape, dtype=object)
+
+    if output_format in _VECTOR_OUTPUT_FORMATS:
+        unit, replacements = _VECTOR_OUTPUT_FORMATS[output_format]
+        strings = np.datetime_as_string(dates[valid], unit=unit)
+        for old, new in replacements:
+            strings = np.char.replace(strings, old, new)
+        out[valid] = strings
+    else:
+        out[valid] = [d.strftime(output_format) for d in dates[valid].astype(object)]
+
+    out[~valid] = None
+    return out.tolist()
+
+
+def diff_column(
+    dates: np.ndarray,
+    compare_to: Optional[np.datetime64] = None,
+    unit: str = "days"
+) -> Tuple[List[Optional[float]], Dict[str, Any]]:
+    """
+    计算时间差
+
+    - 给定 compare_to：每个元素与之相减（element - compare_to）
+    - 未给定：相邻元素之差（第一个元素为 None），用于事件时间线间隔分析
+    """
+    scale = DIFF_UNITS[unit]
+    seconds = dates.astype("int64").astype(float)
+    seconds[np.isnat(dates)] = np.nan
+
+    if compare_to is not None:
+        deltas = (seconds - float(compare_to.astype("datetime64[s]").astype("int64"))) / scale
+    else:
+        deltas = np.full(seconds.shape, np.nan)
+        deltas[1:] = np.diff(seconds) / scale
+
+    finite = deltas[np.isfinite(deltas)]
+    stats = {
+        "unit": unit,
+        "count": int(finite.size),
+        "min": round(float(finite.min()), 4) if finite.size else None,
+        "max": round(float(finite.max()), 4) if finite.size else None,
+        "mean": round(float(finite.mean()), 4) if finite.size else None,
+        "median": round(float(np.median(finite)), 4) if finite.size else None,
+    }
+    values = np.round(deltas, 4).astype(object)
+    values[~np.isfinite(deltas)] = None
+    return values.tolist(), stats
+
+
+def week_start(days: np.ndarray) -> np.ndarray:
+    """datetime64[D] -> 所在周的周一（1970-01-01 为周四）"""
+    weekday = (days.astype("int64") + 3) % 7
+    return days - weekday.astype("timedelta64[D]")
+
+
+def bucket_column(dates: np.ndarray, bucket: str) -> List[Dict[str, Any]]:
+    """按天 / 周 / 月统计事件数量"""
+    valid = dates[~np.isnat(dates)]
+    if bucket == "day":
+        keys = valid.astype("datetime64[D]")
+    elif bucket == "week":
+        keys = week_start(valid.astype("datetime64[D]"))
+    elif bucket == "month":
+        keys = valid.astype("datetime64[M]")
+    else:
+        raise ValueError(f"不支持的分桶类型: {bucket}")
+
+    unique, counts = np.unique(keys, return_counts=True)
+    return [
+        {"bucket": str(key), "count": int(count)}
+        for key, count in zip(unique, counts)
+    ]
+
+
+def cohort_table(dates: np.ndarray, user_ids: Sequence[str], period: str = "week") -> List[Dict[str, Any]]:
+    """
+    留存 cohort：按用户首次出现的周期分组，统计其后每个周期仍活跃的用户数
+
+    Returns:
+        [{'cohort': '2024-01-01', 'size': 120, 'retention': [120, 80, 65, ...]}]
+    """
+    if len(user_ids) != len(dates):
+        raise ValueError("user_ids 长度必须与 dates 一致")
+
+    valid = ~np.isnat(dates)
+    users = np.asarray(user_ids, dtype=str)[valid]
+    days = dates[valid].astype("datetime64[D]")
+    if period == "week":
+        periods = week_start(days).astype("int64")  # 周一的天序号
+        step = 7
+    elif period == "month":
+        periods = days.astype("datetime64[M]").astype("int64")
+        step = 1
+    else:
+        periods = days.astype("int64")
+        step = 1
+    if periods.size == 0:
+        return []
+
+    user_codes, user_index = np.unique(users, return_inverse=True)
+    first_period = np.full(user_codes.size, np.iinfo(np.int64).max)
+    np.minimum.at(first_period, user_index, periods)
+
+    cohorts = first_period[user_index]
+    offsets = (periods - cohorts) // step
+
+    # 同一用户在同一周期的多次事件只计一次
+    triples = np.unique(np.stack([cohorts, offsets, user_index]), axis=1)
+    pairs, active = np.unique(triples[:2], axis=1, return_counts=True)
+
+    table: Dict[int, Dict[int, int]] = {}
+    for cohort, offset, count in zip(pairs[0], pairs[1], active):
+        table.setdefault(int(cohort), {})[int(offset)] = int(count)
+
+    unit = "M" if period == "month" else "D"
+    rows = []
+    for cohort in sorted(table):
+        retention_by_offset = table[cohort]
+        width = max(retention_by_offset) + 1
+        rows.append({
+            "cohort": str(np.datetime64(cohort, unit)),
+            "size": retention_by_offset.get(0, 0),
+            "retention": [retention_by_offset.get(i, 0) for i in range(width)]
+        })
+    return rows
@@ -0,0 +1,113 @@
+"""
+请求截止时间（deadline）传播
+
+调用方通过请求头 X-Request-Deadline-Ms 或请求体字段 deadline_ms 给出总预算（毫秒），
+截止时间保存在 ContextVar 中，沿 EventPlanningService -> ActionExecutorService ->
+OpenAIService / 图像服务 的调用链自动传递。每一步只拿到剩余预算；超时的步骤返回
+deadline_exceeded 标记，由上层决定返回部分结果。
+"""
+import asyncio
+import contextlib
+import contextvars
+import time
+from contextvars import ContextVar
+from typing import Any, Coroutine, Optional, Awaitable
+
+DEADLINE_HEADER = "x-request-deadline-ms"
+
+# 绝对截止时间（time.monotonic() 时间轴），None 表示不限时
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """请求预算已用完"""
+
+
+def remaining() -> Optional[float]:
+    """剩余预算（秒），未设置截止时间时返回 None"""
+    deadline = current_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+@contextlib.contextmanager
+def deadline_scope(budget_ms: Optional[float]):
+    """
+    在当前上下文内设置截止时间；已有更早的截止时间时保留更早的那个
+
+    Args:
+        budget_ms: 预算毫秒数，None 或非正数表示不额外限制
+    """
+    if not budget_ms or budget_ms <= 0:
+        yield
+        return
+
+    deadline = time.monotonic() + budget_ms / 1000
+    existing = current_deadline.get()
+    if existing is not None:
+        deadline = min(deadline, existing)
+    token = current_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+
+def create_detached_task(coro: Coroutine[Any, Any, Any]) -> asyncio.Task:
+    """
+    在空白上下文中创建后台任务
+
+    asyncio.create_task 会复制当前上下文：在请求中创建的 worker 和后台任务会永久继承
+    该请求的截止时间、优先级类别和进度回调。不属于当前请求的任务都应通过本函数创建。
+    """
+    return asyncio.create_task(coro, context=contextvars.Context())
+
+
+async def with_deadline(awaitable: Awaitable[Any]) -> Any:
+    """
+    在剩余预算内等待 awaitable
+
+    Raises:
+        DeadlineExceeded: 预算已用完或等待超时
+    """
+    left = remaining()
+    if left is None:
+        return await awaitable
+    if left <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceeded("请求已超过截止时间")
+    try:
+        return await asyncio.wait_for(awaitable, timeout=left)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"请求在截止时间前未完成（剩余预算 {left:.1f}s）")
+
+
+class DeadlineMiddleware:
+    """从 X-Request-Deadline-Ms 请求头读取预算，作用于整个请求"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # WebSocket 是长连接，不适用单次请求预算
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        budget_ms = None
+        for name, value in scope.get("headers", []):
+            if name.decode("latin-1").lower() == DEADLINE_HEADER:
+                try:
+                    budget_ms = float(value.decode("latin-1"))
+                except ValueError:
+                    pass
+                break
+
+        with deadline_scope(budget_ms):
+            await self.app(scope, receive, send)
@@ -0,0 +1,313 @@
+"""
+文本向量化服务
+
+知识库写入、入库和语义检索统一通过本服务取得 embedding：
+1. 缓存：键为 (模型, 正文) 的内容哈希。进程内 LRU 挡住热点查询，SQLite 持久缓存跨重启保留，
+   重新入库、重建索引时已向量化过的正文不再请求上游
+2. 批处理：未命中的文本按估算 token 数和条数打包，一批一次上游请求，多批并发（受上游调度器限流）；
+   上游报告输入超长时把该批对半拆开重试
+3. 提供方：openai（Compass embeddings 接口）、local（本地 CPU 模型，需安装 sentence-transformers）、
+   hash（哈希向量，离线测试用）。USE_MOCK_OPENAI 时不请求上游，改用 local 或 hash
+"""
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import config
+from .cache_utils import TTLCache, content_hash
+from .openai_service import openai_service
+from .text_analytics import _CJK_CHAR, search_terms
+
+EMBEDDING_PROVIDERS = ("openai", "local", "hash")
+HASH_EMBEDDING_DIM = 256
+
+_TOO_LONG = re.compile(r"maximum context length|too many tokens|max.*tokens|token limit", re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：CJK 字符约 1 个 token，其余约 4 个字符 1 个 token"""
+    cjk = len(_CJK_CHAR.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4 + 1
+
+
+def hash_embedding(texts: List[str], dim: int = HASH_EMBEDDING_DIM) -> np.ndarray:
+    """
+    哈希向量：每个检索词项哈希到一个维度，符号由哈希位决定
+
+    共享词项的文本得到相近的向量，离线测试时检索结果仍有意义
+    """
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for term in search_terms(text):
+            digest = hashlib.md5(term.encode("utf-8")).digest()
+            bucket = int.from_bytes(digest[:4], "little") % dim
+            vectors[i, bucket] += 1.0 if digest[4] & 1 else -1.0
+    return vectors
+
+
+class EmbeddingCache:
+    """持久向量缓存：内容哈希 -> float32 向量（SQLite，超过上限时按写入顺序淘汰最旧的条目）"""
+
+    def __init__(self, path: str, max_rows: int = 2_000_000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update((key, np.frombuffer(blob, dtype=np.float32)) for key, blob in rows)
+        return found
+
+    def put_many(self, items: List[Tuple[str, np.ndarray]]) -> None:
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items]
+            )
+            self._rows += self._conn.total_changes - before
+            if self._rows > self.max_rows:
+                excess = self._rows - self.max_rows
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)",
+                    (excess,)
+                )
+                self._rows -= excess
+
+    def __len__(self) -> int:
+        return self._rows
+
+
+class EmbeddingService:
+    """带缓存和自适应批处理的 embedding 客户端"""
+
+    def __init__(self):
+        self._cache: Optional[EmbeddingCache] = None
+        self._memory = TTLCache(maxsize=config.EMBEDDING_MEMORY_CACHE_SIZE)
+        self._open_lock = threading.Lock()
+        self._local_model = None
+        self._local_unavailable = False
+
+        self.requests = 0
+        self.texts = 0
+        self.cache_hits = 0
+        self.upstream_calls = 0
+        self.upstream_texts = 0
+        self.upstream_tokens = 0
+        self.batch_splits = 0
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        if self._cache is None:
+            with self._open_lock:
+                if self._cache is None:
+                    self._cache = EmbeddingCache(config.EMBEDDING_CACHE_PATH, config.EMBEDDING_CACHE_MAX_ROWS)
+        return self._cache
+
+    # ==========================================
+    # 提供方
+    # ==========================================
+
+    @property
+    def provider(self) -> str:
+        """实际使用的提供方；USE_MOCK_OPENAI 时不请求上游"""
+        provider = config.EMBEDDING_PROVIDER
+        if provider == "openai" and config.USE_MOCK_OPENAI:
+            provider = "local" if config.EMBEDDING_LOCAL_MODEL else "hash"
+        if provider == "local" and (self._local_unavailable or not config.EMBEDDING_LOCAL_MODEL):
+            provider = "hash"
+        return provider
+
+    @property
+    def model_id(self) -> str:
+        """缓存键中的模型标识，不同模型的向量空间互不混用"""
+        provider = self.provider
+        if provider == "openai":
+            return f"openai:{config.EMBEDDING_MODEL}"
+        if provider == "local":
+            return f"local:{config.EMBEDDING_LOCAL_MODEL}"
+        return f"hash:{HASH_EMBEDDING_DIM}"
+
+    def _load_local_model(self):
+        """首次使用时加载本地模型；未安装 sentence-transformers 时退回哈希向量"""
+        with self._open_lock:
+            if self._local_model is None and not self._local_unavailable:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    self._local_model = SentenceTransformer(config.EMBEDDING_LOCAL_MODEL, device="cpu")
+                    print(f"🧮 已加载本地 embedding 模型: {config.EMBEDDING_LOCAL_MODEL}")
+                except Exception as e:
+                    print(f"⚠️ 本地 embedding 模型不可用，改用哈希向量: {e}")
+                    self._local_unavailable = True
+        return self._local_model
+
+    def _embed_local(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(
+            self._local_model.encode(texts, batch_size=config.EMBEDDING_LOCAL_BATCH_SIZE, normalize_embeddings=True),
+            dtype=np.float32
+        )
+
+    # ==========================================
+    # 批处理
+    # ==========================================
+
+    @staticmethod
+    def plan_batches(texts: List[str], max_items: int, max_tokens: int) -> List[List[int]]:
+        """按条数和估算 token 数把文本下标分批，单条超过上限的文本单独成批"""
+        batches: List[List[int]] = []
+        current: List[int] = []
+        tokens = 0
+        for i, text in enumerate(texts):
+            cost = estimate_tokens(text)
+            if current and (len(current) >= max_items or tokens + cost > max_tokens):
+                batches.append(current)
+                current, tokens = [], 0
+            current.append(i)
+            tokens += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _embed_upstream(self, texts: List[str]) -> Dict[str, Any]:
+        """一批文本一次上游请求；输入超长时对半拆开重试"""
+        result = await openai_service.get_embeddings(texts)
+        if result["success"]:
+            self.upstream_calls += 1
+            self.upstream_texts += len(texts)
+            self.upstream_tokens += result.get("usage", {}).get("prompt_tokens", 0)
+            return {"success": True, "embeddings": np.asarray(result["embeddings"], dtype=np.float32)}
+        if len(texts) > 1 and _TOO_LONG.search(str(result.get("error", ""))):
+            self.batch_splits += 1
+            middle = len(texts) // 2
+            left, right = await asyncio.gather(
+                self._embed_upstream(texts[:middle]),
+                self._embed_upstream(texts[middle:])
+            )
+            for part in (left, right):
+                if not part["success"]:
+                    return part
+            return {"success": True, "embeddings": np.concatenate([left["embeddings"], right["embeddings"]])}
+        return result
+
+    async def _embed_missing(self, texts: List[str]) -> Dict[str, Any]:
+        provider = self.provider
+        if provider == "hash":
+            return {"success": True, "embeddings": await asyncio.to_thread(hash_embedding, texts)}
+        if provider == "local":
+            return {"success": True, "embeddings": await asyncio.to_thread(self._embed_local, texts)}
+
+        batches = self.plan_batches(texts, config.EMBEDDING_BATCH_SIZE, config.EMBEDDING_BATCH_TOKENS)
+        semaphore = asyncio.Semaphore(config.EMBEDDING_CONCURRENCY)
+
+        async def run(batch: List[int]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._embed_upstream([texts[i] for i in batch])
+
+        results = await asyncio.gather(*(run(batch) for batch in batches))
+        for result in results:
+            if not result["success"]:
+                return result
+        vectors = np.empty((len(texts), results[0]["embeddings"].shape[1]), dtype=np.float32)
+        for batch, result in zip(batches, results):
+            vectors[batch] = result["embeddings"]
+        return {"success": True, "embeddings": vectors}
+
+    # ==========================================
+    # 对外接口
+    # ==========================================
+
+    async def embed(self, texts: List[str]) -> Dict[str, Any]:
+        """
+        向量化一组文本（顺序与输入一致）
+
+        Returns:
+            {'success': True, 'embeddings': (n, dim) float32 矩阵, 'model': 模型标识, 'cached': 缓存命中数}
+            或 {'success': False, 'error': ...}
+        """
+        self.requests += 1
+        self.texts += len(texts)
+        if self.provider == "local":
+            # 先确定本地模型能否加载，加载失败时本次就按哈希向量计算缓存键
+            await asyncio.to_thread(self._load_local_model)
+        model_id = self.model_id
+        if not texts:
+            return {"success": True, "embeddings": np.zeros((0, 0), dtype=np.float32), "model": model_id, "cached": 0}
+
+        keys = [content_hash(f"{model_id}\n{text}") for text in texts]
+        vectors: Dict[str, np.ndarray] = {}
+        for key in dict.fromkeys(keys):
+            vector = self._memory.get(key)
+            if vector is not None:
+                vectors[key] = vector
+        lookup = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if lookup:
+            stored = await asyncio.to_thread(self.cache.get_many, lookup)
+            for key, vector in stored.items():
+                vectors[key] = vector
+                self._memory.set(key, vector)
+
+        # 未命中的文本（同一正文只向量化一次）
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        cached = sum(1 for key in keys if key in vectors)
+        self.cache_hits += cached
+
+        if missing:
+            result = await self._embed_missing(list(missing.values()))
+            if not result["success"]:
+                return {"success": False, "error": result.get("error"), "deadline_exceeded": result.get("deadline_exceeded", False)}
+            fresh = list(zip(missing, result["embeddings"]))
+            for key, vector in fresh:
+                vectors[key] = vector
+                self._memory.set(key, vector)
+            await asyncio.to_thread(self.cache.put_many, fresh)
+
+        return {
+            "success": True,
+            "embeddings": np.stack([vectors[key] for key in keys]).astype(np.float32, copy=False),
+            "model": model_id,
+            "cached": cached
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "provider": self.provider,
+            "model": self.model_id,
+            "requests": self.requests,
+            "texts": self.texts,
+            "cache_hits": self.cache_hits,
+            "cache_hit_rate": round(self.cache_hits / self.texts, 4) if self.texts else 0.0,
+            "upstream_calls": self.upstream_calls,
+            "upstream_texts": self.upstream_texts,
+            "upstream_tokens": self.upstream_tokens,
+            "avg_batch_size": round(self.upstream_texts / self.upstream_calls, 1) if self.upstream_calls else 0.0,
+            "batch_splits": self.batch_splits,
+            "memory_cache": self._memory.stats(),
+            "disk_cache_rows": len(self.cache)
+        }
+
+
+# 创建全局实例
+embedding_service = EmbeddingService()
@@ -1,18 +1,79 @@
 """
 Event Planning Service
 生成专业的游戏活动策划案
+
+策划案文本和 UI mockup 都只依赖表单内容，两次生成（各 30-60 秒）同时开始，
+总耗时约为两者中较长的一个；响应中的 timing 给出各阶段的开始、结束时间和耗时。
+mockup_mode 为 separate 时 mockup 作为异步任务（event_mockup）提交，策划案生成完即返回，
+mockup 通过 /api/jobs/{mockup_job_id} 或 /ws/jobs/{mockup_job_id} 获取。
 """
-from typing import Dict, Any, Optional
+import asyncio
+import contextvars
+import time
+from typing import Dict, Any, Optional, Awaitable
 from services.openai_service import openai_service
 from services.gpt_image_service import gpt_image_service
+from services.job_queue_service import job_queue_service
+from services.action_progress import emit_progress
+from services import deadline
+
+# 生成mockup至少需要的剩余预算（秒），不足时跳过以便按时返回策划案
+MIN_MOCKUP_BUDGET_SECONDS = 10
+
+# inline: mockup 与策划案并发生成，一起返回；separate: 策划案先返回，mockup 作为异步任务交付
+MOCKUP_MODES = ("inline", "separate")
 
 class EventPlanningService:
     def __init__(self):
         self.openai_service = openai_service
     
-    async def generate_event_plan(self, form_data: Dict[str, Any]) -> Dict[str, Any]:
-        """生成活动策划案"""
+    async def generate_event_plan(self, form_data: Dict[str, Any], mockup_mode: str = "inline") -> Dict[str, Any]:
+        """
+        生成活动策划案
+        
+        Args:
+            form_data: 活动表单
+            mockup_mode: inline（默认）或 separate
+            
+        Returns:
+            {'success', 'plan', 'mockup_image', 'form_data', 'timing'}；
+            separate 模式下 mockup_image 为 None，另有 mockup_job_id
+        """
+        if mockup_mode not in MOCKUP_MODES:
+            return {
+                'success': False,
+                'error': f"不支持的mockup模式: {mockup_mode}，可选 {', '.join(MOCKUP_MODES)}"
+            }
+        
+        started = time.monotonic()
+        stages: Dict[str, Dict[str, Any]] = {}
+        mockup_task: Optional[asyncio.Task] = None
+        mockup_job_id: Optional[str] = None
+        plan_succeeded = False
         try:
+            left = deadline.remaining()
+            mockup_skipped = False
+            if mockup_mode == 'separate':
+                # 单独交付的mockup不属于本请求：在空白上下文中提交，不受本请求截止时间约束
+                submitted = contextvars.Context().run(
+                    job_queue_service.submit, 'event_mockup', {'form_data': form_data}
+                )
+                if submitted['success']:
+                    mockup_job_id = submitted['data']['job_id']
+                    stages['mockup'] = {'status': 'queued', 'job_id': mockup_job_id}
+                else:
+                    stages['mockup'] = {'status': 'failed', 'error': submitted['error']}
+            elif left is not None and left < MIN_MOCKUP_BUDGET_SECONDS:
+                # 剩余预算不足时不生成mockup，返回不带mockup的部分结果
+                mockup_skipped = True
+                print(f"⏱️  剩余预算 {left:.1f}s 不足以生成mockup，返回部分结果")
+                stages['mockup'] = {'status': 'skipped'}
+            else:
+                # mockup 的 prompt 只依赖表单，与策划案同时开始生成
+                mockup_task = asyncio.create_task(
+                    self._timed(stages, 'mockup', started, self._generate_ui_mockup(form_data))
+                )
+            
             # 构建详细的prompt
             prompt = self._build_event_planning_prompt(form_data)
             
@@ -22,35 +83,102 @@ class EventPlanningService:
                 {"role": "user", "content": prompt}
             ]
             
-            response = await self.openai_service.get_chat_completion(
+            response = await self._timed(stages, 'plan', started, self.openai_service.get_chat_completion(
                 messages=messages,
                 temperature=0.7,
                 max_tokens=4000
-            )
+            ))
             
-            if response.get('success'):
-                plan_content = response['content']
-                
-                # 生成UI mockup图片
-                mockup_image = await self._generate_ui_mockup(form_data)
-                
-                return {
-                    'success': True,
-                    'plan': plan_content,
-                    'mockup_image': mockup_image,
-                    'form_data': form_data
-                }
-            else:
+            if not response.get('success'):
+                stages['plan']['status'] = 'failed'
+                # 策划案失败时mockup没有用处，在 finally 中取消
+                if mockup_task or mockup_job_id:
+                    stages['mockup']['status'] = 'cancelled'
                 return {
                     'success': False,
-                    'error': response.get('error', '生成策划案失败')
+                    'error': response.get('error', '生成策划案失败'),
+                    'deadline_exceeded': response.get('deadline_exceeded', False),
+                    'timing': self._timing(stages, started)
                 }
+            
+            stages['plan']['status'] = 'succeeded'
+            plan_succeeded = True
+            plan_content = response['content']
+            # 通过任务队列执行时，订阅者在mockup完成前就能拿到策划案
+            emit_progress("partial_result", stage="plan", plan=plan_content)
+            
+            mockup_image = None
+            if mockup_task:
+                mockup_image = await mockup_task
+                mockup_skipped = mockup_image is None and deadline.expired()
+                stages['mockup']['status'] = 'succeeded' if mockup_image else 'skipped' if mockup_skipped else 'failed'
+            
+            result = {
+                'success': True,
+                'plan': plan_content,
+                'mockup_image': mockup_image,
+                'form_data': form_data
+            }
+            if mockup_job_id:
+                result['mockup_job_id'] = mockup_job_id
+            if mockup_skipped:
+                result['partial'] = True
+                result['skipped_stages'] = ['mockup']
+                result['deadline_exceeded'] = True
+            result['timing'] = self._timing(stages, started)
+            return result
                 
         except Exception as e:
             return {
                 'success': False,
                 'error': f'生成策划案时发生错误: {str(e)}'
             }
+        finally:
+            if mockup_task and not mockup_task.done():
+                mockup_task.cancel()
+            if mockup_job_id and not plan_succeeded:
+                # 策划案失败、抛出异常或请求被取消时，不再让30-60秒的图像任务白跑
+                await job_queue_service.cancel(mockup_job_id)
+    
+    async def generate_mockup(self, form_data: Dict[str, Any]) -> Dict[str, Any]:
+        """单独生成UI mockup（separate 模式的 event_mockup 任务）"""
+        started = time.monotonic()
+        stages: Dict[str, Dict[str, Any]] = {}
+        mockup_image = await self._timed(stages, 'mockup', started, self._generate_ui_mockup(form_data))
+        stages['mockup']['status'] = 'succeeded' if mockup_image else 'failed'
+        if not mockup_image:
+            return {
+                'success': False,
+                'error': 'UI mockup生成失败',
+                'timing': self._timing(stages, started)
+            }
+        return {
+            'success': True,
+            'mockup_image': mockup_image,
+            'timing': self._timing(stages, started)
+        }
+    
+    @staticmethod
+    async def _timed(stages: Dict[str, Dict[str, Any]], name: str, started: float, awaitable: Awaitable) -> Any:
+        """执行一个生成阶段，记录相对请求开始的开始、结束时间（毫秒）"""
+        stage = stages.setdefault(name, {})
+        stage['start_ms'] = round((time.monotonic() - started) * 1000, 1)
+        try:
+            return await awaitable
+        finally:
+            stage['end_ms'] = round((time.monotonic() - started) * 1000, 1)
+            stage['duration_ms'] = round(stage['end_ms'] - stage['start_ms'], 1)
+    
+    @staticmethod
+    def _timing(stages: Dict[str, Dict[str, Any]], started: float) -> Dict[str, Any]:
+        """
+        各阶段耗时；sequential_ms 为各阶段耗时之和，即依次生成时的耗时
+        """
+        return {
+            'total_ms': round((time.monotonic() - started) * 1000, 1),
+            'sequential_ms': round(sum(stage.get('duration_ms', 0) for stage in stages.values()), 1),
+            'stages': stages
+        }
     
     def _build_event_planning_prompt(self, form_data: Dict[str, Any]) -> str:
         """构建活动策划prompt"""
@@ -6,6 +6,9 @@ import base64
 import httpx
 from typing import Dict, Any, Optional
 from config import config
+from .action_progress import emit_progress
+from .deadline import DeadlineExceeded, with_deadline
+from .upstream_scheduler import upstream_scheduler
 
 class GeminiImageService:
     """Gemini图像生成服务"""
@@ -27,9 +30,10 @@ class GeminiImageService:
             print(f"开始生成图像，提示词: {prompt}")
             
             # 根据用户提供的API调用格式，使用generate_images端点
-            async with httpx.AsyncClient() as client:
+            async with upstream_scheduler.slot("image"), httpx.AsyncClient() as client:
                 # 使用generate_content端点，根据用户最新示例
-                response = await client.post(
+                emit_progress("upstream_request_sent", model=self.model, size=f"{width}x{height}")
+                response = await with_deadline(client.post(
                     f"{self.base_url}/models/{self.model}:generateContent",
                     headers={
                         "Authorization": f"Bearer {self.api_key}",
@@ -51,7 +55,7 @@ class GeminiImageService:
                         }
                     },
                     timeout=60.0
-                )
+                ))
                 
                 if response.status_code != 200:
                     error_text = response.text
@@ -105,6 +109,13 @@ class GeminiImageService:
                     "error": f"API响应中未找到有效数据: {data}"
                 }
                 
+        except DeadlineExceeded as e:
+            print(f"图像生成超过请求截止时间: {str(e)}")
+            return {
+                "success": False,
+                "error": f"图像生成超时: {str(e)}",
+                "deadline_exceeded": True
+            }
         except Exception as e:
             error_message = f"生成图像时发生错误: {str(e)}"
             print(error_message)
@@ -7,6 +7,9 @@ import httpx
 from typing import Dict, Any, Optional
 from config import config
 from openai import AsyncOpenAI
+from .action_progress import emit_progress
+from .deadline import DeadlineExceeded, with_deadline
+from .upstream_scheduler import upstream_scheduler
 
 class GPTImageService:
     """GPT图像生成服务"""
@@ -29,13 +32,15 @@ class GPTImageService:
         try:
             print(f"开始生成图像，提示词: {prompt}")
             
-            # 使用OpenAI的images.generate API
-            response = await self.client.images.generate(
-                model=self.model,
-                prompt=prompt,
-                n=1,
-                size=f"{width}x{height}"
-            )
+            # 使用OpenAI的images.generate API（占用 image 类别的上游槽位）
+            async with upstream_scheduler.slot("image"):
+                emit_progress("upstream_request_sent", model=self.model, size=f"{width}x{height}")
+                response = await with_deadline(self.client.images.generate(
+                    model=self.model,
+                    prompt=prompt,
+                    n=1,
+                    size=f"{width}x{height}"
+                ))
             
             print(f"GPT API响应成功，生成了 {len(response.data)} 张图像")
             print(f"响应数据: {response.data[0] if response.data else 'No data'}")
@@ -47,7 +52,7 @@ class GPTImageService:
                 if hasattr(image_data, 'url') and image_data.url:
                     # 下载图像并转换为base64
                     async with httpx.AsyncClient() as client:
-                        img_response = await client.get(image_data.url)
+                        img_response = await with_deadline(client.get(image_data.url))
                         if img_response.status_code == 200:
                             # 将图像数据转换为base64
                             image_base64_data = base64.b64encode(img_response.content).decode('utf-8')
@@ -82,6 +87,13 @@ class GPTImageService:
                     "error": "API响应中未找到图像数据"
                 }
                 
+        except DeadlineExceeded as e:
+            print(f"图像生成超过请求截止时间: {str(e)}")
+            return {
+                "success": False,
+                "error": f"图像生成超时: {str(e)}",
+                "deadline_exceeded": True
+            }
         except Exception as e:
             error_message = f"生成图像时发生错误: {str(e)}"
             print(error_message)
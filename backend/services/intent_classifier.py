@@ -0,0 +1,514 @@
+"""
+本地意图分类器
+
+前端 intentClassifier.ts 在大多数聊天轮次之前都要做一次 LLM 意图分类，关键路径上多了一整次模型调用。
+本服务在后端本地完成分类，只有置信度不足时才回退到 LLM：
+
+1. 关键词字典树：一次扫描找出消息中出现的全部关键词，按与前端降级规则相同的优先级判断
+2. 向量最近质心：标注样例（内置种子 + LLM 回退记录的标签）按意图求平均向量，取余弦相似度最高的质心；
+   关键词与质心一致时置信度叠加
+3. LLM 回退：两层置信度都低于 INTENT_CONFIDENCE_THRESHOLD 时调用小模型，结果记入 intent_labels.db
+
+后台每 INTENT_RETRAIN_INTERVAL 秒检查一次，新记录的 LLM 标签达到 INTENT_RETRAIN_MIN_LABELS 条时重新计算质心。
+默认用哈希 n-gram 向量（INTENT_EMBEDDING=hash），本地路径不涉及任何 I/O，p50 在毫秒以内。
+"""
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from config import config
+from .embedding_service import embedding_service, hash_embedding
+from .mock_openai_service import mock_openai_service
+from .openai_service import openai_service
+from .upstream_scheduler import priority_scope
+
+INTENTS = ("text_answer", "tool_call", "workflow", "clarify")
+TOOL_IDS = (
+    "calculator", "text_processor", "json_processor", "datetime_processor",
+    "gpt_image_gen", "event_planning", "sentiment_analysis", "game_classification"
+)
+# 需要再经过 LLM 处理的工具（其余工具直接执行）
+LLM_TOOLS = ("sentiment_analysis", "game_classification")
+
+_HAS_MATH = re.compile(r"[0-9+\-*/()=]")
+_JSON_OBJECT = re.compile(r"\{[\s\S]*?\}")
+
+
+# ==========================================
+# 关键词规则（与前端 fallbackIntentDetection 的顺序一致）
+# ==========================================
+
+# (标签, 置信度, 关键词组：每组至少命中一个, 额外条件, 理由)
+KEYWORD_RULES: List[Tuple[str, float, Tuple[Tuple[str, ...], ...], Optional[Callable[[str], bool]], str]] = [
+    ("tool_call:calculator", 0.9, (("计算", "等于", "是多少", "求"),),
+     lambda message: bool(_HAS_MATH.search(message)), "关键词匹配：数学计算"),
+    ("tool_call:gpt_image_gen", 0.85, (("生成图", "画图", "生图", "画一个", "mockup", "ui设计", "原型图"),),
+     None, "关键词匹配：图像生成"),
+    ("workflow", 0.75, (("活动",), ("策划", "方案", "运营活动"), ("竞品", "对手", "竞争")),
+     None, "竞品分析任务，需要工作流"),
+    ("tool_call:event_planning", 0.85, (("活动",), ("策划", "方案", "运营活动")),
+     None, "关键词匹配：活动策划"),
+    ("tool_call:text_processor", 0.8, (("字数", "统计文本", "大写", "小写"),),
+     None, "关键词匹配：文本处理"),
+    ("tool_call:json_processor", 0.8, (("json", "{", "格式化数据"),),
+     None, "关键词匹配：JSON处理"),
+    ("tool_call:datetime_processor", 0.9, (("现在几点", "当前时间", "今天日期", "时间戳"),),
+     None, "关键词匹配：日期时间"),
+    ("tool_call:sentiment_analysis", 0.8, (("情感分析", "分析评论"),),
+     None, "关键词匹配：情感分析"),
+    ("tool_call:sentiment_analysis", 0.8, (("分析",), ("评价",)),
+     None, "关键词匹配：情感分析"),
+    ("tool_call:game_classification", 0.8, (("游戏分类", "分类游戏", "游戏类型"),),
+     None, "关键词匹配：游戏分类"),
+    ("workflow", 0.85, (("竞品分析", "竞争对手", "市场调研", "数据同步"),),
+     None, "专业分析任务，需要工作流"),
+    ("workflow", 0.7, (("帮我", "请"), ("分析", "制定", "创建", "计划")),
+     lambda message: len(message) > 30, "复杂任务，可能需要多步骤"),
+    ("text_answer", 0.9, (("翻译", "translate", "中译英", "英译中"),),
+     None, "翻译请求，使用LLM直接处理"),
+    ("text_answer", 0.85, (("代码", "code"), ("解释", "explain")),
+     None, "代码解释，使用LLM直接处理"),
+]
+
+# 内置标注样例：标签 -> 示例语句
+SEED_EXAMPLES: Dict[str, List[str]] = {
+    "text_answer": [
+        "你好", "早上好", "谢谢你的帮助", "你是谁", "介绍一下你自己",
+        "什么是用户留存率", "DAU 和 MAU 有什么区别", "如何提升留存率", "怎么提高玩家活跃度",
+        "给我一些提升付费转化的建议", "解释一下 LTV 的含义", "把这句话翻译成英文",
+        "这段代码是什么意思", "帮我写一段活动文案", "什么是 A/B 测试", "hello", "how are you",
+        "游戏运营需要关注哪些指标", "推荐几本产品经理的书", "周末适合做什么活动推广",
+    ],
+    "clarify": [
+        "帮我弄一下", "这个怎么办", "做一个", "处理一下这个", "帮我看看",
+        "那个东西", "上次说的那个", "你懂我意思吧", "继续", "按之前的来",
+        "帮我搞定", "改一下", "再来一个", "不对", "就这样弄",
+    ],
+    "workflow": [
+        "帮我做一份竞品分析报告", "分析竞争对手的付费设计并给出建议", "做一次市场调研",
+        "调研东南亚休闲游戏市场并输出报告", "同步两个表格的数据", "搜索最近的行业新闻然后总结成周报",
+        "对比三款竞品的新手引导并生成报告", "帮我制定下个季度的用户增长计划",
+        "收集玩家反馈分类后生成改进方案", "分析竞品活动并设计我们的活动方案",
+    ],
+    "tool_call:calculator": [
+        "计算 2+2", "123*456 等于多少", "求 144 的平方根", "(15+27)/3 是多少",
+        "算一下 3.5 乘以 12", "1000 的 15% 是多少", "计算 2 的 10 次方",
+    ],
+    "tool_call:text_processor": [
+        "统计这段文字的字数", "把这段文本转成大写", "转换成小写", "这段话有多少个字",
+        "去掉文本中的空格", "统计文本里的单词数",
+    ],
+    "tool_call:json_processor": [
+        "格式化这段 JSON", "提取 JSON 里的所有键名", "校验这个 json 是否合法",
+        "把 JSON 压缩成一行", "格式化数据",
+    ],
+    "tool_call:datetime_processor": [
+        "现在几点", "今天是几号", "当前时间", "把这个时间戳转成日期",
+        "距离春节还有几天", "今天星期几", "2024-01-01 和 2024-03-01 相差多少天",
+    ],
+    "tool_call:gpt_image_gen": [
+        "生成一张活动海报", "画一个可爱的猫咪", "帮我生成图片", "画一个登录页面的 UI 设计",
+        "生成一张游戏角色立绘", "做一个 App 首页的 mockup", "画图：夕阳下的城堡",
+    ],
+    "tool_call:event_planning": [
+        "帮我策划一个春节活动", "设计一个拉新运营活动", "做一个周年庆活动方案",
+        "策划一场线上抽奖活动", "给新版本上线做一个运营活动", "我想办一个签到活动",
+    ],
+    "tool_call:sentiment_analysis": [
+        "分析这些评论的情感", "情感分析", "看看玩家评价是正面还是负面", "分析评论",
+        "这些用户反馈的情绪怎么样", "判断这条评价是好评还是差评",
+    ],
+    "tool_call:game_classification": [
+        "这款游戏属于什么类型", "给这些游戏分类", "游戏分类", "判断这个游戏是不是 SLG",
+        "把这些游戏按品类分组",
+    ],
+}
+
+INTENT_SYSTEM_PROMPT = """你是一个意图分类助手。快速准确地分析用户的输入，判断需要采取什么行动。
+
+## 意图类型：
+1. text_answer：一般对话、解释概念、回答问题、翻译、代码解释、简单建议
+2. tool_call：单工具调用，可用工具ID：calculator（数学计算）、text_processor（文本处理）、
+   json_processor（JSON处理）、datetime_processor（日期时间）、gpt_image_gen（图像生成）、
+   event_planning（活动策划）、sentiment_analysis（情感分析）、game_classification（游戏分类）
+3. workflow：竞品分析、市场调研、数据同步等需要多个步骤的复杂任务
+4. clarify：需求不明确、缺少必要参数、需要用户选择或确认
+
+## 返回格式（只返回JSON，不要其他文字）：
+{"intent": "text_answer|tool_call|workflow|clarify", "toolId": "tool_call 时的工具ID", "confidence": 0.95, "reasoning": "简短的判断理由"}"""
+
+
+def split_label(label: str) -> Tuple[str, Optional[str]]:
+    """'tool_call:calculator' -> ('tool_call', 'calculator')"""
+    intent, _, tool_id = label.partition(":")
+    return intent, tool_id or None
+
+
+def make_result(label: str, confidence: float, source: str, reasoning: str) -> Dict[str, Any]:
+    """组装与前端 IntentResult 相同结构的结果"""
+    intent, tool_id = split_label(label)
+    result = {
+        "intent": intent,
+        "confidence": round(float(confidence), 4),
+        "reasoning": reasoning,
+        "shouldUseLLM": intent in ("text_answer", "workflow") or (intent == "tool_call" and tool_id in LLM_TOOLS),
+        "source": source
+    }
+    if tool_id:
+        result["toolId"] = tool_id
+    return result
+
+
+class KeywordTrie:
+    """关键词字典树：一次扫描找出文本中出现的全部关键词"""
+
+    _END = "\0"
+
+    def __init__(self, keywords: List[str]):
+        self._root: Dict[str, Any] = {}
+        for keyword in keywords:
+            node = self._root
+            for char in keyword.lower():
+                node = node.setdefault(char, {})
+            node[self._END] = keyword
+
+    def find_all(self, text: str) -> Set[str]:
+        text = text.lower()
+        found: Set[str] = set()
+        for start in range(len(text)):
+            node = self._root
+            for position in range(start, len(text)):
+                node = node.get(text[position])
+                if node is None:
+                    break
+                if self._END in node:
+                    found.add(node[self._END])
+        return found
+
+
+class IntentLabelLog:
+    """LLM 回退产生的标签（SQLite，同一句话只保留最新的标签）"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS labels ("
+                "text TEXT PRIMARY KEY, label TEXT NOT NULL, confidence REAL, created_at REAL)"
+            )
+            self._conn.commit()
+
+    def record(self, text: str, label: str, confidence: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO labels (text, label, confidence, created_at) VALUES (?, ?, ?, ?)",
+                (text, label, confidence, time.time())
+            )
+            self._conn.commit()
+
+    def examples(self, per_label: int) -> Dict[str, List[str]]:
+        """每个标签最近的 per_label 条样例"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT label, text FROM ("
+                " SELECT label, text, ROW_NUMBER() OVER (PARTITION BY label ORDER BY created_at DESC) AS n"
+                " FROM labels) WHERE n <= ?",
+                (per_label,)
+            ).fetchall()
+        examples: Dict[str, List[str]] = {}
+        for label, text in rows:
+            examples.setdefault(label, []).append(text)
+        return examples
+
+    def count_since(self, timestamp: float) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM labels WHERE created_at > ?", (timestamp,)).fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM labels").fetchone()[0]
+
+
+class IntentClassifierService:
+    """关键词 + 最近质心的本地意图分类，低置信度时回退 LLM"""
+
+    def __init__(self):
+        self.trie = KeywordTrie([keyword for rule in KEYWORD_RULES for group in rule[2] for keyword in group])
+        self._log: Optional[IntentLabelLog] = None
+        self._open_lock = threading.Lock()
+        self._train_lock: Optional[asyncio.Lock] = None
+        self._retrain_task: Optional[asyncio.Task] = None
+
+        self.labels: List[str] = []
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_at = 0.0
+        self.trained_examples = 0
+
+        self.requests = 0
+        self.by_source: Dict[str, int] = {}
+        self.llm_failures = 0
+        self._local_latencies: Deque[float] = deque(maxlen=2000)
+
+    @property
+    def log(self) -> IntentLabelLog:
+        if self._log is None:
+            with self._open_lock:
+                if self._log is None:
+                    self._log = IntentLabelLog(config.INTENT_LABELS_PATH)
+        return self._log
+
+    # ==========================================
+    # 向量与训练
+    # ==========================================
+
+    @property
+    def embedding_id(self) -> str:
+        if config.INTENT_EMBEDDING == "service":
+            return embedding_service.model_id
+        return f"hash-{config.INTENT_HASH_DIM}"
+
+    async def _embed(self, texts: List[str]) -> np.ndarray:
+        """单位化的向量矩阵；hash 模式为纯 CPU 计算，不经过缓存和上游"""
+        if config.INTENT_EMBEDDING == "service":
+            embedded = await embedding_service.embed(texts)
+            if not embedded["success"]:
+                raise RuntimeError(embedded.get("error"))
+            vectors = embedded["embeddings"]
+        elif len(texts) > 1:
+            # 训练时整批计算，放到线程中执行，不阻塞事件循环
+            vectors = await asyncio.to_thread(hash_embedding, texts, config.INTENT_HASH_DIM)
+        else:
+            vectors = hash_embedding(texts, dim=config.INTENT_HASH_DIM)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _load(self) -> bool:
+        """加载已保存的质心；向量模型变化后视为未训练"""
+        if not os.path.exists(config.INTENT_CENTROIDS_PATH):
+            return False
+        saved = np.load(config.INTENT_CENTROIDS_PATH)
+        if str(saved["embedding_id"]) != self.embedding_id:
+            return False
+        self.labels = [str(label) for label in saved["labels"]]
+        self.centroids = saved["centroids"]
+        self.trained_at = float(saved["trained_at"])
+        self.trained_examples = int(saved["examples"])
+        return True
+
+    async def train(self) -> Dict[str, Any]:
+        """用种子样例和已记录的 LLM 标签重新计算各意图的质心"""
+        if self._train_lock is None:
+            self._train_lock = asyncio.Lock()
+        async with self._train_lock:
+            started = time.time()
+            examples = {label: list(texts) for label, texts in SEED_EXAMPLES.items()}
+            logged = await asyncio.to_thread(self.log.examples, config.INTENT_MAX_EXAMPLES_PER_LABEL)
+            for label, texts in logged.items():
+                examples.setdefault(label, []).extend(texts)
+
+            labels = sorted(examples)
+            texts = [text for label in labels for text in examples[label]]
+            vectors = await self._embed(texts)
+            sizes = [len(examples[label]) for label in labels]
+            centroids = await asyncio.to_thread(self._fit_and_save, labels, sizes, vectors, started)
+
+            self.labels = labels
+            self.centroids = centroids
+            self.trained_at = started
+            self.trained_examples = len(texts)
+            logged_count = sum(len(texts) for texts in logged.values())
+            print(f"🎯 意图分类器训练完成: {len(labels)} 个标签，{len(texts)} 条样例（其中 LLM 标签 {logged_count} 条）")
+            return {"labels": len(labels), "examples": len(texts), "logged_examples": logged_count}
+
+    def _fit_and_save(self, labels: List[str], sizes: List[int], vectors: np.ndarray, trained_at: float) -> np.ndarray:
+        """计算各标签的单位化质心并写入磁盘（在线程中执行）"""
+        centroids = []
+        offset = 0
+        for size in sizes:
+            centroid = vectors[offset:offset + size].mean(axis=0)
+            centroids.append(centroid / max(float(np.linalg.norm(centroid)), 1e-12))
+            offset += size
+        matrix = np.stack(centroids).astype(np.float32)
+        os.makedirs(os.path.dirname(config.INTENT_CENTROIDS_PATH), exist_ok=True)
+        np.savez(
+            config.INTENT_CENTROIDS_PATH,
+            labels=np.array(labels),
+            centroids=matrix,
+            embedding_id=np.array(self.embedding_id),
+            trained_at=np.array(trained_at),
+            examples=np.array(sum(sizes))
+        )
+        return matrix
+
+    async def _ensure_trained(self) -> None:
+        if self.centroids is None and not await asyncio.to_thread(self._load):
+            await self.train()
+
+    async def _retrain_loop(self) -> None:
+        try:
+            await self._ensure_trained()
+        except Exception as e:
+            print(f"⚠️ 意图分类器训练失败: {e}")
+        while True:
+            await asyncio.sleep(config.INTENT_RETRAIN_INTERVAL)
+            try:
+                new_labels = await asyncio.to_thread(self.log.count_since, self.trained_at)
+                if new_labels >= config.INTENT_RETRAIN_MIN_LABELS:
+                    await self.train()
+            except Exception as e:
+                print(f"⚠️ 意图分类器重新训练失败: {e}")
+
+    def start(self) -> None:
+        """预先加载或训练质心，并启动定期重新训练（在事件循环中调用）"""
+        if self._retrain_task is None or self._retrain_task.done():
+            self._retrain_task = asyncio.create_task(self._retrain_loop())
+
+    def shutdown(self) -> None:
+        if self._retrain_task is not None:
+            self._retrain_task.cancel()
+            self._retrain_task = None
+
+    # ==========================================
+    # 分类
+    # ==========================================
+
+    def _keyword_match(self, message: str) -> Optional[Tuple[str, float, str]]:
+        found = self.trie.find_all(message)
+        if not found:
+            return None
+        for label, confidence, groups, condition, reasoning in KEYWORD_RULES:
+            if all(any(keyword in found for keyword in group) for group in groups) and \
+                    (condition is None or condition(message)):
+                return label, confidence, reasoning
+        return None
+
+    def _nearest_centroid(self, vector: np.ndarray) -> Tuple[str, float, float]:
+        """(标签, 置信度, 相似度)；置信度为按温度缩放的 softmax 概率"""
+        similarities = self.centroids @ vector
+        best = int(np.argmax(similarities))
+        logits = (similarities - similarities[best]) / config.INTENT_CENTROID_TEMPERATURE
+        probabilities = np.exp(logits)
+        return self.labels[best], float(probabilities[best] / probabilities.sum()), float(similarities[best])
+
+    async def classify_local(self, message: str) -> Dict[str, Any]:
+        """只用本地两层分类，返回结果中 confident 表示是否达到阈值"""
+        await self._ensure_trained()
+        threshold = config.INTENT_CONFIDENCE_THRESHOLD
+        keyword = self._keyword_match(message)
+        if keyword is not None and keyword[1] >= threshold:
+            return {**make_result(keyword[0], keyword[1], "keyword", keyword[2]), "confident": True}
+
+        vector = (await self._embed([message]))[0]
+        label, confidence, similarity = self._nearest_centroid(vector)
+        reasoning = f"最近质心：{label}（相似度 {similarity:.2f}）"
+        if keyword is not None:
+            if keyword[0] == label:
+                # 两层独立证据一致：noisy-or 合并置信度
+                confidence = 1 - (1 - confidence) * (1 - keyword[1])
+                reasoning = f"{keyword[2]}；{reasoning}"
+            elif keyword[1] >= confidence:
+                return {**make_result(keyword[0], keyword[1], "keyword", keyword[2]), "confident": False}
+        return {**make_result(label, confidence, "centroid", reasoning), "confident": confidence >= threshold}
+
+    async def _classify_llm(self, message: str) -> Optional[Dict[str, Any]]:
+        service = mock_openai_service if config.USE_MOCK_OPENAI else openai_service
+        with priority_scope("interactive"):
+            response = await service.get_chat_completion(
+                messages=[
+                    {"role": "system", "content": INTENT_SYSTEM_PROMPT},
+                    {"role": "user", "content": message}
+                ],
+                temperature=0.3,
+                max_tokens=500,
+                model=config.INTENT_LLM_MODEL
+            )
+        if not response["success"] or not response.get("content"):
+            return None
+        match = _JSON_OBJECT.search(response["content"])
+        if not match:
+            return None
+        try:
+            parsed = json.loads(match.group())
+        except json.JSONDecodeError:
+            return None
+
+        intent = parsed.get("intent")
+        if intent not in INTENTS:
+            return None
+        label = intent
+        if intent == "tool_call":
+            if parsed.get("toolId") not in TOOL_IDS:
+                return None
+            label = f"tool_call:{parsed['toolId']}"
+        try:
+            confidence = float(parsed.get("confidence") or 0.5)
+        except (TypeError, ValueError):
+            confidence = 0.5
+        return {"label": label, "confidence": confidence, "reasoning": str(parsed.get("reasoning") or "")}
+
+    async def classify(self, message: str, allow_llm: bool = True) -> Dict[str, Any]:
+        """
+        分类一条用户消息
+
+        Args:
+            message: 用户输入
+            allow_llm: 本地置信度不足时是否回退 LLM
+
+        Returns:
+            {'intent', 'confidence', 'toolId'(可选), 'reasoning', 'shouldUseLLM', 'source', 'latency_ms'}，
+            source 为 keyword / centroid / llm
+        """
+        started = time.perf_counter()
+        self.requests += 1
+        result = await self.classify_local(message)
+        confident = result.pop("confident")
+        self._local_latencies.append(time.perf_counter() - started)
+
+        if not confident and allow_llm and message.strip():
+            try:
+                llm = await self._classify_llm(message)
+            except Exception as e:
+                print(f"⚠️ LLM 意图分类失败，使用本地结果: {e}")
+                llm = None
+            if llm is None:
+                self.llm_failures += 1
+            else:
+                result = make_result(llm["label"], llm["confidence"], "llm", llm["reasoning"])
+                if llm["confidence"] >= config.INTENT_LLM_LABEL_MIN_CONFIDENCE:
+                    await asyncio.to_thread(self.log.record, message.strip(), llm["label"], llm["confidence"])
+
+        self.by_source[result["source"]] = self.by_source.get(result["source"], 0) + 1
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = np.asarray(self._local_latencies) * 1000 if self._local_latencies else None
+        return {
+            "embedding": self.embedding_id,
+            "labels": len(self.labels),
+            "trained_examples": self.trained_examples,
+            "trained_at": self.trained_at or None,
+            "logged_labels": len(self.log),
+            "requests": self.requests,
+            "by_source": self.by_source,
+            "llm_fallback_rate": round(self.by_source.get("llm", 0) / self.requests, 4) if self.requests else 0.0,
+            "llm_failures": self.llm_failures,
+            "local_p50_ms": round(float(np.percentile(latencies, 50)), 3) if latencies is not None else None,
+            "local_p99_ms": round(float(np.percentile(latencies, 99)), 3) if latencies is not None else None
+        }
+
+
+# 创建全局实例
+intent_classifier_service = IntentClassifierService()
@@ -0,0 +1,348 @@
+"""
+知识库近似最近邻索引（IVF，倒排文件）
+
+在 VectorStore 之上建立：用球面 k-means 把向量划分到 nlist 个簇，查询时只扫描与查询
+最接近的 nprobe 个簇。nprobe 越大召回越高、延迟越高，可按请求调整。
+
+存储（与向量文件同目录）：
+- ivf_centroids.npz: 簇中心和训练时的行数，训练时整体替换
+- ivf_assign.i32: 每行所属的簇号，与 vectors.f32 按行对齐、只追加
+
+内存中按簇重排出连续的向量副本（packed），每个簇一次矩阵乘法即可打分；
+训练后新写入的行先进入增量区（delta），查询时全量扫描，积累到 repack_rows 行后并入 packed。
+删除沿用 VectorStore 的墓碑标记，查询时过滤；重排时丢弃已删除的行。
+
+传入 QuantizedVectors 且编码已覆盖全部已分配行时不再复制 float32 向量：按簇读取量化编码打分
+（IVF-int8 / IVF-PQ），再取前 k x rerank 个候选读回原向量精确重排。
+"""
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from .vector_quantizer import QuantizedVectors, rerank_exact
+from .vector_store import VectorStore
+
+CENTROID_FILE = "ivf_centroids.npz"
+ASSIGN_FILE = "ivf_assign.i32"
+
+
+def spherical_kmeans(
+    vectors: np.ndarray,
+    n_clusters: int,
+    n_iter: int = 10,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    球面 k-means（向量已归一化，按内积分配，中心重新归一化）
+
+    空簇用当前分得最差的样本重新初始化。
+
+    Returns:
+        (n_clusters, dim) 的归一化簇中心
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        labels, similarity = _nearest(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        counts = np.bincount(labels, minlength=n_clusters)
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            sums[empty] = vectors[np.argsort(similarity)[:empty.size]]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = (sums / np.maximum(norms, 1e-12)).astype(np.float32)
+    return centroids
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray, block_rows: int = 32768) -> Tuple[np.ndarray, np.ndarray]:
+    """每行最近的簇号及其相似度（分块计算，避免一次生成 N x nlist 的大矩阵）"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    similarity = np.empty(len(vectors), dtype=np.float32)
+    centroids_t = np.ascontiguousarray(centroids.T)
+    for start in range(0, len(vectors), block_rows):
+        scores = np.asarray(vectors[start:start + block_rows]) @ centroids_t
+        labels[start:start + len(scores)] = scores.argmax(axis=1)
+        similarity[start:start + len(scores)] = scores.max(axis=1)
+    return labels, similarity
+
+
+class IVFIndex:
+    """VectorStore 的 IVF 近似检索索引"""
+
+    def __init__(
+        self,
+        store: VectorStore,
+        nprobe: int = 16,
+        min_rows: int = 50000,
+        repack_rows: int = 20000,
+        retrain_growth: float = 4.0,
+        quantized: Optional[QuantizedVectors] = None
+    ):
+        """
+        Args:
+            store: 底层向量存储
+            nprobe: 默认每次查询扫描的簇数
+            min_rows: 行数达到后才自动训练（更小的库精确检索已经足够快）
+            repack_rows: 增量区达到该行数后并入 packed
+            retrain_growth: 行数增长到训练时的该倍数后重新训练
+            quantized: 量化编码；须在本索引 sync 之前 sync
+        """
+        self.store = store
+        self.quantized = quantized
+        self.nprobe = nprobe
+        self.min_rows = min_rows
+        self.repack_rows = repack_rows
+        self.retrain_growth = retrain_growth
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()  # 串行化 train / sync
+
+        self._centroid_path = os.path.join(store.directory, CENTROID_FILE)
+        self._assign_path = os.path.join(store.directory, ASSIGN_FILE)
+        self._centroids: Optional[np.ndarray] = None
+        self._assign = np.empty(0, dtype=np.int32)
+        self._trained_rows = 0
+        self._reset_layout()
+        self._load()
+
+    def _reset_layout(self) -> None:
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._order = np.empty(0, dtype=np.int64)
+        self._packed = np.empty((0, self.store.dim or 0), dtype=np.float32)
+        self._delta_rows = np.empty(0, dtype=np.int64)
+        self._delta_vectors = np.empty((0, self.store.dim or 0), dtype=np.float32)
+
+    # ==========================================
+    # 持久化
+    # ==========================================
+
+    def _load(self) -> None:
+        """读取簇中心和簇分配；分配文件比向量文件长（向量写入未提交）时截断"""
+        if not (os.path.exists(self._centroid_path) and os.path.exists(self._assign_path)):
+            return
+        with np.load(self._centroid_path) as saved:
+            centroids = saved["centroids"]
+            trained_rows = int(saved["trained_rows"])
+        if centroids.shape[1] != self.store.dim:
+            print(f"⚠️ IVF 簇中心维度与向量存储不一致，忽略已有索引: {self._centroid_path}")
+            return
+        assign = np.fromfile(self._assign_path, dtype=np.int32)
+        rows = self.store.stats()["rows"]
+        if assign.size > rows:
+            assign = assign[:rows]
+            with open(self._assign_path, "r+b") as f:
+                f.truncate(rows * 4)
+        self._centroids = centroids
+        self._assign = assign
+        self._trained_rows = trained_rows
+        self._install(self._pack(assign, len(centroids)))
+        print(f"🧭 已加载 IVF 索引: {len(centroids)} 个簇，{assign.size} 行")
+
+    def _save_training(self) -> None:
+        """训练后整体替换簇中心和分配文件"""
+        tmp_assign = self._assign_path + ".tmp"
+        self._assign.tofile(tmp_assign)
+        tmp_centroids = self._centroid_path + ".tmp.npz"
+        np.savez(tmp_centroids, centroids=self._centroids, trained_rows=self._trained_rows)
+        os.replace(tmp_assign, self._assign_path)
+        os.replace(tmp_centroids, self._centroid_path)
+
+    # ==========================================
+    # 构建
+    # ==========================================
+
+    @property
+    def trained(self) -> bool:
+        return self._centroids is not None
+
+    def train(self, nlist: Optional[int] = None, sample_size: Optional[int] = None, n_iter: int = 10) -> Dict[str, Any]:
+        """
+        训练簇中心并重新分配全部行
+
+        Args:
+            nlist: 簇数，默认 sqrt(行数)
+            sample_size: 训练采样行数，默认 nlist * 64
+            n_iter: k-means 迭代次数
+        """
+        with self._build_lock:
+            return self._train_locked(nlist, sample_size, n_iter)
+
+    def _train_locked(self, nlist: Optional[int], sample_size: Optional[int], n_iter: int) -> Dict[str, Any]:
+        matrix, live = self.store.snapshot()
+        live_rows = np.flatnonzero(live)
+        if live_rows.size == 0:
+            return {"trained": False, "reason": "向量库为空"}
+
+        nlist = min(nlist or max(1, int(np.sqrt(live_rows.size))), live_rows.size)
+        sample_size = min(sample_size or nlist * 64, live_rows.size)
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(live_rows, sample_size, replace=False))
+        centroids = spherical_kmeans(np.asarray(matrix[sample]), nlist, n_iter=n_iter)
+        assign, _ = _nearest(matrix, centroids)
+        layout = self._pack(assign, nlist)
+
+        with self._lock:
+            self._centroids = centroids
+            self._assign = assign
+            self._trained_rows = int(assign.size)
+            self._install(layout)
+        self._save_training()
+        print(f"🧭 IVF 索引训练完成: {nlist} 个簇，{assign.size} 行")
+        return {"trained": True, "nlist": nlist, "rows": int(assign.size), "sample_size": sample_size}
+
+    def _pack(self, assign: np.ndarray, n_lists: int) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """
+        按簇重排存活行，返回 (offsets, order, packed)；不持锁，构建完成后再替换
+
+        量化编码已覆盖全部已分配行时 packed 为 None，查询按 order 读取编码
+        """
+        matrix, live = self.store.snapshot()
+        assigned = np.flatnonzero(live[:assign.size])
+        labels = assign[assigned]
+        order = assigned[np.argsort(labels, kind="stable")]
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=n_lists), out=offsets[1:])
+        if self.quantized is not None and self.quantized.trained and self.quantized.rows >= assign.size:
+            packed = None
+        else:
+            packed = np.asarray(matrix[order]) if order.size else np.empty((0, self.store.dim), dtype=np.float32)
+        return offsets, order, packed
+
+    def _install(self, layout: Tuple[np.ndarray, np.ndarray, np.ndarray]) -> None:
+        """替换 packed 布局并清空增量区（调用方持有锁）"""
+        self._offsets, self._order, self._packed = layout
+        self._delta_rows = np.empty(0, dtype=np.int64)
+        self._delta_vectors = np.empty((0, self.store.dim), dtype=np.float32)
+
+    def sync(self) -> Dict[str, Any]:
+        """
+        写入后调用：为新增行分配簇并追加到分配文件；按需训练、重排
+
+        Returns:
+            {'action': 'none' | 'assigned' | 'trained' | 'repacked', ...}
+        """
+        with self._build_lock:
+            return self._sync_locked()
+
+    def _sync_locked(self) -> Dict[str, Any]:
+        rows = self.store.stats()["rows"]
+        if not self.trained or rows >= self._trained_rows * self.retrain_growth:
+            if rows >= self.min_rows:
+                return {"action": "trained", **self._train_locked(None, None, 10)}
+            return {"action": "none"}
+        if rows <= self._assign.size:
+            return {"action": "none"}
+
+        matrix, _ = self.store.snapshot()
+        start = self._assign.size
+        new_vectors = np.asarray(matrix[start:rows])
+        labels, _ = _nearest(new_vectors, self._centroids)
+        with open(self._assign_path, "ab") as f:
+            f.write(labels.tobytes())
+
+        with self._lock:
+            self._assign = np.concatenate([self._assign, labels])
+            self._delta_rows = np.concatenate([self._delta_rows, np.arange(start, rows)])
+            self._delta_vectors = np.concatenate([self._delta_vectors, new_vectors])
+            repack = self._delta_rows.size >= self.repack_rows
+        if repack:
+            # 打包期间 delta 不会再增长（sync 已串行化），替换时整体清空
+            layout = self._pack(self._assign, len(self._centroids))
+            with self._lock:
+                self._install(layout)
+            return {"action": "repacked", "rows": rows}
+        return {"action": "assigned", "rows": rows - start}
+
+    # ==========================================
+    # 查询
+    # ==========================================
+
+    def search_vectors(
+        self,
+        queries: np.ndarray,
+        k: int = 10,
+        mask: Optional[np.ndarray] = None,
+        nprobe: Optional[int] = None,
+        rerank: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        近似 top-k 内积检索，返回格式与 VectorStore.search_vectors 相同
+
+        未训练时退化为量化扫描或精确检索；尚未分配簇的新行（sync 之前）总是精确扫描。
+        按量化编码打分时，rerank > 0 取前 k x rerank 个候选读回原向量精确重排。
+        各条查询的候选数不同，结果列数按候选最少的查询截齐。
+        """
+        if not self.trained:
+            if self.quantized is not None:
+                return self.quantized.search_vectors(queries, k, mask, rerank)
+            return self.store.search_vectors(queries, k, mask)
+
+        queries = self.store.prepare_queries(queries)
+        matrix, candidates = self.store.snapshot(mask)
+        with self._lock:
+            centroids, offsets, order, packed = self._centroids, self._offsets, self._order, self._packed
+            delta_rows, delta_vectors = self._delta_rows, self._delta_vectors
+            assigned = self._assign.size
+
+        nprobe = max(1, min(nprobe or self.nprobe, len(centroids)))
+        probes = np.argpartition(-(queries @ centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        tail_rows = np.arange(assigned, matrix.shape[0])
+        tail_vectors = np.asarray(matrix[assigned:]) if tail_rows.size else None
+        quantizer, codes = self.quantized.snapshot() if packed is None else (None, None)
+        if rerank is None:
+            rerank = self.quantized.rerank if self.quantized is not None else 0
+        n_candidates = k * rerank if quantizer is not None and rerank > 0 else k
+
+        all_rows, all_scores = [], []
+        for query, lists in zip(queries, probes):
+            rows = [order[offsets[l]:offsets[l + 1]] for l in lists]
+            if quantizer is None:
+                scores = [packed[offsets[l]:offsets[l + 1]] @ query for l in lists]
+            else:
+                rows = [np.concatenate(rows)]
+                scores = [quantizer.score(codes[rows[0]], quantizer.prepare(query[None]))[:, 0]]
+            if delta_rows.size:
+                rows.append(delta_rows)
+                scores.append(delta_vectors @ query)
+            if tail_vectors is not None:
+                rows.append(tail_rows)
+                scores.append(tail_vectors @ query)
+            rows = np.concatenate(rows)
+            scores = np.concatenate(scores)
+            keep = candidates[rows]
+            rows, scores = rows[keep], scores[keep]
+            if rows.size > n_candidates:
+                top = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+                rows, scores = rows[top], scores[top]
+            if n_candidates > k:
+                rows, scores = rerank_exact(matrix, query, rows, k)
+            ranked = np.argsort(-scores, kind="stable")
+            all_rows.append(rows[ranked])
+            all_scores.append(scores[ranked])
+
+        width = min(len(r) for r in all_rows)
+        return (
+            np.stack([r[:width] for r in all_rows]).astype(np.int64),
+            np.stack([s[:width] for s in all_scores]).astype(np.float32)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            if not self.trained:
+                return {"trained": False, "min_rows": self.min_rows}
+            sizes = np.diff(self._offsets)
+            return {
+                "trained": True,
+                "nlist": int(len(self._centroids)),
+                "nprobe": self.nprobe,
+                "assigned_rows": int(self._assign.size),
+                "packed_rows": int(self._order.size),
+                "packed": "float32" if self._packed is not None else self.quantized.kind,
+                "packed_bytes": int(self._packed.nbytes) if self._packed is not None else 0,
+                "delta_rows": int(self._delta_rows.size),
+                "trained_rows": self._trained_rows,
+                "list_size_max": int(sizes.max()) if sizes.size else 0,
+                "list_size_mean": round(float(sizes.mean()), 1) if sizes.size else 0.0
+            }
@@ -0,0 +1,310 @@
+"""
+异步任务队列服务
+
+把耗时 30-90 秒的操作（图像生成、活动策划、Action 执行）从 HTTP 请求中剥离：
+- 提交后立即返回 job_id
+- 固定数量的 worker 按优先级（数字越小越优先）取任务执行
+- 客户端可轮询状态，或通过 WebSocket 订阅进度和完成事件
+- 已完成任务的结果保留 TTL 时间后淘汰
+- 排队中或运行中的任务都可以取消
+"""
+import asyncio
+import itertools
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config import config
+from .action_progress import progress_scope
+from .deadline import create_detached_task
+
+# 任务处理函数签名：(payload, report_progress) -> 结果字典
+ProgressReporter = Callable[..., None]
+JobHandler = Callable[[Dict[str, Any], ProgressReporter], Awaitable[Dict[str, Any]]]
+
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class Job:
+    """单个异步任务"""
+
+    def __init__(self, kind: str, payload: Dict[str, Any], priority: int):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.payload = payload
+        self.priority = priority
+        self.status = "queued"  # queued | running | succeeded | failed | cancelled
+        self.progress: Dict[str, Any] = {"stage": "queued"}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers: List[asyncio.Queue] = []
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "priority": self.priority,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_wait_ms": round((self.started_at - self.created_at) * 1000, 1) if self.started_at else None,
+            "run_ms": round((self.finished_at - self.started_at) * 1000, 1) if self.started_at and self.finished_at else None
+        }
+        if include_result:
+            data["result"] = self.result
+        return data
+
+
+class JobQueueService:
+    """优先级任务队列 + 有界 worker 池"""
+
+    def __init__(self, workers: int = 4, result_ttl: float = 3600, max_queued: int = 1000):
+        self.worker_count = workers
+        self.result_ttl = result_ttl
+        self.max_queued = max_queued
+        self.handlers: Dict[str, JobHandler] = {}
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._sequence = itertools.count()  # 同优先级按提交顺序执行
+
+    def register_handler(self, kind: str, handler: JobHandler) -> None:
+        """注册任务类型的处理函数"""
+        self.handlers[kind] = handler
+
+    def _ensure_workers(self) -> None:
+        """在事件循环中首次提交任务时启动 worker（不继承提交请求的上下文）"""
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < self.worker_count:
+            self._workers.append(create_detached_task(self._worker_loop()))
+
+    def submit(self, kind: str, payload: Dict[str, Any], priority: int = 5) -> Dict[str, Any]:
+        """
+        提交任务，立即返回
+
+        Returns:
+            {'success': True, 'data': 任务状态} 或错误信息
+        """
+        if kind not in self.handlers:
+            return {
+                "success": False,
+                "error": f"不支持的任务类型: {kind}，可选 {', '.join(self.handlers)}"
+            }
+
+        self._evict_expired()
+        queued = sum(1 for job in self.jobs.values() if job.status == "queued")
+        if queued >= self.max_queued:
+            return {
+                "success": False,
+                "error": f"任务队列已满（{queued}），请稍后重试"
+            }
+
+        self._ensure_workers()
+        job = Job(kind, payload, priority)
+        self.jobs[job.id] = job
+        self._queue.put_nowait((priority, next(self._sequence), job.id))
+        print(f"📥 任务已入队: {job.id} ({kind}, 优先级 {priority})")
+        return {"success": True, "data": job.to_dict(include_result=False)}
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._evict_expired()
+        return self.jobs.get(job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Job]:
+        """取消排队中或运行中的任务"""
+        job = self.jobs.get(job_id)
+        if not job or job.done:
+            return job
+
+        if job.status == "queued":
+            # worker 取到后会直接跳过
+            self._finish(job, "cancelled", error="任务已取消")
+        elif job.task:
+            job.task.cancel()
+            try:
+                await job.task
+            except asyncio.CancelledError:
+                pass
+        return job
+
+    def subscribe(self, job_id: str) -> Optional[asyncio.Queue]:
+        """订阅任务事件；返回的队列会依次收到 progress 和最终状态事件"""
+        job = self.jobs.get(job_id)
+        if not job:
+            return None
+        queue: asyncio.Queue = asyncio.Queue()
+        job.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue) -> None:
+        job = self.jobs.get(job_id)
+        if job and queue in job.subscribers:
+            job.subscribers.remove(queue)
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "workers": self.worker_count,
+            "jobs": counts,
+            "kinds": list(self.handlers)
+        }
+
+    # ==========================================
+    # 内部实现
+    # ==========================================
+
+    def _publish(self, job: Job, event: Dict[str, Any]) -> None:
+        event = {"job_id": job.id, "timestamp": time.time(), **event}
+        for queue in job.subscribers:
+            queue.put_nowait(event)
+
+    def _finish(self, job: Job, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        job.progress = {"stage": status}
+        self._publish(job, {"type": status, "job": job.to_dict()})
+
+    async def _worker_loop(self) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            try:
+                if job is None or job.status != "queued":
+                    continue
+                job.task = asyncio.create_task(self._run(job))
+                try:
+                    await job.task
+                except asyncio.CancelledError:
+                    if not job.task.cancelled():
+                        raise  # worker 本身被取消
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        handler = self.handlers[job.kind]
+        job.status = "running"
+        job.started_at = time.time()
+
+        def report_progress(stage: str, **info: Any) -> None:
+            job.progress = {"stage": stage, **info}
+            self._publish(job, {"type": "progress", "progress": job.progress})
+
+        report_progress("started")
+        try:
+            result = await handler(job.payload, report_progress)
+        except asyncio.CancelledError:
+            self._finish(job, "cancelled", error="任务已取消")
+            raise
+        except Exception as e:
+            print(f"❌ 任务执行失败: {job.id} - {e}")
+            self._finish(job, "failed", error=str(e))
+            return
+
+        if result.get("success", True):
+            self._finish(job, "succeeded", result=result)
+        else:
+            self._finish(job, "failed", result=result, error=result.get("error"))
+
+    def _evict_expired(self) -> None:
+        """淘汰结果保留超过 TTL 的已完成任务"""
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.done and job.finished_at and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+
+# ==========================================
+# 内置任务类型
+# ==========================================
+
+def _forward_progress(report_progress: ProgressReporter) -> Callable[[Dict[str, Any]], None]:
+    """把服务内部的进度事件（上游请求、首个 token、中间结果）转发为任务进度"""
+    return lambda event: report_progress(event.pop("type"), **event)
+
+
+async def _run_image_job(payload: Dict[str, Any], report_progress: ProgressReporter) -> Dict[str, Any]:
+    from .gpt_image_service import gpt_image_service
+
+    if not payload.get("prompt"):
+        return {"success": False, "error": "缺少必要参数: prompt"}
+    report_progress("generating_image")
+    with progress_scope(_forward_progress(report_progress)):
+        return await gpt_image_service.generate_image(
+            prompt=payload["prompt"],
+            width=payload.get("width", 1024),
+            height=payload.get("height", 1024)
+        )
+
+
+async def _run_action_job(payload: Dict[str, Any], report_progress: ProgressReporter) -> Dict[str, Any]:
+    from .action_executor_service import action_executor_service
+
+    if not payload.get("action_id"):
+        return {"success": False, "error": "缺少必要参数: action_id"}
+    report_progress("executing_action", action_id=payload["action_id"])
+    with progress_scope(_forward_progress(report_progress)):
+        return await action_executor_service.execute_action(
+            action_id=payload["action_id"],
+            action_name=payload.get("action_name", payload["action_id"]),
+            action_type=payload.get("action_type", ""),
+            parameters=payload.get("parameters", {})
+        )
+
+
+async def _run_event_plan_job(payload: Dict[str, Any], report_progress: ProgressReporter) -> Dict[str, Any]:
+    from .event_planning_service import event_planning_service
+
+    form_data = dict(payload)
+    mockup_mode = form_data.pop("mockup_mode", "inline")
+    report_progress("generating_plan", mockup_mode=mockup_mode)
+    with progress_scope(_forward_progress(report_progress)):
+        return await event_planning_service.generate_event_plan(form_data, mockup_mode)
+
+
+async def _run_event_mockup_job(payload: Dict[str, Any], report_progress: ProgressReporter) -> Dict[str, Any]:
+    from .event_planning_service import event_planning_service
+
+    if not payload.get("form_data"):
+        return {"success": False, "error": "缺少必要参数: form_data"}
+    report_progress("generating_mockup")
+    with progress_scope(_forward_progress(report_progress)):
+        return await event_planning_service.generate_mockup(payload["form_data"])
+
+
+async def _run_kb_ingest_job(payload: Dict[str, Any], report_progress: ProgressReporter) -> Dict[str, Any]:
+    from .kb_ingestion_service import kb_ingestion_service
+
+    return await kb_ingestion_service.ingest(payload.get("files", []), report_progress)
+
+
+# 创建全局实例
+job_queue_service = JobQueueService(
+    workers=config.JOB_WORKERS,
+    result_ttl=config.JOB_RESULT_TTL,
+    max_queued=config.JOB_MAX_QUEUED
+)
+job_queue_service.register_handler("image", _run_image_job)
+job_queue_service.register_handler("action", _run_action_job)
+job_queue_service.register_handler("event_plan", _run_event_plan_job)
+job_queue_service.register_handler("event_mockup", _run_event_mockup_job)
+job_queue_service.register_handler("kb_ingest", _run_kb_ingest_job)
@@ -0,0 +1,205 @@
+"""
+知识库文档切分（在进程池中运行）
+
+按格式流式读取文件并切成 chunk，不把整个文件载入内存：
+- Markdown: 按标题分节，节内按段落累积到 max_chars，metadata 带标题路径和起始行号
+- CSV: 每行一个 chunk（"列名: 值" 逐行拼接），metadata 带行号；Google Sheet 导出为 CSV 后按同样方式处理
+- 纯文本: 按空行分段，段落累积到 max_chars
+
+每个 chunk 以正文的内容哈希标识。worker 只读查询入库清单（ingest manifest），
+未变化的 chunk 只记录哈希，变化的 chunk 才把正文写入暂存文件（spool），交给主进程向量化。
+
+本模块只依赖标准库，便于以 spawn 方式启动的 worker 快速导入。
+"""
+import csv
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+CHUNK_FORMATS = {
+    ".md": "markdown",
+    ".markdown": "markdown",
+    ".csv": "csv",
+    ".txt": "text",
+}
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_SENTENCE_END = re.compile(r"[。！？!?；;.\n]")
+
+Chunk = Tuple[str, Dict[str, Any]]
+
+
+def content_hash(text: str) -> str:
+    """chunk 正文的内容哈希（128 位 BLAKE2b）"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def detect_format(path: str) -> Optional[str]:
+    return CHUNK_FORMATS.get(os.path.splitext(path)[1].lower())
+
+
+def split_long(text: str, max_chars: int) -> List[str]:
+    """超长文本按句末标点切开，找不到标点时硬切"""
+    parts = []
+    while len(text) > max_chars:
+        window = text[:max_chars]
+        ends = [m.end() for m in _SENTENCE_END.finditer(window)]
+        cut = ends[-1] if ends and ends[-1] >= max_chars // 2 else max_chars
+        parts.append(text[:cut].strip())
+        text = text[cut:]
+    if text.strip():
+        parts.append(text.strip())
+    return [part for part in parts if part]
+
+
+class _ParagraphPacker:
+    """把段落累积成不超过 max_chars 的 chunk"""
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.parts: List[str] = []
+        self.size = 0
+        self.start_line = 0
+
+    def add(self, paragraph: str, line: int, metadata: Dict[str, Any]) -> Iterator[Chunk]:
+        if not self.parts:
+            self.start_line = line
+        if self.size and self.size + len(paragraph) + 2 > self.max_chars:
+            yield from self.flush(metadata)
+            self.start_line = line
+        if len(paragraph) > self.max_chars:
+            for part in split_long(paragraph, self.max_chars):
+                yield part, {**metadata, "line": line}
+            return
+        self.parts.append(paragraph)
+        self.size += len(paragraph) + 2
+
+    def flush(self, metadata: Dict[str, Any]) -> Iterator[Chunk]:
+        if self.parts:
+            yield "\n\n".join(self.parts), {**metadata, "line": self.start_line}
+        self.parts, self.size = [], 0
+
+
+def iter_text_chunks(f: TextIO, max_chars: int) -> Iterator[Chunk]:
+    """纯文本：空行分段"""
+    packer = _ParagraphPacker(max_chars)
+    paragraph: List[str] = []
+    start = 1
+    for line_no, line in enumerate(f, start=1):
+        if line.strip():
+            if not paragraph:
+                start = line_no
+            paragraph.append(line.rstrip("\r\n"))
+            continue
+        if paragraph:
+            yield from packer.add("\n".join(paragraph), start, {})
+            paragraph = []
+    if paragraph:
+        yield from packer.add("\n".join(paragraph), start, {})
+    yield from packer.flush({})
+
+
+def iter_markdown_chunks(f: TextIO, max_chars: int) -> Iterator[Chunk]:
+    """Markdown：标题分节（代码块内的 # 不算标题），节内空行分段"""
+    packer = _ParagraphPacker(max_chars)
+    headings: List[str] = []
+    paragraph: List[str] = []
+    start = 1
+    in_fence = False
+
+    def section() -> Dict[str, Any]:
+        return {"section": " > ".join(headings)} if headings else {}
+
+    for line_no, raw in enumerate(f, start=1):
+        line = raw.rstrip("\r\n")
+        if _FENCE.match(line):
+            in_fence = not in_fence
+        heading = None if in_fence else _HEADING.match(line)
+        if heading or (not in_fence and not line.strip()):
+            if paragraph:
+                yield from packer.add("\n".join(paragraph), start, section())
+                paragraph = []
+            if heading:
+                yield from packer.flush(section())
+                level = len(heading.group(1))
+                headings = headings[:level - 1] + [heading.group(2)]
+            continue
+        if not paragraph:
+            start = line_no
+        paragraph.append(line)
+    if paragraph:
+        yield from packer.add("\n".join(paragraph), start, section())
+    yield from packer.flush(section())
+
+
+def iter_csv_chunks(f: TextIO, max_chars: int) -> Iterator[Chunk]:
+    """CSV：每行一个 chunk，空字段省略；超长的行切成多段"""
+    for row_index, row in enumerate(csv.DictReader(f), start=1):
+        text = "\n".join(
+            f"{key}: {value.strip()}" for key, value in row.items()
+            if key and isinstance(value, str) and value.strip()
+        )
+        if not text:
+            continue
+        if len(text) <= max_chars:
+            yield text, {"row": row_index}
+            continue
+        for part_index, part in enumerate(split_long(text, max_chars)):
+            yield part, {"row": row_index, "part": part_index}
+
+
+_ITERATORS = {
+    "markdown": iter_markdown_chunks,
+    "csv": iter_csv_chunks,
+    "text": iter_text_chunks,
+}
+
+
+def iter_chunks(path: str, fmt: str, max_chars: int) -> Iterator[Chunk]:
+    """按格式流式切分文件"""
+    newline = "" if fmt == "csv" else None
+    with open(path, "r", encoding="utf-8-sig", errors="replace", newline=newline) as f:
+        yield from _ITERATORS[fmt](f, max_chars)
+
+
+def chunk_file_to_spool(
+    path: str,
+    fmt: str,
+    source_id: str,
+    file_key: str,
+    manifest_path: str,
+    spool_path: str,
+    max_chars: int
+) -> Dict[str, Any]:
+    """
+    进程池 worker：切分文件，把每个 chunk 写入暂存文件
+
+    暂存文件为 JSONL：已入库的 chunk 只写 {"h": 哈希}，新的或改动过的 chunk
+    写 {"h": 哈希, "t": 正文, "m": metadata}。
+
+    Returns:
+        {'chunks': 总数, 'changed': 需要向量化的数量, 'bytes': 文件大小}
+    """
+    conn = sqlite3.connect(f"file:{manifest_path}?mode=ro", uri=True)
+    total = changed = 0
+    try:
+        with open(spool_path, "w", encoding="utf-8") as spool:
+            for text, metadata in iter_chunks(path, fmt, max_chars):
+                digest = content_hash(text)
+                known = conn.execute(
+                    "SELECT 1 FROM manifest WHERE source_id = ? AND file_key = ? AND content_hash = ?",
+                    (source_id, file_key, digest)
+                ).fetchone()
+                if known:
+                    spool.write(json.dumps({"h": digest}) + "\n")
+                else:
+                    spool.write(json.dumps({"h": digest, "t": text, "m": metadata}, ensure_ascii=False) + "\n")
+                    changed += 1
+                total += 1
+    finally:
+        conn.close()
+    return {"chunks": total, "changed": changed, "bytes": os.path.getsize(path)}
@@ -0,0 +1,311 @@
+"""
+知识库文档入库服务
+
+把 KnowledgeSource（file / google_sheet）的文件切分、向量化并写入知识库：
+- 切分在进程池中按文件并行，worker 流式读取文件，不把整个文件载入内存
+- 每个 chunk 以内容哈希标识，chunk id 由 (知识源, 文件, 哈希) 决定；入库清单记录已写入的哈希，
+  重新入库时未变化的 chunk 不再向量化，只有新增或改动过的 chunk 才调用 embeddings 接口
+- 改动过的 chunk 按 KB_INGEST_BATCH 分批向量化写入，写入成功后才登记到清单
+- 文件处理完后，本次没有出现的旧 chunk（被删除或改动前的版本）从知识库中移除
+
+Google Sheet 以导出的 CSV 文件入库（每行一个 chunk）。
+"""
+import asyncio
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from config import config
+from .kb_chunker import chunk_file_to_spool, detect_format
+from .knowledge_base_service import knowledge_base_service
+from .text_analytics import resolve_upload_path
+
+ProgressReporter = Callable[..., None]
+
+
+def _noop_progress(stage: str, **info: Any) -> None:
+    pass
+
+
+class IngestManifest:
+    """
+    入库清单：(知识源, 文件, 内容哈希) -> chunk id 和最后一次出现的入库批次
+
+    切分 worker 以只读方式查询本表判断 chunk 是否变化；WAL 模式下读写互不阻塞。
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS manifest (
+                source_id TEXT NOT NULL,
+                file_key TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                run_id TEXT NOT NULL,
+                PRIMARY KEY (source_id, file_key, content_hash)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def claim(self, source_id: str, file_key: str, hashes: List[str], run_id: str) -> Set[str]:
+        """
+        标记本批次出现的哈希，返回需要向量化写入的哈希
+
+        已登记的哈希改记为本批次（未变化）；本批次已登记过的是文件内重复内容，跳过。
+        """
+        unique = list(dict.fromkeys(hashes))
+        with self._lock, self._conn:
+            placeholders = ",".join("?" * len(unique))
+            known = dict(self._conn.execute(
+                f"SELECT content_hash, run_id FROM manifest WHERE source_id = ? AND file_key = ? "
+                f"AND content_hash IN ({placeholders})",
+                [source_id, file_key, *unique]
+            ).fetchall())
+            seen = [digest for digest, run in known.items() if run != run_id]
+            self._conn.executemany(
+                "UPDATE manifest SET run_id = ? WHERE source_id = ? AND file_key = ? AND content_hash = ?",
+                [(run_id, source_id, file_key, digest) for digest in seen]
+            )
+        return {digest for digest in unique if digest not in known}
+
+    def record(self, source_id: str, file_key: str, rows: List[Tuple[str, str]], run_id: str) -> None:
+        """登记已写入知识库的 chunk：rows 为 [(内容哈希, chunk id)]"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO manifest (source_id, file_key, content_hash, chunk_id, run_id) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(source_id, file_key, digest, chunk_id, run_id) for digest, chunk_id in rows]
+            )
+
+    def stale(self, source_id: str, file_key: str, run_id: str) -> List[str]:
+        """本批次没有出现的旧 chunk id"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id FROM manifest WHERE source_id = ? AND file_key = ? AND run_id != ?",
+                (source_id, file_key, run_id)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def remove_stale(self, source_id: str, file_key: str, run_id: str) -> int:
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM manifest WHERE source_id = ? AND file_key = ? AND run_id != ?",
+                (source_id, file_key, run_id)
+            ).rowcount
+
+    def sources(self) -> List[Dict[str, Any]]:
+        """每个知识源已入库的文件数和 chunk 数"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source_id, COUNT(DISTINCT file_key), COUNT(*) FROM manifest GROUP BY source_id ORDER BY source_id"
+            ).fetchall()
+        return [{"sourceId": source_id, "files": files, "chunks": chunks} for source_id, files, chunks in rows]
+
+
+def _iter_spool(path: str, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """按批读取切分 worker 写出的暂存文件"""
+    batch = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            batch.append(json.loads(line))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+class KnowledgeIngestionService:
+    """知识库文件入库：进程池并行切分 + 内容哈希去重 + 分批向量化"""
+
+    def __init__(self):
+        self._manifest: Optional[IngestManifest] = None
+        self._pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        # 同一文件的两次入库串行执行，避免互相把对方的 chunk 当作过期删除
+        self._file_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+
+    @property
+    def manifest(self) -> IngestManifest:
+        if self._manifest is None:
+            self._manifest = IngestManifest(config.KB_INGEST_MANIFEST_PATH)
+        return self._manifest
+
+    @property
+    def pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        """
+        切分进程池，首次入库时创建
+
+        使用 spawn 启动：此时主进程已有线程池线程持有锁，fork 出的子进程可能死锁；
+        worker 只导入仅依赖标准库的 kb_chunker，启动开销很小。
+        """
+        if self._pool is None:
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=config.KB_INGEST_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def prepare_files(self, files: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        校验并规范化待入库文件
+
+        Args:
+            files: [{'file_path': 上传目录内的相对路径, 'source_id', 'source_name'(可选), 'file_key'(可选)}]
+
+        Returns:
+            {'success': True, 'files': [...]} 或 {'success': False, 'error': ...}
+        """
+        if not files:
+            return {"success": False, "error": "缺少待入库的文件"}
+        prepared = []
+        for item in files:
+            file_path = item.get("file_path")
+            source_id = str(item.get("source_id") or "")
+            if not file_path or not source_id:
+                return {"success": False, "error": f"文件缺少 file_path 或 source_id 字段: {item}"}
+            try:
+                path = resolve_upload_path(file_path)
+            except ValueError as e:
+                return {"success": False, "error": str(e)}
+            fmt = item.get("format") or detect_format(path)
+            if fmt not in ("markdown", "csv", "text"):
+                return {"success": False, "error": f"不支持的文件格式: {file_path}（支持 .md / .csv / .txt）"}
+            prepared.append({
+                "path": path,
+                "format": fmt,
+                "file_key": str(item.get("file_key") or file_path),
+                "source_id": source_id,
+                "source_name": str(item.get("source_name") or source_id)
+            })
+        return {"success": True, "files": prepared}
+
+    async def ingest(self, files: List[Dict[str, Any]], report_progress: ProgressReporter = _noop_progress) -> Dict[str, Any]:
+        """
+        切分、向量化并写入一批文件
+
+        Returns:
+            {'success', 'files': [{'file', 'sourceId', 'chunks', 'unchanged', 'added', 'removed', 'seconds'}],
+             'totals': {...}}；单个文件失败记录在该文件的 error 字段中，不影响其他文件
+        """
+        prepared = self.prepare_files(files)
+        if not prepared["success"]:
+            return prepared
+        files = prepared["files"]
+        await asyncio.to_thread(lambda: self.manifest)  # worker 只读打开清单，须先建表
+        os.makedirs(config.KB_INGEST_SPOOL_DIR, exist_ok=True)
+
+        report_progress("chunking", files=len(files))
+        started = time.perf_counter()
+        results = await asyncio.gather(*(self._ingest_file(item, report_progress) for item in files))
+
+        totals = {key: sum(result.get(key, 0) for result in results) for key in ("chunks", "unchanged", "added", "removed")}
+        failed = [result for result in results if result.get("error")]
+        totals["seconds"] = round(time.perf_counter() - started, 2)
+        print(
+            f"📥 知识库入库完成: {len(files)} 个文件，{totals['chunks']} 个 chunk，"
+            f"新增 {totals['added']}，未变化 {totals['unchanged']}，移除 {totals['removed']}"
+        )
+        response = {"success": not failed, "files": results, "totals": totals}
+        if failed:
+            response["error"] = f"{len(failed)} 个文件入库失败: {failed[0]['error']}"
+        return response
+
+    async def _ingest_file(self, item: Dict[str, Any], report_progress: ProgressReporter) -> Dict[str, Any]:
+        key = (item["source_id"], item["file_key"])
+        lock = self._file_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            result = {"file": item["file_key"], "sourceId": item["source_id"]}
+            started = time.perf_counter()
+            spool_path = os.path.join(config.KB_INGEST_SPOOL_DIR, f"{uuid.uuid4().hex}.jsonl")
+            try:
+                result.update(await self._process_file(item, spool_path, report_progress))
+            except Exception as e:
+                print(f"❌ 文件入库失败: {item['file_key']} - {e}")
+                result["error"] = str(e)
+            finally:
+                if os.path.exists(spool_path):
+                    os.remove(spool_path)
+            result["seconds"] = round(time.perf_counter() - started, 2)
+            return result
+
+    async def _process_file(self, item: Dict[str, Any], spool_path: str, report_progress: ProgressReporter) -> Dict[str, Any]:
+        source_id, file_key = item["source_id"], item["file_key"]
+        run_id = uuid.uuid4().hex
+
+        pool = self.pool
+        try:
+            chunked = await asyncio.wrap_future(pool.submit(
+                chunk_file_to_spool, item["path"], item["format"], source_id, file_key,
+                self.manifest.path, spool_path, config.KB_CHUNK_MAX_CHARS
+            ))
+        except concurrent.futures.process.BrokenProcessPool:
+            # worker 异常退出后进程池不可再用，下次入库时重建
+            if self._pool is pool:
+                self._pool = None
+            raise
+        report_progress("file_chunked", file=file_key, chunks=chunked["chunks"], changed=chunked["changed"])
+
+        added = 0
+        for batch in _iter_spool(spool_path, config.KB_INGEST_BATCH):
+            new = await asyncio.to_thread(self.manifest.claim, source_id, file_key, [line["h"] for line in batch], run_id)
+            chunks = {}
+            for line in batch:
+                digest = line["h"]
+                if digest in new and "t" in line and digest not in chunks:
+                    chunks[digest] = {
+                        "id": f"{source_id}/{file_key}#{digest[:16]}",
+                        "content": line["t"],
+                        "sourceId": source_id,
+                        "sourceName": item["source_name"],
+                        "metadata": {**line["m"], "file": file_key}
+                    }
+            if not chunks:
+                continue
+            written = await knowledge_base_service.add_chunks(list(chunks.values()))
+            if not written["success"]:
+                raise RuntimeError(written["error"])
+            await asyncio.to_thread(
+                self.manifest.record, source_id, file_key,
+                [(digest, chunk["id"]) for digest, chunk in chunks.items()], run_id
+            )
+            added += len(chunks)
+            report_progress("embedding", file=file_key, added=added, changed=chunked["changed"])
+
+        stale = await asyncio.to_thread(self.manifest.stale, source_id, file_key, run_id)
+        if stale:
+            await knowledge_base_service.delete_chunks(stale)
+            await asyncio.to_thread(self.manifest.remove_stale, source_id, file_key, run_id)
+        return {
+            "chunks": chunked["chunks"],
+            "unchanged": chunked["chunks"] - chunked["changed"],
+            "added": added,
+            "removed": len(stale)
+        }
+
+    def sources(self) -> List[Dict[str, Any]]:
+        return self.manifest.sources()
+
+
+# 创建全局实例
+kb_ingestion_service = KnowledgeIngestionService()
@@ -0,0 +1,385 @@
+"""
+知识库检索服务
+
+取代前端 knowledgeBase.ts 中写死的 chunk 列表和浏览器端 TF.js 向量化：
+chunk 在后端向量化（embedding_service：持久缓存 + 按 token 数分批，USE_MOCK_OPENAI 时用本地模型或哈希向量），
+存入 VectorStore，检索为余弦 top-k：行数较少时精确检索，达到 KB_ANN_MIN_ROWS 后
+由 IVF 索引近似检索（KB_ANN_INDEX=exact 时始终精确）。返回字段与前端 SearchResult 一致。
+KB_QUANTIZATION=int8 / pq 时检索扫描量化编码（IVF 也不再常驻 float32 副本），再用原向量重排前 k x KB_RERANK_FACTOR 个候选。
+
+默认为混合检索：同一批 chunk 同时写入 BM25 倒排索引（CJK 二元组分词，keywords 按标题加权），
+查询时词法和向量两路并行召回，按倒数排名融合（RRF）排序。语义检索容易漏掉的
+精确术语（"ARPU"、"7日留存"）由词法一路补上。两路都支持按 sourceId / metadata 字段过滤。
+"""
+import asyncio
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import config
+from .ivf_index import IVFIndex
+from .embedding_service import embedding_service
+from .search_index import BM25Index
+from .vector_quantizer import QuantizedVectors
+from .vector_store import VectorStore
+
+SEARCH_MODES = ("hybrid", "vector", "lexical")
+
+
+def reciprocal_rank_fusion(rankings: Dict[str, Sequence[str]], k: int = 60) -> List[Tuple[str, float, Dict[str, int]]]:
+    """
+    倒数排名融合：score(d) = Σ 1 / (k + rank_i(d))，rank 从 1 开始
+
+    Args:
+        rankings: {召回方式: 按相关性排序的 id 列表}
+        k: 平滑常数，越大各路排名差异的影响越小
+
+    Returns:
+        [(id, 融合分数, {召回方式: 排名})]，按融合分数降序
+    """
+    scores: Dict[str, float] = {}
+    ranks: Dict[str, Dict[str, int]] = {}
+    for name, ids in rankings.items():
+        for rank, item_id in enumerate(ids, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+            ranks.setdefault(item_id, {})[name] = rank
+    ordered = sorted(scores, key=lambda item_id: -scores[item_id])
+    return [(item_id, scores[item_id], ranks[item_id]) for item_id in ordered]
+
+
+class KnowledgeBaseService:
+    """知识库 chunk 的写入、删除和检索"""
+
+    def __init__(self):
+        self._store: Optional[VectorStore] = None
+        self._ann: Optional[IVFIndex] = None
+        self._quantized: Optional[QuantizedVectors] = None
+        self._lexical: Optional[BM25Index] = None
+        # 多个线程（如并行入库的文件）可能同时首次访问，存储和索引只能打开一次
+        self._open_lock = threading.RLock()
+        # 过滤条件 -> (向量行掩码, 词法文档掩码)；任何写入后清空
+        self._mask_cache: "OrderedDict[str, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._mask_lock = threading.Lock()
+        self._mask_generation = 0
+
+    @property
+    def store(self) -> VectorStore:
+        """首次使用时打开向量存储"""
+        if self._store is None:
+            with self._open_lock:
+                if self._store is None:
+                    self._store = VectorStore(config.KB_VECTOR_DIR, block_rows=config.KB_SEARCH_BLOCK_ROWS)
+        return self._store
+
+    @property
+    def quantized(self) -> Optional[QuantizedVectors]:
+        """量化编码；KB_QUANTIZATION=none 时为空"""
+        if self._quantized is None and config.KB_QUANTIZATION != "none":
+            with self._open_lock:
+                if self._quantized is None:
+                    self._quantized = QuantizedVectors(
+                        self.store,
+                        kind=config.KB_QUANTIZATION,
+                        min_rows=config.KB_QUANT_MIN_ROWS,
+                        pq_subvectors=config.KB_PQ_SUBVECTORS or None,
+                        rerank=config.KB_RERANK_FACTOR,
+                        block_rows=config.KB_SEARCH_BLOCK_ROWS
+                    )
+        return self._quantized
+
+    @property
+    def ann(self) -> Optional[IVFIndex]:
+        """近似检索索引；KB_ANN_INDEX=exact 时为空"""
+        if self._ann is None and config.KB_ANN_INDEX == "ivf":
+            with self._open_lock:
+                if self._ann is None:
+                    self._ann = IVFIndex(
+                        self.store,
+                        nprobe=config.KB_ANN_NPROBE,
+                        min_rows=config.KB_ANN_MIN_ROWS,
+                        repack_rows=config.KB_ANN_REPACK_ROWS,
+                        quantized=self.quantized
+                    )
+        return self._ann
+
+    @property
+    def lexical(self) -> BM25Index:
+        """词法索引；首次打开时为空而向量库已有数据（升级前写入的 chunk）则从向量库回填"""
+        if self._lexical is None:
+            with self._open_lock:
+                if self._lexical is None:
+                    self._lexical = self._open_lexical()
+        return self._lexical
+
+    def _open_lexical(self) -> BM25Index:
+        lexical = BM25Index(config.KB_LEXICAL_INDEX_PATH)
+        if lexical.stats()["documents"] == 0 and self.store.stats()["chunks"] > 0:
+            backfilled = 0
+            for batch in self.store.iter_chunks():
+                lexical.add_documents([self._lexical_document(chunk) for chunk in batch])
+                backfilled += len(batch)
+            lexical.compact()
+            print(f"📚 已从向量库回填词法索引: {backfilled} 个 chunk")
+        return lexical
+
+    @staticmethod
+    def _lexical_document(chunk: Dict[str, Any]) -> Dict[str, Any]:
+        """chunk -> BM25 文档：keywords 作为标题加权，来源字段并入 metadata 以便过滤"""
+        metadata = dict(chunk.get("metadata") or {})
+        keywords = chunk.get("keywords") or metadata.get("keywords") or []
+        metadata["sourceId"] = str(chunk.get("sourceId") or "")
+        metadata["sourceName"] = str(chunk.get("sourceName") or "")
+        return {
+            "id": str(chunk["id"]),
+            "title": " ".join(str(keyword) for keyword in keywords),
+            "body": str(chunk.get("content") or ""),
+            "metadata": metadata
+        }
+
+    async def _embed(self, texts: List[str]) -> Dict[str, Any]:
+        """向量化（带缓存、按 token 数分批，见 embedding_service）"""
+        return await embedding_service.embed(texts)
+
+    # ==========================================
+    # 写入
+    # ==========================================
+
+    async def add_chunks(self, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        写入或替换 chunk（按 id 去重）
+
+        Args:
+            chunks: [{'id', 'content', 'sourceId', 'sourceName', 'metadata', 'keywords'(可选), 'embedding'(可选)}]；
+                全部带 embedding 时直接使用，否则统一调用 embeddings 接口
+
+        Returns:
+            {'success': True, 'added': N, 'replaced': M}
+        """
+        invalid = [i for i, chunk in enumerate(chunks) if not chunk.get("id") or not chunk.get("content")]
+        if invalid:
+            return {"success": False, "error": f"chunk 缺少 id 或 content 字段: 第 {invalid[:10]} 条"}
+        if not chunks:
+            return {"success": True, "added": 0, "replaced": 0}
+
+        if all(chunk.get("embedding") for chunk in chunks):
+            embeddings = np.asarray([chunk["embedding"] for chunk in chunks], dtype=np.float32)
+        else:
+            embedded = await self._embed([chunk["content"] for chunk in chunks])
+            if not embedded["success"]:
+                return {"success": False, "error": f"向量化失败: {embedded.get('error')}"}
+            embeddings = embedded["embeddings"]
+
+        # keywords 随 metadata 保存，词法索引回填时仍可按标题加权
+        stored = [
+            {**chunk, "metadata": {**(chunk.get("metadata") or {}), "keywords": chunk["keywords"]}}
+            if chunk.get("keywords") else chunk
+            for chunk in chunks
+        ]
+        # 先打开词法索引（可能需要回填），再写入向量库，避免本批 chunk 被回填后重复写入
+        lexical = await asyncio.to_thread(lambda: self.lexical)
+        try:
+            result = await asyncio.to_thread(self.store.add_chunks, stored, embeddings)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        await asyncio.to_thread(lexical.add_documents, [self._lexical_document(chunk) for chunk in stored])
+        self._clear_mask_cache()
+        if self.quantized is not None:
+            await asyncio.to_thread(self.quantized.sync)
+        if self.ann is not None:
+            await asyncio.to_thread(self.ann.sync)
+        print(f"📚 知识库写入 {result['added']} 个新 chunk，替换 {result['replaced']} 个")
+        return {"success": True, **result}
+
+    async def delete_chunks(self, chunk_ids: List[str]) -> Dict[str, Any]:
+        deleted = await asyncio.to_thread(self.store.delete_chunks, chunk_ids)
+        await asyncio.to_thread(self.lexical.delete_documents, chunk_ids)
+        self._clear_mask_cache()
+        return {"success": True, "deleted": deleted}
+
+    # ==========================================
+    # 检索
+    # ==========================================
+
+    def _clear_mask_cache(self) -> None:
+        with self._mask_lock:
+            self._mask_cache.clear()
+            self._mask_generation += 1
+
+    def _filter_masks(self, filters: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+        """过滤条件对应的 (向量行掩码, 词法文档掩码)，LRU 缓存"""
+        key = json.dumps(filters, sort_keys=True, ensure_ascii=False, default=str)
+        with self._mask_lock:
+            if key in self._mask_cache:
+                self._mask_cache.move_to_end(key)
+                return self._mask_cache[key]
+            generation = self._mask_generation
+        masks = (self.store.metadata_mask(filters), self.lexical.metadata_mask(filters))
+        with self._mask_lock:
+            if generation != self._mask_generation:
+                return masks  # 计算期间有写入，结果可能已过期，不缓存
+            self._mask_cache[key] = masks
+            while len(self._mask_cache) > config.KB_FILTER_CACHE_SIZE:
+                self._mask_cache.popitem(last=False)
+        return masks
+
+    def _vector_ranking(
+        self,
+        query_vector: np.ndarray,
+        n: int,
+        filters: Dict[str, Any],
+        nprobe: Optional[int],
+        exact: bool,
+        rerank: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        mask = self._filter_masks(filters)[0] if filters else None
+        if exact:
+            rows, scores = self.store.search_vectors(query_vector, n, mask)
+        elif self.ann is not None:
+            rows, scores = self.ann.search_vectors(query_vector, n, mask, nprobe, rerank)
+        elif self.quantized is not None:
+            rows, scores = self.quantized.search_vectors(query_vector, n, mask, rerank)
+        else:
+            rows, scores = self.store.search_vectors(query_vector, n, mask)
+        return self.store.get_chunks(rows[0].tolist(), scores[0].tolist())
+
+    def _lexical_ranking(self, query: str, n: int, filters: Dict[str, Any]) -> List[Tuple[str, float]]:
+        mask = self._filter_masks(filters)[1] if filters else None
+        return self.lexical.rank(query, n, mask)
+
+    async def retrieve(
+        self,
+        query: str,
+        query_vector: Optional[np.ndarray],
+        limit: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        mode: str = "hybrid",
+        nprobe: Optional[int] = None,
+        exact: bool = False,
+        rerank: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        已有查询向量时的检索（词法和向量两路在线程池中并行）
+
+        hybrid 模式下 score 为 RRF 融合分数，ranks 给出各路排名；vector / lexical 模式下
+        score 分别为余弦相似度和 BM25 分数。query_vector 为空时只走词法一路。
+        """
+        filters = filters or {}
+        n = max(limit, config.KB_HYBRID_CANDIDATES) if mode == "hybrid" else limit
+        use_vector = mode in ("hybrid", "vector") and query_vector is not None
+        use_lexical = mode in ("hybrid", "lexical") or query_vector is None
+
+        vector_task = asyncio.to_thread(self._vector_ranking, query_vector, n, filters, nprobe, exact, rerank) \
+            if use_vector else asyncio.sleep(0, [])
+        lexical_task = asyncio.to_thread(self._lexical_ranking, query, n, filters) \
+            if use_lexical else asyncio.sleep(0, [])
+        vector_hits, lexical_hits = await asyncio.gather(vector_task, lexical_task)
+
+        if not use_lexical:
+            return vector_hits[:limit]
+
+        chunks = {chunk["id"]: chunk for chunk in vector_hits}
+        fused = reciprocal_rank_fusion({
+            "vector": [chunk["id"] for chunk in vector_hits],
+            "lexical": [chunk_id for chunk_id, _ in lexical_hits]
+        }, k=config.KB_RRF_K)[:limit]
+        missing = [chunk_id for chunk_id, _, _ in fused if chunk_id not in chunks]
+        if missing:
+            chunks.update(await asyncio.to_thread(self.store.get_chunks_by_ids, missing))
+
+        lexical_scores = dict(lexical_hits)
+        results = []
+        for chunk_id, fused_score, ranks in fused:
+            if chunk_id not in chunks:
+                continue
+            result = dict(chunks[chunk_id])
+            if use_vector:
+                result["score"] = round(fused_score, 6)
+                result["ranks"] = ranks
+            else:
+                result["score"] = round(lexical_scores[chunk_id], 4)
+            results.append(result)
+        return results
+
+    async def search(
+        self,
+        query: str,
+        limit: int = 5,
+        source_ids: Optional[List[str]] = None,
+        nprobe: Optional[int] = None,
+        exact: bool = False,
+        mode: str = "hybrid",
+        filters: Optional[Dict[str, Any]] = None,
+        rerank: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        知识库检索
+
+        Args:
+            query: 查询文本
+            limit: 返回结果数
+            source_ids: 只在这些知识源中检索（前端当前激活的知识源），等同 filters['sourceId']
+            nprobe: 覆盖 IVF 每次扫描的簇数
+            exact: 向量一路强制精确检索（不走 IVF 和量化）
+            mode: hybrid（默认）/ vector / lexical
+            filters: 元数据过滤，如 {'sourceId': ['1', '2'], 'feedback_type': '游戏体验'}
+            rerank: 覆盖量化检索的重排倍数，0 表示直接使用量化分数
+
+        Returns:
+            {'success': True, 'results': [SearchResult...], 'mode': 实际使用的模式}
+            混合检索时向量化失败会退化为纯词法检索（degraded: true）
+        """
+        if mode not in SEARCH_MODES:
+            return {"success": False, "error": f"不支持的检索模式: {mode}，可选 {', '.join(SEARCH_MODES)}", "results": []}
+        if not query.strip():
+            return {"success": True, "results": [], "mode": mode}
+        filters = dict(filters or {})
+        if source_ids:
+            filters.setdefault("sourceId", source_ids)
+
+        query_vector = None
+        degraded = False
+        if mode != "lexical":
+            embedded = await self._embed([query])
+            if embedded["success"]:
+                query_vector = embedded["embeddings"][0]
+            elif mode == "vector":
+                return {"success": False, "error": f"查询向量化失败: {embedded.get('error')}", "results": []}
+            else:
+                print(f"⚠️ 查询向量化失败，退化为词法检索: {embedded.get('error')}")
+                degraded = True
+
+        try:
+            results = await self.retrieve(query, query_vector, limit, filters, mode, nprobe, exact, rerank)
+        except ValueError as e:
+            return {"success": False, "error": str(e), "results": []}
+        response = {"success": True, "results": results, "mode": "lexical" if degraded else mode}
+        if degraded:
+            response["degraded"] = True
+        return response
+
+    async def rebuild_index(self, nlist: Optional[int] = None) -> Dict[str, Any]:
+        """重新训练量化器和 IVF 索引（数据分布明显变化后调用）"""
+        if self.ann is None and self.quantized is None:
+            return {"success": False, "error": "KB_ANN_INDEX=exact 且 KB_QUANTIZATION=none，没有需要训练的索引"}
+        result: Dict[str, Any] = {}
+        if self.quantized is not None:
+            result["quantization"] = await asyncio.to_thread(self.quantized.train)
+        if self.ann is not None:
+            result.update(await asyncio.to_thread(self.ann.train, nlist))
+        return {"success": True, **result}
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.store.stats()
+        if self.ann is not None:
+            stats["ann"] = self.ann.stats()
+        if self.quantized is not None:
+            stats["quantization"] = self.quantized.stats()
+        stats["lexical"] = self.lexical.stats()
+        return stats
+
+
+# 创建全局实例
+knowledge_base_service = KnowledgeBaseService()
@@ -5,6 +5,7 @@ import asyncio
 import json
 from typing import AsyncGenerator, List, Dict, Any
 
+
 class MockOpenAIService:
     """Mock OpenAI service for development and testing"""
     
@@ -16,7 +17,8 @@ class MockOpenAIService:
         self, 
         messages: List[Dict[str, str]], 
         temperature: float = 0.7,
-        max_tokens: int = 2000
+        max_tokens: int = 2000,
+        model: str = None
     ) -> AsyncGenerator[str, None]:
         """
         Mock streaming chat completion
@@ -65,7 +67,8 @@ This mock response demonstrates that the entire system architecture is working c
         self, 
         messages: List[Dict[str, str]], 
         temperature: float = 0.7,
-        max_tokens: int = 2000
+        max_tokens: int = 2000,
+        model: str = None
     ) -> Dict[str, Any]:
         """
         Mock non-streaming chat completion
@@ -97,6 +100,24 @@ This mock response demonstrates that the entire system architecture is working c
                 "content": None
             }
     
+    async def warm_up(self) -> None:
+        """Mock service has no upstream connection to open"""
+        return None
+    
+    async def get_embeddings(self, texts: List[str], model: str = None) -> Dict[str, Any]:
+        """
+        Mock embeddings: hash embedding from embedding_service, so texts
+        sharing terms still get similar vectors
+        """
+        from .embedding_service import hash_embedding
+
+        return {
+            "success": True,
+            "embeddings": hash_embedding(texts).tolist(),
+            "model": "hash-embedding (mock)",
+            "usage": {"prompt_tokens": 0, "total_tokens": 0}
+        }
+    
     def format_messages(self, conversation_history: List[Dict]) -> List[Dict[str, str]]:
         """
         Format conversation history for mock API
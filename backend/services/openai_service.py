@@ -3,9 +3,14 @@ Compass API service for chat interactions
 """
 import json
 import asyncio
+import time
 from typing import AsyncGenerator, List, Dict, Any
+import httpx
 from openai import AsyncOpenAI
 from config import config
+from .action_progress import emit_progress
+from .deadline import DeadlineExceeded, with_deadline
+from .upstream_scheduler import upstream_scheduler
 
 class OpenAIService:
     """Compass API service for chat completions"""
@@ -18,6 +23,23 @@ class OpenAIService:
             base_url=openai_config["base_url"]
         )
         self.model = openai_config["model"]
+        self._last_upstream_use = 0.0  # time.monotonic()，用于判断连接池里是否还有可复用的连接
+    
+    async def warm_up(self) -> None:
+        """
+        预先建立到上游的 HTTP 连接（DNS + TCP + TLS）
+
+        与检索等请求前的准备工作并发执行，随后的对话请求直接复用连接池中的连接。
+        最近刚用过上游时连接仍在池中，直接跳过；任何响应状态（包括 404）都足以建立连接，错误忽略。
+        """
+        now = time.monotonic()
+        if now - self._last_upstream_use < config.UPSTREAM_WARMUP_IDLE:
+            return
+        self._last_upstream_use = now
+        try:
+            await self.client.with_options(max_retries=0, timeout=5.0).get("/models", cast_to=httpx.Response)
+        except Exception:
+            pass
     
     async def stream_chat_completion(
         self, 
@@ -42,23 +64,39 @@ class OpenAIService:
             # Use provided model or fall back to default
             selected_model = model if model else self.model
             
-            # Create streaming chat completion
-            stream = await self.client.chat.completions.create(
-                model=selected_model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                stream=True
-            )
-            
-            # Stream the response (Compass API format)
-            async for chunk in stream:
-                if chunk.choices and len(chunk.choices) > 0:
-                    delta = chunk.choices[0].delta
-                    if hasattr(delta, 'content') and delta.content is not None:
-                        content = delta.content
-                        yield content
+            # Hold an upstream slot for the whole stream (priority class from context)
+            async with upstream_scheduler.slot():
+                # Create streaming chat completion within the remaining request budget
+                emit_progress("upstream_request_sent", model=selected_model, stream=True)
+                self._last_upstream_use = time.monotonic()
+                stream = await with_deadline(self.client.chat.completions.create(
+                    model=selected_model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True
+                ))
+                
+                # Stream the response (Compass API format)
+                chunks = stream.__aiter__()
+                first_token = True
+                while True:
+                    try:
+                        chunk = await with_deadline(chunks.__anext__())
+                    except StopAsyncIteration:
+                        break
+                    if chunk.choices and len(chunk.choices) > 0:
+                        delta = chunk.choices[0].delta
+                        if hasattr(delta, 'content') and delta.content is not None:
+                            content = delta.content
+                            if first_token:
+                                emit_progress("first_token", model=selected_model)
+                                first_token = False
+                            yield content
                     
+        except DeadlineExceeded as e:
+            print(f"Deadline reached in stream_chat_completion: {str(e)}")
+            yield "\n\n⏱️ 已达到请求截止时间，回答可能不完整"
         except Exception as e:
             error_message = f"Compass API Error: {str(e)}"
             print(f"Error in stream_chat_completion: {error_message}")
@@ -87,12 +125,17 @@ class OpenAIService:
             # Use provided model or fall back to default
             selected_model = model if model else self.model
             
-            response = await self.client.chat.completions.create(
-                model=selected_model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
+            async with upstream_scheduler.slot():
+                emit_progress("upstream_request_sent", model=selected_model, stream=False)
+                self._last_upstream_use = time.monotonic()
+                response = await with_deadline(self.client.chat.completions.create(
+                    model=selected_model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                ))
+            # 非流式调用：完整响应到达即视为首个 token
+            emit_progress("first_token", model=selected_model, stream=False)
             
             return {
                 "success": True,
@@ -104,6 +147,13 @@ class OpenAIService:
                 }
             }
             
+        except DeadlineExceeded as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "content": None,
+                "deadline_exceeded": True
+            }
         except Exception as e:
             return {
                 "success": False,
@@ -111,6 +161,56 @@ class OpenAIService:
                 "content": None
             }
     
+    async def get_embeddings(
+        self,
+        texts: List[str],
+        model: str = None
+    ) -> Dict[str, Any]:
+        """
+        Get embeddings for a batch of texts
+        
+        Args:
+            texts: Texts to embed (one upstream request per call)
+            model: Optional embedding model override
+            
+        Returns:
+            Dict containing 'embeddings' in the same order as texts
+        """
+        try:
+            selected_model = model if model else config.EMBEDDING_MODEL
+            
+            async with upstream_scheduler.slot():
+                emit_progress("upstream_request_sent", model=selected_model, inputs=len(texts))
+                response = await with_deadline(self.client.embeddings.create(
+                    model=selected_model,
+                    input=texts
+                ))
+            
+            data = sorted(response.data, key=lambda item: item.index)
+            return {
+                "success": True,
+                "embeddings": [item.embedding for item in data],
+                "model": selected_model,
+                "usage": {
+                    "prompt_tokens": response.usage.prompt_tokens,
+                    "total_tokens": response.usage.total_tokens
+                }
+            }
+            
+        except DeadlineExceeded as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "embeddings": None,
+                "deadline_exceeded": True
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "embeddings": None
+            }
+    
     def format_messages(self, conversation_history: List[Dict]) -> List[Dict[str, str]]:
         """
         Format conversation history for OpenAI API
@@ -0,0 +1,515 @@
+"""
+Action 参数提取
+
+前端 parameterExtractor.ts 和 TodoExecutor.extractExecutionParams 每次都调用 LLM 从步骤文本中
+提取 expression、date_input、json_string 等参数，即使一个正则就能取到。本服务启动时根据 Action 库
+中每个参数的定义（名称、类型、options）编译确定性的提取规则：
+
+- expression: 数学表达式（支持 ×、÷、"乘以"、"的N次方" 等写法），用 ast 校验可解析
+- json_string: 文本中第一个完整的 JSON 对象或数组
+- date_input / compare_to: 日期时间，统一为 YYYY-MM-DD[ HH:MM[:SS]]
+- query / prompt: 去掉"搜索"、"生成一张"等指令词后的内容
+- select 参数: 关键词表 -> option 的 label / value -> defaultValue
+- 其他文本参数: 引号内或冒号后的内容
+
+按步骤文本、用户原始输入（表达式和 JSON 还包括前置步骤结果）的顺序查找；步骤文本没有提到运算时
+不从前置步骤结果中取表达式。必填参数都由规则取到时直接返回，
+否则才调用 LLM，结果按输入内容缓存。/api/extract-parameters/stats 按 Action 报告规则命中率和节省的 LLM 耗时。
+"""
+import ast
+import json
+import re
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import config
+from .action_registry import ActionSpec, action_registry
+from .cache_utils import TTLCache, content_hash
+from .mock_openai_service import mock_openai_service
+from .openai_service import openai_service
+from .upstream_scheduler import priority_scope
+
+# 规则签名：(待查找文本) -> 参数值或 None
+Rule = Callable[[str], Any]
+
+# ==========================================
+# 通用规则
+# ==========================================
+
+_MATH_FUNCTIONS = ("sqrt", "sin", "cos", "tan", "log", "abs", "pow")
+_OPERATOR_WORDS = [
+    (re.compile(r"(?<=[\d)])\s*(?:乘以|乘|×|x|X)\s*(?=[\d(])"), "*"),
+    (re.compile(r"(?<=[\d)])\s*(?:除以|÷)\s*(?=[\d(])"), "/"),
+    (re.compile(r"(?<=[\d)])\s*(?:加上|加)\s*(?=[\d(])"), "+"),
+    (re.compile(r"(?<=[\d)])\s*(?:减去|减)\s*(?=[\d(])"), "-"),
+]
+_POWER_WORDS = re.compile(r"\s*的\s*(\d+)\s*次方")
+_SQUARE_WORDS = re.compile(r"\s*的\s*(平方|立方)")
+_EXPRESSION_CANDIDATE = re.compile(r"(?:sqrt|sin|cos|tan|log|abs|pow|[\d.()+\-*/,\s])+")
+# 步骤文本中表示计算的运算符或运算词
+_OPERATION_MENTION = re.compile(r"[+\-*/×÷^＋－]|乘|除|加|减|次方|平方|立方|sqrt|sin|cos|tan|log|abs|pow")
+
+_QUOTED = re.compile(r"“([^”]+)”|\"([^\"]+)\"|「([^」]+)」|『([^』]+)』|‘([^’]+)’|'([^']+)'")
+# 冒号后的内容（不匹配 12:00 这样的时间）
+_AFTER_COLON = re.compile(r"(?<!\d)[：:](?!\d)\s*([\s\S]+)$")
+
+_DATE = re.compile(
+    r"(\d{4})\s*[-/.年]\s*(\d{1,2})\s*[-/.月]\s*(\d{1,2})\s*[日号]?"
+    r"(?:[ T]*(\d{1,2})\s*[:：点时]\s*(\d{1,2})?\s*分?(?:\s*[:：]\s*(\d{1,2})\s*秒?)?)?"
+)
+_STRFTIME = re.compile(r"%[a-zA-Z](?:[^\s，。,\"”']*%[a-zA-Z])*[^\s，。,\"”']*")
+_SIZE = re.compile(r"(\d{3,4})\s*[x×*]\s*(\d{3,4})")
+_COUNT = re.compile(r"(?:前|top\s*)(\d+)|(\d+)\s*(?:条|个结果)", re.IGNORECASE)
+
+_SEARCH_PREFIX = re.compile(r"^(?:请|帮我|帮忙)?\s*(?:在网上|上网|网上)?\s*(?:搜索|查找|查询|检索|搜一下|查一下|搜|查)\s*(?:一下)?\s*(?:关于)?\s*")
+_SEARCH_SUFFIX = re.compile(r"\s*(?:的)?\s*(?:相关)?\s*(?:信息|资讯|新闻|内容|资料)?\s*$")
+_IMAGE_PREFIX = re.compile(
+    r"^(?:请|帮我|帮忙)?\s*(?:生成|绘制|画|创建|设计|制作)\s*(?:一张|一幅|一个|张|幅|个)?\s*(?:图片|图像|插图)?\s*[：:，,]?\s*"
+)
+
+
+def _first_quoted(text: str) -> Optional[str]:
+    """最长的引号内容"""
+    quoted = [next(group for group in match.groups() if group) for match in _QUOTED.finditer(text)]
+    quoted = [value.strip() for value in quoted if value.strip()]
+    return max(quoted, key=len) if quoted else None
+
+
+def extract_content(text: str) -> Optional[str]:
+    """引号内或冒号后的文本内容"""
+    quoted = _first_quoted(text)
+    if quoted:
+        return quoted
+    match = _AFTER_COLON.search(text)
+    if match and len(match.group(1).strip()) >= 2:
+        return match.group(1).strip()
+    return None
+
+
+def extract_expression(text: str) -> Optional[str]:
+    """最长的可解析数学表达式（至少含一个运算符或数学函数）；日期不算表达式"""
+    normalized = _DATE.sub(" ", text)
+    normalized = normalized.replace("（", "(").replace("）", ")").replace("＋", "+").replace("－", "-")
+    normalized = _POWER_WORDS.sub(lambda m: f"**{m.group(1)}", normalized)
+    normalized = _SQUARE_WORDS.sub(lambda m: "**2" if m.group(1) == "平方" else "**3", normalized)
+    for pattern, operator in _OPERATOR_WORDS:
+        normalized = pattern.sub(operator, normalized)
+
+    best: Optional[str] = None
+    for match in _EXPRESSION_CANDIDATE.finditer(normalized):
+        candidate = match.group(0).strip().strip(",").strip()
+        # 去掉两端多余的运算符和不成对的括号
+        candidate = candidate.rstrip("+-*/.( ").lstrip("+*/.) ")
+        if not re.search(r"\d", candidate):
+            continue
+        has_function = any(func + "(" in candidate for func in _MATH_FUNCTIONS)
+        if not has_function and not re.search(r"\d\s*[+\-*/]", candidate):
+            continue
+        try:
+            tree = ast.parse(candidate, mode="eval")
+        except SyntaxError:
+            continue
+        if isinstance(tree.body, ast.Tuple):
+            continue
+        if best is None or len(candidate) > len(best):
+            best = candidate
+    return best
+
+
+def extract_json(text: str) -> Optional[str]:
+    """第一个完整的 JSON 对象或数组（原样返回）"""
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"[\[{]", text):
+        try:
+            value, end = decoder.raw_decode(text, match.start())
+        except ValueError:
+            continue
+        if isinstance(value, (dict, list)):
+            return text[match.start():end]
+    return None
+
+
+def extract_dates(text: str) -> List[str]:
+    """文本中的全部日期，统一为 YYYY-MM-DD[ HH:MM[:SS]]"""
+    dates = []
+    for match in _DATE.finditer(text):
+        year, month, day, hour, minute, second = match.groups()
+        value = f"{year}-{int(month):02d}-{int(day):02d}"
+        if hour is not None:
+            value += f" {int(hour):02d}:{int(minute or 0):02d}"
+            if second is not None:
+                value += f":{int(second):02d}"
+        dates.append(value)
+    return dates
+
+
+def _nth_date(index: int) -> Rule:
+    def rule(text: str) -> Optional[str]:
+        dates = extract_dates(text)
+        return dates[index] if len(dates) > index else None
+    return rule
+
+
+def _strip_instruction(prefix: "re.Pattern", suffix: Optional["re.Pattern"] = None, min_length: int = 2) -> Rule:
+    """引号内容优先；否则去掉指令前缀（和后缀）后剩余足够长时作为参数值"""
+    def rule(text: str) -> Optional[str]:
+        quoted = _first_quoted(text)
+        if quoted:
+            return quoted
+        if not prefix.search(text):
+            return None
+        value = prefix.sub("", text.strip(), count=1)
+        if suffix is not None:
+            value = suffix.sub("", value)
+        value = value.strip(" ，,。.")
+        return value if len(value) >= min_length else None
+    return rule
+
+
+def _size_part(index: int) -> Rule:
+    def rule(text: str) -> Optional[int]:
+        match = _SIZE.search(text)
+        return int(match.group(index)) if match else None
+    return rule
+
+
+def _count(text: str) -> Optional[int]:
+    match = _COUNT.search(text)
+    return int(match.group(1) or match.group(2)) if match else None
+
+
+def _strftime(text: str) -> Optional[str]:
+    match = _STRFTIME.search(text)
+    return match.group(0) if match else None
+
+
+def _mentions_operation(text: str) -> bool:
+    return bool(_OPERATION_MENTION.search(text))
+
+
+# 按参数名的规则：(规则, 是否也在前置步骤结果中查找)
+PARAMETER_RULES: Dict[str, Tuple[Rule, bool]] = {
+    "expression": (extract_expression, True),
+    "json_string": (extract_json, True),
+    "date_input": (_nth_date(0), False),
+    "compare_to": (_nth_date(1), False),
+    "output_format": (_strftime, False),
+    "query": (_strip_instruction(_SEARCH_PREFIX, _SEARCH_SUFFIX), False),
+    "prompt": (_strip_instruction(_IMAGE_PREFIX, min_length=4), False),
+    "width": (_size_part(1), False),
+    "height": (_size_part(2), False),
+    "max_results": (_count, False),
+    "top_k": (_count, False),
+}
+
+# 在前置步骤结果中查找的前提（按步骤文本判断）：步骤本身没提到运算时，
+# 前置结果里的数字串不能当作表达式，交给 LLM 理解步骤意图
+CONTEXT_GUARDS: Dict[str, Callable[[str], bool]] = {
+    "expression": _mentions_operation,
+}
+
+# select 参数的关键词表：Action ID -> 参数名 -> [(option 值, 关键词)]，按顺序匹配
+OPTION_KEYWORDS: Dict[str, Dict[str, List[Tuple[str, Tuple[str, ...]]]]] = {
+    "text_processor": {
+        "operation": [
+            ("uppercase", ("大写", "uppercase")),
+            ("lowercase", ("小写", "lowercase")),
+            ("word_count", ("字数", "词数", "多少字", "word count")),
+            ("analyze", ("分析", "关键词", "词频", "统计")),
+        ],
+    },
+    "json_processor": {
+        "operation": [
+            ("validate", ("验证", "校验", "是否合法", "是否有效", "validate")),
+            ("keys", ("键名", "字段名", "有哪些字段", "keys")),
+            ("count", ("数量", "多少个", "多少条", "统计")),
+            ("format", ("格式化", "美化", "整理", "format")),
+        ],
+    },
+    "datetime_processor": {
+        "operation": [
+            ("diff", ("相差", "间隔", "距离", "差几", "多少天", "时间差", "diff")),
+            ("bucket", ("分桶", "按天统计", "按周", "按月", "留存", "cohort")),
+            ("format", ("格式化", "转换格式", "格式为", "format")),
+            ("parse", ("解析", "星期几", "周几", "parse")),
+            ("now", ("当前", "现在", "今天", "此刻", "now")),
+        ],
+        "unit": [
+            ("weeks", ("多少周", "几周", "周数")),
+            ("hours", ("多少小时", "几个小时", "小时数")),
+            ("minutes", ("多少分钟", "几分钟", "分钟数")),
+            ("seconds", ("多少秒", "秒数")),
+            ("days", ("多少天", "几天", "天数")),
+        ],
+        "bucket": [
+            ("cohort", ("留存", "cohort")),
+            ("week", ("按周", "每周")),
+            ("month", ("按月", "每月")),
+            ("day", ("按天", "每天", "每日")),
+        ],
+    },
+}
+
+
+def _datetime_operation_fallback(text: str) -> Optional[str]:
+    """没有关键词时按日期个数推断：两个日期算时间差，一个日期解析"""
+    count = len(extract_dates(text))
+    return "diff" if count >= 2 else "parse" if count == 1 else None
+
+
+SELECT_FALLBACKS: Dict[Tuple[str, str], Rule] = {
+    ("datetime_processor", "operation"): _datetime_operation_fallback,
+}
+
+
+def _select_rule(action_id: str, param: Dict[str, Any]) -> Rule:
+    """select 参数：关键词表，再匹配 option 的 label / value"""
+    keywords = OPTION_KEYWORDS.get(action_id, {}).get(param["name"], [])
+    labels = [(str(option["value"]), str(option.get("label") or option["value"])) for option in param.get("options", [])]
+    fallback = SELECT_FALLBACKS.get((action_id, param["name"]))
+
+    def rule(text: str) -> Optional[str]:
+        lowered = text.lower()
+        for value, words in keywords:
+            if any(word in lowered for word in words):
+                return value
+        for value, label in labels:
+            if label in text or re.search(rf"\b{re.escape(value)}\b", lowered):
+                return value
+        return fallback(text) if fallback else None
+
+    return rule
+
+
+class ParameterRule:
+    """单个参数的提取规则"""
+
+    __slots__ = ("name", "required", "has_default", "rule", "search_context", "context_guard")
+
+    def __init__(self, param: Dict[str, Any], rule: Rule, search_context: bool):
+        self.name: str = param["name"]
+        self.required = bool(param.get("required"))
+        self.has_default = "defaultValue" in param
+        self.rule = rule
+        self.search_context = search_context
+        self.context_guard = CONTEXT_GUARDS.get(self.name)
+
+
+def compile_rules(spec: ActionSpec) -> List[ParameterRule]:
+    """根据 Action 库中的参数定义编译提取规则（没有适用规则的参数不在列表中）"""
+    rules = []
+    for param in spec.definition.get("parameters", []):
+        if param["name"] in PARAMETER_RULES:
+            rule, search_context = PARAMETER_RULES[param["name"]]
+        elif param.get("type") == "select" and param.get("options"):
+            rule, search_context = _select_rule(spec.id, param), False
+        elif param.get("type") in ("string", "textarea") and param.get("required"):
+            rule, search_context = extract_content, False
+        else:
+            continue
+        rules.append(ParameterRule(param, rule, search_context))
+    return rules
+
+
+class _ActionStats:
+    def __init__(self):
+        self.requests = 0
+        self.rule_hits = 0
+        self.cache_hits = 0
+        self.llm_calls = 0
+        self.llm_failures = 0
+        self.llm_ms: Deque[float] = deque(maxlen=500)
+        self.rule_us: Deque[float] = deque(maxlen=2000)
+
+
+class ParameterExtractorService:
+    """规则优先的 Action 参数提取，规则取不全必填参数时才调用 LLM（结果缓存）"""
+
+    def __init__(self):
+        self.rules: Dict[str, List[ParameterRule]] = {spec.id: compile_rules(spec) for spec in action_registry}
+        self.cache = TTLCache(maxsize=config.PARAM_EXTRACT_CACHE_SIZE, ttl=config.PARAM_EXTRACT_CACHE_TTL)
+        self._stats: Dict[str, _ActionStats] = {}
+
+    def extract_with_rules(
+        self, spec: ActionSpec, text: str, user_input: str = "", context: str = ""
+    ) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        只用规则提取
+
+        Returns:
+            (提取到的参数, 规则未能提取的必填参数名；有 defaultValue 的 select 参数不算缺失)
+        """
+        parameters: Dict[str, Any] = {}
+        missing: List[str] = []
+        for rule in self.rules.get(spec.id, []):
+            sources = [text, user_input]
+            if rule.search_context and (rule.context_guard is None or rule.context_guard(text)):
+                sources.append(context)
+            for source in sources:
+                if not source:
+                    continue
+                value = rule.rule(source)
+                if value not in (None, ""):
+                    parameters[rule.name] = value
+                    break
+            else:
+                if rule.required and not rule.has_default:
+                    missing.append(rule.name)
+        # 没有任何规则的必填参数
+        covered = {rule.name for rule in self.rules.get(spec.id, [])}
+        for param in spec.definition.get("parameters", []):
+            if param.get("required") and "defaultValue" not in param and param["name"] not in covered:
+                missing.append(param["name"])
+        return parameters, missing
+
+    async def extract(
+        self,
+        action_id: str,
+        text: str,
+        user_input: str = "",
+        context: str = "",
+        allow_llm: bool = True
+    ) -> Dict[str, Any]:
+        """
+        提取 Action 参数
+
+        Args:
+            action_id: Action ID
+            text: 步骤文本或用户的自然语言输入
+            user_input: 用户原始请求（待办步骤执行时）
+            context: 前置步骤结果
+            allow_llm: 规则取不全必填参数时是否调用 LLM
+
+        Returns:
+            {'success', 'parameters', 'source': rules / cache / llm / fallback, 'missing', 'latency_ms'}
+        """
+        spec = action_registry.get(action_id)
+        if spec is None:
+            return {"success": False, "error": f"不支持的Action ID: {action_id}"}
+        started = time.perf_counter()
+        stats = self._stats.setdefault(spec.id, _ActionStats())
+        stats.requests += 1
+
+        parameters, missing = self.extract_with_rules(spec, text, user_input, context)
+        stats.rule_us.append((time.perf_counter() - started) * 1e6)
+        source = "rules"
+        if not missing:
+            stats.rule_hits += 1
+        elif allow_llm:
+            key = content_hash(json.dumps([spec.id, text, user_input, context], ensure_ascii=False))
+            cached = self.cache.get(key)
+            if cached is not None:
+                stats.cache_hits += 1
+                parameters, source = {**parameters, **cached}, "cache"
+            else:
+                llm_started = time.perf_counter()
+                extracted = await self._extract_with_llm(spec, text, user_input, context)
+                stats.llm_calls += 1
+                stats.llm_ms.append((time.perf_counter() - llm_started) * 1000)
+                if extracted is None:
+                    stats.llm_failures += 1
+                    source = "fallback"
+                else:
+                    self.cache.set(key, extracted)
+                    parameters, source = {**parameters, **extracted}, "llm"
+        else:
+            source = "fallback"
+
+        parameters = self._sanitize(spec, parameters, text)
+        return {
+            "success": True,
+            "parameters": parameters,
+            "source": source,
+            "missing": [name for name in missing if name not in parameters],
+            "latency_ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+
+    @staticmethod
+    def _sanitize(spec: ActionSpec, parameters: Dict[str, Any], text: str) -> Dict[str, Any]:
+        """
+        丢弃不合法的 select 取值（由注册表校验填入默认值）；
+        第一个仍缺失的必填文本参数使用原文（与前端降级处理一致）
+        """
+        declared = spec.definition.get("parameters", [])
+        for param in declared:
+            allowed = {str(option["value"]) for option in param.get("options", [])}
+            if allowed and param["name"] in parameters and str(parameters[param["name"]]) not in allowed:
+                del parameters[param["name"]]
+        for param in declared:
+            if param.get("required") and not param.get("options") and param["name"] not in parameters:
+                parameters[param["name"]] = text
+                break
+        return parameters
+
+    async def _extract_with_llm(
+        self, spec: ActionSpec, text: str, user_input: str, context: str
+    ) -> Optional[Dict[str, Any]]:
+        """LLM 提取；失败或无法解析时返回 None"""
+        lines = []
+        for param in spec.definition.get("parameters", []):
+            options = "、".join(str(option["value"]) for option in param.get("options", []))
+            description = param.get("description") or param.get("label") or ""
+            line = f"- {param['name']} ({param.get('type', 'string')}): {description}{' [必需]' if param.get('required') else ' [可选]'}"
+            lines.append(line + (f"，可选值：{options}" if options else ""))
+        prompt = (
+            "你是一个参数提取专家。请从以下信息中提取工具所需的参数。\n\n"
+            f"工具信息：\n- 工具ID: {spec.id}\n- 工具名称: {spec.name}\n"
+            f"- 工具描述: {spec.definition.get('description', '')}\n\n"
+            "参数定义：\n" + "\n".join(lines)
+            + f"\n\n【当前任务】: {text}"
+            + (f"\n\n【用户原始输入】\n{user_input}" if user_input else "")
+            + (f"\n\n【前置步骤结果】\n{context}" if context else "")
+            + "\n\n要求：\n1. 优先从当前任务和用户原始输入中提取，其次从前置步骤结果中提取\n"
+            "2. 对于calculator：只提取纯数学表达式（数字和运算符）\n"
+            "3. 无法提取的参数不要返回\n\n只返回JSON对象，键为参数名，不要其他说明文字。"
+        )
+
+        service = mock_openai_service if config.USE_MOCK_OPENAI else openai_service
+        try:
+            with priority_scope("interactive"):
+                response = await service.get_chat_completion(
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0,
+                    max_tokens=500,
+                    model=config.PARAM_EXTRACT_LLM_MODEL
+                )
+            if not response["success"] or not response.get("content"):
+                return None
+            match = re.search(r"\{[\s\S]*\}", response["content"])
+            parsed = json.loads(match.group(0)) if match else None
+        except Exception as e:
+            print(f"⚠️ LLM 参数提取失败: {e}")
+            return None
+        if not isinstance(parsed, dict):
+            return None
+        declared = {param["name"] for param in spec.definition.get("parameters", [])}
+        return {name: value for name, value in parsed.items() if name in declared and value not in (None, "")}
+
+    def stats(self) -> Dict[str, Any]:
+        """各 Action 的规则命中率、缓存命中数、LLM 调用数和估算节省的 LLM 耗时"""
+        all_llm_ms = [ms for stats in self._stats.values() for ms in stats.llm_ms]
+        global_llm_ms = float(np.mean(all_llm_ms)) if all_llm_ms else None
+        actions = {}
+        for action_id, stats in self._stats.items():
+            avg_llm_ms = float(np.mean(stats.llm_ms)) if stats.llm_ms else global_llm_ms
+            avoided = stats.rule_hits + stats.cache_hits
+            actions[action_id] = {
+                "requests": stats.requests,
+                "rule_hits": stats.rule_hits,
+                "rule_hit_rate": round(stats.rule_hits / stats.requests, 4) if stats.requests else None,
+                "cache_hits": stats.cache_hits,
+                "llm_calls": stats.llm_calls,
+                "llm_failures": stats.llm_failures,
+                "rule_p50_us": round(float(np.percentile(stats.rule_us, 50)), 1) if stats.rule_us else None,
+                "avg_llm_ms": round(avg_llm_ms, 1) if avg_llm_ms is not None else None,
+                # 规则或缓存命中省下的 LLM 调用 × 平均 LLM 提取耗时（该 Action 尚无样本时用全局平均）
+                "latency_saved_ms": round(avoided * avg_llm_ms, 1) if avg_llm_ms is not None else None
+            }
+        return {"actions": actions, "cache": self.cache.stats()}
+
+
+# 创建全局实例
+parameter_extractor_service = ParameterExtractorService()
@@ -0,0 +1,209 @@
+"""
+聊天检索增强（RAG）
+
+前端不再自己检索、拼接上下文再把增强后的 prompt 发回后端；/api/chat 和 /ws/chat 带上 rag
+选项后由后端完成：
+- 以最后一条用户消息为查询，在服务端知识库中检索
+- 按 token 预算打包上下文（格式与前端 formatSearchResultsAsContext 一致），前置到最后一条用户消息
+- 检索期间并发建立上游连接，检索耗时与模型耗时分开上报
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from config import config
+from .embedding_service import estimate_tokens
+from .knowledge_base_service import knowledge_base_service
+
+CONTEXT_HEADER = "基于知识库的相关信息：\n\n"
+CONTEXT_FOOTER = "\n\n请基于以上信息回答用户问题："
+
+
+def normalize_options(rag: Any) -> Optional[Dict[str, Any]]:
+    """
+    把请求中的 rag 字段统一为选项字典
+
+    Args:
+        rag: None / False（关闭）、True（默认选项）或选项字典 {'enabled', 'limit', 'source_ids', ...}
+
+    Returns:
+        选项字典，关闭时为 None
+    """
+    if not rag:
+        return None
+    if rag is True:
+        return {}
+    options = dict(rag)
+    if not options.pop("enabled", True):
+        return None
+    return options
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """按估算 token 数截断文本（先按比例截，再逐步收缩）"""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    cut = max(1, len(text) * max_tokens // tokens)
+    while cut > 1 and estimate_tokens(text[:cut]) > max_tokens:
+        cut = cut * 9 // 10
+    return text[:cut].rstrip() + "…"
+
+
+def pack_context(results: List[Dict[str, Any]], max_tokens: int) -> Tuple[str, List[Dict[str, Any]], int, bool]:
+    """
+    按相关度顺序把检索结果打包进 token 预算
+
+    整段放不下时，剩余预算不少于 RAG_MIN_CHUNK_TOKENS 则截断后放入，之后的结果全部丢弃。
+
+    Returns:
+        (上下文文本, 实际放入的结果, 估算 token 数, 是否有截断或丢弃)
+    """
+    budget = max_tokens - estimate_tokens(CONTEXT_HEADER + CONTEXT_FOOTER)
+    blocks: List[str] = []
+    used: List[Dict[str, Any]] = []
+    truncated = False
+    for result in results:
+        label = f"[知识库{len(blocks) + 1}] {result.get('sourceName') or result.get('sourceId') or ''}：\n"
+        block = label + str(result.get("content") or "")
+        # 块之间的 "\n\n" 计入预算
+        block_tokens = estimate_tokens(block) + (1 if blocks else 0)
+        if block_tokens <= budget:
+            blocks.append(block)
+            used.append(result)
+            budget -= block_tokens
+            continue
+        content_budget = budget - estimate_tokens(label) - 2
+        if content_budget >= config.RAG_MIN_CHUNK_TOKENS:
+            blocks.append(label + _truncate_to_tokens(str(result.get("content") or ""), content_budget))
+            used.append(result)
+        truncated = True
+        break
+    context = _render(blocks)
+    return context, used, estimate_tokens(context) if context else 0, truncated
+
+
+def _render(blocks: List[str]) -> str:
+    return CONTEXT_HEADER + "\n\n".join(blocks) + CONTEXT_FOOTER if blocks else ""
+
+
+def augment_messages(messages: List[Dict[str, str]], context: str) -> List[Dict[str, str]]:
+    """把上下文前置到最后一条用户消息（不修改传入的列表）"""
+    if not context:
+        return messages
+    augmented = [dict(message) for message in messages]
+    for message in reversed(augmented):
+        if message.get("role") == "user":
+            message["content"] = f"{context}\n\n{message.get('content', '')}"
+            break
+    return augmented
+
+
+def last_user_message(messages: List[Dict[str, str]]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return str(message.get("content") or "")
+    return ""
+
+
+class RAGService:
+    """为聊天请求检索并注入知识库上下文"""
+
+    def __init__(self):
+        self._warm_ups: Set[asyncio.Task] = set()
+
+    def _start_warm_up(self, service: Any) -> None:
+        """后台建立上游连接；不等待完成，连接慢时对话请求照常自己建连"""
+        task = asyncio.create_task(service.warm_up())
+        self._warm_ups.add(task)
+        task.add_done_callback(self._warm_ups.discard)
+
+    async def retrieve_context(self, query: str, options: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        检索并打包上下文
+
+        Args:
+            query: 查询文本
+            options: {'limit', 'source_ids', 'mode', 'filters', 'max_context_tokens'}，均可省略
+
+        Returns:
+            {'success', 'context', 'sources', 'tokens', 'truncated', 'mode', 'retrieval_ms'}
+        """
+        started = time.perf_counter()
+        search = await knowledge_base_service.search(
+            query,
+            limit=int(options.get("limit") or config.RAG_MAX_RESULTS),
+            source_ids=options.get("source_ids"),
+            mode=options.get("mode") or "hybrid",
+            filters=options.get("filters")
+        )
+        if not search["success"]:
+            return {
+                "success": False,
+                "error": search.get("error"),
+                "retrieval_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+
+        max_tokens = int(options.get("max_context_tokens") or config.RAG_CONTEXT_TOKENS)
+        context, used, tokens, truncated = pack_context(search["results"], max_tokens)
+        info = {
+            "success": True,
+            "context": context,
+            "sources": [
+                {
+                    "id": result["id"],
+                    "sourceId": result.get("sourceId"),
+                    "sourceName": result.get("sourceName"),
+                    "score": result.get("score")
+                }
+                for result in used
+            ],
+            "tokens": tokens,
+            "truncated": truncated,
+            "mode": search["mode"],
+            "retrieval_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+        if search.get("degraded"):
+            info["degraded"] = True
+        return info
+
+    async def prepare(
+        self,
+        messages: List[Dict[str, str]],
+        options: Dict[str, Any],
+        service: Any
+    ) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """
+        检索增强一次聊天请求
+
+        检索开始前先在后台建立上游连接，两者重叠。检索失败时不注入上下文，对话照常进行。
+
+        Args:
+            messages: 已格式化的消息列表
+            options: normalize_options 的结果
+            service: openai_service 或 mock_openai_service
+
+        Returns:
+            (增强后的消息, 检索信息：上下文之外的字段，即 sources / tokens / retrieval_ms 等)
+        """
+        self._start_warm_up(service)
+        query = last_user_message(messages)
+        if not query.strip():
+            return messages, {"success": True, "sources": [], "tokens": 0, "retrieval_ms": 0.0}
+
+        try:
+            info = await self.retrieve_context(query, options)
+        except Exception as e:
+            print(f"⚠️ 知识库检索失败，按无上下文继续对话: {e}")
+            return messages, {"success": False, "error": str(e)}
+        if not info["success"]:
+            print(f"⚠️ 知识库检索失败，按无上下文继续对话: {info.get('error')}")
+            return messages, info
+
+        context = info.pop("context")
+        print(f"📚 检索增强: {len(info['sources'])} 个片段，约 {info['tokens']} tokens，检索 {info['retrieval_ms']}ms")
+        return augment_messages(messages, context), info
+
+
+# 创建全局实例
+rag_service = RAGService()
@@ -0,0 +1,315 @@
+"""
+Python 代码沙箱进程池
+
+为 code_execution 类型的自定义 Action 执行 Action 库中定义的 Python 代码（codeConfig.code，
+只从服务端读取，不接受请求中的代码）：
+- 启动时预先创建固定数量的沙箱进程，执行时只需一次管道往返，不再为每次调用新建进程
+- 沙箱进程是独立的解释器（sandbox_worker.py，exec 启动而非 fork），不继承服务端的内存、
+  环境变量和文件描述符；隔离措施（命名空间、chroot、非特权用户、资源上限、seccomp）见该模块
+- 每次执行有独立的 CPU 时间、内存和墙钟时间上限
+- 超时的进程直接 kill 并在后台补充新进程；执行 N 次或触发资源上限后回收重建
+- 进程之间只传 JSON，不反序列化沙箱返回的 pickle
+
+代码片段约定：参数通过 params 字典传入，结果写入变量 result，print 输出会被捕获。
+"""
+import asyncio
+import contextlib
+import json
+import os
+import pwd
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from config import config
+from .deadline import create_detached_task, remaining
+
+WORKER_ENTRYPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+WORKER_START_TIMEOUT = 10.0  # 沙箱进程完成隔离并报告就绪的时间上限（秒）
+
+MAX_CODE_CHARS = 100 * 1024
+MAX_REPLY_BYTES = 4 * 1024 * 1024
+
+
+class _SandboxWorker:
+    """父进程持有的沙箱进程句柄"""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+        self.tasks = 0
+        self.isolation: Dict[str, Any] = {}
+
+    @classmethod
+    async def spawn(cls, args: List[str]) -> "_SandboxWorker":
+        """启动沙箱进程并等待其完成隔离；隔离失败时抛出 RuntimeError"""
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-I", "-S", WORKER_ENTRYPOINT, *args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            env={"LC_ALL": "C.UTF-8"},  # 不传递服务端的环境变量
+            cwd="/",
+            start_new_session=True
+        )
+        worker = cls(process)
+        try:
+            ready = await asyncio.wait_for(worker._read_frame(), timeout=WORKER_START_TIMEOUT)
+        except (asyncio.TimeoutError, EOFError, ValueError) as e:
+            worker.kill()
+            raise RuntimeError(f"沙箱进程未能启动: {str(e) or type(e).__name__}")
+        if not ready.get("ready"):
+            worker.kill()
+            raise RuntimeError(ready.get("error", "沙箱进程未能启动"))
+        worker.isolation = ready.get("isolation", {})
+        return worker
+
+    async def _read_frame(self) -> Dict[str, Any]:
+        header = await self.process.stdout.readexactly(4)
+        size = struct.unpack(">I", header)[0]
+        if size > MAX_REPLY_BYTES:
+            raise ValueError(f"沙箱回复过大: {size} 字节")
+        return json.loads(await self.process.stdout.readexactly(size))
+
+    async def execute(self, code: str, params: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """发送任务并等待结果；超时抛出 asyncio.TimeoutError"""
+        body = json.dumps({"code": code, "params": params}, ensure_ascii=False, default=repr).encode("utf-8")
+
+        async def round_trip() -> Dict[str, Any]:
+            self.process.stdin.write(struct.pack(">I", len(body)) + body)
+            await self.process.stdin.drain()
+            return await self._read_frame()
+
+        return await asyncio.wait_for(round_trip(), timeout=timeout)
+
+    def kill(self) -> None:
+        """立即结束进程；不等待退出，由事件循环的子进程监视器回收"""
+        if self.process.returncode is None:
+            with contextlib.suppress(ProcessLookupError):
+                self.process.kill()
+
+    def stop(self) -> None:
+        """正常退出：关闭请求管道，进程读到 EOF 后自行退出"""
+        with contextlib.suppress(Exception):
+            self.process.stdin.close()
+
+
+class SandboxPool:
+    """预先启动的沙箱进程池"""
+
+    def __init__(
+        self,
+        size: int = 4,
+        max_tasks_per_worker: int = 200,
+        cpu_seconds: int = 2,
+        memory_mb: int = 256,
+        wall_timeout: float = 5.0,
+        user: str = "nobody"
+    ):
+        self.size = size
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.wall_timeout = wall_timeout
+        self.user = user
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: List[_SandboxWorker] = []
+        self._replenishing: Set[asyncio.Task] = set()
+        self._root_dir: Optional[str] = None
+        self._worker_args: List[str] = []
+        self.error: Optional[str] = None
+        self.isolation: Dict[str, Any] = {}
+
+        self.executions = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.recycled = 0
+        self.total_ms = 0.0
+
+    def _prepare(self) -> None:
+        """确定沙箱进程的用户和 chroot 目录；以 root 运行时找不到非特权用户则拒绝启动"""
+        uid = gid = -1
+        if os.geteuid() == 0:
+            try:
+                account = pwd.getpwnam(self.user)
+            except KeyError:
+                raise RuntimeError(f"沙箱用户不存在: {self.user}")
+            if account.pw_uid == 0:
+                raise RuntimeError(f"沙箱用户不能是 root: {self.user}")
+            uid, gid = account.pw_uid, account.pw_gid
+        # 空目录作为沙箱进程的根目录（只有 root 可访问，切换用户后无法列出）
+        self._root_dir = tempfile.mkdtemp(prefix="sandbox-root-")
+        # CPU 硬上限覆盖进程的全部执行次数，达到后内核直接结束进程
+        cpu_hard_seconds = self.cpu_seconds * (self.max_tasks_per_worker + 1) + 10
+        self._worker_args = [
+            str(uid), str(gid), self._root_dir, str(self.cpu_seconds), str(self.memory_mb), str(cpu_hard_seconds)
+        ]
+
+    async def _spawn(self) -> _SandboxWorker:
+        worker = await _SandboxWorker.spawn(self._worker_args)
+        self._workers.append(worker)
+        self.isolation = worker.isolation
+        return worker
+
+    async def _spawn_idle(self) -> None:
+        try:
+            worker = await self._spawn()
+        except Exception as e:
+            print(f"⚠️ 沙箱进程补充失败: {e}")
+            return
+        if self._idle is not None:
+            self._idle.put_nowait(worker)
+        else:
+            worker.stop()
+
+    def _retire(self, worker: _SandboxWorker, graceful: bool = False) -> None:
+        """回收进程并在后台补充新进程（不阻塞事件循环）"""
+        if worker in self._workers:
+            self._workers.remove(worker)
+        if graceful:
+            worker.stop()
+        else:
+            worker.kill()
+        self.recycled += 1
+        task = create_detached_task(self._spawn_idle())
+        self._replenishing.add(task)
+        task.add_done_callback(self._replenishing.discard)
+
+    async def start(self) -> None:
+        """预热进程池（首次执行时也会自动调用）"""
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        try:
+            self._prepare()
+            workers = await asyncio.gather(*(self._spawn() for _ in range(self.size)))
+        except Exception as e:
+            self.error = str(e)
+            print(f"❌ 代码沙箱进程池启动失败: {e}")
+            return
+        for worker in workers:
+            self._idle.put_nowait(worker)
+        print(f"🧪 代码沙箱进程池已启动: {self.size} 个进程，隔离 {self.isolation}")
+
+    def shutdown(self) -> None:
+        for task in self._replenishing:
+            task.cancel()
+        for worker in self._workers:
+            worker.stop()
+        self._workers = []
+        self._idle = None
+        if self._root_dir:
+            shutil.rmtree(self._root_dir, ignore_errors=True)
+            self._root_dir = None
+
+    async def run(self, code: str, params: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        在沙箱中执行代码片段
+
+        Args:
+            code: Python 代码，结果写入变量 result
+            params: 传给代码的参数（代码中通过 params 访问）
+            timeout: 墙钟时间上限，默认使用配置值；同时受请求截止时间约束
+
+        Returns:
+            {'success': True, 'result': ..., 'stdout': ..., 'duration_ms': ...} 或错误信息
+        """
+        if len(code) > MAX_CODE_CHARS:
+            return {"success": False, "error": f"代码长度超过上限 {MAX_CODE_CHARS} 字符"}
+        try:
+            # 语法错误在父进程中直接返回，不占用沙箱进程
+            compile(code, "<action>", "exec")
+        except SyntaxError as e:
+            return {"success": False, "error": f"代码语法错误: {e}"}
+
+        timeout = timeout or self.wall_timeout
+        left = remaining()
+        if left is not None:
+            timeout = min(timeout, left)
+        if timeout <= 0:
+            return {"success": False, "error": "请求已超过截止时间", "deadline_exceeded": True}
+
+        await self.start()
+        if self.error:
+            return {"success": False, "error": f"代码沙箱不可用: {self.error}"}
+        started = time.monotonic()
+        budget = timeout
+        try:
+            worker = await asyncio.wait_for(self._idle.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return {"success": False, "error": f"等待空闲沙箱进程超时（{round(budget, 2)}s）", "timeout": True}
+        timeout -= time.monotonic() - started  # 排队时间计入墙钟上限
+
+        try:
+            reply = await worker.execute(code, params, timeout=max(timeout, 0.001))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self._retire(worker)
+            return {"success": False, "error": f"代码执行超时（{round(budget, 2)}s）", "timeout": True}
+        except (EOFError, OSError, ValueError) as e:
+            # 进程意外退出（如被系统 OOM kill）或回复格式错误
+            self.failures += 1
+            self._retire(worker)
+            return {"success": False, "error": f"沙箱进程异常退出: {str(e) or type(e).__name__}"}
+        except BaseException:
+            # 调用方被取消：进程状态未知，直接替换
+            self._retire(worker)
+            raise
+
+        duration_ms = (time.monotonic() - started) * 1000
+        self.executions += 1
+        self.total_ms += duration_ms
+        worker.tasks += 1
+
+        if reply.get("kind") in ("cpu_limit", "memory_limit") or worker.tasks >= self.max_tasks_per_worker:
+            self._retire(worker, graceful=True)
+        else:
+            self._idle.put_nowait(worker)
+
+        if not reply.get("ok"):
+            self.failures += 1
+            return {
+                "success": False,
+                "error": reply.get("error"),
+                "limit": reply.get("kind") if reply.get("kind") != "error" else None,
+                "stdout": reply.get("stdout", "")
+            }
+        return {
+            "success": True,
+            "result": reply.get("result"),
+            "stdout": reply.get("stdout", ""),
+            "duration_ms": round(duration_ms, 2)
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._workers),
+            "idle": self._idle.qsize() if self._idle else 0,
+            "error": self.error,
+            "isolation": self.isolation,
+            "executions": self.executions,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "recycled": self.recycled,
+            "avg_ms": round(self.total_ms / self.executions, 2) if self.executions else None,
+            "limits": {
+                "cpu_seconds": self.cpu_seconds,
+                "memory_mb": self.memory_mb,
+                "wall_timeout": self.wall_timeout,
+                "max_tasks_per_worker": self.max_tasks_per_worker
+            }
+        }
+
+
+# 创建全局实例
+sandbox_pool = SandboxPool(
+    size=config.SANDBOX_WORKERS,
+    max_tasks_per_worker=config.SANDBOX_MAX_TASKS_PER_WORKER,
+    cpu_seconds=config.SANDBOX_CPU_SECONDS,
+    memory_mb=config.SANDBOX_MEMORY_MB,
+    wall_timeout=config.SANDBOX_WALL_TIMEOUT,
+    user=config.SANDBOX_USER
+)
@@ -0,0 +1,356 @@
+"""
+代码沙箱进程入口
+
+由 sandbox_pool 以 `python -I -S sandbox_worker.py <uid> <gid> <root_dir> <cpu_seconds> <memory_mb> <cpu_hard_seconds>`
+启动的独立解释器（不是 fork）：只依赖标准库，不导入 config 或任何服务模块，进程内没有服务端的内存和密钥，
+环境变量由父进程清空。
+
+执行任何代码片段之前依次完成隔离：
+1. 预先导入允许的模块（之后不能再读文件）
+2. 协议只走 stdin（请求）和 fd 3（回复），标准输出、错误指向 /dev/null
+3. 新建网络、IPC、UTS、挂载命名空间（非 root 时借助用户命名空间），chroot 到空目录
+4. root 启动时切换到非特权用户，无法切换则拒绝启动
+5. 设置资源上限（内存、文件数、子进程数、文件大小、CPU）
+6. 安装 seccomp 过滤器：网络、文件、进程、信号、提权等系统调用一律返回 EPERM
+
+协议：4 字节大端长度 + UTF-8 JSON。启动完成后先发送 {"ready": true, "isolation": {...}}，
+之后每个请求 {"code", "params"} 对应一个回复。受限的 builtins 只是第一道防线，
+代码片段逃出 builtins 后仍受上述进程级隔离约束。
+"""
+import builtins
+import contextlib
+import ctypes
+import io
+import json
+import math
+import os
+import platform
+import resource
+import signal
+import struct
+import sys
+
+# 代码片段可以 import 的模块（在隔离前预先导入）
+ALLOWED_MODULES = (
+    "math", "cmath", "statistics", "random", "decimal", "fractions",
+    "json", "re", "string", "textwrap", "unicodedata",
+    "datetime", "calendar", "itertools", "functools", "collections",
+    "heapq", "bisect", "hashlib", "base64",
+)
+
+# 允许模块在运行时才导入的依赖（如 datetime.strptime -> _strptime）
+_LAZY_DEPENDENCIES = ("_strptime",)
+
+_SAFE_BUILTIN_NAMES = (
+    "abs", "all", "any", "ascii", "bin", "bool", "bytearray", "bytes", "callable", "chr",
+    "dict", "divmod", "enumerate", "filter", "float", "format", "frozenset", "hash", "hex",
+    "int", "isinstance", "issubclass", "iter", "len", "list", "map", "max", "min", "next",
+    "object", "oct", "ord", "pow", "print", "range", "repr", "reversed", "round", "set",
+    "slice", "sorted", "str", "sum", "tuple", "zip",
+    "ArithmeticError", "AssertionError", "AttributeError", "Exception", "IndexError",
+    "KeyError", "LookupError", "OverflowError", "RuntimeError", "StopIteration",
+    "TypeError", "ValueError", "ZeroDivisionError",
+)
+
+MAX_STDOUT_CHARS = 64 * 1024
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+MAX_REPLY_BYTES = 4 * 1024 * 1024
+
+REQUEST_FD = 0
+REPLY_FD = 3
+
+# ==========================================
+# seccomp
+# ==========================================
+
+_CLONE_NEWNS = 0x00020000
+_CLONE_NEWUTS = 0x04000000
+_CLONE_NEWIPC = 0x08000000
+_CLONE_NEWUSER = 0x10000000
+_CLONE_NEWNET = 0x40000000
+
+_PR_SET_NO_NEW_PRIVS = 38
+_PR_SET_SECCOMP = 22
+_SECCOMP_MODE_FILTER = 2
+_SECCOMP_RET_KILL_PROCESS = 0x80000000
+_SECCOMP_RET_ERRNO = 0x00050000
+_SECCOMP_RET_ALLOW = 0x7FFF0000
+_EPERM = 1
+
+_BPF_LD_W_ABS = 0x20
+_BPF_JEQ_K = 0x15
+_BPF_JGE_K = 0x35
+_BPF_RET_K = 0x06
+
+# 禁止的系统调用：网络、打开/修改文件、创建进程和线程、发信号、调试、提权、命名空间、内核接口
+_DENIED_SYSCALLS = {
+    "x86_64": (0xC000003E, {
+        "socket": 41, "connect": 42, "accept": 43, "bind": 49, "listen": 50, "socketpair": 53,
+        "accept4": 288, "clone": 56, "fork": 57, "vfork": 58, "execve": 59, "execveat": 322, "clone3": 435,
+        "kill": 62, "tkill": 200, "tgkill": 234, "pidfd_open": 434, "pidfd_send_signal": 424,
+        "ptrace": 101, "process_vm_readv": 310, "process_vm_writev": 311,
+        "open": 2, "openat": 257, "openat2": 437, "creat": 85, "open_by_handle_at": 304,
+        "name_to_handle_at": 303, "memfd_create": 319,
+        "unlink": 87, "unlinkat": 263, "rename": 82, "renameat": 264, "renameat2": 316,
+        "mkdir": 83, "mkdirat": 258, "rmdir": 84, "link": 86, "linkat": 265, "symlink": 88,
+        "symlinkat": 266, "mknod": 133, "mknodat": 259, "truncate": 76, "ftruncate": 77,
+        "chmod": 90, "fchmod": 91, "fchmodat": 268, "chown": 92, "fchown": 93, "lchown": 94,
+        "fchownat": 260, "utime": 132, "utimes": 235, "utimensat": 280, "futimesat": 261,
+        "mount": 165, "umount2": 166, "pivot_root": 155, "chroot": 161, "unshare": 272, "setns": 308,
+        "setuid": 105, "setgid": 106, "setreuid": 113, "setregid": 114, "setresuid": 117,
+        "setresgid": 119, "setgroups": 116, "setfsuid": 122, "setfsgid": 123, "capset": 126,
+        "prctl": 157, "personality": 135, "bpf": 321, "perf_event_open": 298, "userfaultfd": 323,
+        "io_uring_setup": 425, "keyctl": 250, "add_key": 248, "request_key": 249,
+        "init_module": 175, "finit_module": 313, "delete_module": 176, "kexec_load": 246,
+        "reboot": 169, "swapon": 167, "swapoff": 168, "sethostname": 170, "setdomainname": 171,
+        "acct": 163, "iopl": 172, "ioperm": 173,
+    }),
+    "aarch64": (0xC00000B7, {
+        "socket": 198, "connect": 203, "accept": 202, "bind": 200, "listen": 201, "socketpair": 199,
+        "accept4": 242, "clone": 220, "execve": 221, "execveat": 281, "clone3": 435,
+        "kill": 129, "tkill": 130, "tgkill": 131, "pidfd_open": 434, "pidfd_send_signal": 424,
+        "ptrace": 117, "process_vm_readv": 270, "process_vm_writev": 271,
+        "openat": 56, "openat2": 437, "open_by_handle_at": 265, "name_to_handle_at": 264,
+        "memfd_create": 279, "unlinkat": 35, "renameat": 38, "renameat2": 276, "mkdirat": 34,
+        "linkat": 37, "symlinkat": 36, "mknodat": 33, "truncate": 45, "ftruncate": 46,
+        "fchmod": 52, "fchmodat": 53, "fchown": 55, "fchownat": 54, "utimensat": 88,
+        "mount": 40, "umount2": 39, "pivot_root": 41, "chroot": 51, "unshare": 97, "setns": 268,
+        "setuid": 146, "setgid": 144, "setreuid": 145, "setregid": 143, "setresuid": 147,
+        "setresgid": 149, "setgroups": 159, "setfsuid": 151, "setfsgid": 152, "capset": 91,
+        "prctl": 167, "personality": 92, "bpf": 280, "perf_event_open": 241, "userfaultfd": 282,
+        "io_uring_setup": 425, "keyctl": 219, "add_key": 217, "request_key": 218,
+        "init_module": 105, "finit_module": 273, "delete_module": 106, "kexec_load": 104,
+        "reboot": 142, "swapon": 224, "swapoff": 225, "sethostname": 161, "setdomainname": 162,
+        "acct": 89,
+    }),
+}
+
+
+class _SockFilter(ctypes.Structure):
+    _fields_ = [("code", ctypes.c_ushort), ("jt", ctypes.c_ubyte), ("jf", ctypes.c_ubyte), ("k", ctypes.c_uint)]
+
+
+class _SockFprog(ctypes.Structure):
+    _fields_ = [("len", ctypes.c_ushort), ("filter", ctypes.POINTER(_SockFilter))]
+
+
+def _seccomp_program(audit_arch: int, denied: list, block_x32: bool) -> list:
+    """生成 BPF 程序：架构不符直接杀死进程，禁止的调用返回 EPERM，其余放行"""
+    program = [
+        (_BPF_LD_W_ABS, 0, 0, 4),          # seccomp_data.arch
+        (_BPF_JEQ_K, 1, 0, audit_arch),
+        (_BPF_RET_K, 0, 0, _SECCOMP_RET_KILL_PROCESS),
+        (_BPF_LD_W_ABS, 0, 0, 0),          # seccomp_data.nr
+    ]
+    checks = [(_BPF_JGE_K, 0x40000000)] if block_x32 else []
+    checks += [(_BPF_JEQ_K, nr) for nr in sorted(set(denied))]
+    deny_index = len(program) + len(checks) + 1
+    for code, k in checks:
+        program.append((code, deny_index - len(program) - 1, 0, k))
+    program.append((_BPF_RET_K, 0, 0, _SECCOMP_RET_ALLOW))
+    program.append((_BPF_RET_K, 0, 0, _SECCOMP_RET_ERRNO | _EPERM))
+    return program
+
+
+def _install_seccomp(libc) -> bool:
+    machine = platform.machine()
+    if machine not in _DENIED_SYSCALLS:
+        return False
+    audit_arch, denied = _DENIED_SYSCALLS[machine]
+    program = _seccomp_program(audit_arch, list(denied.values()), block_x32=machine == "x86_64")
+    filters = (_SockFilter * len(program))(*(_SockFilter(*instruction) for instruction in program))
+    prog = _SockFprog(len(program), filters)
+    if libc.prctl(_PR_SET_NO_NEW_PRIVS, ctypes.c_ulong(1), ctypes.c_ulong(0), ctypes.c_ulong(0), ctypes.c_ulong(0)) != 0:
+        return False
+    return libc.prctl(
+        _PR_SET_SECCOMP, ctypes.c_ulong(_SECCOMP_MODE_FILTER), ctypes.byref(prog), ctypes.c_ulong(0), ctypes.c_ulong(0)
+    ) == 0
+
+
+# ==========================================
+# 隔离
+# ==========================================
+
+class _CpuLimitExceeded(BaseException):
+    """SIGXCPU 触发；继承 BaseException，避免被代码片段中的 except Exception 吞掉"""
+
+
+def _virtual_memory_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _set_limit(kind: int, soft: int, hard: int) -> None:
+    _, current_hard = resource.getrlimit(kind)
+    if current_hard != resource.RLIM_INFINITY:
+        hard = min(hard, current_hard)
+        soft = min(soft, hard)
+    resource.setrlimit(kind, (soft, hard))
+
+
+def _lock_down(uid: int, gid: int, root_dir: str, memory_mb: int, cpu_hard_seconds: int) -> dict:
+    """完成全部隔离步骤；必需的步骤失败时抛出异常"""
+    for module in ALLOWED_MODULES + _LAZY_DEPENDENCIES:
+        __import__(module)
+    base_memory = _virtual_memory_bytes()
+    libc = ctypes.CDLL(None, use_errno=True)
+    started_as_root = os.geteuid() == 0
+    if started_as_root and uid <= 0:
+        raise RuntimeError("以 root 启动时必须指定非特权用户")
+
+    # 协议 fd：请求 fd 0，回复 fd 3；标准输出和错误指向 /dev/null，其余描述符全部关闭
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+    os.close(devnull)
+    os.closerange(REPLY_FD + 1, resource.getrlimit(resource.RLIMIT_NOFILE)[0])
+
+    # 命名空间：没有网络设备、独立的挂载表；非 root 时先进入用户命名空间以获得 chroot 权限
+    flags = _CLONE_NEWNET | _CLONE_NEWIPC | _CLONE_NEWUTS | _CLONE_NEWNS
+    namespaces = libc.unshare(flags if started_as_root else flags | _CLONE_NEWUSER) == 0
+    jailed = False
+    if namespaces or started_as_root:
+        with contextlib.suppress(OSError):
+            os.chroot(root_dir)
+            os.chdir("/")
+            jailed = True
+
+    if started_as_root:
+        os.setgroups([])
+        os.setgid(gid)
+        os.setuid(uid)
+        if os.getuid() == 0 or os.geteuid() == 0:
+            raise RuntimeError("无法切换到非特权用户")
+
+    _set_limit(resource.RLIMIT_AS, base_memory + memory_mb * 1024 * 1024, base_memory + memory_mb * 1024 * 1024)
+    _set_limit(resource.RLIMIT_NOFILE, REPLY_FD + 1, REPLY_FD + 1)
+    _set_limit(resource.RLIMIT_NPROC, 0, 0)
+    _set_limit(resource.RLIMIT_FSIZE, 0, 0)
+    _set_limit(resource.RLIMIT_CORE, 0, 0)
+    _set_limit(resource.RLIMIT_CPU, cpu_hard_seconds, cpu_hard_seconds)
+
+    seccomp = _install_seccomp(libc)
+    # 隔离完成后不再需要 ctypes，不留给代码片段
+    for name in [name for name in sys.modules if name == "ctypes" or name.startswith("ctypes.")]:
+        del sys.modules[name]
+    return {
+        "uid": os.getuid(),
+        "namespaces": namespaces,
+        "chroot": jailed,
+        "seccomp": seccomp
+    }
+
+
+# ==========================================
+# 执行
+# ==========================================
+
+def _guarded_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # 允许模块内部的延迟导入（已在隔离前导入）也经过这里
+    if level != 0 or name.split(".")[0] not in ALLOWED_MODULES + _LAZY_DEPENDENCIES:
+        raise ImportError(f"沙箱中不允许导入模块: {name}")
+    return __import__(name, globals, locals, fromlist, level)
+
+
+def _safe_builtins() -> dict:
+    safe = {name: getattr(builtins, name) for name in _SAFE_BUILTIN_NAMES}
+    safe["__import__"] = _guarded_import
+    return safe
+
+
+def _to_jsonable(value):
+    """结果转为可 JSON 序列化的结构，无法序列化的对象用 repr 表示"""
+    return json.loads(json.dumps(value, ensure_ascii=False, default=repr))
+
+
+def _run_snippet(code: str, params: dict) -> dict:
+    stdout = io.StringIO()
+    scope = {"__builtins__": _safe_builtins(), "params": params, "result": None}
+    try:
+        with contextlib.redirect_stdout(stdout):
+            exec(compile(code, "<action>", "exec"), scope)
+        return {
+            "ok": True,
+            "result": _to_jsonable(scope.get("result")),
+            "stdout": stdout.getvalue()[:MAX_STDOUT_CHARS]
+        }
+    except _CpuLimitExceeded:
+        return {"ok": False, "kind": "cpu_limit", "error": "超过CPU时间上限"}
+    except MemoryError:
+        return {"ok": False, "kind": "memory_limit", "error": "超过内存上限"}
+    except Exception as e:
+        return {
+            "ok": False,
+            "kind": "error",
+            "error": f"{type(e).__name__}: {e}",
+            "stdout": stdout.getvalue()[:MAX_STDOUT_CHARS]
+        }
+
+
+def _read_exactly(size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = os.read(REQUEST_FD, min(size, 1 << 20))
+        if not chunk:
+            raise EOFError
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _read_frame():
+    size = struct.unpack(">I", _read_exactly(4))[0]
+    if size > MAX_REQUEST_BYTES:
+        raise EOFError
+    return json.loads(_read_exactly(size))
+
+
+def _write_frame(message: dict) -> None:
+    body = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    if len(body) > MAX_REPLY_BYTES:
+        body = json.dumps({"ok": False, "kind": "error", "error": "执行结果过大"}, ensure_ascii=False).encode("utf-8")
+    view = memoryview(struct.pack(">I", len(body)) + body)
+    while view:
+        view = view[os.write(REPLY_FD, view):]
+
+
+def main(argv: list) -> None:
+    uid, gid, root_dir, cpu_seconds, memory_mb, cpu_hard_seconds = (
+        int(argv[0]), int(argv[1]), argv[2], int(argv[3]), int(argv[4]), int(argv[5])
+    )
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C 由父进程统一处理
+
+    def on_cpu_limit(signum, frame):
+        raise _CpuLimitExceeded()
+
+    signal.signal(signal.SIGXCPU, on_cpu_limit)
+    os.dup2(1, REPLY_FD)
+    try:
+        isolation = _lock_down(uid, gid, root_dir, memory_mb, cpu_hard_seconds)
+    except Exception as e:
+        _write_frame({"ready": False, "error": f"沙箱隔离失败: {type(e).__name__}: {e}"})
+        sys.exit(1)
+    _write_frame({"ready": True, "isolation": isolation})
+
+    while True:
+        try:
+            message = _read_frame()
+        except (EOFError, OSError, ValueError):
+            break
+
+        # RLIMIT_CPU 按进程累计：每次执行前把软上限设为已用时间 + 单次配额
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = math.ceil(usage.ru_utime + usage.ru_stime)
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        with contextlib.suppress(ValueError, OSError):
+            resource.setrlimit(resource.RLIMIT_CPU, (min(used + cpu_seconds, hard), hard))
+
+        try:
+            reply = _run_snippet(message["code"], message.get("params") or {})
+        except MemoryError:
+            reply = {"ok": False, "kind": "memory_limit", "error": "超过内存上限"}
+        _write_frame(reply)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
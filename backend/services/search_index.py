@@ -0,0 +1,518 @@
+"""
+本地全文检索索引（BM25）
+
+存储在单个 SQLite 文件中：
+- docs: 文档正文、标题、URL、长度和删除标记
+- postings: 按段（segment）存储的倒排表，每个 (term, segment) 一行，
+  doc_id 和词频打包为 NumPy 数组 BLOB，查询时一次读出、向量化打分
+
+写入采用分段方式：每次 add_documents 生成一个新段，段数超过上限时合并为一个段；
+删除只写墓碑标记，合并时才真正从倒排表中清除。
+文档长度和存活标记常驻内存（每百万文档约 9MB），打分时不需要回表。
+查询含低频词时，高频词只对低频词命中的候选文档打分（类似 Lucene CommonTermsQuery）。
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .text_analytics import search_terms
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    doc_id INTEGER PRIMARY KEY,
+    external_id TEXT NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    url TEXT NOT NULL DEFAULT '',
+    body TEXT NOT NULL DEFAULT '',
+    metadata TEXT NOT NULL DEFAULT '{}',
+    length INTEGER NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS docs_external_id ON docs(external_id) WHERE deleted = 0;
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    segment INTEGER NOT NULL,
+    doc_ids BLOB NOT NULL,
+    tfs BLOB NOT NULL,
+    PRIMARY KEY (term, segment)
+) WITHOUT ROWID;
+"""
+
+SNIPPET_CHARS = 160
+HIGHLIGHT = ("**", "**")
+_FILTER_KEY = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def metadata_filter_clause(filters: Dict[str, Any], columns: Optional[Dict[str, str]] = None) -> Tuple[str, List[Any]]:
+    """
+    把元数据过滤条件转为 SQL WHERE 子句
+
+    Args:
+        filters: {字段: 值 或 值列表}，多个字段之间为 AND，值列表为 IN
+        columns: 直接对应表列的字段（如 {'sourceId': 'source_id'}），其余字段从 metadata JSON 中取
+
+    Returns:
+        (子句, 参数)
+    """
+    clauses, params = [], []
+    for key, value in filters.items():
+        if not _FILTER_KEY.match(key):
+            raise ValueError(f"不支持的过滤字段: {key}")
+        column = (columns or {}).get(key) or f"json_extract(metadata, '$.{key}')"
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        if not values:
+            clauses.append("0")
+            continue
+        clauses.append(f"{column} IN ({','.join('?' * len(values))})")
+        params.extend(values)
+    return " AND ".join(clauses) or "1", params
+
+
+class BM25Index:
+    """基于 SQLite 的分段倒排索引，BM25 排序"""
+
+    def __init__(
+        self,
+        path: str,
+        k1: float = 1.2,
+        b: float = 0.75,
+        title_boost: int = 2,
+        max_segments: int = 8,
+        common_df_ratio: float = 0.05
+    ):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.title_boost = title_boost
+        self.max_segments = max_segments
+        self.common_df_ratio = common_df_ratio
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._load_state()
+
+    # ==========================================
+    # 状态
+    # ==========================================
+
+    def _load_state(self) -> None:
+        """把文档长度和存活标记读入内存"""
+        rows = self._conn.execute("SELECT doc_id, length, deleted FROM docs").fetchall()
+        size = max((row[0] for row in rows), default=0) + 1
+        self._lengths = np.zeros(size, dtype=np.float32)
+        self._live = np.zeros(size, dtype=bool)
+        if rows:
+            data = np.asarray(rows, dtype=np.int64)
+            self._lengths[data[:, 0]] = data[:, 1]
+            self._live[data[:, 0]] = data[:, 2] == 0
+        self._next_doc_id = size
+        self._norm: Optional[np.ndarray] = None
+        self._live_count = int(self._live.sum())
+        self._total_length = float(self._lengths[self._live].sum())
+        self._segments = [
+            row[0] for row in self._conn.execute("SELECT DISTINCT segment FROM postings ORDER BY segment")
+        ]
+
+    def _length_norm(self) -> np.ndarray:
+        """
+        BM25 的文档长度归一项 k1 * (1 - b + b * len / avgdl)，按文档预先算好（调用方持有锁）
+
+        只在文档集合变化后的首次查询时重新计算。
+        """
+        if self._norm is None or self._norm.size != self._lengths.size:
+            avgdl = self._total_length / self._live_count if self._live_count else 1.0
+            self._norm = (self.k1 * (1 - self.b + self.b * self._lengths / max(avgdl, 1e-6))).astype(np.float32)
+        return self._norm
+
+    def _ensure_capacity(self, doc_id: int) -> None:
+        if doc_id < len(self._lengths):
+            return
+        size = max(doc_id + 1, len(self._lengths) * 2)
+        self._lengths = np.resize(self._lengths, size)
+        self._lengths[self._live.size:] = 0
+        live = np.zeros(size, dtype=bool)
+        live[:self._live.size] = self._live
+        self._live = live
+
+    def _tombstone(self, external_ids: Iterable[str]) -> int:
+        """标记删除（调用方持有锁）"""
+        deleted = 0
+        for external_id in external_ids:
+            rows = self._conn.execute(
+                "SELECT doc_id FROM docs WHERE external_id = ? AND deleted = 0", (external_id,)
+            ).fetchall()
+            for (doc_id,) in rows:
+                self._conn.execute("UPDATE docs SET deleted = 1 WHERE doc_id = ?", (doc_id,))
+                self._live[doc_id] = False
+                self._norm = None
+                self._live_count -= 1
+                self._total_length -= float(self._lengths[doc_id])
+                deleted += 1
+        return deleted
+
+    # ==========================================
+    # 写入
+    # ==========================================
+
+    def add_documents(self, documents: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        批量添加文档，同一 id 的旧版本会被替换
+
+        Args:
+            documents: [{'id': 'plan-001', 'title': '...', 'body': '...', 'url': '...', 'metadata': {...}}]
+
+        Returns:
+            {'added': 新增数, 'replaced': 替换的旧版本数, 'segments': 当前段数}
+        """
+        # 同一批次中重复的 id 只保留最后一个
+        documents = list({str(doc["id"]): doc for doc in documents}.values())
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        rows = []
+        with self._lock:
+            replaced = self._tombstone(str(doc["id"]) for doc in documents)
+            for doc in documents:
+                title = str(doc.get("title") or "")
+                body = str(doc.get("body") or "")
+                terms = Counter(search_terms(body))
+                for term in search_terms(title):
+                    terms[term] += self.title_boost
+                length = sum(terms.values())
+
+                doc_id = self._next_doc_id
+                self._next_doc_id += 1
+                self._ensure_capacity(doc_id)
+                self._lengths[doc_id] = length
+                self._live[doc_id] = True
+                self._norm = None
+                self._live_count += 1
+                self._total_length += length
+
+                rows.append((
+                    doc_id, str(doc["id"]), title, str(doc.get("url") or ""), body,
+                    json.dumps(doc.get("metadata") or {}, ensure_ascii=False), length
+                ))
+                for term, tf in terms.items():
+                    postings.setdefault(term, []).append((doc_id, tf))
+
+            segment = (self._segments[-1] + 1) if self._segments else 0
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO docs (doc_id, external_id, title, url, body, metadata, length) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.executemany(
+                    "INSERT INTO postings (term, segment, doc_ids, tfs) VALUES (?, ?, ?, ?)",
+                    (
+                        (
+                            term, segment,
+                            np.fromiter((d for d, _ in entries), dtype=np.int32, count=len(entries)).tobytes(),
+                            np.fromiter((min(t, 65535) for _, t in entries), dtype=np.uint16, count=len(entries)).tobytes()
+                        )
+                        for term, entries in postings.items()
+                    )
+                )
+            if postings:
+                self._segments.append(segment)
+
+            if len(self._segments) > self.max_segments:
+                self._compact_locked()
+
+        return {"added": len(rows), "replaced": replaced, "segments": len(self._segments)}
+
+    def delete_documents(self, external_ids: List[str]) -> int:
+        """删除文档（写墓碑，合并段时清理倒排表），返回删除数量"""
+        with self._lock, self._conn:
+            return self._tombstone(external_ids)
+
+    def compact(self) -> Dict[str, int]:
+        """把所有段合并为一个，并清除已删除文档的倒排项"""
+        with self._lock:
+            return self._compact_locked()
+
+    def _compact_locked(self) -> Dict[str, int]:
+        if not self._segments:
+            return {"segments": 0, "terms": 0}
+        merged_segment = self._segments[-1] + 1
+        terms = 0
+        with self._conn:
+            cursor = self._conn.execute("SELECT term, doc_ids, tfs FROM postings ORDER BY term")
+            merged: List[Tuple[str, bytes, bytes]] = []
+            current_term: Optional[str] = None
+            ids_parts: List[np.ndarray] = []
+            tf_parts: List[np.ndarray] = []
+
+            def flush() -> None:
+                if current_term is None:
+                    return
+                ids = np.concatenate(ids_parts)
+                tfs = np.concatenate(tf_parts)
+                keep = self._live[ids]
+                if keep.any():
+                    merged.append((current_term, ids[keep].tobytes(), tfs[keep].tobytes()))
+
+            for term, ids_blob, tfs_blob in cursor:
+                if term != current_term:
+                    flush()
+                    current_term, ids_parts, tf_parts = term, [], []
+                ids_parts.append(np.frombuffer(ids_blob, dtype=np.int32))
+                tf_parts.append(np.frombuffer(tfs_blob, dtype=np.uint16))
+            flush()
+
+            self._conn.execute("DELETE FROM postings")
+            self._conn.executemany(
+                "INSERT INTO postings (term, segment, doc_ids, tfs) VALUES (?, ?, ?, ?)",
+                ((term, merged_segment, ids, tfs) for term, ids, tfs in merged)
+            )
+            self._conn.execute("DELETE FROM docs WHERE deleted = 1")
+            terms = len(merged)
+
+        self._segments = [merged_segment]
+        return {"segments": 1, "terms": terms}
+
+    # ==========================================
+    # 查询
+    # ==========================================
+
+    def _accumulate(self, postings: List[Tuple[np.ndarray, np.ndarray, np.float32]], norm: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """对若干词的倒排表做 BM25 打分并按文档累加，返回 (doc_ids, scores)"""
+        weighted = []
+        for ids, tfs, idf in postings:
+            tf = tfs.astype(np.float32)
+            weighted.append((ids, idf * tf * (self.k1 + 1) / (tf + norm[ids])))
+
+        if len(weighted) == 1:
+            ids, scores = weighted[0]
+            return ids, scores.copy()
+        if sum(ids.size for ids, _ in weighted) * 8 >= norm.size:
+            # 命中占比高：稠密累加（每个词的倒排表内 doc_id 唯一，可直接按下标相加）
+            dense = np.zeros(norm.size, dtype=np.float32)
+            for ids, scores in weighted:
+                dense[ids] += scores
+            ids = np.flatnonzero(dense).astype(np.int32)
+            return ids, dense[ids]
+        ids, inverse = np.unique(np.concatenate([ids for ids, _ in weighted]), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate([w for _, w in weighted])).astype(np.float32)
+        return ids.astype(np.int32), scores
+
+    def _score(self, query: str, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        对查询命中的存活文档打分，返回 (doc_ids, scores)（未排序）
+
+        查询同时含低频词和高频词时，只有包含低频词的文档计入命中。
+        """
+        empty = (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32))
+        terms = list(dict.fromkeys(search_terms(query)))
+        if not terms:
+            return empty
+
+        with self._lock:
+            placeholders = ",".join("?" * len(terms))
+            rows = self._conn.execute(
+                f"SELECT term, doc_ids, tfs FROM postings WHERE term IN ({placeholders}) ORDER BY term, segment",
+                terms
+            ).fetchall()
+            live = self._live
+            n_docs = max(self._live_count, 1)
+            norm = self._length_norm()
+
+        per_term: Dict[str, Tuple[List[np.ndarray], List[np.ndarray]]] = {}
+        for term, ids_blob, tfs_blob in rows:
+            ids_parts, tf_parts = per_term.setdefault(term, ([], []))
+            ids_parts.append(np.frombuffer(ids_blob, dtype=np.int32))
+            tf_parts.append(np.frombuffer(tfs_blob, dtype=np.uint16))
+        if not per_term:
+            return empty
+
+        # 各段 doc_id 区间递增，按段顺序拼接后每个词的倒排表有序且无重复
+        postings = []
+        for ids_parts, tf_parts in per_term.values():
+            ids = np.concatenate(ids_parts) if len(ids_parts) > 1 else ids_parts[0]
+            tfs = np.concatenate(tf_parts) if len(tf_parts) > 1 else tf_parts[0]
+            idf = np.float32(np.log1p((n_docs - ids.size + 0.5) / (ids.size + 0.5)))
+            postings.append((ids, tfs, idf))
+
+        # 高频词（如常见二元组）只给包含低频词的候选文档加分，避免扫描整张倒排表；
+        # 查询全部由高频词组成时退化为完整打分
+        common_df = self.common_df_ratio * n_docs
+        rare = [p for p in postings if p[0].size <= common_df]
+        common = [p for p in postings if p[0].size > common_df]
+        if not rare:
+            rare, common = postings, []
+
+        ids, scores = self._accumulate(rare, norm)
+        for term_ids, tfs, idf in common:
+            positions = np.searchsorted(term_ids, ids)
+            positions[positions == term_ids.size] = 0
+            matched = term_ids[positions] == ids
+            tf = tfs[positions[matched]].astype(np.float32)
+            scores[matched] += idf * tf * (self.k1 + 1) / (tf + norm[ids[matched]])
+        alive = live[ids]
+        if mask is not None:
+            inside = ids < mask.size
+            allowed = np.zeros(ids.size, dtype=bool)
+            allowed[inside] = mask[ids[inside]]
+            alive &= allowed
+        return ids[alive], scores[alive]
+
+    @staticmethod
+    def _top(ids: np.ndarray, scores: np.ndarray, k: int) -> np.ndarray:
+        """分数最高的 k 个位置，按分数降序"""
+        k = min(k, ids.size)
+        if k == 0:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k] if k < ids.size else np.arange(ids.size)
+        return top[np.argsort(-scores[top], kind="stable")]
+
+    def search(self, query: str, limit: int = 10, offset: int = 0, mask: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """
+        BM25 检索
+
+        Args:
+            mask: 可选的文档过滤（按内部 doc_id，见 metadata_mask）
+
+        Returns:
+            {'results': [{'id', 'title', 'url', 'snippet', 'score', 'metadata'}], 'total': 命中文档数}
+            查询同时含低频词和高频词时，只有包含低频词的文档计入命中
+        """
+        ids, scores = self._score(query, mask)
+        total = int(ids.size)
+        top = self._top(ids, scores, offset + limit)[offset:offset + limit]
+        if top.size == 0:
+            return {"results": [], "total": total}
+
+        doc_ids = [int(i) for i in ids[top]]
+        with self._lock:
+            placeholders = ",".join("?" * len(doc_ids))
+            docs = {
+                row[0]: row for row in self._conn.execute(
+                    f"SELECT doc_id, external_id, title, url, body, metadata FROM docs WHERE doc_id IN ({placeholders})",
+                    doc_ids
+                )
+            }
+
+        results = []
+        for doc_id, score in zip(doc_ids, scores[top]):
+            row = docs.get(doc_id)
+            if row is None:
+                continue
+            _, external_id, title, url, body, metadata = row
+            results.append({
+                "id": external_id,
+                "title": title,
+                "url": url,
+                "snippet": make_snippet(body, query),
+                "score": round(float(score), 4),
+                "metadata": json.loads(metadata)
+            })
+        return {"results": results, "total": total}
+
+    def rank(self, query: str, limit: int = 50, mask: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """只返回排序后的 (文档 id, 分数)，不取正文和摘要（供混合检索融合排名）"""
+        ids, scores = self._score(query, mask)
+        top = self._top(ids, scores, limit)
+        if top.size == 0:
+            return []
+        doc_ids = [int(i) for i in ids[top]]
+        with self._lock:
+            placeholders = ",".join("?" * len(doc_ids))
+            external = dict(self._conn.execute(
+                f"SELECT doc_id, external_id FROM docs WHERE doc_id IN ({placeholders})", doc_ids
+            ).fetchall())
+        return [
+            (external[doc_id], float(score))
+            for doc_id, score in zip(doc_ids, scores[top]) if doc_id in external
+        ]
+
+    def metadata_mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        """满足元数据过滤条件的存活文档（按内部 doc_id 的布尔数组）"""
+        clause, params = metadata_filter_clause(filters)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT doc_id FROM docs WHERE deleted = 0 AND {clause}", params).fetchall()
+            mask = np.zeros(self._live.size, dtype=bool)
+        if rows:
+            mask[np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))] = True
+        return mask
+
+    def get_documents(self, external_ids: List[str]) -> List[Dict[str, Any]]:
+        """按 id 读取存活文档（供混合检索等上层使用）"""
+        if not external_ids:
+            return []
+        placeholders = ",".join("?" * len(external_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT external_id, title, url, body, metadata FROM docs "
+                f"WHERE deleted = 0 AND external_id IN ({placeholders})",
+                external_ids
+            ).fetchall()
+        return [
+            {"id": r[0], "title": r[1], "url": r[2], "body": r[3], "metadata": json.loads(r[4])}
+            for r in rows
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            terms = self._conn.execute("SELECT COUNT(DISTINCT term) FROM postings").fetchone()[0]
+            deleted = self._conn.execute("SELECT COUNT(*) FROM docs WHERE deleted = 1").fetchone()[0]
+            return {
+                "documents": self._live_count,
+                "tombstones": deleted,
+                "terms": terms,
+                "segments": len(self._segments),
+                "avg_doc_length": round(self._total_length / self._live_count, 1) if self._live_count else 0,
+                "path": self.path
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def make_snippet(body: str, query: str, width: int = SNIPPET_CHARS) -> str:
+    """
+    截取包含查询词最多的片段，并用 ** 标出命中词
+
+    CJK 查询按二元组匹配，拉丁单词不区分大小写。
+    """
+    if not body:
+        return ""
+    terms = sorted(set(search_terms(query)), key=len, reverse=True)
+    if not terms:
+        return body[:width]
+
+    pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+    positions = [m.start() for m in pattern.finditer(body)]
+    if not positions:
+        return body[:width] + ("…" if len(body) > width else "")
+
+    # 滑动窗口：找到覆盖命中最多的起点
+    best_start, best_hits = positions[0], 0
+    j = 0
+    for i, start in enumerate(positions):
+        while positions[j] < start - width // 2:
+            j += 1
+        if i - j + 1 > best_hits:
+            best_hits, best_start = i - j + 1, positions[j]
+    start = max(0, best_start - width // 4)
+    end = min(len(body), start + width)
+    fragment = body[start:end].replace("\n", " ")
+
+    open_mark, close_mark = HIGHLIGHT
+    # 连续的 CJK 二元组（如 王者、者荣、荣耀）合并为一个高亮区间
+    highlighted = re.sub(
+        f"(?:{pattern.pattern})+",
+        lambda m: f"{open_mark}{m.group()}{close_mark}",
+        fragment,
+        flags=re.IGNORECASE
+    )
+    return ("…" if start > 0 else "") + highlighted + ("…" if end < len(body) else "")
@@ -0,0 +1,111 @@
+"""
+搜索服务
+
+google_search Action 通过 SearchProvider 接口检索，具体实现由配置 SEARCH_PROVIDER 选择：
+- local: 本地 BM25 全文索引（离线 / 内网部署，检索自有语料：历史活动策划、运营手册等）
+- mock: 原先的模拟结果，便于前端联调
+
+新的远程搜索服务只需实现 SearchProvider.search 并调用 register_search_provider 注册。
+"""
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
+
+from config import config
+from .search_index import BM25Index
+
+
+class SearchProvider:
+    """搜索服务接口"""
+
+    name = "base"
+
+    async def search(self, query: str, max_results: int = 10) -> Dict[str, Any]:
+        """
+        Returns:
+            {'results': [{'title', 'snippet', 'url', ...}], 'total': 命中总数}
+        """
+        raise NotImplementedError
+
+
+class LocalSearchProvider(SearchProvider):
+    """本地 BM25 索引"""
+
+    name = "local"
+
+    def __init__(self, index: BM25Index):
+        self.index = index
+
+    async def search(self, query: str, max_results: int = 10) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.index.search, query, max_results)
+
+    async def add_documents(self, documents: List[Dict[str, Any]]) -> Dict[str, int]:
+        return await asyncio.to_thread(self.index.add_documents, documents)
+
+    async def delete_documents(self, external_ids: List[str]) -> int:
+        return await asyncio.to_thread(self.index.delete_documents, external_ids)
+
+    async def compact(self) -> Dict[str, int]:
+        return await asyncio.to_thread(self.index.compact)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.index.stats()
+
+
+class MockSearchProvider(SearchProvider):
+    """模拟搜索结果"""
+
+    name = "mock"
+
+    async def search(self, query: str, max_results: int = 10) -> Dict[str, Any]:
+        results = [
+            {
+                "title": f"{query} - 相关结果 1",
+                "snippet": "这是一个模拟的搜索结果描述...",
+                "url": f"https://example.com/result1?q={query}"
+            },
+            {
+                "title": f"{query} - 相关结果 2",
+                "snippet": "另一个模拟的搜索结果，包含相关信息...",
+                "url": f"https://example.com/result2?q={query}"
+            },
+            {
+                "title": f"{query} - 深入分析",
+                "snippet": "详细的分析和讨论内容...",
+                "url": f"https://example.com/result3?q={query}"
+            }
+        ]
+        return {"results": results[:max_results], "total": len(results)}
+
+
+_PROVIDER_FACTORIES: Dict[str, Callable[[], SearchProvider]] = {}
+_providers: Dict[str, SearchProvider] = {}
+
+
+def register_search_provider(name: str, factory: Callable[[], SearchProvider]) -> None:
+    """注册搜索服务；factory 在首次使用时调用一次"""
+    _PROVIDER_FACTORIES[name] = factory
+    _providers.pop(name, None)
+
+
+def get_search_provider(name: Optional[str] = None) -> SearchProvider:
+    """按名称获取搜索服务，默认使用配置 SEARCH_PROVIDER"""
+    name = name or config.SEARCH_PROVIDER
+    if name not in _providers:
+        if name not in _PROVIDER_FACTORIES:
+            raise ValueError(f"未注册的搜索服务: {name}，可选 {', '.join(_PROVIDER_FACTORIES)}")
+        _providers[name] = _PROVIDER_FACTORIES[name]()
+    return _providers[name]
+
+
+def get_local_search() -> LocalSearchProvider:
+    """本地索引（文档管理接口总是操作本地索引）"""
+    return get_search_provider("local")
+
+
+register_search_provider("local", lambda: LocalSearchProvider(BM25Index(
+    config.SEARCH_INDEX_PATH,
+    k1=config.SEARCH_BM25_K1,
+    b=config.SEARCH_BM25_B,
+    max_segments=config.SEARCH_MAX_SEGMENTS
+)))
+register_search_provider("mock", MockSearchProvider)
@@ -0,0 +1,314 @@
+"""
+聊天回答的语义缓存
+
+运营同学经常用不同说法问同一件事（“如何提升留存率?” / “怎么提高留存”），每个变体都要一次完整的补全。
+开启 SEMANTIC_CACHE_ENABLED 后，/api/chat 和 /ws/chat 在调用 OpenAIService 之前先查缓存：
+- 作用域：模型 + system prompt + 之前的对话轮次 + 检索增强选项完全一致才可能命中
+- 匹配：规范化后的最后一条用户消息完全相同直接命中；否则向量化后在同一作用域内找最近邻，
+  余弦相似度不低于 SEMANTIC_CACHE_THRESHOLD 时返回缓存的回答
+- 淘汰：全局 LRU（SEMANTIC_CACHE_SIZE）+ 写入后 SEMANTIC_CACHE_TTL 秒过期
+- 误命中审计：语义命中（非完全相同）按 SEMANTIC_CACHE_AUDIT_RATE 抽样，在后台以 batch 优先级重新生成回答，
+  新旧回答的向量相似度低于 SEMANTIC_CACHE_AUDIT_MIN_SIMILARITY 时记为疑似误命中，保留样本供调整阈值
+"""
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from config import config
+from .cache_utils import content_hash
+from .deadline import create_detached_task
+from .embedding_service import embedding_service
+from .upstream_scheduler import priority_scope
+
+_TRAILING_PUNCT = re.compile(r"[\s?？!！。.,，~～]+$")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """完全匹配用的规范化：小写、合并空白、去掉结尾标点"""
+    return _TRAILING_PUNCT.sub("", _WHITESPACE.sub(" ", text.strip().lower()))
+
+
+def is_cacheable_answer(content: Optional[str]) -> bool:
+    """服务在出错或到达截止时间时也会以文本形式返回，这些回答不缓存"""
+    return bool(content) and not content.startswith("❌") and "⏱️" not in content
+
+
+def is_error_chunk(chunk: str) -> bool:
+    """流式输出中的错误或截止提示块（可能出现在已输出部分内容之后）"""
+    return chunk.lstrip().startswith(("❌", "⏱️"))
+
+
+def _split_final_turn(messages: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], str]:
+    """(最后一条用户消息之前的所有消息, 最后一条用户消息)；最后一条不是用户消息时返回空问题"""
+    if not messages or messages[-1].get("role") != "user":
+        return messages, ""
+    return messages[:-1], str(messages[-1].get("content") or "")
+
+
+class _Entry:
+    __slots__ = ("scope", "question", "vector", "content", "expires_at")
+
+    def __init__(self, scope: str, question: str, vector: Optional[np.ndarray], content: str, expires_at: float):
+        self.scope = scope
+        self.question = question
+        self.vector = vector
+        self.content = content
+        self.expires_at = expires_at
+
+
+class SemanticResponseCache:
+    """按作用域划分的最近邻回答缓存"""
+
+    def __init__(
+        self,
+        maxsize: int = 5000,
+        ttl: float = 24 * 3600,
+        threshold: float = 0.92,
+        audit_rate: float = 0.05,
+        audit_min_similarity: float = 0.8
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.audit_rate = audit_rate
+        self.audit_min_similarity = audit_min_similarity
+
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()  # LRU 顺序
+        self._scopes: Dict[str, Dict[int, None]] = {}  # 作用域 -> 条目 id（有序集合）
+        self._exact: Dict[Tuple[str, str], int] = {}  # (作用域, 规范化问题) -> 条目 id
+        self._matrices: Dict[str, Tuple[List[int], np.ndarray]] = {}  # 作用域内向量矩阵，写入或淘汰后重建
+        self._ids = itertools.count()
+        self._audits: Set[asyncio.Task] = set()
+
+        self.lookups = 0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.embed_failures = 0
+        self.audited = 0
+        self.suspected_false_hits = 0
+        self.audit_samples: Deque[Dict[str, Any]] = deque(maxlen=100)
+
+    @property
+    def enabled(self) -> bool:
+        return config.SEMANTIC_CACHE_ENABLED
+
+    # ==========================================
+    # 查询与写入
+    # ==========================================
+
+    @staticmethod
+    def scope_key(messages: List[Dict[str, str]], model: str, extra: Optional[Dict[str, Any]] = None) -> str:
+        """模型 + 最后一条用户消息之前的全部消息（含 system prompt）+ 附加选项"""
+        history, _ = _split_final_turn(messages)
+        return content_hash(json.dumps(
+            {"model": model, "history": history, "extra": extra or {}},
+            sort_keys=True,
+            ensure_ascii=False
+        ))
+
+    async def lookup(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        extra: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        查找可复用的回答
+
+        Args:
+            messages: 格式化后的消息（检索增强之前）
+            model: 实际使用的模型
+            extra: 影响回答的其他选项（如 rag 选项），并入作用域
+
+        Returns:
+            {'hit': True, 'content', 'similarity', 'exact', 'matched_question', ...} 或 {'hit': False, ...}；
+            原样传给 store / audit
+        """
+        self.lookups += 1
+        scope = self.scope_key(messages, model, extra)
+        _, question = _split_final_turn(messages)
+        result: Dict[str, Any] = {"hit": False, "scope": scope, "question": question, "vector": None}
+        if not question.strip():
+            return result
+
+        entry_id = self._exact.get((scope, normalize_question(question)))
+        entry = self._live_entry(entry_id) if entry_id is not None else None
+        if entry is not None:
+            self.exact_hits += 1
+            self._entries.move_to_end(entry_id)
+            return {**result, "hit": True, "exact": True, "similarity": 1.0,
+                    "content": entry.content, "matched_question": entry.question}
+
+        embedded = await embedding_service.embed([question])
+        if not embedded["success"]:
+            self.embed_failures += 1
+            return result
+        vector = _normalized(embedded["embeddings"][0])
+        result["vector"] = vector
+
+        match = self._nearest(scope, vector)
+        if match is None:
+            return result
+        entry_id, similarity = match
+        entry = self._entries[entry_id]
+        self.semantic_hits += 1
+        self._entries.move_to_end(entry_id)
+        return {**result, "hit": True, "exact": False, "similarity": round(similarity, 4),
+                "content": entry.content, "matched_question": entry.question}
+
+    def store(self, lookup: Dict[str, Any], content: Optional[str]) -> None:
+        """把未命中时新生成的回答写入缓存（lookup 为同一请求的查询结果）"""
+        if lookup.get("hit") or not lookup.get("question", "").strip() or not is_cacheable_answer(content):
+            return
+        scope = lookup["scope"]
+        key = (scope, normalize_question(lookup["question"]))
+        if key in self._exact:
+            self._remove(self._exact[key])
+
+        entry_id = next(self._ids)
+        self._entries[entry_id] = _Entry(scope, lookup["question"], lookup.get("vector"), content, time.monotonic() + self.ttl)
+        self._scopes.setdefault(scope, {})[entry_id] = None
+        self._exact[key] = entry_id
+        self._matrices.pop(scope, None)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+        if entry_id % 256 == 0:
+            self._purge_expired()
+
+    def audit(self, lookup: Dict[str, Any], regenerate: Callable[[], Awaitable[Optional[str]]]) -> None:
+        """
+        按比例抽样审计语义命中：后台重新生成回答，与缓存的回答比较
+
+        Args:
+            lookup: 命中的查询结果
+            regenerate: 不经过缓存重新生成回答的协程函数（在 batch 优先级下执行）
+        """
+        if not lookup.get("hit") or lookup.get("exact") or random.random() >= self.audit_rate:
+            return
+        # 审计不属于原请求：不受其截止时间限制，也不向其进度回调上报
+        task = create_detached_task(self._run_audit(lookup, regenerate))
+        self._audits.add(task)
+        task.add_done_callback(self._audits.discard)
+
+    async def _run_audit(self, lookup: Dict[str, Any], regenerate: Callable[[], Awaitable[Optional[str]]]) -> None:
+        try:
+            with priority_scope("batch"):
+                fresh = await regenerate()
+            if not is_cacheable_answer(fresh):
+                return
+            embedded = await embedding_service.embed([lookup["content"], fresh])
+            if not embedded["success"]:
+                return
+            cached_vector, fresh_vector = (_normalized(v) for v in embedded["embeddings"])
+            answer_similarity = float(cached_vector @ fresh_vector)
+        except Exception as e:
+            print(f"⚠️ 语义缓存审计失败: {e}")
+            return
+
+        self.audited += 1
+        suspected = answer_similarity < self.audit_min_similarity
+        if suspected:
+            self.suspected_false_hits += 1
+            print(f"🔍 语义缓存疑似误命中: '{lookup['question'][:40]}' -> '{lookup['matched_question'][:40]}'"
+                  f"（问题相似度 {lookup['similarity']}，回答相似度 {answer_similarity:.3f}）")
+        self.audit_samples.append({
+            "question": lookup["question"],
+            "matched_question": lookup["matched_question"],
+            "similarity": lookup["similarity"],
+            "answer_similarity": round(answer_similarity, 4),
+            "suspected_false_hit": suspected,
+            "timestamp": time.time()
+        })
+
+    # ==========================================
+    # 内部实现
+    # ==========================================
+
+    def _live_entry(self, entry_id: int) -> Optional[_Entry]:
+        entry = self._entries.get(entry_id)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._remove(entry_id)
+            return None
+        return entry
+
+    def _nearest(self, scope: str, vector: np.ndarray) -> Optional[Tuple[int, float]]:
+        """作用域内相似度最高且未过期、不低于阈值的条目"""
+        if scope not in self._scopes:
+            return None
+        if scope not in self._matrices:
+            ids = [i for i in self._scopes[scope] if self._entries[i].vector is not None]
+            if not ids:
+                return None
+            self._matrices[scope] = (ids, np.stack([self._entries[i].vector for i in ids]))
+        ids, matrix = self._matrices[scope]
+        if matrix.shape[1] != vector.shape[0]:
+            return None  # 向量模型变更过，旧条目不再可比
+        similarities = matrix @ vector
+        for row in np.argsort(-similarities):
+            if similarities[row] < self.threshold:
+                return None
+            if self._live_entry(ids[row]) is not None:
+                return ids[row], float(similarities[row])
+        return None
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        members = self._scopes.get(entry.scope)
+        if members is not None:
+            members.pop(entry_id, None)
+            if not members:
+                del self._scopes[entry.scope]
+        key = (entry.scope, normalize_question(entry.question))
+        if self._exact.get(key) == entry_id:
+            del self._exact[key]
+        self._matrices.pop(entry.scope, None)
+
+    def _purge_expired(self) -> None:
+        now = time.monotonic()
+        for entry_id in [i for i, entry in self._entries.items() if entry.expires_at <= now]:
+            self._remove(entry_id)
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.exact_hits + self.semantic_hits
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "scopes": len(self._scopes),
+            "threshold": self.threshold,
+            "lookups": self.lookups,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "hit_rate": round(hits / self.lookups, 4) if self.lookups else 0.0,
+            "embed_failures": self.embed_failures,
+            "audited": self.audited,
+            "suspected_false_hits": self.suspected_false_hits,
+            "false_hit_rate": round(self.suspected_false_hits / self.audited, 4) if self.audited else None,
+            "audit_samples": list(self.audit_samples)[-20:]
+        }
+
+
+def _normalized(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
+
+
+# 创建全局实例
+semantic_cache = SemanticResponseCache(
+    maxsize=config.SEMANTIC_CACHE_SIZE,
+    ttl=config.SEMANTIC_CACHE_TTL,
+    threshold=config.SEMANTIC_CACHE_THRESHOLD,
+    audit_rate=config.SEMANTIC_CACHE_AUDIT_RATE,
+    audit_min_similarity=config.SEMANTIC_CACHE_AUDIT_MIN_SIMILARITY
+)
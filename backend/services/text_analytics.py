@@ -0,0 +1,338 @@
+"""
+文本流式分析服务
+
+对分块输入做单遍扫描，同时得到：
+1. 原有统计（单词数、字符数、不含空白字符数、行数）
+2. CJK 感知的分词计数（中日韩字符按单字计，拉丁文按单词计）
+3. 高频词 Top-K 与 n-gram 频率（Space-Saving 有界内存近似计数）
+
+每个分块只读取一次，适合处理大于内存的上传文件。
+"""
+import heapq
+import os
+import re
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+from config import config
+
+# 中日韩统一表意文字、扩展A/B、兼容表意文字、假名、韩文音节
+_CJK_CLASS = (
+    "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+    "\u3040-\u30ff\uac00-\ud7af\U00020000-\U0002a6df"
+)
+
+# cjk: 单个CJK字符；word: 连续的非CJK字母数字；brk: 标点或换行（打断 n-gram）
+_TOKEN_PATTERN = re.compile(
+    rf"(?P<cjk>[{_CJK_CLASS}])"
+    rf"|(?P<word>(?:(?![{_CJK_CLASS}])[^\W_])+)"
+    rf"|(?P<brk>[^\w\s]+|\n)"
+)
+
+# 分块末尾可能被截断的拉丁单词，需要拼到下一块开头
+_TRAILING_WORD = re.compile(rf"(?:(?![{_CJK_CLASS}])[^\W_])+\Z")
+
+_CJK_CHAR = re.compile(f"[{_CJK_CLASS}]")
+
+# Top-K 统计时忽略的高频虚词
+_STOPWORDS = frozenset(
+    "的 了 是 我 你 他 她 它 在 和 也 就 都 不 很 有 这 那 吗 呢 啊 吧 与 及 等 着 个 之 "
+    "the a an and or of to in is it this that for on with be are was i you".split()
+)
+
+# 单次分析允许的 Top-K / sketch 容量上限，防止参数把内存撑爆
+MAX_TOP_K = 100
+MAX_SKETCH_CAPACITY = 20000
+
+
+def is_cjk_token(token: str) -> bool:
+    """判断 token 是否为单个 CJK 字符"""
+    return len(token) == 1 and _CJK_CHAR.match(token) is not None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 LLM token 数：CJK 字符约 1 token/字，其余约 4 字符/token
+
+    用于批量打包和上下文预算，不需要精确值。
+    """
+    cjk = len(_CJK_CHAR.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    CJK 感知分词：CJK 字符逐字切分，其余按字母数字连续段切分并转小写
+
+    Args:
+        text: 待分词文本
+
+    Returns:
+        token 列表（不含标点）
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text):
+        kind = match.lastgroup
+        if kind == "cjk":
+            tokens.append(match.group())
+        elif kind == "word":
+            tokens.append(match.group().lower())
+    return tokens
+
+
+def search_terms(text: str) -> List[str]:
+    """
+    检索用分词：拉丁单词转小写，连续的 CJK 字符切成重叠二元组（"王者荣耀" -> 王者、者荣、荣耀）
+
+    CJK 单字区分度太低，倒排表会非常长；二元组兼顾召回和查询速度。
+    单独出现的 CJK 字符保留为单字，停用词和单字母词被忽略。
+    紧接 CJK 字符的数字并入二元组（"7日留存" -> 7日、日留、留存），保留"7日""30天"这类运营术语。
+    """
+    terms: List[str] = []
+    run: List[str] = []
+    run_end = -1
+
+    def flush_run() -> None:
+        if len(run) == 1:
+            if run[0] not in _STOPWORDS:
+                terms.append(run[0])
+        else:
+            terms.extend(run[i] + run[i + 1] for i in range(len(run) - 1))
+        run.clear()
+
+    for match in _TOKEN_PATTERN.finditer(text):
+        kind = match.lastgroup
+        if kind == "cjk":
+            if run and match.start() != run_end:
+                flush_run()
+            run.append(match.group())
+            run_end = match.end()
+            continue
+        if kind == "word" and match.group().isdigit() and _CJK_CHAR.match(text, match.end()):
+            if run and match.start() != run_end:
+                flush_run()
+            run.append(match.group())
+            run_end = match.end()
+            continue
+        if run:
+            flush_run()
+        if kind == "word":
+            word = match.group().lower()
+            if len(word) > 1 and word not in _STOPWORDS:
+                terms.append(word)
+    if run:
+        flush_run()
+    return terms
+
+
+class SpaceSavingCounter:
+    """
+    Space-Saving 高频项近似计数器
+
+    只保留 capacity 个计数器；新元素到来且计数器已满时，替换当前最小计数项，
+    并把被替换项的计数作为误差上界记录下来。频率高于 N/capacity 的元素一定会被保留。
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = max(1, capacity)
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        # 惰性最小堆：每个元素恰有一个堆条目，条目计数可能落后于真实计数
+        self._heap: List[Tuple[int, str]] = []
+        self.total = 0
+
+    def add(self, item: str, count: int = 1) -> None:
+        """记录一次出现"""
+        self.total += count
+        counts = self.counts
+        if item in counts:
+            counts[item] += count
+            return
+
+        if len(counts) < self.capacity:
+            counts[item] = count
+            self.errors[item] = 0
+            heapq.heappush(self._heap, (count, item))
+            return
+
+        # 弹出真正的最小计数项（跳过过期的堆条目）
+        while True:
+            min_count, victim = self._heap[0]
+            current = counts[victim]
+            if current == min_count:
+                break
+            heapq.heapreplace(self._heap, (current, victim))
+
+        del counts[victim]
+        del self.errors[victim]
+        counts[item] = min_count + count
+        self.errors[item] = min_count
+        heapq.heapreplace(self._heap, (min_count + count, item))
+
+    def top(self, k: int) -> List[Dict[str, Any]]:
+        """返回计数最高的 k 项，附带误差上界"""
+        items = heapq.nlargest(k, self.counts.items(), key=lambda kv: kv[1])
+        return [
+            {"term": term, "count": count, "max_error": self.errors[term]}
+            for term, count in items
+        ]
+
+
+class StreamingTextAnalyzer:
+    """
+    单遍流式文本分析器
+
+    用法：
+        analyzer = StreamingTextAnalyzer()
+        for chunk in chunks:
+            analyzer.feed(chunk)
+        stats = analyzer.result()
+    """
+
+    def __init__(self, top_k: int = 10, ngram_n: int = 2, sketch_capacity: int = 1000):
+        self.top_k = max(1, min(top_k, MAX_TOP_K))
+        self.ngram_n = max(2, ngram_n)
+        capacity = max(self.top_k, min(sketch_capacity, MAX_SKETCH_CAPACITY))
+        self.term_sketch = SpaceSavingCounter(capacity)
+        self.ngram_sketch = SpaceSavingCounter(capacity)
+
+        # 原有统计
+        self.word_count = 0
+        self.char_count = 0
+        self.char_count_no_space = 0
+        self.newline_count = 0
+
+        # CJK 感知统计
+        self.token_count = 0
+        self.cjk_char_count = 0
+        self.latin_word_count = 0
+        self.ngram_count = 0
+
+        # 跨分块状态
+        self._prev_ended_nonspace = False
+        self._carry = ""
+        self._window: List[Tuple[str, bool]] = []
+
+    def feed(self, chunk: str) -> None:
+        """处理一个文本分块"""
+        if not chunk:
+            return
+
+        # 原有统计：与 split()/len/replace/split('\n') 的结果保持一致
+        spaces = chunk.count(" ")
+        newlines = chunk.count("\n")
+        self.char_count += len(chunk)
+        self.char_count_no_space += len(chunk) - spaces - newlines
+        self.newline_count += newlines
+
+        words = len(chunk.split())
+        if words and self._prev_ended_nonspace and not chunk[0].isspace():
+            words -= 1  # 单词被分块边界截断，已在上一块计过
+        self.word_count += words
+        self._prev_ended_nonspace = not chunk[-1].isspace()
+
+        # 分词：把上一块末尾的半个单词拼回来，并扣留本块末尾的半个单词
+        text = self._carry + chunk
+        trailing = _TRAILING_WORD.search(text)
+        if trailing:
+            self._carry = text[trailing.start():]
+            text = text[:trailing.start()]
+        else:
+            self._carry = ""
+        self._consume_tokens(text)
+
+    def _consume_tokens(self, text: str) -> None:
+        term_add = self.term_sketch.add
+        ngram_add = self.ngram_sketch.add
+        window = self._window
+        n = self.ngram_n
+
+        for match in _TOKEN_PATTERN.finditer(text):
+            kind = match.lastgroup
+            if kind == "brk":
+                window.clear()
+                continue
+
+            if kind == "cjk":
+                token = match.group()
+                is_cjk = True
+                self.cjk_char_count += 1
+            else:
+                token = match.group().lower()
+                is_cjk = False
+                self.latin_word_count += 1
+
+            self.token_count += 1
+            if token not in _STOPWORDS and (is_cjk or len(token) > 1):
+                term_add(token)
+
+            window.append((token, is_cjk))
+            if len(window) > n:
+                del window[0]
+            if len(window) == n:
+                if all(flag for _, flag in window):
+                    gram = "".join(tok for tok, _ in window)
+                else:
+                    gram = " ".join(tok for tok, _ in window)
+                ngram_add(gram)
+                self.ngram_count += 1
+
+    def result(self) -> Dict[str, Any]:
+        """结束输入并返回统计结果"""
+        if self._carry:
+            carry, self._carry = self._carry, ""
+            self._consume_tokens(carry)
+
+        return {
+            "word_count": self.word_count,
+            "char_count": self.char_count,
+            "char_count_no_space": self.char_count_no_space,
+            "line_count": self.newline_count + 1,
+            "token_count": self.token_count,
+            "cjk_char_count": self.cjk_char_count,
+            "latin_word_count": self.latin_word_count,
+            "top_terms": self.term_sketch.top(self.top_k),
+            "ngram_n": self.ngram_n,
+            "ngram_count": self.ngram_count,
+            "top_ngrams": self.ngram_sketch.top(self.top_k),
+            "sketch_capacity": self.term_sketch.capacity,
+        }
+
+
+def resolve_upload_path(file_path: str) -> str:
+    """
+    把参数中的文件路径解析到上传目录内，拒绝目录穿越
+
+    Raises:
+        ValueError: 路径不在上传目录内或文件不存在
+    """
+    upload_dir = os.path.realpath(config.UPLOAD_DIR)
+    resolved = os.path.realpath(os.path.join(upload_dir, file_path))
+    if os.path.commonpath([upload_dir, resolved]) != upload_dir:
+        raise ValueError(f"文件路径必须位于上传目录内: {file_path}")
+    if not os.path.isfile(resolved):
+        raise ValueError(f"文件不存在: {file_path}")
+    return resolved
+
+
+def iter_file_chunks(path: str, chunk_size: Optional[int] = None) -> Iterator[str]:
+    """按块读取文本文件，不把整个文件载入内存"""
+    chunk_size = chunk_size or config.TEXT_STREAM_CHUNK_SIZE
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def analyze_chunks(
+    chunks: Iterable[str],
+    top_k: int = 10,
+    ngram_n: int = 2,
+    sketch_capacity: int = 1000
+) -> Dict[str, Any]:
+    """对分块文本执行一次流式分析"""
+    analyzer = StreamingTextAnalyzer(top_k=top_k, ngram_n=ngram_n, sketch_capacity=sketch_capacity)
+    for chunk in chunks:
+        analyzer.feed(chunk)
+    return analyzer.result()
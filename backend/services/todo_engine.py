@@ -0,0 +1,643 @@
+"""
+服务端待办执行引擎
+
+前端 TodoExecutor 在浏览器里逐个执行步骤，每一步都要往返后端多次（callLLM、选择 Action、
+提取参数、/api/execute-action），一个步骤等待用户输入时整个列表都停下。本引擎把编排移到后端：
+
+- 推断步骤之间的数据依赖（引用"上一步"/"第N步"、汇总类步骤、与前面步骤共享的关键词），
+  得到一个有向无环图；显式给出 dependsOn 时以其为准
+- 依赖全部完成的步骤立即并发执行（每个运行最多 TODO_MAX_CONCURRENT_STEPS 个）
+- 步骤只拿到其依赖链上的结果作为上下文，而不是之前所有步骤的结果
+- user_input 步骤只暂停依赖它的分支，其余分支继续执行
+- 浏览器通过 /ws/todo/{run_id} 订阅进度，也可以在同一连接上提交用户输入、重试失败步骤
+
+步骤结果与前端 TodoStepResult 结构一致（stepId、stepText、actionUsed、executionResult 等）。
+"""
+import asyncio
+import json
+import re
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set
+
+from config import config
+from .action_executor_service import action_executor_service
+from .action_registry import ActionSpec, action_registry
+from .action_selector import action_selector_service
+from .deadline import create_detached_task
+from .knowledge_base_service import knowledge_base_service
+from .mock_openai_service import mock_openai_service
+from .openai_service import openai_service
+from .parameter_extractor import parameter_extractor_service
+from .upstream_scheduler import priority_scope
+
+TASK_TYPES = ("action", "llm", "user_input")
+WAITING_FOR_USER_INPUT = "WAITING_FOR_USER_INPUT"
+
+# 运行状态：running | waiting_input | failed | succeeded | cancelled
+# 失败的运行可以重试失败步骤，因此只有 succeeded / cancelled 是终态
+FINISHED_STATUSES = ("succeeded", "cancelled")
+
+# ==========================================
+# 依赖推断
+# ==========================================
+
+# 引用紧邻的上一步
+_PREVIOUS_STEP = re.compile(r"上一步|前一步|上述|上面的|前述|该结果|此结果|这些结果|这些数据")
+# 汇总类步骤：依赖之前的全部步骤
+_ALL_PREVIOUS = re.compile(r"以上|前面|前置|所有结果|全部结果|汇总|总结|综合|整合|归纳|报告")
+# 按序号引用："第2步"、"步骤2"
+_STEP_NUMBER = re.compile(r"第\s*(\d+)\s*步|步骤\s*(\d+)")
+
+# 计算关键词重合时忽略的通用动词和虚词
+_GENERIC_WORDS = re.compile(
+    r"用户|询问|提供|获取|计算|分析|生成|进行|根据|基于|使用|利用|结果|信息|数据|内容|相关|"
+    r"一下|一个|请|帮我|需要|然后|并且|以及"
+)
+_STOP_CHARS = re.compile(r"[的了和与及并或在对把将从为是\s\W_]+")
+
+
+def _content_bigrams(text: str) -> Set[str]:
+    """去掉通用词后的字符二元组，用于判断两个步骤是否涉及同一份数据"""
+    segments = _STOP_CHARS.split(_GENERIC_WORDS.sub(" ", text.lower()))
+    return {segment[i:i + 2] for segment in segments for i in range(len(segment) - 1)}
+
+
+def infer_dependencies(items: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """
+    推断步骤依赖（只可能依赖排在前面的步骤，因此结果一定无环）
+
+    规则按顺序叠加：
+    1. 步骤带有 dependsOn 时直接使用（忽略不存在或排在后面的 ID）
+    2. 汇总类步骤（"总结"、"生成报告"……）依赖之前的全部步骤
+    3. 引用"上一步"、"上述"依赖紧邻的前一步；"第N步"依赖对应步骤
+    4. 与前面 user_input 步骤共享任一关键词，或与其他步骤共享至少
+       TODO_DEPENDENCY_MIN_SHARED 个关键词（字符二元组）时依赖该步骤
+
+    Returns:
+        步骤 ID -> 依赖的步骤 ID 列表（按步骤顺序）
+    """
+    dependencies: Dict[str, List[str]] = {}
+    bigrams = [_content_bigrams(item["text"]) for item in items]
+    for index, item in enumerate(items):
+        earlier = items[:index]
+        if item.get("dependsOn") is not None:
+            allowed = {other["id"] for other in earlier}
+            dependencies[item["id"]] = [dep for dep in item["dependsOn"] if dep in allowed]
+            continue
+
+        text = item["text"]
+        chosen: Set[int] = set()
+        if earlier and _ALL_PREVIOUS.search(text):
+            chosen.update(range(index))
+        if index > 0 and _PREVIOUS_STEP.search(text):
+            chosen.add(index - 1)
+        for match in _STEP_NUMBER.finditer(text):
+            number = int(match.group(1) or match.group(2))
+            if 1 <= number <= index:
+                chosen.add(number - 1)
+        for other_index, other in enumerate(earlier):
+            shared = len(bigrams[index] & bigrams[other_index])
+            needed = 1 if other["taskType"] == "user_input" else config.TODO_DEPENDENCY_MIN_SHARED
+            if shared >= needed:
+                chosen.add(other_index)
+        dependencies[item["id"]] = [items[i]["id"] for i in sorted(chosen)]
+    return dependencies
+
+
+def _normalize_items(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """校验并规范化待办步骤（按 order 排序，缺省 taskType 视为 action）"""
+    normalized = []
+    seen: Set[str] = set()
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f"第 {position + 1} 个步骤必须是对象")
+        step_id = str(item.get("id") or f"step_{position + 1}")
+        text = str(item.get("text") or "").strip()
+        task_type = item.get("taskType") or "action"
+        order = item.get("order", position)
+        depends_on = item.get("dependsOn")
+        if isinstance(order, bool) or not isinstance(order, (int, float)):
+            raise ValueError(f"步骤 {step_id} 的 order 必须是数字")
+        if depends_on is not None and not isinstance(depends_on, list):
+            raise ValueError(f"步骤 {step_id} 的 dependsOn 必须是步骤 ID 数组")
+        if not text:
+            raise ValueError(f"步骤 {step_id} 缺少 text")
+        if task_type not in TASK_TYPES:
+            raise ValueError(f"步骤 {step_id} 的任务类型不支持: {task_type}，可选 {', '.join(TASK_TYPES)}")
+        if step_id in seen:
+            raise ValueError(f"步骤 ID 重复: {step_id}")
+        seen.add(step_id)
+        normalized.append({
+            "id": step_id,
+            "text": text,
+            "taskType": task_type,
+            "userPrompt": item.get("userPrompt"),
+            "order": order,
+            # 与步骤 ID 一样转为字符串，数字 ID 的依赖才能对上
+            "dependsOn": [str(dep) for dep in depends_on] if depends_on is not None else None
+        })
+    normalized.sort(key=lambda item: item["order"])
+    return normalized
+
+
+def _summarize_result(result: Optional[Dict[str, Any]]) -> str:
+    """从步骤结果中取出作为下游上下文的部分（与前端 extractExecutionParams 取值顺序一致）"""
+    execution = (result or {}).get("executionResult") or {}
+    data = execution.get("result", execution.get("data"))
+    if isinstance(data, dict):
+        for key in ("extractedInfo", "userInput", "result", "response", "answer", "data"):
+            if data.get(key) not in (None, ""):
+                value = data[key]
+                break
+        else:
+            value = data
+    else:
+        value = data
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    if len(text) > config.TODO_CONTEXT_CHARS:
+        text = text[:config.TODO_CONTEXT_CHARS] + "…"
+    return text
+
+
+# ==========================================
+# 运行
+# ==========================================
+
+class TodoRun:
+    """一次待办列表执行"""
+
+    def __init__(self, items: List[Dict[str, Any]], user_input: str, title: str = ""):
+        self.id = uuid.uuid4().hex
+        self.title = title
+        self.items = items
+        self.steps: Dict[str, Dict[str, Any]] = {item["id"]: item for item in items}
+        self.user_input = user_input
+        self.dependencies = infer_dependencies(items)
+        # 步骤状态：pending | running | waiting_input | succeeded | failed | blocked
+        self.states: Dict[str, str] = {item["id"]: "pending" for item in items}
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.status = "running"
+        self.created_at = time.time()
+        self.started = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.semaphore = asyncio.Semaphore(config.TODO_MAX_CONCURRENT_STEPS)
+        self.tasks: Set[asyncio.Task] = set()
+        self.subscribers: List[asyncio.Queue] = []
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def ancestors(self, step_id: str) -> List[str]:
+        """依赖链上的全部步骤（按步骤顺序），即该步骤可见的上下文"""
+        found: Set[str] = set()
+        stack = list(self.dependencies[step_id])
+        while stack:
+            dep = stack.pop()
+            if dep not in found:
+                found.add(dep)
+                stack.extend(self.dependencies[dep])
+        return [item["id"] for item in self.items if item["id"] in found]
+
+    def to_dict(self, include_results: bool = True) -> Dict[str, Any]:
+        step_ms = sum(result.get("executionTime", 0) for result in self.results.values())
+        elapsed_ms = round(((self.finished_at or time.time()) - self.created_at) * 1000, 1)
+        data = {
+            "run_id": self.id,
+            "title": self.title,
+            "status": self.status,
+            "steps": [
+                {
+                    "id": item["id"],
+                    "text": item["text"],
+                    "taskType": item["taskType"],
+                    "dependsOn": self.dependencies[item["id"]],
+                    "state": self.states[item["id"]]
+                }
+                for item in self.items
+            ],
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "elapsed_ms": elapsed_ms,
+            # 各步骤耗时之和，即逐个执行时的大致耗时（不含等待用户输入的时间）
+            "sequential_ms": round(step_ms, 1)
+        }
+        if include_results:
+            data["results"] = [self.results[item["id"]] for item in self.items if item["id"] in self.results]
+        return data
+
+
+class TodoEngine:
+    """按依赖图并发执行待办步骤"""
+
+    def __init__(self, run_ttl: float = 3600):
+        self.run_ttl = run_ttl
+        self.runs: Dict[str, TodoRun] = {}
+        self.steps_executed = 0
+        self.saved_ms = 0.0
+
+    # ==========================================
+    # 对外接口
+    # ==========================================
+
+    def start(self, items: List[Dict[str, Any]], user_input: str = "", title: str = "") -> Dict[str, Any]:
+        """
+        开始执行待办列表，立即返回运行快照（含推断出的依赖）
+
+        Args:
+            items: SimpleTodoItem 列表（id、text、taskType、userPrompt、order，可选 dependsOn）
+            user_input: 用户原始请求，作为每个步骤的上下文
+            title: 待办列表标题
+        """
+        self._evict_expired()
+        if not items:
+            return {"success": False, "error": "待办列表为空"}
+        try:
+            normalized = _normalize_items(items)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+
+        run = TodoRun(normalized, user_input, title)
+        self.runs[run.id] = run
+        print(f"🗂️ 待办执行开始: {run.id}，{len(normalized)} 个步骤，依赖 {run.dependencies}")
+        self._schedule(run)
+        return {"success": True, "data": run.to_dict()}
+
+    def get(self, run_id: str) -> Optional[TodoRun]:
+        self._evict_expired()
+        return self.runs.get(run_id)
+
+    async def submit_input(self, run_id: str, step_id: str, response: str) -> Dict[str, Any]:
+        """
+        提交 user_input 步骤的用户回复
+
+        回复经 LLM 校验：不满足要求时推送追问（步骤保持等待），满足时步骤完成并继续调度其下游
+        """
+        run = self.runs.get(run_id)
+        if not run:
+            return {"success": False, "error": f"运行不存在或已过期: {run_id}"}
+        if run.states.get(step_id) != "waiting_input":
+            return {"success": False, "error": f"步骤未在等待用户输入: {step_id}"}
+
+        step = run.steps[step_id]
+        started = time.monotonic()
+        run.states[step_id] = "running"
+        validation = await self._validate_user_response(step, response)
+        elapsed_ms = round((time.monotonic() - started) * 1000, 1)
+
+        if not validation["isValid"]:
+            run.states[step_id] = "waiting_input"
+            run.results[step_id] = self._step_result(step, False, {
+                "task": step["text"],
+                "askMessage": validation["followUpQuestion"],
+                "method": "用户输入询问",
+                "waitingForInput": True,
+                "partialSuccess": True,
+                "previousResponse": response
+            }, elapsed_ms, error=WAITING_FOR_USER_INPUT)
+            self._publish(run, {"type": "follow_up", "step_id": step_id, "result": run.results[step_id]})
+            return {"success": True, "data": {"accepted": False, "followUpQuestion": validation["followUpQuestion"]}}
+
+        run.results[step_id] = self._step_result(step, True, {
+            "task": step["text"],
+            "userInput": response,
+            "extractedInfo": validation.get("extractedInfo"),
+            "method": "用户输入",
+            "prompt": step.get("userPrompt") or step["text"]
+        }, elapsed_ms)
+        self._complete_step(run, step_id, "succeeded")
+        return {"success": True, "data": {"accepted": True}}
+
+    def retry(self, run_id: str, step_id: str) -> Dict[str, Any]:
+        """重新执行失败的步骤，被它阻塞的下游步骤恢复为待执行"""
+        run = self.runs.get(run_id)
+        if not run:
+            return {"success": False, "error": f"运行不存在或已过期: {run_id}"}
+        if run.states.get(step_id) != "failed":
+            return {"success": False, "error": f"只能重试失败的步骤: {step_id}"}
+
+        run.states[step_id] = "pending"
+        for other_id, state in run.states.items():
+            if state == "blocked":
+                run.states[other_id] = "pending"
+        run.status = "running"
+        run.finished_at = None
+        self._schedule(run)
+        return {"success": True, "data": run.to_dict(include_results=False)}
+
+    async def cancel(self, run_id: str) -> Optional[TodoRun]:
+        """取消运行中的全部步骤"""
+        run = self.runs.get(run_id)
+        if not run or run.finished:
+            return run
+        tasks = list(run.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        run.status = "cancelled"
+        run.finished_at = time.time()
+        self._publish(run, {"type": "run_cancelled", "run": run.to_dict(include_results=False)})
+        return run
+
+    def subscribe(self, run_id: str) -> Optional[asyncio.Queue]:
+        """订阅运行事件；返回的队列依次收到步骤事件和运行结束事件"""
+        run = self.runs.get(run_id)
+        if not run:
+            return None
+        queue: asyncio.Queue = asyncio.Queue()
+        run.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, run_id: str, queue: asyncio.Queue) -> None:
+        run = self.runs.get(run_id)
+        if run and queue in run.subscribers:
+            run.subscribers.remove(queue)
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for run in self.runs.values():
+            counts[run.status] = counts.get(run.status, 0) + 1
+        return {
+            "runs": counts,
+            "steps_executed": self.steps_executed,
+            "max_concurrent_steps": config.TODO_MAX_CONCURRENT_STEPS,
+            # 已完成的运行中，并发执行比逐个执行节省的时间
+            "saved_ms": round(self.saved_ms, 1)
+        }
+
+    # ==========================================
+    # 调度
+    # ==========================================
+
+    def _publish(self, run: TodoRun, event: Dict[str, Any]) -> None:
+        event = {
+            "run_id": run.id,
+            "timestamp": time.time(),
+            "elapsed_ms": round((time.monotonic() - run.started) * 1000, 1),
+            **event
+        }
+        for queue in run.subscribers:
+            queue.put_nowait(event)
+
+    def _schedule(self, run: TodoRun) -> None:
+        """启动依赖已满足的步骤；依赖失败的步骤标记为 blocked"""
+        if run.finished:
+            return
+        for item in run.items:
+            step_id = item["id"]
+            if run.states[step_id] != "pending":
+                continue
+            dep_states = [run.states[dep] for dep in run.dependencies[step_id]]
+            if any(state in ("failed", "blocked") for state in dep_states):
+                run.states[step_id] = "blocked"
+                self._publish(run, {"type": "step_blocked", "step_id": step_id})
+            elif all(state == "succeeded" for state in dep_states):
+                run.states[step_id] = "running"
+                # 步骤可能由 POST 请求触发调度，不能继承该请求的截止时间
+                task = create_detached_task(self._run_step(run, item))
+                run.tasks.add(task)
+                task.add_done_callback(run.tasks.discard)
+        self._update_status(run)
+
+    def _update_status(self, run: TodoRun) -> None:
+        states = set(run.states.values())
+        if states & {"running", "pending"}:
+            status = "running"
+        elif states == {"succeeded"}:
+            status = "succeeded"
+        elif "waiting_input" in states:
+            status = "waiting_input"
+        else:
+            status = "failed"
+        if status == run.status:
+            return
+
+        run.status = status
+        if status in ("succeeded", "failed"):
+            run.finished_at = time.time()
+            snapshot = run.to_dict()
+            if status == "succeeded":
+                self.saved_ms += max(snapshot["sequential_ms"] - snapshot["elapsed_ms"], 0.0)
+            print(f"🏁 待办执行结束: {run.id} ({status})，耗时 {snapshot['elapsed_ms']}ms，"
+                  f"逐个执行约 {snapshot['sequential_ms']}ms")
+            self._publish(run, {"type": f"run_{status}", "run": snapshot})
+        else:
+            self._publish(run, {"type": "run_status", "status": status})
+
+    def _complete_step(self, run: TodoRun, step_id: str, state: str) -> None:
+        run.states[step_id] = state
+        self._publish(run, {"type": f"step_{state}", "step_id": step_id, "result": run.results.get(step_id)})
+        self._schedule(run)
+
+    async def _run_step(self, run: TodoRun, step: Dict[str, Any]) -> None:
+        async with run.semaphore:
+            self._publish(run, {"type": "step_started", "step_id": step["id"]})
+            started = time.monotonic()
+            try:
+                with priority_scope("interactive"):
+                    result = await self._execute_step(run, step, started)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ 待办步骤执行失败: {step['text']} - {e}")
+                result = self._step_result(step, False, None, self._elapsed(started), error=str(e))
+        self.steps_executed += 1
+        run.results[step["id"]] = result
+
+        if result.get("error") == WAITING_FOR_USER_INPUT:
+            run.states[step["id"]] = "waiting_input"
+            self._publish(run, {"type": "waiting_input", "step_id": step["id"], "result": result})
+            self._update_status(run)
+        else:
+            self._complete_step(run, step["id"], "succeeded" if result["success"] else "failed")
+
+    def _evict_expired(self) -> None:
+        """淘汰结束超过 TTL 的运行"""
+        cutoff = time.time() - self.run_ttl
+        expired = [
+            run_id for run_id, run in self.runs.items()
+            if run.finished_at and run.finished_at < cutoff
+        ]
+        for run_id in expired:
+            del self.runs[run_id]
+
+    # ==========================================
+    # 步骤执行
+    # ==========================================
+
+    @staticmethod
+    def _elapsed(started: float) -> float:
+        return round((time.monotonic() - started) * 1000, 1)
+
+    @staticmethod
+    def _step_result(
+        step: Dict[str, Any],
+        success: bool,
+        data: Optional[Dict[str, Any]],
+        elapsed_ms: float,
+        error: Optional[str] = None,
+        action: Optional[ActionSpec] = None
+    ) -> Dict[str, Any]:
+        """与前端 TodoStepResult 相同的结构"""
+        result: Dict[str, Any] = {
+            "success": success,
+            "stepId": step["id"],
+            "stepText": step["text"],
+            "executionTime": elapsed_ms
+        }
+        if action is not None:
+            result["actionUsed"] = {"id": action.id, "name": action.name, "type": action.type}
+        if data is not None:
+            result["executionResult"] = {"success": True, "result": data, "executionTime": elapsed_ms}
+        if error:
+            result["error"] = error
+        return result
+
+    async def _call_llm(self, prompt: str, max_tokens: int) -> str:
+        service = mock_openai_service if config.USE_MOCK_OPENAI else openai_service
+        response = await service.get_chat_completion(
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.7,
+            max_tokens=max_tokens
+        )
+        if not response["success"] or not response.get("content"):
+            raise RuntimeError(response.get("error") or "后端API调用失败")
+        return response["content"].strip()
+
+    def _dependency_context(self, run: TodoRun, step: Dict[str, Any]) -> str:
+        lines = []
+        for dep_id in run.ancestors(step["id"]):
+            dep = run.steps[dep_id]
+            lines.append(f"步骤{run.items.index(dep) + 1}: {dep['text']}\n结果: {_summarize_result(run.results.get(dep_id))}")
+        return "\n\n".join(lines)
+
+    async def _search_knowledge(self, query: str) -> List[str]:
+        try:
+            search = await knowledge_base_service.search(query, limit=config.TODO_KB_RESULTS)
+        except Exception as e:
+            print(f"⚠️ 待办步骤知识库检索失败: {e}")
+            return []
+        return [result["content"] for result in search.get("results", [])] if search.get("success") else []
+
+    async def _execute_step(self, run: TodoRun, step: Dict[str, Any], started: float) -> Dict[str, Any]:
+        if step["taskType"] == "user_input":
+            return await self._ask_user(step, started)
+        if step["taskType"] == "action":
+            selection = await action_selector_service.select(step["text"])
+            self._publish(run, {"type": "step_action_selected", "step_id": step["id"], "selection": selection})
+            spec = action_registry.get(selection["action_id"]) if selection["action_id"] else None
+            if spec and spec.id in action_executor_service.action_handlers:
+                return await self._execute_action(run, step, spec, started)
+        # 不需要工具、没有匹配的工具或工具没有后端实现时由 LLM 处理
+        return await self._execute_with_llm(run, step, started)
+
+    async def _execute_action(
+        self, run: TodoRun, step: Dict[str, Any], spec: ActionSpec, started: float
+    ) -> Dict[str, Any]:
+        parameters = await self._extract_parameters(run, step, spec)
+        outcome = await action_executor_service.execute_action(
+            action_id=spec.id,
+            action_name=spec.name,
+            action_type=spec.type,
+            parameters=parameters
+        )
+        if not outcome.get("success"):
+            return self._step_result(step, False, None, self._elapsed(started), error=outcome.get("error"), action=spec)
+        data = {"action": spec.name, "parameters": parameters, **outcome}
+        data.pop("success", None)
+        return self._step_result(step, True, data, self._elapsed(started), action=spec)
+
+    async def _extract_parameters(self, run: TodoRun, step: Dict[str, Any], spec: ActionSpec) -> Dict[str, Any]:
+        """规则优先提取 Action 参数，必填参数取不全时才调用 LLM（见 parameter_extractor）"""
+        extracted = await parameter_extractor_service.extract(
+            spec.id,
+            step["text"],
+            user_input=run.user_input,
+            context=self._dependency_context(run, step)
+        )
+        self._publish(run, {
+            "type": "step_parameters_extracted",
+            "step_id": step["id"],
+            "source": extracted["source"],
+            "latency_ms": extracted["latency_ms"]
+        })
+        return extracted["parameters"]
+
+    async def _execute_with_llm(self, run: TodoRun, step: Dict[str, Any], started: float) -> Dict[str, Any]:
+        context, knowledge = self._dependency_context(run, step), await self._search_knowledge(step["text"])
+        prompt = (
+            "你是一个智能助手，正在执行多步骤任务的其中一步。\n\n"
+            f"【当前任务】\n{step['text']}"
+            + (f"\n\n【用户的原始请求】\n{run.user_input}" if run.user_input else "")
+            + (f"\n\n【前置步骤的执行结果】\n{context}" if context else "")
+            + ("\n\n【相关知识库信息】\n" + "\n".join(f"- {content}" for content in knowledge) if knowledge else "")
+            + "\n\n【重要提示】\n"
+            "1. 如果前置步骤提供了数据，请务必使用这些真实数据\n"
+            "2. 如果用户原始请求包含了所需信息，请从中提取\n"
+            "3. 不要编造或假设数据，只使用已提供的真实信息\n"
+            "4. 如果是生成报告/总结，请基于前置步骤的真实结果\n"
+            "5. 【格式要求】使用纯文本和自然语言回答，不要使用LaTeX格式\n\n"
+            "请完成当前任务："
+        )
+        response = await self._call_llm(prompt, config.TODO_LLM_MAX_TOKENS)
+        return self._step_result(step, True, {
+            "task": step["text"],
+            "response": response,
+            "method": "LLM智能处理",
+            "knowledgeUsed": bool(knowledge),
+            "knowledgeCount": len(knowledge),
+            "usedPreviousResults": bool(context),
+            "usedUserInput": bool(run.user_input)
+        }, self._elapsed(started))
+
+    async def _ask_user(self, step: Dict[str, Any], started: float) -> Dict[str, Any]:
+        """生成询问消息，步骤进入等待用户输入状态（LLM 失败时使用默认询问）"""
+        user_prompt = step.get("userPrompt") or f"请提供以下信息：{step['text']}"
+        try:
+            ask_message = await self._call_llm(
+                "你是一个智能助手。现在需要向用户询问信息以继续执行任务。\n\n"
+                f"任务步骤: {step['text']}\n需要询问: {user_prompt}\n\n"
+                "请生成一个友好、简洁的询问消息，向用户说明需要什么信息。要求：\n"
+                "- 使用简短、清晰的语言\n- 说明为什么需要这个信息\n- 保持友好和专业的语调\n- 不超过50字",
+                200
+            )
+        except Exception as e:
+            print(f"⚠️ 询问消息生成失败，使用默认询问: {e}")
+            ask_message = user_prompt
+        return self._step_result(step, False, {
+            "task": step["text"],
+            "askMessage": ask_message,
+            "method": "用户输入询问",
+            "prompt": user_prompt,
+            "waitingForInput": True,
+            "partialSuccess": True
+        }, self._elapsed(started), error=WAITING_FOR_USER_INPUT)
+
+    async def _validate_user_response(self, step: Dict[str, Any], response: str) -> Dict[str, Any]:
+        """LLM 判断用户回复是否满足要求；调用或解析失败时直接接受"""
+        prompt = (
+            "你是一个智能助手，需要验证用户的回复是否满足任务要求。\n\n"
+            f"任务步骤: {step['text']}\n原始询问: {step.get('userPrompt') or step['text']}\n用户回复: \"{response}\"\n\n"
+            "请以JSON格式回复：\n"
+            '{"isValid": true/false, "extractedInfo": "提取的有用信息（如果有效）", '
+            '"followUpQuestion": "进一步询问的问题（如果无效）", "reason": "判断理由"}\n\n'
+            "要求：\n- 如果用户提供了基本信息（如生日、年龄、偏好等），通常应该接受\n"
+            "- 只有在信息明显不完整或不相关时才要求补充\n- followUpQuestion应该友好、具体，指出需要什么信息"
+        )
+        try:
+            with priority_scope("interactive"):
+                content = await self._call_llm(prompt, 500)
+            match = re.search(r"\{[\s\S]*\}", content)
+            if match:
+                parsed = json.loads(match.group(0))
+                if parsed.get("isValid") is False and parsed.get("followUpQuestion"):
+                    return {"isValid": False, "followUpQuestion": parsed["followUpQuestion"]}
+                return {"isValid": True, "extractedInfo": parsed.get("extractedInfo") or response}
+        except Exception as e:
+            print(f"⚠️ 用户回复验证失败，直接接受: {e}")
+        return {"isValid": True, "extractedInfo": response}
+
+
+# 创建全局实例
+todo_engine = TodoEngine(run_ttl=config.TODO_RUN_TTL)
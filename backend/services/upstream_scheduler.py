@@ -0,0 +1,195 @@
+"""
+上游调用调度器
+
+所有对 Compass API 的调用共享有限的连接和配额。为避免批量任务拖慢交互式聊天，
+调用按优先级类别排队：
+
+- interactive: /ws/chat、/api/chat 等用户正在等待首字的请求
+- action: 单次 Action 执行
+- batch: 批量分类、批量情感分析等后台任务
+- image: 图像生成
+
+每个类别有独立的并发上限（隔舱），全局并发满时按权重公平排队（start-time fair queueing）：
+权重越高的类别在竞争时获得越多的空闲槽位，但低权重类别不会被饿死。
+"""
+import asyncio
+import contextlib
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+
+from config import config
+from .deadline import with_deadline
+
+# 当前请求所属的优先级类别，由入口（路由、批量任务）设置，OpenAIService 等读取
+current_priority_class: ContextVar[str] = ContextVar("current_priority_class", default="action")
+
+
+@contextlib.contextmanager
+def priority_scope(priority_class: str):
+    """在当前上下文（及其中创建的子任务）内使用指定优先级类别"""
+    token = current_priority_class.set(priority_class)
+    try:
+        yield
+    finally:
+        current_priority_class.reset(token)
+
+
+class _PriorityClass:
+    """单个优先级类别的队列和统计"""
+
+    def __init__(self, name: str, weight: float, max_concurrency: int):
+        self.name = name
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.running = 0
+        self.waiters: Deque[Tuple[asyncio.Future, float]] = deque()
+        self.virtual_start = 0.0
+
+        # 排队等待时间统计
+        self.admitted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent_waits: Deque[float] = deque(maxlen=1000)
+
+    def record_wait(self, wait: float) -> None:
+        self.admitted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.recent_waits.append(wait)
+
+    def stats(self) -> Dict[str, Any]:
+        recent = sorted(self.recent_waits)
+
+        def percentile(p: float) -> Optional[float]:
+            if not recent:
+                return None
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))] * 1000, 1)
+
+        return {
+            "weight": self.weight,
+            "max_concurrency": self.max_concurrency,
+            "running": self.running,
+            "queued": len(self.waiters),
+            "admitted": self.admitted,
+            "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 1) if self.admitted else None,
+            "p50_wait_ms": percentile(0.5),
+            "p95_wait_ms": percentile(0.95),
+            "max_wait_ms": round(self.max_wait * 1000, 1)
+        }
+
+
+class UpstreamScheduler:
+    """带隔舱的加权公平上游调度器"""
+
+    def __init__(self, max_concurrency: int, classes: Dict[str, Dict[str, Any]]):
+        self.max_concurrency = max_concurrency
+        self.classes = {
+            name: _PriorityClass(name, spec["weight"], spec["max_concurrency"])
+            for name, spec in classes.items()
+        }
+        self.running = 0
+        self.virtual_time = 0.0
+
+    def _class(self, name: str) -> _PriorityClass:
+        # 未知类别按 action 处理
+        return self.classes.get(name) or self.classes["action"]
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority_class: Optional[str] = None) -> AsyncIterator[None]:
+        """
+        占用一个上游并发槽位
+
+        Raises:
+            DeadlineExceeded: 在请求截止时间前没有排到槽位
+
+        用法：
+            async with upstream_scheduler.slot():
+                await client.chat.completions.create(...)
+        """
+        cls = self._class(priority_class or current_priority_class.get())
+        # 排队时间也计入请求预算，超过截止时间抛出 DeadlineExceeded
+        await with_deadline(self._acquire(cls))
+        try:
+            yield
+        finally:
+            self._release(cls)
+
+    async def _acquire(self, cls: _PriorityClass) -> None:
+        enqueued_at = time.monotonic()
+
+        # 没有人排队且有空位：直接通过
+        if not cls.waiters and cls.running < cls.max_concurrency and self.running < self.max_concurrency \
+                and not self._has_eligible_waiters():
+            self._admit(cls, enqueued_at)
+            return
+
+        if not cls.waiters:
+            # 类别从空闲变为积压：虚拟开始时间不早于全局虚拟时间，避免攒"信用"
+            cls.virtual_start = max(cls.virtual_start, self.virtual_time)
+
+        future = asyncio.get_running_loop().create_future()
+        cls.waiters.append((future, enqueued_at))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已经分到槽位但调用方被取消：归还槽位
+                self._release(cls)
+            else:
+                self._remove_waiter(cls, future)
+            raise
+
+    def _admit(self, cls: _PriorityClass, enqueued_at: float) -> None:
+        cls.running += 1
+        self.running += 1
+        cls.record_wait(time.monotonic() - enqueued_at)
+
+    def _release(self, cls: _PriorityClass) -> None:
+        cls.running -= 1
+        self.running -= 1
+        self._dispatch()
+
+    def _has_eligible_waiters(self) -> bool:
+        return any(c.waiters and c.running < c.max_concurrency for c in self.classes.values())
+
+    def _dispatch(self) -> None:
+        """按虚拟开始时间最小的类别依次分配空闲槽位"""
+        while self.running < self.max_concurrency:
+            eligible = [
+                c for c in self.classes.values()
+                if c.waiters and c.running < c.max_concurrency
+            ]
+            if not eligible:
+                return
+
+            cls = min(eligible, key=lambda c: c.virtual_start)
+            future, enqueued_at = cls.waiters.popleft()
+            if future.done():
+                continue
+
+            self.virtual_time = cls.virtual_start
+            cls.virtual_start += 1.0 / cls.weight
+            self._admit(cls, enqueued_at)
+            future.set_result(None)
+
+    def _remove_waiter(self, cls: _PriorityClass, future: asyncio.Future) -> None:
+        for i, (waiter, _) in enumerate(cls.waiters):
+            if waiter is future:
+                del cls.waiters[i]
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": self.running,
+            "classes": {name: cls.stats() for name, cls in self.classes.items()}
+        }
+
+
+# 创建全局实例
+upstream_scheduler = UpstreamScheduler(
+    max_concurrency=config.UPSTREAM_MAX_CONCURRENCY,
+    classes=config.UPSTREAM_PRIORITY_CLASSES
+)
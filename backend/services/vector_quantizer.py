@@ -0,0 +1,391 @@
+"""
+知识库向量量化
+
+float32 向量矩阵常驻内存的代价是 行数 x 维度 x 4 字节。量化后查询只读压缩编码：
+- int8 标量量化：每维按训练样本的取值范围线性映射到 [-128, 127]，内存 1/4
+- PQ 乘积量化：向量切成 m 段，每段用 256 个中心的码本编码为 1 字节，内存 m / (4 x 维度)，
+  维度 384、m=48 时为 1/32
+
+打分为非对称距离：查询保持 float32，int8 为 (编码 @ 缩放后的查询) + 偏置，PQ 为查表求和。
+量化分数是近似值，可选取前 k x rerank 个候选读回 float32 原向量（memmap，只访问少量行）重新精确打分。
+
+QuantizedVectors 与 IVFIndex 一样是 VectorStore 的派生索引（与向量文件同目录）：
+- quant_params.npz: 量化器类型和参数，训练时整体替换
+- quant_codes.u8: 每行的编码，与 vectors.f32 按行对齐、只追加
+行数达到 min_rows 后自动训练；训练前和尚未编码的新行按 float32 精确打分。
+"""
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from .vector_store import VectorStore
+
+QUANTIZATION_KINDS = ("none", "int8", "pq")
+PARAMS_FILE = "quant_params.npz"
+CODES_FILE = "quant_codes.u8"
+# int8 编码每次转为 float32 的行数：转换缓冲区留在 CPU 缓存内，整块转换会变成内存带宽瓶颈
+_DECODE_ROWS = 1024
+
+
+class ScalarQuantizer:
+    """int8 标量量化：x ≈ low + scale * (code + 128)"""
+
+    kind = "int8"
+
+    def __init__(self, low: np.ndarray, scale: np.ndarray):
+        self.low = low.astype(np.float32)
+        self.scale = scale.astype(np.float32)
+        self.dim = int(low.size)
+        self.code_size = self.dim
+
+    @classmethod
+    def train(cls, sample: np.ndarray) -> "ScalarQuantizer":
+        # 取 0.1% / 99.9% 分位数作为取值范围，少数离群值截断，不拉低其余值的精度
+        low = np.percentile(sample, 0.1, axis=0)
+        high = np.percentile(sample, 99.9, axis=0)
+        return cls(low, np.maximum(high - low, 1e-6) / 255.0)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((vectors - self.low) / self.scale) - 128
+        return np.clip(codes, -128, 127).astype(np.int8).view(np.uint8)
+
+    def prepare(self, queries: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(q, dim) 查询 -> (权重 (dim, q), 偏置 (q,))"""
+        weights = np.ascontiguousarray((queries * self.scale).T)
+        bias = queries @ self.low + 128.0 * weights.sum(axis=0)
+        return weights, bias
+
+    def score(self, codes: np.ndarray, prepared: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+        """(n, code_size) 编码 -> (n, q) 近似内积"""
+        weights, bias = prepared
+        codes = codes.view(np.int8)
+        scores = np.empty((len(codes), weights.shape[1]), dtype=np.float32)
+        buffer = np.empty((min(_DECODE_ROWS, len(codes)), self.dim), dtype=np.float32)
+        for start in range(0, len(codes), _DECODE_ROWS):
+            block = codes[start:start + _DECODE_ROWS]
+            decoded = buffer[:len(block)]
+            np.copyto(decoded, block, casting="unsafe")
+            np.matmul(decoded, weights, out=scores[start:start + len(block)])
+        scores += bias
+        return scores
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"low": self.low, "scale": self.scale}
+
+
+class ProductQuantizer:
+    """PQ 乘积量化：m 段子向量，每段 256 个中心"""
+
+    kind = "pq"
+
+    def __init__(self, codebooks: np.ndarray):
+        self.codebooks = codebooks.astype(np.float32)  # (m, 256, dsub)
+        self.m, self.n_centroids, self.dsub = codebooks.shape
+        self.dim = self.m * self.dsub
+        self.code_size = self.m
+
+    @classmethod
+    def train(cls, sample: np.ndarray, m: int, n_iter: int = 15, seed: int = 0) -> "ProductQuantizer":
+        dim = sample.shape[1]
+        if dim % m:
+            raise ValueError(f"PQ 段数 {m} 不能整除维度 {dim}")
+        n_centroids = min(256, len(sample))
+        dsub = dim // m
+        rng = np.random.default_rng(seed)
+        # 每个中心 64 个样本足以收敛，更多样本只会线性增加训练时间
+        if len(sample) > n_centroids * 64:
+            sample = sample[rng.choice(len(sample), n_centroids * 64, replace=False)]
+        codebooks = np.empty((m, 256, dsub), dtype=np.float32)
+        for j in range(m):
+            sub = np.ascontiguousarray(sample[:, j * dsub:(j + 1) * dsub])
+            centroids = _kmeans(sub, n_centroids, n_iter, rng)
+            codebooks[j, :n_centroids] = centroids
+            codebooks[j, n_centroids:] = centroids[0]
+        return cls(codebooks)
+
+    def encode(self, vectors: np.ndarray, block_rows: int = 65536) -> np.ndarray:
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        half_norms = 0.5 * (self.codebooks ** 2).sum(axis=2)  # (m, 256)
+        for start in range(0, len(vectors), block_rows):
+            block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+            for j in range(self.m):
+                # argmin ||x - c||² = argmin (||c||² / 2 - x·c)
+                distances = block[:, j * self.dsub:(j + 1) * self.dsub] @ self.codebooks[j].T
+                np.subtract(half_norms[j], distances, out=distances)
+                codes[start:start + len(block), j] = distances.argmin(axis=1)
+        return codes
+
+    def prepare(self, queries: np.ndarray) -> np.ndarray:
+        """(q, dim) 查询 -> 查找表 (q, m, 256)：每段子向量与各中心的内积"""
+        subs = queries.reshape(len(queries), self.m, self.dsub)
+        return np.einsum("qmd,mcd->qmc", subs, self.codebooks).astype(np.float32)
+
+    def score(self, codes: np.ndarray, lut: np.ndarray) -> np.ndarray:
+        """(n, m) 编码 -> (n, q) 近似内积：逐段查表累加"""
+        scores = np.zeros((len(lut), len(codes)), dtype=np.float32)
+        for j in range(self.m):
+            column = codes[:, j]
+            for qi, table in enumerate(lut):
+                scores[qi] += table[j].take(column)
+        return scores.T
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}
+
+
+Quantizer = Union[ScalarQuantizer, ProductQuantizer]
+
+
+def _kmeans(vectors: np.ndarray, k: int, n_iter: int, rng: np.random.Generator) -> np.ndarray:
+    """欧氏距离 k-means（PQ 子空间码本），空簇用距离最远的样本重新初始化"""
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(n_iter):
+        distances = vectors @ centroids.T
+        np.subtract(0.5 * (centroids ** 2).sum(axis=1), distances, out=distances)
+        labels = distances.argmin(axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.stack([np.bincount(labels, weights=vectors[:, d], minlength=k) for d in range(vectors.shape[1])], axis=1)
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            worst = np.argsort(-distances[np.arange(len(vectors)), labels])[:empty.size]
+            sums[empty] = vectors[worst]
+            counts[empty] = 1
+        centroids = (sums / counts[:, None]).astype(np.float32)
+    return centroids
+
+
+def pq_subvectors(dim: int, requested: Optional[int] = None) -> int:
+    """PQ 段数：默认每段 8 维，取不超过请求值且能整除维度的最大段数"""
+    m = max(1, min(requested or dim // 8, dim))
+    while dim % m:
+        m -= 1
+    return m
+
+
+def rerank_exact(matrix: np.ndarray, query: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """读回候选行的 float32 原向量精确打分，返回按分数降序的前 k 个 (rows, scores)"""
+    if rows.size == 0:
+        return rows, np.empty(0, dtype=np.float32)
+    rows = np.sort(rows)  # 按行号顺序读 memmap
+    scores = np.asarray(matrix[rows]) @ query
+    top = np.argsort(-scores, kind="stable")[:k]
+    return rows[top], scores[top].astype(np.float32)
+
+
+class QuantizedVectors:
+    """VectorStore 的量化编码：压缩扫描 + 可选 float32 重排"""
+
+    def __init__(
+        self,
+        store: VectorStore,
+        kind: str = "int8",
+        min_rows: int = 10000,
+        pq_subvectors: Optional[int] = None,
+        rerank: int = 4,
+        block_rows: int = 65536
+    ):
+        """
+        Args:
+            store: 底层向量存储（float32 原向量保留在磁盘上，用于重排和重新训练）
+            kind: int8 / pq
+            min_rows: 行数达到后才自动训练
+            pq_subvectors: PQ 段数，默认维度 / 8
+            rerank: 默认取前 k x rerank 个候选精确重排，0 表示直接返回量化分数
+            block_rows: 扫描时每次解码打分的行数
+        """
+        if kind not in ("int8", "pq"):
+            raise ValueError(f"不支持的量化方式: {kind}，可选 int8 / pq")
+        self.store = store
+        self.kind = kind
+        self.min_rows = min_rows
+        self.pq_subvectors = pq_subvectors
+        self.rerank = rerank
+        self.block_rows = block_rows
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()  # 串行化 train / sync
+
+        self._params_path = os.path.join(store.directory, PARAMS_FILE)
+        self._codes_path = os.path.join(store.directory, CODES_FILE)
+        self._quantizer: Optional[Quantizer] = None
+        self._codes = np.empty((0, 0), dtype=np.uint8)
+        self._load()
+
+    # ==========================================
+    # 持久化
+    # ==========================================
+
+    def _load(self) -> None:
+        """读取量化器和编码；类型或维度与配置不符时忽略，编码比向量文件长时截断"""
+        if not (os.path.exists(self._params_path) and os.path.exists(self._codes_path)):
+            return
+        with np.load(self._params_path) as saved:
+            kind = str(saved["kind"])
+            quantizer = ScalarQuantizer(saved["low"], saved["scale"]) if kind == "int8" \
+                else ProductQuantizer(saved["codebooks"]) if kind == "pq" else None
+        if quantizer is None or kind != self.kind or quantizer.dim != self.store.dim:
+            print(f"⚠️ 量化参数与当前配置不一致，忽略已有编码: {self._params_path}")
+            return
+        codes = np.fromfile(self._codes_path, dtype=np.uint8)
+        rows = min(codes.size // quantizer.code_size, self.store.stats()["rows"])
+        if codes.size != rows * quantizer.code_size:
+            codes = codes[:rows * quantizer.code_size]
+            with open(self._codes_path, "r+b") as f:
+                f.truncate(codes.size)
+        self._quantizer = quantizer
+        self._codes = codes.reshape(rows, quantizer.code_size)
+        print(f"🗜️ 已加载 {kind} 量化编码: {rows} 行")
+
+    def _save_training(self, quantizer: Quantizer, codes: np.ndarray) -> None:
+        tmp_codes = self._codes_path + ".tmp"
+        codes.tofile(tmp_codes)
+        tmp_params = self._params_path + ".tmp.npz"
+        np.savez(tmp_params, kind=quantizer.kind, **quantizer.arrays())
+        os.replace(tmp_codes, self._codes_path)
+        os.replace(tmp_params, self._params_path)
+
+    # ==========================================
+    # 构建
+    # ==========================================
+
+    @property
+    def trained(self) -> bool:
+        return self._quantizer is not None
+
+    @property
+    def rows(self) -> int:
+        """已编码的行数"""
+        return int(self._codes.shape[0])
+
+    def snapshot(self) -> Tuple[Optional[Quantizer], np.ndarray]:
+        """当前的 (量化器, 编码)，重新训练时两者一起替换"""
+        with self._lock:
+            return self._quantizer, self._codes
+
+    def train(self, sample_size: int = 65536) -> Dict[str, Any]:
+        """训练量化器并重新编码全部行"""
+        with self._build_lock:
+            return self._train_locked(sample_size)
+
+    def _train_locked(self, sample_size: int) -> Dict[str, Any]:
+        matrix, live = self.store.snapshot()
+        live_rows = np.flatnonzero(live)
+        if live_rows.size == 0:
+            return {"trained": False, "reason": "向量库为空"}
+
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(live_rows, min(sample_size, live_rows.size), replace=False))
+        sample_vectors = np.asarray(matrix[sample])
+        if self.kind == "int8":
+            quantizer: Quantizer = ScalarQuantizer.train(sample_vectors)
+        else:
+            quantizer = ProductQuantizer.train(sample_vectors, pq_subvectors(matrix.shape[1], self.pq_subvectors))
+        codes = np.empty((matrix.shape[0], quantizer.code_size), dtype=np.uint8)
+        for start in range(0, matrix.shape[0], self.block_rows):
+            codes[start:start + self.block_rows] = quantizer.encode(np.asarray(matrix[start:start + self.block_rows]))
+
+        with self._lock:
+            self._quantizer, self._codes = quantizer, codes
+        self._save_training(quantizer, codes)
+        print(f"🗜️ {self.kind} 量化训练完成: {codes.shape[0]} 行，每行 {quantizer.code_size} 字节")
+        return {"trained": True, "kind": self.kind, "rows": int(codes.shape[0]), "code_size": quantizer.code_size}
+
+    def sync(self) -> Dict[str, Any]:
+        """写入后调用：编码新增行并追加到编码文件；行数达到 min_rows 后自动训练"""
+        with self._build_lock:
+            rows = self.store.stats()["rows"]
+            if not self.trained:
+                if rows >= self.min_rows:
+                    return {"action": "trained", **self._train_locked(65536)}
+                return {"action": "none"}
+            start = self.rows
+            if rows <= start:
+                return {"action": "none"}
+            matrix, _ = self.store.snapshot()
+            new_codes = self._quantizer.encode(np.asarray(matrix[start:rows]))
+            with open(self._codes_path, "ab") as f:
+                f.write(new_codes.tobytes())
+            with self._lock:
+                self._codes = np.concatenate([self._codes, new_codes])
+            return {"action": "encoded", "rows": rows - start}
+
+    # ==========================================
+    # 查询
+    # ==========================================
+
+    def search_vectors(
+        self,
+        queries: np.ndarray,
+        k: int = 10,
+        mask: Optional[np.ndarray] = None,
+        rerank: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        扫描量化编码的 top-k 检索，返回格式与 VectorStore.search_vectors 相同
+
+        未训练时退化为精确检索；尚未编码的新行按 float32 精确打分。
+        rerank > 0 时先按量化分数取 k x rerank 个候选，再读回原向量精确重排。
+        """
+        quantizer, codes = self.snapshot()
+        if quantizer is None:
+            return self.store.search_vectors(queries, k, mask)
+
+        queries = self.store.prepare_queries(queries)
+        matrix, candidates = self.store.snapshot(mask)
+        rerank = self.rerank if rerank is None else rerank
+        n_candidates = k * rerank if rerank > 0 else k
+        prepared = quantizer.prepare(queries)
+        encoded = min(codes.shape[0], matrix.shape[0])
+
+        n_queries = queries.shape[0]
+        best_rows = np.empty((n_queries, 0), dtype=np.int64)
+        best_scores = np.empty((n_queries, 0), dtype=np.float32)
+        blocks = [(start, min(start + self.block_rows, encoded)) for start in range(0, encoded, self.block_rows)]
+        if encoded < matrix.shape[0]:
+            blocks.append((encoded, matrix.shape[0]))
+        for start, end in blocks:
+            block_live = candidates[start:end]
+            if not block_live.any():
+                continue
+            if start < encoded:
+                scores = quantizer.score(codes[start:end], prepared).T
+            else:
+                scores = (np.asarray(matrix[start:end]) @ queries.T).T
+            scores[:, ~block_live] = -np.inf
+            local_k = min(n_candidates, int(block_live.sum()))
+            top = np.argpartition(-scores, local_k - 1, axis=1)[:, :local_k]
+            best_rows = np.concatenate([best_rows, top + start], axis=1)
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            if best_rows.shape[1] > n_candidates:
+                keep = np.argpartition(-best_scores, n_candidates - 1, axis=1)[:, :n_candidates]
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+
+        if rerank > 0 and best_rows.shape[1]:
+            reranked = [rerank_exact(matrix, query, rows, k) for query, rows in zip(queries, best_rows)]
+            return (
+                np.stack([rows for rows, _ in reranked]).astype(np.int64),
+                np.stack([scores for _, scores in reranked]).astype(np.float32)
+            )
+        order = np.argsort(-best_scores, axis=1, kind="stable")[:, :k]
+        return (
+            np.take_along_axis(best_rows, order, axis=1).astype(np.int64),
+            np.take_along_axis(best_scores, order, axis=1).astype(np.float32)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        quantizer, codes = self.snapshot()
+        if quantizer is None:
+            return {"trained": False, "kind": self.kind, "min_rows": self.min_rows}
+        float_bytes = codes.shape[0] * quantizer.dim * 4
+        return {
+            "trained": True,
+            "kind": self.kind,
+            "rows": int(codes.shape[0]),
+            "code_size": quantizer.code_size,
+            "code_bytes": int(codes.nbytes),
+            "float_bytes": int(float_bytes),
+            "compression": round(float_bytes / codes.nbytes, 1) if codes.nbytes else 0.0,
+            "rerank": self.rerank
+        }
@@ -0,0 +1,399 @@
+"""
+知识库向量存储
+
+目录结构：
+- vectors.f32: 行主序的 float32 矩阵（无文件头），每行一个已归一化的 chunk 向量，
+  只追加写入，查询时通过 np.memmap 映射，不整体读入内存
+- chunks.db: SQLite，按行号存放 chunk 的 id、来源、正文、元数据和删除标记，维度记录在 meta 表
+
+写入顺序为先追加向量、再提交 SQLite；写入出错时截掉本次追加的向量并回滚 SQLite，
+启动时按 SQLite 的行数截断向量文件，中途崩溃留下的半截向量会被丢弃。删除和替换只写墓碑标记，不改写向量文件。
+
+向量写入前做 L2 归一化，余弦相似度即内积；查询按块（默认 65536 行）做矩阵乘法，
+每块用 argpartition 取局部 top-k 再合并，多条查询可以一次算完。
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .search_index import metadata_filter_clause
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    row INTEGER PRIMARY KEY,
+    chunk_id TEXT NOT NULL,
+    source_id TEXT NOT NULL DEFAULT '',
+    source_name TEXT NOT NULL DEFAULT '',
+    content TEXT NOT NULL DEFAULT '',
+    metadata TEXT NOT NULL DEFAULT '{}',
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS chunks_chunk_id ON chunks(chunk_id) WHERE deleted = 0;
+CREATE INDEX IF NOT EXISTS chunks_source_id ON chunks(source_id) WHERE deleted = 0;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+VECTOR_FILE = "vectors.f32"
+CHUNK_DB = "chunks.db"
+_FILTER_COLUMNS = {"sourceId": "source_id", "sourceName": "source_name"}
+_CHUNK_COLUMNS = "row, chunk_id, source_id, source_name, content, metadata"
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2 归一化（零向量保持为零）"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class VectorStore:
+    """memmap 向量矩阵 + SQLite 元数据，精确余弦 top-k"""
+
+    def __init__(self, directory: str, dim: Optional[int] = None, block_rows: int = 65536):
+        """
+        Args:
+            directory: 存储目录
+            dim: 向量维度；为空时使用已有数据的维度，或在首次写入时确定
+            block_rows: 查询时每次矩阵乘法处理的行数
+        """
+        self.directory = directory
+        self.block_rows = block_rows
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._vector_path = os.path.join(directory, VECTOR_FILE)
+        self._conn = sqlite3.connect(os.path.join(directory, CHUNK_DB), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        stored_dim = int(row[0]) if row else None
+        if stored_dim and dim and stored_dim != dim:
+            raise ValueError(f"向量维度不一致: 已有数据为 {stored_dim}，配置为 {dim}")
+        self.dim: Optional[int] = stored_dim or dim
+        self._load_state()
+
+    # ==========================================
+    # 状态
+    # ==========================================
+
+    def _load_state(self) -> None:
+        """读入存活标记，并把向量文件截断到与 SQLite 一致的行数"""
+        rows = self._conn.execute("SELECT row, deleted FROM chunks").fetchall()
+        self._rows = max((row[0] for row in rows), default=-1) + 1
+        self._live = np.zeros(max(self._rows, 1024), dtype=bool)
+        if rows:
+            data = np.asarray(rows, dtype=np.int64)
+            self._live[data[:, 0]] = data[:, 1] == 0
+        self._live_count = int(self._live.sum())
+
+        expected = self._rows * (self.dim or 0) * 4
+        if os.path.exists(self._vector_path) and os.path.getsize(self._vector_path) != expected:
+            if os.path.getsize(self._vector_path) < expected:
+                raise RuntimeError(f"向量文件不完整: {self._vector_path}")
+            with open(self._vector_path, "r+b") as f:
+                f.truncate(expected)
+        self._matrix: Optional[np.ndarray] = None
+
+    def _mapped(self) -> np.ndarray:
+        """当前行数的只读映射（调用方持有锁）；追加后首次查询时重新映射"""
+        if self._matrix is None or self._matrix.shape[0] != self._rows:
+            if self._rows == 0:
+                self._matrix = np.zeros((0, self.dim or 0), dtype=np.float32)
+            else:
+                self._matrix = np.memmap(self._vector_path, dtype=np.float32, mode="r", shape=(self._rows, self.dim))
+        return self._matrix
+
+    def _tombstone(self, chunk_ids: Sequence[str]) -> int:
+        """标记删除（调用方持有锁）"""
+        deleted = 0
+        for chunk_id in chunk_ids:
+            rows = self._conn.execute(
+                "SELECT row FROM chunks WHERE chunk_id = ? AND deleted = 0", (chunk_id,)
+            ).fetchall()
+            for (row,) in rows:
+                self._conn.execute("UPDATE chunks SET deleted = 1 WHERE row = ?", (row,))
+                self._live[row] = False
+                self._live_count -= 1
+                deleted += 1
+        return deleted
+
+    # ==========================================
+    # 写入
+    # ==========================================
+
+    def add_chunks(self, chunks: List[Dict[str, Any]], embeddings: np.ndarray) -> Dict[str, int]:
+        """
+        追加 chunk 及其向量；id 已存在的 chunk 先标记删除再写入新版本
+
+        Args:
+            chunks: [{'id', 'content', 'sourceId', 'sourceName', 'metadata'}]
+            embeddings: (len(chunks), dim) 的向量矩阵，写入前归一化
+
+        Returns:
+            {'added': 新增数, 'replaced': 替换数}
+        """
+        embeddings = normalize_rows(embeddings)
+        if embeddings.ndim != 2 or embeddings.shape[0] != len(chunks):
+            raise ValueError(f"向量数量与 chunk 数量不一致: {embeddings.shape} / {len(chunks)}")
+        if not chunks:
+            return {"added": 0, "replaced": 0}
+
+        # 同一批内重复的 id 只保留最后一个
+        latest = {str(chunk["id"]): i for i, chunk in enumerate(chunks)}
+        keep = sorted(latest.values())
+        chunks = [chunks[i] for i in keep]
+        embeddings = np.ascontiguousarray(embeddings[keep])
+
+        with self._lock:
+            if self.dim is not None and embeddings.shape[1] != self.dim:
+                raise ValueError(f"向量维度不一致: 期望 {self.dim}，收到 {embeddings.shape[1]}")
+
+            # 先把所有行序列化好，元数据无法序列化时不写入任何东西
+            start = self._rows
+            records = [
+                (
+                    start + i,
+                    str(chunk["id"]),
+                    str(chunk.get("sourceId") or ""),
+                    str(chunk.get("sourceName") or ""),
+                    str(chunk.get("content") or ""),
+                    json.dumps(chunk.get("metadata") or {}, ensure_ascii=False)
+                )
+                for i, chunk in enumerate(chunks)
+            ]
+
+            dim_before = self.dim
+            live_before = self._live.copy()
+            live_count_before = self._live_count
+            try:
+                if self.dim is None:
+                    self.dim = int(embeddings.shape[1])
+                    self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)", (str(self.dim),))
+
+                replaced = self._tombstone(list(latest))
+
+                with open(self._vector_path, "ab") as f:
+                    f.write(embeddings.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                self._conn.executemany(
+                    "INSERT INTO chunks (row, chunk_id, source_id, source_name, content, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                    records
+                )
+                self._conn.commit()
+            except BaseException:
+                # 回滚到写入前：截掉已追加的向量、撤销未提交的墓碑和维度，恢复内存中的存活标记，
+                # 否则之后的行号会与向量错位
+                if os.path.exists(self._vector_path):
+                    with open(self._vector_path, "r+b") as f:
+                        f.truncate(start * (self.dim or 0) * 4)
+                self._conn.rollback()
+                self.dim = dim_before
+                self._live = live_before
+                self._live_count = live_count_before
+                raise
+
+            self._rows = start + len(chunks)
+            if self._rows > self._live.size:
+                live = np.zeros(max(self._rows, self._live.size * 2), dtype=bool)
+                live[:self._live.size] = self._live
+                self._live = live
+            self._live[start:self._rows] = True
+            self._live_count += len(chunks)
+
+        return {"added": len(chunks) - replaced, "replaced": replaced}
+
+    def delete_chunks(self, chunk_ids: List[str]) -> int:
+        """按 chunk id 删除，返回删除数"""
+        with self._lock:
+            deleted = self._tombstone(chunk_ids)
+            self._conn.commit()
+        return deleted
+
+    # ==========================================
+    # 查询
+    # ==========================================
+
+    def metadata_mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        """
+        满足元数据过滤条件的存活行
+
+        Args:
+            filters: {字段: 值 或 值列表}，sourceId / sourceName 对应表列，其余字段从 metadata 中取
+        """
+        clause, params = metadata_filter_clause(filters, _FILTER_COLUMNS)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT row FROM chunks WHERE deleted = 0 AND {clause}", params).fetchall()
+            mask = np.zeros(self._rows, dtype=bool)
+        if rows:
+            mask[np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))] = True
+        return mask
+
+    def source_mask(self, source_ids: Sequence[str]) -> np.ndarray:
+        """只保留指定来源的行"""
+        return self.metadata_mask({"sourceId": list(source_ids)})
+
+    def prepare_queries(self, queries: np.ndarray) -> np.ndarray:
+        """查询向量转为归一化的 (q, dim) 矩阵并检查维度"""
+        queries = normalize_rows(np.atleast_2d(queries))
+        if self.dim is not None and queries.shape[1] != self.dim:
+            raise ValueError(f"查询向量维度不一致: 期望 {self.dim}，收到 {queries.shape[1]}")
+        return queries
+
+    def snapshot(self, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        当前的向量矩阵映射和候选行标记
+
+        Args:
+            mask: 可选的行过滤（True 表示候选），长度不足的部分视为不可选
+
+        Returns:
+            (matrix, candidates)：candidates[i] 为 True 表示第 i 行存活且通过 mask
+        """
+        with self._lock:
+            matrix = self._mapped()
+            live = self._live[:self._rows]
+        if mask is not None:
+            allowed = np.zeros(live.size, dtype=bool)
+            allowed[:min(mask.size, live.size)] = mask[:live.size]
+            live = live & allowed
+        return matrix, live
+
+    def search_vectors(
+        self,
+        queries: np.ndarray,
+        k: int = 10,
+        mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        精确 top-k 内积检索
+
+        Args:
+            queries: (dim,) 或 (q, dim) 的查询向量，内部归一化
+            k: 每条查询返回的结果数
+            mask: 可选的行过滤（True 表示候选），长度不足的部分视为不可选
+
+        Returns:
+            (rows, scores)，形状均为 (q, k')，按分数降序；k' = min(k, 候选行数)
+        """
+        queries = self.prepare_queries(queries)
+        matrix, live = self.snapshot(mask)
+
+        n_queries = queries.shape[0]
+        best_rows = np.empty((n_queries, 0), dtype=np.int64)
+        best_scores = np.empty((n_queries, 0), dtype=np.float32)
+        if k <= 0 or matrix.shape[0] == 0:
+            return best_rows, best_scores
+
+        queries_t = np.ascontiguousarray(queries.T)
+        for start in range(0, matrix.shape[0], self.block_rows):
+            block_live = live[start:start + self.block_rows]
+            if not block_live.any():
+                continue
+            scores = np.asarray(matrix[start:start + self.block_rows]) @ queries_t  # (rows, q)
+            scores = scores.T
+            scores[:, ~block_live] = -np.inf
+            local_k = min(k, int(block_live.sum()))
+            top = np.argpartition(-scores, local_k - 1, axis=1)[:, :local_k]
+            best_rows = np.concatenate([best_rows, top + start], axis=1)
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            if best_rows.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    def search(
+        self,
+        query_vector: np.ndarray,
+        limit: int = 5,
+        source_ids: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """单条查询，返回带正文和元数据的结果（字段与前端 SearchResult 一致）"""
+        mask = self.source_mask(source_ids) if source_ids else None
+        rows, scores = self.search_vectors(query_vector, limit, mask)
+        return self.get_chunks(rows[0].tolist(), scores[0].tolist())
+
+    @staticmethod
+    def _chunk_dict(row: Tuple) -> Dict[str, Any]:
+        _, chunk_id, source_id, source_name, content, metadata = row
+        return {
+            "id": chunk_id,
+            "sourceId": source_id,
+            "sourceName": source_name,
+            "content": content,
+            "metadata": json.loads(metadata)
+        }
+
+    def get_chunks(self, rows: List[int], scores: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """按行号取 chunk，保持传入顺序"""
+        if not rows:
+            return []
+        placeholders = ",".join("?" * len(rows))
+        with self._lock:
+            found = {
+                row[0]: row for row in self._conn.execute(
+                    f"SELECT {_CHUNK_COLUMNS} FROM chunks WHERE row IN ({placeholders})", rows
+                )
+            }
+        results = []
+        for i, row in enumerate(rows):
+            if row not in found:
+                continue
+            result = self._chunk_dict(found[row])
+            if scores is not None:
+                result["score"] = round(float(scores[i]), 6)
+            results.append(result)
+        return results
+
+    def get_chunks_by_ids(self, chunk_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """按 chunk id 取存活 chunk，返回 {id: chunk}"""
+        if not chunk_ids:
+            return {}
+        placeholders = ",".join("?" * len(chunk_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_CHUNK_COLUMNS} FROM chunks WHERE deleted = 0 AND chunk_id IN ({placeholders})", chunk_ids
+            ).fetchall()
+        return {row[1]: self._chunk_dict(row) for row in rows}
+
+    def iter_chunks(self, batch_size: int = 5000) -> Iterator[List[Dict[str, Any]]]:
+        """按行号顺序分批遍历存活 chunk（不含向量）"""
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT {_CHUNK_COLUMNS} FROM chunks WHERE deleted = 0 AND row > ? ORDER BY row LIMIT ?",
+                    (last, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            yield [self._chunk_dict(row) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "chunks": self._live_count,
+                "rows": self._rows,
+                "deleted_rows": self._rows - self._live_count,
+                "dim": self.dim,
+                "vector_file_bytes": os.path.getsize(self._vector_path) if os.path.exists(self._vector_path) else 0
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._matrix = None
+            self._conn.close()
@@ -136,7 +136,8 @@ export const ACTION_LIBRARY: ActionLibrary = [
           { value: 'now', label: '获取当前时间' },
           { value: 'parse', label: '解析日期' },
           { value: 'format', label: '格式化日期' },
-          { value: 'diff', label: '计算时间差' }
+          { value: 'diff', label: '计算时间差' },
+          { value: 'bucket', label: '按时间分桶（批量）' }
         ]
       },
       {
@@ -145,6 +146,62 @@ export const ACTION_LIBRARY: ActionLibrary = [
         type: 'string',
         required: false,
         description: '例如：2024-01-01、2024-01-01 12:00:00'
+      },
+      {
+        name: 'dates',
+        label: '批量日期（可选）',
+        type: 'textarea',
+        required: false,
+        description: '每行一个日期；提供后按整列批量处理'
+      },
+      {
+        name: 'output_format',
+        label: '输出格式（可选）',
+        type: 'string',
+        required: false,
+        defaultValue: '%Y-%m-%d %H:%M:%S',
+        description: 'strftime 格式，例如：%Y-%m-%d、%Y年%m月%d日'
+      },
+      {
+        name: 'compare_to',
+        label: '对比日期（可选）',
+        type: 'string',
+        required: false,
+        description: '计算时间差的基准日期；单个日期默认当前时间，批量默认计算相邻间隔'
+      },
+      {
+        name: 'unit',
+        label: '时间差单位',
+        type: 'select',
+        required: false,
+        defaultValue: 'days',
+        options: [
+          { value: 'seconds', label: '秒' },
+          { value: 'minutes', label: '分钟' },
+          { value: 'hours', label: '小时' },
+          { value: 'days', label: '天' },
+          { value: 'weeks', label: '周' }
+        ]
+      },
+      {
+        name: 'bucket',
+        label: '分桶方式',
+        type: 'select',
+        required: false,
+        defaultValue: 'day',
+        options: [
+          { value: 'day', label: '按天' },
+          { value: 'week', label: '按周' },
+          { value: 'month', label: '按月' },
+          { value: 'cohort', label: '留存Cohort（需 user_ids）' }
+        ]
+      },
+      {
+        name: 'user_ids',
+        label: '用户ID（Cohort用）',
+        type: 'textarea',
+        required: false,
+        description: '每行一个，与批量日期一一对应'
       }
     ],
     codeConfig: {